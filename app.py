@@ -1,21 +1,30 @@
 import streamlit as st
-from PIL.Image import Image
-from backend.database import (
-    create_user, authenticate_user, add_expense, get_expenses, delete_expense, update_expense,
-    add_income, add_recurring_expense, add_split_expense, add_debt
-)
-from backend.expenses import (
-    calculate_monthly_spending, calculate_category_spending, calculate_daily_spending, get_expenses_df
-)
-from backend.utils import (
-    validate_expense, check_budget, send_email_notification, extract_text_from_image,
-    train_expense_categorizer, predict_category
-)
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+from backend.repository import get_repository
+from backend.records import ALL_CATEGORIES, BUDGET_PERIODS, split_shares
+from backend.expenses import get_expenses_page_df
+from backend.dashboard import load_dashboard, get_budget_statuses
+from backend.settlements import get_balances_df, get_settlement_df
+from backend.utils import validate_expense
+from backend.notifications import start_notification_worker
+from backend.importer import import_statement
+from backend.features import lazy_feature
+from backend import metrics
 from datetime import datetime
 
+# MongoDB or SQLite, picked by STORAGE_BACKEND (see backend/repository.py)
+repository = get_repository()
+
+# Heavy subsystems, imported the first time the logged-in page uses them
+categorizer = lazy_feature("categorizer")
+ocr = lazy_feature("ocr")
+exporter = lazy_feature("export")
+charts = lazy_feature("plotting")
+
+# Email notifications are sent from a background thread, started once per process
+start_notification_worker()
+# Rewrites METRICS_TEXTFILE for Prometheus when it is set
+metrics.start_textfile_writer()
+
 # Initialize session state for user authentication
 if "username" not in st.session_state:
     st.session_state.username = None
@@ -30,7 +39,7 @@ def login_signup_page():
 
     if choice == "Login":
         if st.button("Login"):
-            success, message = authenticate_user(username, password)
+            success, message = repository.authenticate_user(username, password)
             if success:
                 st.session_state.username = username
                 st.success(message)
@@ -40,12 +49,56 @@ def login_signup_page():
     elif choice == "Signup":
         email = st.text_input("Email")  # Add email input
         if st.button("Signup"):
-            success, message = create_user(username, password, email)
+            success, message = repository.create_user(username, password, email)
             if success:
                 st.success(message)
             else:
                 st.error(message)
 
+EXPENSES_PAGE_SIZE = 50
+SPLIT_PICKER_SIZE = 50
+
+
+# Paginated expense table; filters are applied by MongoDB
+def expense_table_section(username):
+    with st.expander("Filter Expenses"):
+        date_range = None
+        if st.checkbox("Filter by date"):
+            selected_dates = st.date_input("Date Range", (datetime.today(), datetime.today()))
+            if len(selected_dates) == 2:
+                date_range = selected_dates
+        category_filter = st.selectbox(
+            "Filter Category", ["All", "Food", "Transport", "Entertainment", "Utilities", "Other"]
+        )
+        amount_range = None
+        if st.checkbox("Filter by amount"):
+            min_amount = st.number_input("Min Amount", min_value=0.0, format="%.2f")
+            max_amount = st.number_input("Max Amount", min_value=0.0, value=1000.0, format="%.2f")
+            amount_range = (min_amount, max_amount)
+
+    filters = {"date_range": date_range, "category": category_filter, "amount_range": amount_range}
+
+    # Restart from the first page whenever the filters change
+    if st.session_state.get("expense_filters") != filters:
+        st.session_state.expense_filters = filters
+        st.session_state.expense_page_cursors = [None]
+    cursors = st.session_state.expense_page_cursors
+
+    page_df, next_cursor = get_expenses_page_df(username, EXPENSES_PAGE_SIZE, cursors[-1], **filters)
+    st.dataframe(page_df, use_container_width=True)
+
+    totals = repository.get_expense_totals(username, **filters)
+    st.caption(f"Page {len(cursors)} · {totals['count']} expenses · Total ${totals['total']:.2f}")
+
+    previous_col, next_col = st.columns(2)
+    if previous_col.button("Previous Page", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.experimental_rerun()
+    if next_col.button("Next Page", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.experimental_rerun()
+
+
 # Main App Page
 def main_app_page():
     st.title("💰 Expense Tracker")
@@ -61,11 +114,33 @@ def main_app_page():
         if st.button("Add Expense"):
             is_valid, message = validate_expense(date, category, description, amount)
             if is_valid:
-                add_expense(st.session_state.username, date, category, description, amount)
-                st.success("Expense added successfully!")
+                added, message = repository.add_expense(st.session_state.username, date, category, description, amount)
+                if added:
+                    categorizer.learn_expense(st.session_state.username, description, category)
+                    st.success("Expense added successfully!")
+                else:
+                    st.error(message)
             else:
                 st.error(message)
 
+        # Bulk import from a bank statement
+        st.header("Import Statement")
+        statement = st.file_uploader("Bank Statement", type=["csv", "xlsx"])
+        auto_categorize = st.checkbox("Auto-categorize imported expenses", value=True)
+        negative_spending = st.checkbox("Statement shows spending as negative amounts")
+        if statement and st.button("Import"):
+            report = import_statement(
+                st.session_state.username, statement, filename=statement.name, auto_categorize=auto_categorize,
+                spending_sign=-1 if negative_spending else 1,
+            )
+            st.success(
+                f"Imported {report['inserted']} expenses "
+                f"({report['duplicates']} duplicates, {report['skipped']} skipped) "
+                f"at {report['rows_per_second']:.0f} rows/s."
+            )
+            for error in report["errors"]:
+                st.warning(error)
+
         # Recurring Expenses
         st.header("Add Recurring Expense")
         start_date = st.date_input("Start Date", datetime.today())
@@ -75,30 +150,40 @@ def main_app_page():
         recurring_amount = st.number_input("Recurring Amount", min_value=0.0, format="%.2f")
         frequency = st.selectbox("Frequency", ["Monthly", "Weekly"])
         if st.button("Add Recurring Expense"):
-            add_recurring_expense(st.session_state.username, start_date, end_date, recurring_category, recurring_description, recurring_amount, frequency)
+            repository.add_recurring_expense(st.session_state.username, start_date, end_date, recurring_category, recurring_description, recurring_amount, frequency)
             st.success("Recurring expense added successfully!")
 
         # Income Tracking
         st.header("Add Income")
         income_date = st.date_input("Income Date", datetime.today())
         source = st.text_input("Income Source")
-        income_description = st.text_input("Income Description")
         income_amount = st.number_input("Income Amount", min_value=0.0, format="%.2f")
         if st.button("Add Income"):
-            add_income(st.session_state.username, income_date, source, income_description, income_amount)
-            st.success("Income added successfully!")
+            success, message = repository.add_income(st.session_state.username, income_date, source, income_amount)
+            if success:
+                st.success(message)
+            else:
+                st.error(message)
 
-        # Expense Splitting
-        # Fetch the user's expenses before using it anywhere
-        expenses_df = get_expenses_df(st.session_state.username)
+        # Expense Splitting: the picker lists one page of the most recent
+        # expenses, or of the expenses on a chosen date
+        split_date = st.date_input("Split Expense From (optional)", None)
+        split_df, _ = get_expenses_page_df(
+            st.session_state.username, SPLIT_PICKER_SIZE,
+            date_range=(split_date, split_date) if split_date else None,
+        )
 
-        # Ensure the DataFrame is not empty before accessing its values
-        if expenses_df.empty:
+        if split_df.empty and split_date:
+            st.warning("No expenses on that date to split.")
+        elif split_df.empty:
             st.warning("No expenses available to split. Please add an expense first.")
         else:
-            # Expense Splitting
             st.header("Split Expense")
-            expense_to_split = st.selectbox("Select Expense to Split", expenses_df["description"])
+            split_row = st.selectbox(
+                "Select Expense to Split", split_df.index,
+                format_func=lambda row: f"{split_df.at[row, 'date']:%Y-%m-%d} {split_df.at[row, 'description']} "
+                                        f"({split_df.at[row, 'amount']:.2f})",
+            )
             split_amount = st.number_input("Total Amount to Split", min_value=0.0, format="%.2f")
             num_people = st.number_input("Number of People", min_value=1, step=1)
 
@@ -113,11 +198,15 @@ def main_app_page():
                 if not person_names or len(person_names) != num_people:
                     st.error("Please enter names for all people.")
                 else:
-                    per_person_amount = split_amount / num_people
-                    expense_id = expenses_df[expenses_df["description"] == expense_to_split].iloc[0]["id"]
-                    for person in person_names:
-                        add_split_expense(st.session_state.username, expense_id, person, per_person_amount)
-                    st.success("Expense split successfully!")
+                    expense_id = split_df.at[split_row, "id"]
+                    # All shares are stored together, or none of them
+                    success, message = repository.add_split_expenses(
+                        st.session_state.username, expense_id, split_shares(split_amount, person_names)
+                    )
+                    if success:
+                        st.success(message)
+                    else:
+                        st.error(message)
 
         # Debt & Loan Tracking
         st.header("Add Debt/Loan")
@@ -127,72 +216,79 @@ def main_app_page():
         debt_amount = st.number_input("Debt/Loan Amount", min_value=0.0, format="%.2f")
         debt_type = st.selectbox("Type", ["Debt", "Loan"])
         if st.button("Add Debt/Loan"):
-            add_debt(st.session_state.username, debt_date, person_name, debt_description, debt_amount, debt_type)
+            repository.add_debt(st.session_state.username, debt_date, person_name, debt_description, debt_amount, debt_type)
             st.success("Debt/Loan added successfully!")
 
-    # Main content area
+    # Main content area. Everything it shows is read at once, after the sidebar's writes.
+    dashboard = load_dashboard(st.session_state.username, st.session_state.get("base_currency", "USD"))
     st.header("Your Expenses")
-    expenses_df = get_expenses_df(st.session_state.username)
 
-    if not expenses_df.empty:
-        st.dataframe(expenses_df, use_container_width=True)
+    if dashboard["has_expenses"]:
+        expense_table_section(st.session_state.username)
 
-        # Visualizations
-        # Apply Seaborn's dark theme for a modern look
-        sns.set_style("darkgrid")
-        sns.set_palette("pastel")
+        # Export Data
+        st.header("📤 Export Data")
+        export_kind = st.selectbox("Data to Export", list(exporter.EXPORT_FIELDS))
+        export_format = st.selectbox("Export Format", exporter.available_formats())
+        if st.button("Prepare Export"):
+            # Built in a spooled temp file; Streamlit keeps the download in memory,
+            # so it is read once here and bounded by EXPORT_MAX_ROWS
+            export, rows = exporter.export_file(export_kind, st.session_state.username, export_format)
+            with export:
+                st.download_button(f"Download {export_kind}.{export_format}", export.read(),
+                                   file_name=f"{export_kind}.{export_format}")
+            if rows >= exporter.EXPORT_MAX_ROWS:
+                st.warning(f"Downloads include the first {exporter.EXPORT_MAX_ROWS:,} rows. "
+                           f"Use `python -m backend.exporter` for a full export.")
 
+        # Visualizations
         st.header("📊 Visualizations")
+        # Amounts in other currencies are converted with the offline rates table
+        st.selectbox("Base Currency", ["USD", "EUR", "GBP", "INR", "JPY", "CAD", "AUD"], key="base_currency")
+        if dashboard["missing_rates"]:
+            st.warning(
+                f"No exchange rates for {', '.join(dashboard['missing_rates'])}: those amounts are left out of "
+                f"the charts, shown in {dashboard['base_currency']}. Run `python -m backend.rates fetch` to update "
+                f"the rates."
+            )
 
         # 📈 **Daily Spending**
         st.subheader("Daily Spending")
-        daily_spending = calculate_daily_spending(expenses_df)
-        fig, ax = plt.subplots(figsize=(10, 5))
-        sns.lineplot(x="date", y="amount", data=daily_spending, marker="o", markersize=8, linewidth=2, ax=ax)
-        ax.set_xlabel("Date", fontsize=12, fontweight="bold")
-        ax.set_ylabel("Total Amount ($)", fontsize=12, fontweight="bold")
-        ax.set_title("Daily Spending Trend", fontsize=14, fontweight="bold")
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        st.image(charts.render_chart("daily", dashboard["daily"]), use_column_width=True)
 
         # 📊 **Monthly Spending**
         st.subheader("Monthly Spending")
-        monthly_spending = calculate_monthly_spending(expenses_df)
-        fig, ax = plt.subplots(figsize=(10, 5))
-        sns.barplot(x="month", y="amount", data=monthly_spending, ax=ax, edgecolor="black", linewidth=2)
-        ax.set_xlabel("Month", fontsize=12, fontweight="bold")
-        ax.set_ylabel("Total Amount ($)", fontsize=12, fontweight="bold")
-        ax.set_title("Monthly Spending Breakdown", fontsize=14, fontweight="bold")
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        st.image(charts.render_chart("monthly", dashboard["monthly"]), use_column_width=True)
 
         # 🥧 **Category-wise Breakdown**
         st.subheader("Category-wise Breakdown")
-        category_spending = calculate_category_spending(expenses_df)
-        fig, ax = plt.subplots(figsize=(10, 5))
-        colors = sns.color_palette("pastel")
-        ax.pie(category_spending["amount"], labels=category_spending["category"], autopct="%1.1f%%", colors=colors,
-               startangle=140)
-        ax.set_title("Spending by Category", fontsize=14, fontweight="bold")
-        st.pyplot(fig)
+        st.image(charts.render_chart("category", dashboard["category"]), use_column_width=True)
 
         # Budget Tracking
         st.header("💸 Budget Tracking")
-        budget = st.number_input("Set Your Monthly Budget", min_value=0.0, format="%.2f")
-        user_email = st.text_input("Enter your email for notifications")
-        if budget > 0 and user_email:
-            total_spent = monthly_spending["amount"].sum()
-            st.write(f"Total Spent This Month: ${total_spent:.2f}")
-            st.write(f"Remaining Budget: ${budget - total_spent:.2f}")
-            alert_message = check_budget(total_spent, budget)
+        with st.form("budget_form"):
+            budget_category = st.selectbox(
+                "Budget Category", [ALL_CATEGORIES, "Food", "Transport", "Entertainment", "Utilities", "Other"]
+            )
+            budget_period = st.selectbox("Budget Period", list(BUDGET_PERIODS), index=1)
+            budget_amount = st.number_input("Budget Amount", min_value=0.0, format="%.2f")
+            if st.form_submit_button("Save Budget"):
+                success, message = repository.set_budget(st.session_state.username, budget_category, budget_amount, budget_period)
+                if success:
+                    dashboard["budgets"] = get_budget_statuses(st.session_state.username)
+                    st.success(message)
+                else:
+                    st.error(message)
+
+        # Alerts are emailed to the signup address when an expense write crosses 80% or 100%
+        for budget, status, alert_message in dashboard["budgets"]:
+            st.subheader(f"{budget['category']} ({budget['period']}, {status['period_key']})")
+            st.write(f"Spent: ${status['spent']:.2f} of ${status['budget']:.2f}")
+            st.write(f"Remaining Budget: ${status['remaining']:.2f}")
             if "exceeded" in alert_message:
                 st.error(alert_message)
-                if send_email_notification(
-                    "Budget Exceeded",
-                    f"You have exceeded your monthly budget. Total spent: ${total_spent:.2f}",
-                    user_email,
-                ):
-                    st.success("Notification sent to your email!")
+            elif "Warning" in alert_message:
+                st.warning(alert_message)
             else:
                 st.success(alert_message)
 
@@ -200,23 +296,91 @@ def main_app_page():
         st.header("📄 Upload Receipt")
         uploaded_file = st.file_uploader("Upload Receipt", type=["png", "jpg", "jpeg"])
         if uploaded_file:
-            image = Image.open(uploaded_file)
-            extracted_text = extract_text_from_image(image)
-            st.write("Extracted Text:", extracted_text)
+            receipt_key = ocr.submit_receipt(uploaded_file.getvalue())
+            try:
+                receipt = ocr.get_receipt_result(receipt_key)
+            except Exception as e:
+                receipt = None
+                st.error(f"Could not read receipt: {e}")
+            else:
+                if receipt is None:
+                    st.info("Reading receipt...")
+                    st.button("Refresh", key="refresh_receipt")
+            if receipt:
+                draft = receipt["draft"]
+                with st.expander("Extracted Text"):
+                    st.text(receipt["text"])
+                with st.form("receipt_draft"):
+                    draft_date = st.date_input("Date", draft["date"] or datetime.today())
+                    draft_description = st.text_input("Description", draft["description"])
+                    draft_amount = st.number_input("Amount", min_value=0.0, value=float(draft["amount"] or 0.0))
+                    categories = ["Food", "Transport", "Entertainment", "Utilities", "Other"]
+                    predicted_category = categorizer.predict_categories(st.session_state.username, [draft["description"]])[0]
+                    draft_category = st.selectbox(
+                        "Category", categories,
+                        index=categories.index(predicted_category) if predicted_category in categories else 4,
+                    )
+                    if st.form_submit_button("Save Expense"):
+                        success, message = ocr.save_receipt_draft(st.session_state.username, {
+                            "date": draft_date, "description": draft_description, "amount": draft_amount,
+                        }, draft_category)
+                        if success:
+                            categorizer.learn_expense(st.session_state.username, draft_description, draft_category)
+                            st.success(message)
+                        else:
+                            st.error(message)
 
         # AI-Powered Categorization
         st.header("🤖 AI-Powered Categorization")
-        model, vectorizer = train_expense_categorizer(expenses_df)
         description = st.text_input("Enter Expense Description")
         if description:
-            predicted_category = predict_category(model, vectorizer, description)
+            predicted_category = categorizer.predict_categories(st.session_state.username, [description])[0]
             st.write(f"Predicted Category: {predicted_category}")
 
     else:
         st.info("No expenses added yet. Start by adding an expense in the sidebar!")
 
+    # Balances across splits and debts/loans, and the fewest transfers that settle them
+    balances = dashboard["balances"]
+    balances_df = get_balances_df(st.session_state.username, balances)
+    if not balances_df.empty:
+        st.header("🤝 Balances")
+        st.caption("Positive balances are owed to you, negative ones you owe.")
+        st.dataframe(balances_df, use_container_width=True)
+        st.subheader("Settle Up")
+        st.dataframe(get_settlement_df(st.session_state.username, balances), use_container_width=True)
+
+    # The user's other records
+    with st.expander("🧾 Income, Debts & Recurring Expenses"):
+        for title, records in (
+            ("Income", dashboard["income"]),
+            ("Debts & Loans", dashboard["debts"]),
+            ("Recurring Expenses", dashboard["recurring"]),
+        ):
+            st.subheader(title)
+            if records:
+                st.dataframe(records, use_container_width=True)
+            else:
+                st.caption("None yet.")
+
+# Where the time went, per instrumented function (see backend/metrics.py)
+def performance_panel(rerun_checkpoint):
+    with st.sidebar:
+        st.header("⏱️ Performance")
+        scope = st.radio("Calls", ["This rerun", "Since start"], horizontal=True)
+        rows = metrics.snapshot(rerun_checkpoint if scope == "This rerun" else None)
+        st.dataframe(rows, use_container_width=True)
+        st.download_button("Download Prometheus Metrics", metrics.prometheus_text(), file_name="metrics.prom")
+        if st.button("Reset Counters"):
+            metrics.reset()
+
+
 # Run the app
 if st.session_state.username:
-    main_app_page()
+    rerun_checkpoint = metrics.checkpoint() if st.session_state.get("show_performance") else None
+    with metrics.measure("app.main_app_page"):
+        main_app_page()
+    if st.sidebar.checkbox("Show Performance Panel", key="show_performance"):
+        performance_panel(rerun_checkpoint)
 else:
     login_signup_page()
\ No newline at end of file
@@ -0,0 +1,399 @@
+"""
+Monthly buckets for cold expense history.
+
+archive_expenses (in each storage backend) moves a user's expenses dated
+before a cutoff into one bucket per user and month and deletes the
+originals. A bucket stores its rows column by column, in (date, _id) order:
+
+    ids                  ObjectIds, indexed so an archived expense can
+                         still be found to edit or delete it
+    dates                int64 seconds since the epoch  \
+    amounts              float64                         | packed bytes
+    recurring            uint8                           |
+    recurrence_periods   int32, 0 for none              /
+    category_values / category_codes, currency_values / currency_codes
+                         the distinct values, and a uint16 code per row
+    descriptions         one string per row
+    import_hashes        one hash or None per row, indexed for import dedup
+
+plus precomputed totals: count, total, first and last date, and one [day,
+category, currency, total, count] row per distinct key. compute_daily_rows,
+get_expense_totals and group_expenses read only those (or, when amounts are
+filtered, only the dates, amounts and categories), so they never unpack
+descriptions or ids.
+
+Archiving doesn't change spending, so summaries and budget counters are
+left alone. The read paths merge buckets with the hot expenses: in the
+backends get_expenses, find_expenses, get_expenses_page, get_expense_totals,
+group_expenses, compute_daily_rows and exports, and in backend/expenses.py
+get_expenses_df, which the calculate_*_spending helpers work on. Editing or
+deleting an archived expense moves it back to the hot expenses first. Only
+whole months are archived; archiving a month again (after expenses were
+added with old dates) merges the new ones into its bucket.
+
+ARCHIVE_AFTER_DAYS (default 0, off) makes the batch runner (backend/batch.py)
+archive every user's expenses older than that many days.
+
+Usage:
+    python -m backend.archive <days> [username]
+"""
+import os
+import sys
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from bson.objectid import ObjectId
+
+from backend.records import ALL_CATEGORIES, normalize_date
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "0"))
+# Bucket fields holding the rows; the rest are the key and the totals
+PACKED_FIELDS = ("ids", "dates", "amounts", "recurring", "recurrence_periods", "category_values", "category_codes",
+                 "currency_values", "currency_codes", "descriptions", "import_hashes")
+# Fields totals and grouping read (see totals_fields and group_fields): the
+# bucket totals without filters, the totals rows when filtering by date or
+# category, and the columns they filter and sum when amounts are filtered
+SPAN_FIELDS = ("username", "month", "count", "total", "first_date", "last_date")
+TOTALS_FIELDS = ("username", "month", "totals")
+FILTER_FIELDS = ("username", "month", "dates", "amounts", "category_values", "category_codes")
+_EPOCH = datetime(1970, 1, 1)
+
+
+def month_key(value):
+    return value.strftime("%Y-%m")
+
+
+# (first, last) month keys a date range touches, for selecting buckets
+def range_months(date_range):
+    if not date_range:
+        return None
+    return month_key(normalize_date(date_range[0])), month_key(normalize_date(date_range[1]))
+
+
+def _unfiltered(date_range, category, amount_range):
+    return not date_range and (not category or category == ALL_CATEGORIES) and amount_range is None
+
+
+# Bucket fields get_expense_totals needs for these filters
+def totals_fields(date_range=None, category=None, amount_range=None):
+    return SPAN_FIELDS if _unfiltered(date_range, category, amount_range) else group_fields(amount_range)
+
+
+# Bucket fields group_expenses needs for these filters
+def group_fields(amount_range=None):
+    return TOTALS_FIELDS if amount_range is None else FILTER_FIELDS
+
+
+# ("YYYY-MM-DD", "YYYY-MM-DD") bounding the days wholly inside a date range,
+# for filtering the per-day totals rows
+def _day_bounds(date_range):
+    start, end = (normalize_date(value) for value in date_range)
+    if start.time() != time():
+        start += timedelta(days=1)
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+
+# First day of the month `days` days before as_of (default today); whole
+# months before it get archived
+def archive_cutoff(days, as_of=None):
+    day = (as_of or datetime.today()) - timedelta(days=days)
+    return datetime(day.year, day.month, 1)
+
+
+def _encode_labels(values):
+    labels, codes = [], {}
+    packed = np.empty(len(values), dtype="<u2")
+    for index, value in enumerate(values):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(labels)
+            labels.append(value)
+        packed[index] = code
+    return labels, packed.tobytes()
+
+
+def _decode_labels(labels, codes):
+    return np.array(labels, dtype=object)[np.frombuffer(codes, dtype="<u2")] if labels else np.array([], dtype=object)
+
+
+# The bucket of one user and month from expense documents; a later document
+# with the same _id replaces an earlier one
+def pack_bucket(username, month, documents):
+    rows = sorted({document["_id"]: document for document in documents}.values(),
+                  key=lambda document: (document["date"], document["_id"]))
+    totals = {}
+    for row in rows:
+        key = (row["date"].strftime("%Y-%m-%d"), row.get("category"), row.get("currency") or "USD")
+        total, count = totals.get(key, (0.0, 0))
+        totals[key] = (total + float(row["amount"]), count + 1)
+    amounts = np.array([row["amount"] for row in rows], dtype="<f8")
+    category_values, category_codes = _encode_labels([row.get("category") for row in rows])
+    currency_values, currency_codes = _encode_labels([row.get("currency") for row in rows])
+    return {
+        "username": username,
+        "month": month,
+        "count": len(rows),
+        "total": float(amounts.sum()),
+        "first_date": rows[0]["date"] if rows else None,
+        "last_date": rows[-1]["date"] if rows else None,
+        "totals": [[day, category, currency, total, count]
+                   for (day, category, currency), (total, count) in totals.items()],
+        "ids": [ObjectId(row["_id"]) for row in rows],
+        "dates": np.array([(row["date"] - _EPOCH) // timedelta(seconds=1) for row in rows], dtype="<i8").tobytes(),
+        "amounts": amounts.tobytes(),
+        "recurring": np.array([bool(row.get("recurring")) for row in rows], dtype="u1").tobytes(),
+        "recurrence_periods": np.array([row.get("recurrence_period") or 0 for row in rows], dtype="<i4").tobytes(),
+        "category_values": category_values,
+        "category_codes": category_codes,
+        "currency_values": currency_values,
+        "currency_codes": currency_codes,
+        "descriptions": [row.get("description") for row in rows],
+        "import_hashes": [row.get("import_hash") for row in rows],
+        "archived_at": datetime.utcnow(),
+    }
+
+
+# A bucket's rows as columns: numpy arrays, plus lists for ids, descriptions
+# and hashes. Only the fields the bucket was read with are decoded.
+def bucket_columns(bucket):
+    columns = {}
+    if "ids" in bucket:
+        columns["_id"] = bucket["ids"]
+    if "dates" in bucket:
+        columns["date"] = np.frombuffer(bucket["dates"], dtype="<i8").astype("datetime64[s]")
+    if "amounts" in bucket:
+        columns["amount"] = np.frombuffer(bucket["amounts"], dtype="<f8")
+    if "recurring" in bucket:
+        columns["recurring"] = np.frombuffer(bucket["recurring"], dtype="u1").astype(bool)
+    if "recurrence_periods" in bucket:
+        columns["recurrence_period"] = np.frombuffer(bucket["recurrence_periods"], dtype="<i4")
+    if "category_codes" in bucket:
+        columns["category_code"] = np.frombuffer(bucket["category_codes"], dtype="<u2")
+        columns["category"] = _decode_labels(bucket["category_values"], bucket["category_codes"])
+    if "currency_codes" in bucket:
+        columns["currency"] = _decode_labels(bucket["currency_values"], bucket["currency_codes"])
+    if "descriptions" in bucket:
+        columns["description"] = bucket["descriptions"]
+    if "import_hashes" in bucket:
+        columns["import_hash"] = bucket["import_hashes"]
+    return columns
+
+
+def _mask(columns, date_range=None, category=None, amount_range=None):
+    mask = np.ones(len(columns["amount"]), dtype=bool)
+    if date_range:
+        start, end = (np.datetime64(normalize_date(value), "s") for value in date_range)
+        mask &= (columns["date"] >= start) & (columns["date"] <= end)
+    if category and category != ALL_CATEGORIES:
+        mask &= columns["category"] == category
+    if amount_range:
+        mask &= (columns["amount"] >= float(amount_range[0])) & (columns["amount"] <= float(amount_range[1]))
+    return mask
+
+
+# Row `index` of a bucket as the expense document it was archived from
+def _document(bucket, columns, index):
+    document = {
+        "_id": columns["_id"][index],
+        "username": bucket["username"],
+        "date": columns["date"][index].item(),
+        "category": columns["category"][index],
+        "description": columns["description"][index],
+        "amount": float(columns["amount"][index]),
+        "currency": columns["currency"][index],
+        "recurring": bool(columns["recurring"][index]),
+        "recurrence_period": int(columns["recurrence_period"][index]) or None,
+        "updated_at": bucket["archived_at"],
+    }
+    if columns["import_hash"][index] is not None:
+        document["import_hash"] = columns["import_hash"][index]
+    return document
+
+
+# Archived expenses matching the filters, as expense documents
+def iter_bucket_expenses(buckets, date_range=None, category=None, amount_range=None):
+    for bucket in buckets:
+        columns = bucket_columns(bucket)
+        for index in np.flatnonzero(_mask(columns, date_range, category, amount_range)):
+            yield _document(bucket, columns, index)
+
+
+# A document cut down to a Mongo-style projection ({field: 1, ...} and/or "_id": 0)
+def project_document(document, projection):
+    if not projection:
+        return document
+    fields = {field for field, wanted in projection.items() if wanted and field != "_id"}
+    if fields:
+        document = {field: value for field, value in document.items() if field in fields or field == "_id"}
+    if not projection.get("_id", 1):
+        document = {field: value for field, value in document.items() if field != "_id"}
+    return document
+
+
+# The expense `expense_id` out of its bucket, and the bucket without it (None when empty)
+def remove_from_bucket(bucket, expense_id):
+    expense_id = ObjectId(expense_id)
+    documents = list(iter_bucket_expenses([bucket]))
+    removed = next(document for document in documents if document["_id"] == expense_id)
+    rest = [document for document in documents if document["_id"] != expense_id]
+    removed["updated_at"] = datetime.utcnow()
+    return removed, pack_bucket(bucket["username"], bucket["month"], rest) if rest else None
+
+
+# Totals rows of the buckets matching a date range and category, compared
+# by day: (day, category, total, count)
+def _totals_rows(buckets, date_range=None, category=None):
+    first, last = _day_bounds(date_range) if date_range else (None, None)
+    for bucket in buckets:
+        for day, row_category, _, total, count in bucket["totals"]:
+            if (date_range and not first <= day <= last) or (
+                    category and category != ALL_CATEGORIES and row_category != category):
+                continue
+            yield day, row_category, total, count
+
+
+# get_expense_totals' dict with the archived expenses matching the filters
+# added; buckets are read with totals_fields(date_range, category, amount_range)
+def add_bucket_totals(totals, buckets, date_range=None, category=None, amount_range=None):
+    spans = []
+    if _unfiltered(date_range, category, amount_range):
+        for bucket in buckets:
+            totals["count"] += bucket["count"]
+            totals["total"] += bucket["total"]
+            spans += [bucket["first_date"], bucket["last_date"]]
+    elif amount_range is None:
+        days = set()
+        for day, _, total, count in _totals_rows(buckets, date_range, category):
+            totals["count"] += count
+            totals["total"] += total
+            days.add(day)
+        if days:
+            spans = [datetime.strptime(min(days), "%Y-%m-%d"), datetime.strptime(max(days), "%Y-%m-%d")]
+    else:
+        for bucket in buckets:
+            columns = bucket_columns(bucket)
+            mask = _mask(columns, date_range, category, amount_range)
+            if not mask.any():
+                continue
+            dates = columns["date"][mask]
+            totals["count"] += int(mask.sum())
+            totals["total"] += float(columns["amount"][mask].sum())
+            spans += [dates.min().item(), dates.max().item()]
+    if spans:
+        first, last = min(spans), max(spans)
+        totals["first_date"] = min(totals["first_date"], first) if totals["first_date"] else first
+        totals["last_date"] = max(totals["last_date"], last) if totals["last_date"] else last
+    return totals
+
+
+# [(key, amount)] of one bucket's rows selected by mask, grouped by day, month or category
+def _group_bucket(bucket, columns, mask, by):
+    amounts = columns["amount"][mask]
+    if not len(amounts):
+        return []
+    if by == "month":
+        return [(bucket["month"], float(amounts.sum()))]
+    if by == "category":
+        codes = columns["category_code"][mask]
+        sums = np.bincount(codes, weights=amounts)
+        return [(bucket["category_values"][code], float(sums[code])) for code in np.unique(codes)]
+    days, inverse = np.unique(columns["date"][mask].astype("datetime64[D]"), return_inverse=True)
+    return [(day.item(), float(total)) for day, total in zip(days, np.bincount(inverse, weights=amounts))]
+
+
+# group_expenses' [(key, amount)] rows with the archived expenses added;
+# buckets are read with group_fields(amount_range)
+def add_bucket_groups(rows, buckets, by, date_range=None, category=None, amount_range=None):
+    grouped = dict(rows)
+    found = False
+    if amount_range is None:
+        days = {}
+        for day, row_category, total, _ in _totals_rows(buckets, date_range, category):
+            found = True
+            if by == "day":
+                key = days.get(day) or days.setdefault(day, datetime.strptime(day, "%Y-%m-%d").date())
+            else:
+                key = day[:7] if by == "month" else row_category
+            grouped[key] = grouped.get(key, 0.0) + total
+    else:
+        for bucket in buckets:
+            columns = bucket_columns(bucket)
+            for key, total in _group_bucket(bucket, columns, _mask(columns, date_range, category, amount_range), by):
+                found = True
+                grouped[key] = grouped.get(key, 0.0) + total
+    if not found:
+        return rows
+    # Sorted like the databases sort them: a missing category first
+    return sorted(grouped.items(), key=lambda item: (item[0] is not None, item[0]))
+
+
+# compute_daily_rows' {(username, day, category, currency): (total, count)}
+# with the buckets' totals added
+def add_bucket_daily_rows(rows, buckets):
+    for bucket in buckets:
+        for day, category, currency, total, count in bucket["totals"]:
+            key = (bucket["username"], day, category, currency)
+            previous_total, previous_count = rows.get(key, (0.0, 0))
+            rows[key] = (previous_total + total, previous_count + count)
+    return rows
+
+
+# (first, last) months of the buckets a keyset page can take rows from:
+# within the date range, not after the cursor and, when the hot rows
+# already fill the page, not before the oldest of them
+def page_months(date_range, after, hot_rows, page_size):
+    first, last = range_months(date_range) or (None, None)
+    if after:
+        cursor_month = month_key(normalize_date(after[0]))
+        last = min(last, cursor_month) if last else cursor_month
+    if len(hot_rows) > page_size:
+        oldest = month_key(hot_rows[-1]["date"])
+        first = max(first, oldest) if first else oldest
+    return first, last
+
+
+# Up to `limit` archived expenses for a keyset page, newest first: the rows
+# of `buckets` (newest month first) after the (date, id) cursor. Buckets are
+# only read until the page is full.
+def page_bucket_expenses(buckets, limit, after=None, date_range=None, category=None, amount_range=None):
+    rows = []
+    for bucket in buckets:
+        columns = bucket_columns(bucket)
+        mask = _mask(columns, date_range, category, amount_range)
+        if after:
+            after_date = np.datetime64(after[0], "s")
+            ids = np.array([str(expense_id) for expense_id in columns["_id"]], dtype="U24")
+            mask &= (columns["date"] < after_date) | ((columns["date"] == after_date) & (ids < str(after[1])))
+        for index in np.flatnonzero(mask)[::-1][:limit - len(rows)]:
+            rows.append(_document(bucket, columns, index))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+# One keyset page (rows, next cursor) from hot and archived rows that are
+# each sorted newest first
+def merge_page(hot, archived, page_size):
+    rows = sorted(hot + archived, key=lambda row: (row["date"], str(row["_id"])), reverse=True)
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, (rows[-1]["date"], str(rows[-1]["_id"]))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or not sys.argv[1].isdigit():
+        print(__doc__)
+        sys.exit(2)
+
+    from backend.repository import get_repository
+
+    repository = get_repository()
+    cutoff = archive_cutoff(int(sys.argv[1]))
+    usernames = sys.argv[2:] or repository.iter_usernames()
+    archived = buckets = 0
+    for name in usernames:
+        user_archived, user_buckets = repository.archive_expenses(name, cutoff)
+        archived += user_archived
+        buckets += user_buckets
+    print(f"Archived {archived} expenses dated before {cutoff:%Y-%m-%d} into {buckets} monthly buckets.")
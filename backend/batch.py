@@ -0,0 +1,224 @@
+"""
+Headless batch run over every user.
+
+Does the periodic work that otherwise only happens when a user opens the
+app, for each user:
+
+    recurring   stores the occurrences of their recurring rules that are due
+                by as_of as expenses (so summaries, budget counters and
+                exports include them) and advances each rule's
+                materialized_through, after which reads stop expanding them
+    rollups     rebuilds their summaries and budget counters if they drifted
+                from the raw expenses
+    budgets     evaluates their budgets for the periods containing as_of,
+                queueing an alert email for every new crossing
+    archive     with ARCHIVE_AFTER_DAYS set, moves their expenses older than
+                that into monthly buckets (see backend/archive.py)
+
+Users are sharded by a stable hash of the username over a process pool, one
+shard per process, and each shard walks its users in username order. Every
+CHECKPOINT_EVERY users a shard rewrites its checkpoint file (last username
+done plus counters) under BATCH_CHECKPOINT_DIR, so running again for the
+same as_of and process count resumes after the last checkpointed user, and
+a finished shard is not run again (delete its file to redo it). A user whose
+steps raise is recorded with the error under "failed" in the shard's result
+and checkpoint, and the shard moves on. Every step
+is idempotent: occurrences carry an import hash (checked against archived
+expenses too), rollups are only rebuilt on drift, each alert level is raised
+once per period and archiving a month again merges into its bucket. So users
+redone after an interruption, or a resume with a different process count
+(which starts over), store nothing twice.
+
+Settings: BATCH_PROCESSES (default: CPU count), BATCH_CHECKPOINT_DIR
+(default data/batch_checkpoints), BATCH_CHECKPOINT_EVERY (default 50),
+ARCHIVE_AFTER_DAYS (default 0, no archiving).
+
+Usage:
+    python -m backend.batch [processes] [as_of YYYY-MM-DD]
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from backend.archive import ARCHIVE_AFTER_DAYS, archive_cutoff
+from backend.records import build_expense_document, normalize_date
+from backend.recurrence import occurrence_dates, unmaterialized_start
+from backend.repository import STORAGE_BACKEND, SQLITE_PATH, create_repository, get_repository, set_repository
+from backend.summaries import check_summary_drift, rebuild_summaries
+
+BATCH_PROCESSES = int(os.getenv("BATCH_PROCESSES", str(os.cpu_count() or 1)))
+BATCH_CHECKPOINT_DIR = os.getenv(
+    "BATCH_CHECKPOINT_DIR", os.path.join(os.path.dirname(__file__), "..", "data", "batch_checkpoints")
+)
+CHECKPOINT_EVERY = int(os.getenv("BATCH_CHECKPOINT_EVERY", "50"))
+
+
+# Shard of a username; crc32 rather than hash(), which is salted per process
+def shard_of(username, shards):
+    return zlib.crc32(username.encode("utf-8")) % shards
+
+
+def _occurrence_hash(rule_id, day):
+    return hashlib.sha256(f"recurring|{rule_id}|{day}".encode("utf-8")).hexdigest()
+
+
+# Store the user's recurring occurrences due by as_of as expenses, then
+# advance each rule's materialized_through. A crash between the two steps is
+# harmless: the rerun's inserts are skipped as duplicate import hashes.
+# Returns the number of expenses stored.
+def materialize_recurring(username, as_of):
+    repository = get_repository()
+    stored = 0
+    for rule in repository.get_recurring_rules(username):
+        dates = occurrence_dates(rule, unmaterialized_start(rule, rule["start_date"]), as_of)
+        if not len(dates):
+            continue
+        documents = []
+        for day in dates.astype(object):
+            document = build_expense_document(username, day, rule["category"], rule["description"], rule["amount"],
+                                              rule.get("currency") or "USD", True, rule.get("interval_days"))
+            document["import_hash"] = _occurrence_hash(rule["_id"], day)
+            documents.append(document)
+        inserted, _ = repository.insert_expenses(documents)
+        stored += inserted
+        repository.update_recurring_expense(rule["_id"], materialized_through=as_of)
+    return stored
+
+
+# Rebuild the user's summaries and budget counters if they drifted from the
+# raw expenses; returns whether they had
+def refresh_rollups(username):
+    if not check_summary_drift(username):
+        return False
+    rebuild_summaries(username)
+    return True
+
+
+# Queue alerts for budgets crossed in the periods containing as_of; returns
+# the new crossings
+def notify_budgets(username, as_of):
+    return get_repository().evaluate_budget_thresholds(username, [as_of])
+
+
+# Move the user's expenses older than archive_after_days (whole months) into
+# buckets; returns the number archived
+def archive_history(username, as_of, archive_after_days=ARCHIVE_AFTER_DAYS):
+    if archive_after_days <= 0:
+        return 0
+    archived, _ = get_repository().archive_expenses(username, archive_cutoff(archive_after_days, as_of))
+    return archived
+
+
+# Every step for one user: (occurrences stored, rollups rebuilt, new alerts, expenses archived)
+def process_user(username, as_of):
+    occurrences = materialize_recurring(username, as_of)
+    rebuilt = refresh_rollups(username)
+    alerts = notify_budgets(username, as_of)
+    archived = archive_history(username, as_of)
+    return occurrences, rebuilt, len(alerts), archived
+
+
+def checkpoint_path(as_of, shard, shards, directory=BATCH_CHECKPOINT_DIR):
+    return os.path.join(directory, f"{as_of:%Y-%m-%d}-shard-{shard + 1:03d}-of-{shards:03d}.json")
+
+
+def _read_checkpoint(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# Replace path atomically, so an interrupted write leaves the previous checkpoint
+def _write_checkpoint(path, state):
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(temporary, path)
+
+
+# Process one shard's users in username order, after the last one its
+# checkpoint records. Runs in a worker process, with its own repository.
+# Returns the checkpoint state (failed users as {"username", "error"}) plus
+# the users and seconds of this run.
+def run_shard(shard, shards, as_of, backend=STORAGE_BACKEND, sqlite_path=SQLITE_PATH,
+              directory=BATCH_CHECKPOINT_DIR):
+    set_repository(create_repository(backend, sqlite_path))
+    os.makedirs(directory, exist_ok=True)
+    path = checkpoint_path(as_of, shard, shards, directory)
+    state = _read_checkpoint(path) or {
+        "last_username": None, "users": 0, "occurrences": 0, "rebuilt": 0, "alerts": 0, "archived": 0, "failed": [],
+        "done": False
+    }
+    started = time.perf_counter()
+    processed = 0
+    if not state["done"]:
+        for username in get_repository().iter_usernames(after=state["last_username"]):
+            if shard_of(username, shards) != shard:
+                continue
+            try:
+                occurrences, rebuilt, alerts, archived = process_user(username, as_of)
+                state["occurrences"] += occurrences
+                state["rebuilt"] += rebuilt
+                state["alerts"] += alerts
+                state["archived"] = state.get("archived", 0) + archived
+            except Exception as e:  # One user's bad data shouldn't stop the shard
+                state["failed"].append({"username": username, "error": f"{type(e).__name__}: {e}"})
+            state["last_username"] = username
+            state["users"] += 1
+            processed += 1
+            if processed % CHECKPOINT_EVERY == 0:
+                _write_checkpoint(path, state)
+        state["done"] = True
+        _write_checkpoint(path, state)
+    return {**state, "shard": shard, "run_users": processed, "run_seconds": time.perf_counter() - started}
+
+
+# Run every shard for as_of (default today) on `processes` processes; returns
+# per-shard results and the throughput of this run
+def run_batch(processes=BATCH_PROCESSES, as_of=None, backend=STORAGE_BACKEND, sqlite_path=SQLITE_PATH,
+              directory=BATCH_CHECKPOINT_DIR):
+    as_of = datetime.combine(normalize_date(as_of or datetime.today()).date(), datetime.min.time())
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(run_shard, shard, processes, as_of, backend, sqlite_path, directory)
+                   for shard in range(processes)]
+        shards = [future.result() for future in futures]
+    seconds = time.perf_counter() - started
+    users = sum(shard["run_users"] for shard in shards)
+    return {
+        "as_of": as_of,
+        "processes": processes,
+        "shards": shards,
+        "users": users,
+        "seconds": seconds,
+        "users_per_second": users / seconds if seconds else 0.0,
+    }
+
+
+def print_report(report):
+    print(f"Batch for {report['as_of']:%Y-%m-%d} on {report['processes']} processes: {report['users']} users "
+          f"in {report['seconds']:.1f} s, {report['users_per_second']:.1f} users/s")
+    print(f"{'shard':>6}{'users':>9}{'this run':>10}{'users/s':>10}{'occurrences':>13}{'rebuilt':>9}"
+          f"{'alerts':>8}{'archived':>10}{'failed':>8}")
+    for shard in report["shards"]:
+        rate = shard["run_users"] / shard["run_seconds"] if shard["run_seconds"] else 0.0
+        print(f"{shard['shard'] + 1:>6}{shard['users']:>9}{shard['run_users']:>10}{rate:>10.1f}"
+              f"{shard['occurrences']:>13}{shard['rebuilt']:>9}{shard['alerts']:>8}{shard.get('archived', 0):>10}"
+              f"{len(shard['failed']):>8}")
+
+
+if __name__ == "__main__":
+    report = run_batch(int(sys.argv[1]) if len(sys.argv) > 1 else BATCH_PROCESSES,
+                       sys.argv[2] if len(sys.argv) > 2 else None)
+    print_report(report)
+    failed = [failure for shard in report["shards"] for failure in shard["failed"]]
+    for failure in failed:
+        print(f"Batch error for {failure['username']}: {failure['error']}")
+    sys.exit(1 if failed else 0)
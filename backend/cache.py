@@ -0,0 +1,140 @@
+"""
+Process-wide, per-user read cache.
+
+Every mutating function in the storage backends calls bump_version(username).
+Cached values are stored with the version they were loaded at, so a write
+makes the next read reload instead of returning stale data. That version only
+sees this process's writes; values another process can change (the batch
+runner, other app servers) are read with a `stamp`, a cheap read of a
+per-user counter kept in storage, and reloaded when it has moved. The cache holds at
+most MAX_CACHED_ENTRIES values taking at most MAX_CACHED_BYTES (DataFrames
+measured with memory_usage(deep=True)) and evicts the least recently used
+ones. A user's version is kept only while they have cached values or a load
+in flight, so the bookkeeping doesn't grow with every user ever seen.
+"""
+import os
+import sys
+import threading
+from collections import Counter, OrderedDict
+
+import pandas as pd
+
+MAX_CACHED_ENTRIES = int(os.getenv("EXPENSE_CACHE_MAX_ENTRIES", "256"))
+MAX_CACHED_BYTES = int(os.getenv("EXPENSE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_versions = {}  # username -> write version, while the user has entries or loads
+_entries = OrderedDict()  # (namespace, username) -> (version, value, size in bytes, stamp)
+_user_entries = Counter()  # username -> cached entries
+_loading = Counter()  # username -> loads in flight
+_usage = {"bytes": 0}
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+# Approximate memory held by a cached value
+def value_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(value_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(value_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+# Current write version for a user
+def get_version(username):
+    with _lock:
+        return _versions.get(username, 0)
+
+
+# Mark every cached value for a user as stale
+def bump_version(username):
+    with _lock:
+        if not _user_entries[username] and not _loading[username]:
+            # Nothing cached or loading to invalidate
+            _forget_user(username)
+            return 0
+        _versions[username] = _versions.get(username, 0) + 1
+        return _versions[username]
+
+
+# Drop a user's version once nothing refers to it. Caller holds _lock.
+def _forget_user(username):
+    if not _user_entries[username] and not _loading[username]:
+        _versions.pop(username, None)
+        del _user_entries[username]
+        del _loading[username]
+
+
+# Caller holds _lock
+def _remove(key):
+    _, _, size, _ = _entries.pop(key)
+    _usage["bytes"] -= size
+    _user_entries[key[1]] -= 1
+    _forget_user(key[1])
+
+
+# Return the cached value for (namespace, username), calling loader() on a miss
+def get_or_load(namespace, username, loader):
+    return get_or_refresh(namespace, username, lambda previous: loader())
+
+
+# Like get_or_load, but on a miss refresh(previous) gets the stale value (or
+# None) so it can update it incrementally instead of loading from scratch.
+# With stamp, a cached value is only used while stamp() returns what it did
+# before the value was loaded.
+def get_or_refresh(namespace, username, refresh, stamp=None):
+    key = (namespace, username)
+    # Read before loading, so a write during the load leaves a newer stamp
+    current = stamp() if stamp is not None else None
+    with _lock:
+        version = _versions.get(username, 0)
+        entry = _entries.get(key)
+        if entry is not None and entry[0] == version and entry[3] == current:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry[1]
+        _stats["misses"] += 1
+        _loading[username] += 1
+
+    try:
+        value = refresh(entry[1] if entry is not None else None)
+    except BaseException:
+        with _lock:
+            _loading[username] -= 1
+            _forget_user(username)
+        raise
+    size = value_size(value)
+
+    with _lock:
+        _loading[username] -= 1
+        # Only store if no write happened while loading, and the value fits at all
+        if _versions.get(username, 0) == version and size <= MAX_CACHED_BYTES:
+            if key in _entries:
+                _remove(key)
+            _entries[key] = (version, value, size, current)
+            _usage["bytes"] += size
+            _user_entries[username] += 1
+            _versions[username] = version
+            while len(_entries) > MAX_CACHED_ENTRIES or _usage["bytes"] > MAX_CACHED_BYTES:
+                _remove(next(iter(_entries)))
+                _stats["evictions"] += 1
+        else:
+            _forget_user(username)
+    return value
+
+
+# Hit/miss/eviction counters plus current size
+def cache_stats():
+    with _lock:
+        return {**_stats, "entries": len(_entries), "max_entries": MAX_CACHED_ENTRIES,
+                "bytes": _usage["bytes"], "max_bytes": MAX_CACHED_BYTES, "tracked_users": len(_versions)}
+
+
+def clear_cache():
+    with _lock:
+        for key in list(_entries):
+            _remove(key)
+        for name in _stats:
+            _stats[name] = 0
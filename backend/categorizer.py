@@ -0,0 +1,240 @@
+"""
+Per-user, incrementally trained expense categorizer.
+
+Descriptions are featurized with a fixed-size HashingVectorizer, so there is
+no vocabulary to refit, and a MultinomialNB model is updated with
+partial_fit whenever expenses are added. Only the model's counts are stored
+in the categorizer_models collection, as plain numpy arrays (no pickles, so
+loading a stored model can't run code), and the estimator is rebuilt from
+them; a stored model in another format or shape is refit from the history
+instead of being used. Loaded models are kept in a process-wide LRU cache.
+Updates are saved at most every SAVE_INTERVAL_SECONDS per user rather than
+on every expense, and when a model leaves the cache or the process exits.
+
+Each user's model has its own lock, so one user's refit on their full
+history doesn't hold up categorization for everyone else.
+"""
+import atexit
+import io
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.naive_bayes import MultinomialNB
+
+from backend.repository import get_repository
+from backend.expenses import get_expenses_df
+
+DEFAULT_CATEGORIES = ["Food", "Transport", "Entertainment", "Utilities", "Other"]
+# 2**14 features keeps a 5-class model around 1 MB, well inside a Mongo document
+N_FEATURES = 2 ** 14
+MAX_CACHED_MODELS = 128
+TRAINING_BATCH_SIZE = 10000
+SAVE_INTERVAL_SECONDS = 60
+# Bumped when the stored payload changes shape
+MODEL_FORMAT = 2
+
+_vectorizer = HashingVectorizer(n_features=N_FEATURES, alternate_sign=False, norm=None)
+_lock = threading.Lock()  # guards _models and _user_locks only
+_models = OrderedDict()  # username -> {"model", "classes", "samples_seen", "unsaved", "saved_at"}
+_evicted = {}  # username -> entry dropped from _models before its updates were saved
+_user_locks = {}  # username -> (lock held while reading, training or updating their model, threads using it)
+
+
+def _featurize(descriptions):
+    return _vectorizer.transform(["" if text is None else str(text) for text in descriptions])
+
+
+# Hold a user's lock; it exists only while some thread is using it
+@contextmanager
+def _user_lock(username):
+    with _lock:
+        lock, users = _user_locks.get(username, (None, 0))
+        lock = lock or threading.Lock()
+        _user_locks[username] = (lock, users + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _lock:
+            users = _user_locks[username][1] - 1
+            if users:
+                _user_locks[username] = (lock, users)
+            else:
+                del _user_locks[username]
+
+
+def _remember(username, entry):
+    with _lock:
+        _models[username] = entry
+        _models.move_to_end(username)
+        while len(_models) > MAX_CACHED_MODELS:
+            evicted, old = _models.popitem(last=False)
+            if old["unsaved"]:
+                _evicted[evicted] = old
+
+
+def _cached(username):
+    with _lock:
+        entry = _models.get(username)
+        if entry is not None:
+            _models.move_to_end(username)
+        return entry
+
+
+# The model's counts as a compressed .npz of plain arrays
+def _dump_model(model):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, format=np.array(MODEL_FORMAT), classes=model.classes_.astype(str),
+                        class_count=model.class_count_, feature_count=model.feature_count_)
+    return buffer.getvalue()
+
+
+# A MultinomialNB rebuilt from stored counts if they are in this format and
+# fit the stored classes, otherwise None
+def _load_model(stored):
+    try:
+        with np.load(io.BytesIO(bytes(stored["model"])), allow_pickle=False) as arrays:
+            if arrays["format"].shape != () or int(arrays["format"]) != MODEL_FORMAT:
+                return None
+            classes, class_count, feature_count = arrays["classes"], arrays["class_count"], arrays["feature_count"]
+    except Exception:
+        return None
+    if classes.tolist() != list(stored["classes"]) or class_count.shape != (len(classes),) \
+            or feature_count.shape != (len(classes), N_FEATURES):
+        return None
+    return _build_model(classes, class_count, feature_count)
+
+
+# A MultinomialNB with these counts, as partial_fit would leave it
+def _build_model(classes, class_count, feature_count):
+    model = MultinomialNB()
+    model.classes_ = np.asarray(classes)
+    model.class_count_ = np.asarray(class_count, dtype=np.float64)
+    model.feature_count_ = np.asarray(feature_count, dtype=np.float64)
+    model.n_features_in_ = N_FEATURES
+    if model.class_count_.sum():
+        model._update_class_log_prior()
+        model._update_feature_log_prob(model._check_alpha())
+    return model
+
+
+def _save(username, entry):
+    get_repository().save_categorizer_model(
+        username, _dump_model(entry["model"]), entry["classes"], entry["samples_seen"]
+    )
+    entry["unsaved"] = 0
+    entry["saved_at"] = time.monotonic()
+
+
+# Save the models that left the cache with updates not saved yet. Takes
+# their users' locks, so callers must not hold one.
+def _save_evicted():
+    while True:
+        with _lock:
+            if not _evicted:
+                return
+            username = next(iter(_evicted))
+        with _user_lock(username):
+            with _lock:
+                entry = _evicted.pop(username, None)
+            if entry is not None:
+                _save(username, entry)
+
+
+# Save every model with updates not saved yet
+def flush_models():
+    with _lock:
+        usernames = [username for username, entry in _models.items() if entry["unsaved"]]
+    for username in usernames:
+        with _user_lock(username):
+            entry = _cached(username)
+            if entry is not None and entry["unsaved"]:
+                _save(username, entry)
+    _save_evicted()
+
+
+atexit.register(flush_models)
+
+
+# Fit a fresh model on all of a user's expenses, in batches
+def _train_from_history(username, extra_categories=()):
+    df = get_expenses_df(username)
+    categories = sorted(set(DEFAULT_CATEGORIES) | set(df["category"].dropna().astype(str)) | set(extra_categories))
+    # Start from zero counts, so a user without expenses still gets a model to store
+    model = _build_model(categories, np.zeros(len(categories)), np.zeros((len(categories), N_FEATURES)))
+    for start in range(0, len(df), TRAINING_BATCH_SIZE):
+        batch = df.iloc[start:start + TRAINING_BATCH_SIZE]
+        model.partial_fit(_featurize(batch["description"]), batch["category"].astype(str), classes=categories)
+    return {"model": model, "classes": categories, "samples_seen": len(df), "unsaved": 0, "saved_at": 0.0}
+
+
+# Cached or stored model for a user, training one if none is usable.
+# Returns (entry, trained), trained is True if it was just fit on the history.
+# Caller holds the user's lock.
+def _get_entry(username):
+    entry = _cached(username)
+    if entry is not None:
+        return entry, False
+    with _lock:
+        entry = _evicted.pop(username, None)
+    if entry is not None:
+        _remember(username, entry)
+        return entry, False
+
+    stored = get_repository().load_categorizer_model(username)
+    model = _load_model(stored) if stored else None
+    trained = model is None
+    if model is not None:
+        entry = {"model": model, "classes": list(stored["classes"]), "samples_seen": stored["samples_seen"],
+                 "unsaved": 0, "saved_at": time.monotonic()}
+    else:
+        entry = _train_from_history(username)
+        _save(username, entry)
+    _remember(username, entry)
+    return entry, trained
+
+
+# Update a user's model with newly added expenses
+def learn_expenses(username, descriptions, categories):
+    categories = [str(category) for category in categories]
+    if not categories:
+        return
+    with _user_lock(username):
+        entry, trained = _get_entry(username)
+        if not trained:  # A fresh model already includes the new expenses
+            unseen = set(categories) - set(entry["classes"])
+            if unseen:
+                # MultinomialNB can't grow its class list, so refit with the new labels
+                entry = _train_from_history(username, unseen)
+                _save(username, entry)
+            else:
+                entry["model"].partial_fit(_featurize(descriptions), categories, classes=entry["classes"])
+                entry["samples_seen"] += len(categories)
+                entry["unsaved"] += len(categories)
+                if time.monotonic() - entry["saved_at"] >= SAVE_INTERVAL_SECONDS:
+                    _save(username, entry)
+            _remember(username, entry)
+    _save_evicted()
+
+
+def learn_expense(username, description, category):
+    learn_expenses(username, [description], [category])
+
+
+# Predict categories for many descriptions at once
+def predict_categories(username, descriptions):
+    descriptions = list(descriptions)
+    if not descriptions:
+        return []
+    with _user_lock(username):
+        entry, _ = _get_entry(username)
+        if entry["samples_seen"] == 0:
+            predictions = [None] * len(descriptions)
+        else:
+            predictions = [str(category) for category in entry["model"].predict(_featurize(descriptions))]
+    _save_evicted()
+    return predictions
@@ -0,0 +1,174 @@
+"""
+Spending charts for the visualizations section.
+
+render_chart(name, data) returns the chart as PNG bytes. Rendered images are
+kept in an LRU cache keyed by a hash of the aggregated data, so a Streamlit
+rerun with unchanged data does not draw anything. Figures are built with
+matplotlib.figure.Figure rather than pyplot, so no figure is ever registered
+globally (and nothing accumulates across reruns). The daily series is cut
+down to MAX_DAILY_POINTS with Largest-Triangle-Three-Buckets, which keeps
+spikes that plain averaging would flatten.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.figure import Figure
+
+MAX_DAILY_POINTS = int(os.getenv("CHART_MAX_DAILY_POINTS", "500"))
+MAX_CACHED_CHARTS = int(os.getenv("CHART_CACHE_MAX_ENTRIES", "64"))
+# Markers only help while the individual days can be told apart
+MAX_MARKED_POINTS = 60
+# Label every month up to this many, then every second, third, ...
+MAX_MONTH_LABELS = 24
+CHART_DPI = 100
+# Fixed margins that fit the rotated x labels; tight_layout would cost an extra draw
+MARGINS = {"left": 0.08, "right": 0.97, "top": 0.92, "bottom": 0.2}
+
+# Apply Seaborn's dark theme for a modern look
+sns.set_style("darkgrid")
+sns.set_palette("pastel")
+
+_lock = threading.Lock()
+_images = OrderedDict()  # (chart name, data hash) -> PNG bytes
+_stats = {"hits": 0, "misses": 0}
+
+
+# Indexes of the `threshold` points Largest-Triangle-Three-Buckets keeps
+def lttb_indices(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    bucket_size = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        next_end = min(int((bucket + 2) * bucket_size) + 1, n)
+        # Triangle between the last kept point, each candidate and the next bucket's centroid
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs(
+            (x[selected] - next_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (next_y - y[selected])
+        )
+        selected = start + int(areas.argmax())
+        indices[bucket + 1] = selected
+    return indices
+
+
+# Daily spending cut down to max_points days, sorted by date
+def downsample_daily(daily_spending, max_points=MAX_DAILY_POINTS):
+    df = pd.DataFrame({"date": pd.to_datetime(daily_spending["date"]), "amount": daily_spending["amount"]})
+    df = df.sort_values("date", ignore_index=True)
+    if len(df) <= max_points:
+        return df
+    keep = lttb_indices(df["date"].to_numpy(dtype="datetime64[ns]").astype(np.int64), df["amount"], max_points)
+    return df.iloc[keep].reset_index(drop=True)
+
+
+# 📈 Daily spending trend from get_daily_summary
+def daily_spending_figure(daily_spending):
+    df = downsample_daily(daily_spending)
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    marker = {"marker": "o", "markersize": 8} if len(df) <= MAX_MARKED_POINTS else {}
+    ax.plot(df["date"], df["amount"], linewidth=2, **marker)
+    ax.set_xlabel("Date", fontsize=12, fontweight="bold")
+    ax.set_ylabel("Total Amount ($)", fontsize=12, fontweight="bold")
+    ax.set_title("Daily Spending Trend", fontsize=14, fontweight="bold")
+    ax.tick_params(axis="x", rotation=45)
+    fig.subplots_adjust(**MARGINS)
+    return fig
+
+
+# 📊 Monthly totals from get_monthly_summary
+def monthly_spending_figure(monthly_spending):
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    months = monthly_spending["month"].astype(str).tolist()
+    positions = np.arange(len(months))
+    # Plain bars: sns.barplot would bootstrap an error bar for every single-value month
+    ax.bar(positions, monthly_spending["amount"], color=sns.color_palette()[0], edgecolor="black", linewidth=2)
+    step = max(1, -(-len(months) // MAX_MONTH_LABELS))
+    ax.set_xticks(positions[::step], months[::step])
+    ax.set_xlabel("Month", fontsize=12, fontweight="bold")
+    ax.set_ylabel("Total Amount ($)", fontsize=12, fontweight="bold")
+    ax.set_title("Monthly Spending Breakdown", fontsize=14, fontweight="bold")
+    ax.tick_params(axis="x", rotation=45)
+    fig.subplots_adjust(**MARGINS)
+    return fig
+
+
+# 🥧 Category shares from get_category_summary
+def category_spending_figure(category_spending):
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    colors = sns.color_palette("pastel")
+    ax.pie(category_spending["amount"], labels=category_spending["category"], autopct="%1.1f%%", colors=colors,
+           startangle=140)
+    ax.set_title("Spending by Category", fontsize=14, fontweight="bold")
+    return fig
+
+
+CHARTS = {
+    "daily": daily_spending_figure,
+    "monthly": monthly_spending_figure,
+    "category": category_spending_figure,
+}
+
+
+# Hash of a chart's input frame: its columns and every value
+def data_hash(df):
+    digest = hashlib.sha256(",".join(map(str, df.columns)).encode())
+    if not df.empty:
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def figure_png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=CHART_DPI)
+    return buffer.getvalue()
+
+
+# PNG bytes of chart `name` ("daily", "monthly" or "category") for its
+# aggregated data, drawn only when that data has not been rendered before
+def render_chart(name, data):
+    key = (name, data_hash(data))
+    with _lock:
+        image = _images.get(key)
+        if image is not None:
+            _images.move_to_end(key)
+            _stats["hits"] += 1
+            return image
+        _stats["misses"] += 1
+
+    image = figure_png(CHARTS[name](data))
+
+    with _lock:
+        _images[key] = image
+        _images.move_to_end(key)
+        while len(_images) > MAX_CACHED_CHARTS:
+            _images.popitem(last=False)
+    return image
+
+
+def chart_cache_stats():
+    with _lock:
+        return {**_stats, "entries": len(_images), "bytes": sum(map(len, _images.values()))}
+
+
+def clear_chart_cache():
+    with _lock:
+        _images.clear()
+        for name in _stats:
+            _stats[name] = 0
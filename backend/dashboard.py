@@ -0,0 +1,107 @@
+"""
+Concurrent reads for the dashboard.
+
+A rerun of the logged-in page used to issue its reads one after another, so
+its latency was the sum of every round trip. AsyncRepository starts each
+Repository call on a shared thread pool and returns a Future (pymongo and
+sqlite3 both release the GIL while they wait), and submit() does the same
+for any other function. load_dashboard() starts every read the page needs at
+once and returns them as one dict, so a rerun waits roughly as long as its
+slowest read:
+
+    has_expenses  whether the user has any expenses (a one-row page read)
+    daily, monthly, category
+                  spending summaries in base_currency (USD if the rates
+                  snapshot doesn't cover it)
+    base_currency the currency the summaries are in
+    missing_rates currencies of the user's expenses (or the requested base)
+                  without exchange rates, left out of the summaries
+    budgets       [(budget, status, alert message)]
+    balances      {person: net amount} over splits and debts/loans
+    income, debts, recurring
+                  the user's records, as get_income / get_debts /
+                  get_recurring_expenses return them
+    load_ms       wall time of the whole load
+
+DASHBOARD_WORKERS (default 8) sizes the pool; keep it at or below
+MONGO_MAX_POOL_SIZE. Futures rather than asyncio: importing asyncio (and the
+ssl module it pulls in) would add tens of milliseconds to the login page.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.repository import get_repository
+from backend.expenses import get_expenses_page_df
+from backend.rates import missing_rates
+from backend.summaries import get_converted_summaries
+from backend.utils import check_budget
+
+DASHBOARD_WORKERS = int(os.getenv("DASHBOARD_WORKERS", "8"))
+
+_executor = {"pool": None}
+_executor_lock = threading.Lock()
+
+
+# The process-wide read pool, created on first use
+def get_executor():
+    with _executor_lock:
+        if _executor["pool"] is None:
+            _executor["pool"] = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix="dashboard-read")
+        return _executor["pool"]
+
+
+# Start fn(*args, **kwargs) on the read pool; returns its Future
+def submit(fn, *args, **kwargs):
+    return get_executor().submit(fn, *args, **kwargs)
+
+
+# Non-blocking view of a Repository: every method call starts on the read
+# pool and returns a Future, e.g. AsyncRepository().get_debts(username).result()
+class AsyncRepository:
+    def __init__(self, repository=None):
+        self._repository = repository
+
+    def __getattr__(self, name):
+        method = getattr(self._repository or get_repository(), name)
+        return lambda *args, **kwargs: submit(method, *args, **kwargs)
+
+
+# [(budget, status, alert message)] for each of the user's budgets, the
+# statuses checked concurrently once the budgets are known
+def get_budget_statuses(username, budgets_future=None):
+    budgets = (budgets_future or AsyncRepository().get_budgets(username)).result()
+    checks = [submit(check_budget, username, budget["category"], budget["period"]) for budget in budgets]
+    return [(budget, *check.result()) for budget, check in zip(budgets, checks)]
+
+
+# Whether the user has stored any expenses, without loading them
+def has_expenses(username):
+    page, _ = get_expenses_page_df(username, page_size=1)
+    return not page.empty
+
+
+# Everything the dashboard shows, read concurrently (see the module docstring)
+def load_dashboard(username, base_currency="USD"):
+    started = time.perf_counter()
+    missing_base = missing_rates([base_currency])
+    if missing_base:
+        base_currency = "USD"
+    repository = AsyncRepository()
+    futures = {
+        "has_expenses": submit(has_expenses, username),
+        "summaries": submit(get_converted_summaries, username, base_currency),
+        "balances": repository.get_counterparty_balances(username),
+        "income": repository.get_income(username),
+        "debts": repository.get_debts(username),
+        "recurring": repository.get_recurring_expenses(username),
+    }
+    budgets = get_budget_statuses(username, repository.get_budgets(username))
+    bundle = {name: future.result() for name, future in futures.items()}
+    bundle["daily"], bundle["monthly"], bundle["category"], currencies = bundle.pop("summaries")
+    bundle["budgets"] = budgets
+    bundle["base_currency"] = base_currency
+    bundle["missing_rates"] = sorted(set(missing_base) | set(missing_rates(currencies)))
+    bundle["load_ms"] = (time.perf_counter() - started) * 1000
+    return bundle
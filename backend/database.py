@@ -1,68 +1,57 @@
-import email
-import streamlit as st
-from pymongo import MongoClient
+from itertools import chain, islice
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 from bson.objectid import ObjectId
+from bson.binary import Binary
 import bcrypt
-from dotenv import load_dotenv
-import os
 from datetime import datetime, timedelta, date
-from urllib.parse import quote_plus
+from backend.archive import (
+    TOTALS_FIELDS, iter_bucket_expenses, pack_bucket, remove_from_bucket, project_document, range_months,
+    page_months, totals_fields, group_fields, page_bucket_expenses, merge_page, add_bucket_totals, add_bucket_groups,
+    add_bucket_daily_rows
+)
+from backend.cache import bump_version as bump_cached_version
+from backend.metrics import instrument_module
+from backend.mongo_client import LazyCollection, run_in_transaction
+from backend.records import (
+    TOMBSTONE_RETENTION, MAX_NOTIFICATION_ATTEMPTS, ALL_CATEGORIES, BUDGET_PERIODS, BUDGET_WARNING_LEVEL,
+    BUDGET_EXCEEDED_LEVEL, DEBT_SIGNS, is_strong_password, normalize_date, build_expense_document, summary_deltas,
+    rebuilt_summaries, build_split_documents, budget_level, budget_alert, notification_failure_update
+)
+from backend.repository import Repository
 
-# Load environment variables
-load_dotenv()
-# Try to get MongoDB URI from environment variables (.env) or Streamlit secrets (if available)
-MONGO_URI = os.getenv("MONGO_URI")  # First, check if .env is available
+# Collections connect through the shared client on first use (see backend/mongo_client.py)
+users_collection = LazyCollection("users")
+expenses_collection = LazyCollection("expenses")
+income_collection = LazyCollection("income")
+# Materialized spending totals, kept in sync by the expense write functions
+expense_summaries_collection = LazyCollection("expense_summaries")  # per user x day x category x currency
+monthly_summaries_collection = LazyCollection("monthly_summaries")  # per user x month x category
+# Deleted expense ids, so cached snapshots can drop them on the next delta sync
+expense_tombstones_collection = LazyCollection("expense_tombstones")
+# Expenses older than the archive cutoff, packed per user x month (see backend/archive.py)
+expense_buckets_collection = LazyCollection("expense_buckets")
+
+# Rollups and exports read with MONGO_ANALYTICS_READ_PREFERENCE
+expenses_analytics = LazyCollection("expenses", analytics=True)
+expense_summaries_analytics = LazyCollection("expense_summaries", analytics=True)
+monthly_summaries_analytics = LazyCollection("monthly_summaries", analytics=True)
+expense_buckets_analytics = LazyCollection("expense_buckets", analytics=True)
+# Per-user write counters, so every app process can tell its cached reads are stale
+user_versions_collection = LazyCollection("user_versions")
+
+
+# Count a write to the user's data in the database, for other processes, and
+# in this process's cache
+def bump_version(username):
+    user_versions_collection.update_one({"username": username}, {"$inc": {"version": 1}}, upsert=True)
+    bump_cached_version(username)
 
-# If .env doesn't exist, check Streamlit Secrets (only in deployment)
-if not MONGO_URI:
-    try:
-        MONGO_URI = st.secrets["MONGO_URI"]
-    except Exception:
-        MONGO_URI = None
-
-# Ensure MONGO_URI is found
-if not MONGO_URI:
-    raise ValueError("MongoDB URI is missing! Set MONGO_URI in .env or Streamlit Secrets.")
-
-# Connect to MongoDB
-client = MongoClient(MONGO_URI)
-db = client["expense_tracker"]
-
-# Collections
-users_collection = db["users"]
-expenses_collection = db["expenses"]
-income_collection = db["income"]
-
-try:
-    # Test connection
-    client.server_info()
-    print("✅ Connected to MongoDB successfully!")
-except Exception as e:
-    print(f"❌ MongoDB Connection Error: {e}")
-
-import re
-
-
-def is_strong_password(password):
-    """
-    Check if the password is strong:
-    - At least 8 characters
-    - Contains at least one uppercase letter
-    - Contains at least one lowercase letter
-    - Contains at least one digit
-    - Contains at least one special character
-    """
-    if len(password) < 8:
-        return False, "Password must be at least 8 characters long."
-    if not re.search(r"[A-Z]", password):
-        return False, "Password must contain at least one uppercase letter."
-    if not re.search(r"[a-z]", password):
-        return False, "Password must contain at least one lowercase letter."
-    if not re.search(r"\d", password):
-        return False, "Password must contain at least one digit."
-    if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
-        return False, "Password must contain at least one special character."
-    return True, ""
+
+def get_data_version(username):
+    row = user_versions_collection.find_one({"username": username}, {"_id": 0, "version": 1})
+    return row["version"] if row else 0
 
 
 def create_user(username, password, email):  # Add email as a parameter
@@ -89,39 +78,53 @@ def authenticate_user(username, password):
     return False, "Invalid username or password."
 
 
+def get_user_email(username):
+    user = users_collection.find_one({"username": username}, {"email": 1})
+    return user.get("email") if user else None
+
+
+# Usernames after `after` in ascending order, read a page at a time so no
+# cursor stays open (and times out) while the caller works through them
+def iter_usernames(after=None, page_size=1000):
+    while True:
+        query = {"username": {"$gt": after}} if after is not None else {}
+        page = [user["username"] for user in
+                users_collection.find(query, {"_id": 0, "username": 1}).sort("username", 1).limit(page_size)]
+        yield from page
+        if len(page) < page_size:
+            return
+        after = page[-1]
+
+
 # Expense Operations
 def add_expense(username, date_value, category, description, amount, currency="USD", recurring=False,
                 recurrence_period=None):
     try:
-        # Convert date to datetime object
-        if isinstance(date_value, str):
-            date_obj = datetime.strptime(date_value, "%Y-%m-%d")
-        elif isinstance(date_value, date):  # Now we can properly check for date type
-            date_obj = datetime.combine(date_value, datetime.min.time())
-        elif isinstance(date_value, datetime):
-            date_obj = date_value
-        else:
-            return False, f"Invalid date type: {type(date_value)}"
-
-        expense = {
-            "username": username,
-            "date": date_obj,
-            "category": category,
-            "description": description,
-            "amount": float(amount),
-            "currency": currency,
-            "recurring": recurring,
-            "recurrence_period": recurrence_period if recurring and recurrence_period else None
-        }
+        expense = build_expense_document(
+            username, date_value, category, description, amount, currency, recurring, recurrence_period
+        )
+        date_obj = expense["date"]
         expenses_collection.insert_one(expense)
+        apply_summary_deltas([expense], 1)
+        evaluate_budget_thresholds(username, [date_obj])
 
         if recurring and recurrence_period and isinstance(recurrence_period, int):
-            for i in range(1, 12):  # Auto-generate 12 future occurrences
-                next_date = date_obj + timedelta(days=recurrence_period * i)
-                expense_copy = expense.copy()
-                expense_copy["date"] = next_date
-                expenses_collection.insert_one(expense_copy)
+            # Store the next 11 occurrences as one rule, expanded on read
+            recurring_expenses_collection.insert_one({
+                "username": username,
+                "start_date": date_obj + timedelta(days=recurrence_period),
+                "end_date": date_obj + timedelta(days=recurrence_period * 11),
+                "category": category,
+                "description": description,
+                "amount": float(amount),
+                "currency": currency,
+                "frequency": "Every N days",
+                "interval_days": recurrence_period,
+                "source_expense_id": str(expense["_id"]),
+                "updated_at": datetime.utcnow()
+            })
 
+        bump_version(username)
         return True, "Expense added successfully."
     except ValueError as e:
         return False, f"Invalid date format: {str(e)}"
@@ -131,14 +134,217 @@ def add_expense(username, date_value, category, description, amount, currency="U
 
 def get_expenses(username):
     expenses = list(expenses_collection.find({"username": username}, {"_id": 0}))
-    return expenses if expenses else []
+    expenses += [project_document(expense, {"_id": 0})
+                 for expense in iter_bucket_expenses(get_expense_buckets(username))]
+    return expenses
+
+
+# Expenses changed and deleted since a point in time, for incremental syncs.
+# Returns (cursor over changed expenses, deleted ids, high-water mark).
+# With since=None every expense is returned. Archived expenses aren't
+# included; get_expenses_df reads their buckets separately.
+def get_expense_changes(username, since=None, projection=None, batch_size=5000):
+    high_water = datetime.utcnow()
+    query = {"username": username}
+    if since is not None:
+        query["updated_at"] = {"$gt": since}
+
+    changed = expenses_collection.find(query, projection).batch_size(batch_size)
+
+    deleted = []
+    if since is not None:
+        deleted = [
+            tombstone["expense_id"]
+            for tombstone in expense_tombstones_collection.find(
+                {"username": username, "deleted_at": {"$gt": since}}, {"expense_id": 1}
+            )
+        ]
+    return changed, deleted, high_water
+
+
+# Remove tombstones older than the retention window
+def prune_expense_tombstones():
+    result = expense_tombstones_collection.delete_many({"deleted_at": {"$lt": datetime.utcnow() - TOMBSTONE_RETENTION}})
+    return result.deleted_count
+
+
+# Build the Mongo equivalent of expenses.filter_expenses
+def build_expense_query(username, date_range=None, category=None, amount_range=None):
+    query = {"username": username}
+    if date_range:
+        query["date"] = {"$gte": normalize_date(date_range[0]), "$lte": normalize_date(date_range[1])}
+    if category and category != "All":
+        query["category"] = category
+    if amount_range:
+        query["amount"] = {"$gte": float(amount_range[0]), "$lte": float(amount_range[1])}
+    return query
+
+
+def find_expenses(username, date_range=None, category=None, amount_range=None, projection=None):
+    query = build_expense_query(username, date_range, category, amount_range)
+    projection = projection if projection else {"_id": 0}
+    archived = iter_bucket_expenses(
+        get_expense_buckets(username, range_months(date_range)), date_range, category, amount_range
+    )
+    return chain(expenses_collection.find(query, projection),
+                 (project_document(expense, projection) for expense in archived))
+
+
+# One page of expenses, newest first, using keyset pagination on (date, _id).
+# `after` is the cursor returned for the previous page. Returns (rows, next
+# cursor), where the next cursor is None on the last page.
+def get_expenses_page(username, page_size=50, after=None, date_range=None, category=None, amount_range=None,
+                      projection=None):
+    query = build_expense_query(username, date_range, category, amount_range)
+    if after:
+        after_date, after_id = after
+        query = {"$and": [query, {"$or": [
+            {"date": {"$lt": after_date}},
+            {"date": after_date, "_id": {"$lt": ObjectId(after_id)}},
+        ]}]}
+
+    rows = list(
+        expenses_collection.find(query, projection).sort([("date", -1), ("_id", -1)]).limit(page_size + 1)
+    )
+    # Buckets are fetched two at a time and only until the page is full
+    buckets = get_expense_buckets(
+        username, page_months(date_range, after, rows, page_size), newest_first=True
+    ).batch_size(2)
+    archived = page_bucket_expenses(buckets, page_size + 1, after, date_range, category, amount_range)
+    rows, next_after = merge_page(rows, archived, page_size)
+    return [project_document(row, projection) for row in rows], next_after
+
+
+# Count, total and date span of the expenses matching the filters
+def get_expense_totals(username, date_range=None, category=None, amount_range=None):
+    rows = list(expenses_analytics.aggregate([
+        {"$match": build_expense_query(username, date_range, category, amount_range)},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "total": {"$sum": "$amount"},
+            "first_date": {"$min": "$date"},
+            "last_date": {"$max": "$date"},
+        }},
+    ]))
+    totals = rows[0] if rows else {"count": 0, "total": 0.0, "first_date": None, "last_date": None}
+    totals.pop("_id", None)
+    buckets = _find_buckets(expense_buckets_analytics, username, range_months(date_range),
+                            fields=totals_fields(date_range, category, amount_range))
+    return add_bucket_totals(totals, buckets, date_range, category, amount_range)
+
+
+# Import hashes among `hashes` that belong to archived expenses
+def _archived_import_hashes(hashes):
+    if not hashes:
+        return set()
+    archived = set()
+    for bucket in expense_buckets_collection.find({"import_hashes": {"$in": hashes}}, {"import_hashes": 1}):
+        archived.update(bucket["import_hashes"])
+    return archived.intersection(hashes)
+
+
+# Insert many expense documents, skipping ones whose import_hash already
+# exists, archived or not. Returns (inserted, duplicates), the inserted documents
+# instead of their count if return_inserted.
+def insert_expenses(expenses, return_inserted=False):
+    if not expenses:
+        return ([] if return_inserted else 0), 0
+    archived = _archived_import_hashes([expense["import_hash"] for expense in expenses if expense.get("import_hash")])
+    fresh = [expense for expense in expenses if expense.get("import_hash") not in archived]
+    duplicate_indexes = set()
+    try:
+        if fresh:
+            expenses_collection.insert_many(fresh, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") != 11000:  # Anything but a duplicate key is a real failure
+                raise
+            duplicate_indexes.add(error["index"])
+
+    inserted = [expense for index, expense in enumerate(fresh) if index not in duplicate_indexes]
+    apply_summary_deltas(inserted, 1)
+    for username in {expense["username"] for expense in inserted}:
+        evaluate_budget_thresholds(
+            username, list({expense["date"] for expense in inserted if expense["username"] == username})
+        )
+        bump_version(username)
+    return (inserted if return_inserted else len(inserted)), len(expenses) - len(inserted)
+
+
+# Run an aggregation pipeline against the expenses collection
+def aggregate_expenses(pipeline):
+    return list(expenses_analytics.aggregate(pipeline))
+
+
+# $group keys for group_expenses and get_summary_totals
+_EXPENSE_GROUP_KEYS = {
+    "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}},
+    "month": {"$dateToString": {"format": "%Y-%m", "date": "$date"}},
+    "category": "$category",
+}
+
+
+# Totals of the filtered expenses grouped by day, month or category, as
+# [(key, amount)] sorted by key. Days come back as dates.
+def group_expenses(username, by, date_range=None, category=None, amount_range=None):
+    rows = aggregate_expenses([
+        {"$match": build_expense_query(username, date_range, category, amount_range)},
+        {"$group": {"_id": _EXPENSE_GROUP_KEYS[by], "amount": {"$sum": "$amount"}}},
+        {"$sort": {"_id": 1}},
+    ])
+    if by == "day":
+        rows = [(datetime.strptime(row["_id"], "%Y-%m-%d").date(), row["amount"]) for row in rows]
+    else:
+        rows = [(row["_id"], row["amount"]) for row in rows]
+    buckets = _find_buckets(expense_buckets_analytics, username, range_months(date_range),
+                            fields=group_fields(amount_range))
+    return add_bucket_groups(rows, buckets, by, date_range, category, amount_range)
 
 
 def delete_expense(expense_id):
     if not ObjectId.is_valid(expense_id):
         return False, "Invalid expense ID."
-    result = expenses_collection.delete_one({"_id": ObjectId(expense_id)})
-    return True, "Expense deleted." if result.deleted_count else False, "Expense not found."
+    deleted = expenses_collection.find_one_and_delete({"_id": ObjectId(expense_id)})
+    if not deleted and _restore_archived_expense(expense_id):
+        deleted = expenses_collection.find_one_and_delete({"_id": ObjectId(expense_id)})
+    if not deleted:
+        return False, "Expense not found."
+    expense_tombstones_collection.insert_one({
+        "username": deleted["username"],
+        "expense_id": str(deleted["_id"]),
+        "deleted_at": datetime.utcnow()
+    })
+    apply_summary_deltas([deleted], -1)
+    evaluate_budget_thresholds(deleted["username"], [deleted["date"]])
+    bump_version(deleted["username"])
+    return True, "Expense deleted."
+
+
+# Delete every expense of a user, hot and archived, and their summary rows and
+# budget counters. Tombstones go in first, so cached snapshots drop them on the
+# next delta sync. Returns how many were deleted.
+def delete_user_expenses(username, batch_size=5000):
+    ids = chain(
+        (expense["_id"] for expense in expenses_collection.find({"username": username}, {"_id": 1})),
+        chain.from_iterable(bucket["ids"] for bucket in
+                            expense_buckets_collection.find({"username": username}, {"ids": 1})),
+    )
+    deleted_at = datetime.utcnow()
+    deleted = 0
+    while True:
+        batch = list(islice(ids, batch_size))
+        if not batch:
+            break
+        expense_tombstones_collection.insert_many([
+            {"username": username, "expense_id": str(expense_id), "deleted_at": deleted_at} for expense_id in batch
+        ])
+        deleted += len(batch)
+    for collection in (expenses_collection, expense_buckets_collection, expense_summaries_collection,
+                       monthly_summaries_collection, budget_spend_collection):
+        collection.delete_many({"username": username})
+    bump_version(username)
+    return deleted
 
 
 def update_expense(expense_id, date, category, description, amount, currency="USD"):
@@ -146,10 +352,7 @@ def update_expense(expense_id, date, category, description, amount, currency="US
         return False, "Invalid expense ID."
 
     try:
-        if isinstance(date, str):
-            date = datetime.strptime(date, "%Y-%m-%d")  # Ensure correct date format
-        elif isinstance(date, datetime.date):
-            date = datetime.combine(date, datetime.min.time())  # Convert date to datetime
+        date = normalize_date(date)
     except ValueError:
         return False, "Invalid date format. Use YYYY-MM-DD."
 
@@ -158,23 +361,333 @@ def update_expense(expense_id, date, category, description, amount, currency="US
         "category": category,
         "description": description,
         "amount": float(amount),
-        "currency": currency
+        "currency": currency,
+        "updated_at": datetime.utcnow()
     }
 
-    result = expenses_collection.update_one(
-        {"_id": ObjectId(expense_id)}, {"$set": update_data}
+    previous = expenses_collection.find_one_and_update(
+        {"_id": ObjectId(expense_id)}, {"$set": update_data}, return_document=ReturnDocument.BEFORE
     )
+    if not previous and _restore_archived_expense(expense_id):
+        previous = expenses_collection.find_one_and_update(
+            {"_id": ObjectId(expense_id)}, {"$set": update_data}, return_document=ReturnDocument.BEFORE
+        )
+    if not previous:
+        return False, "Expense not found or no change made."
+
+    apply_summary_deltas([previous], -1)
+    apply_summary_deltas([{**previous, **update_data}], 1)
+    evaluate_budget_thresholds(previous["username"], [previous["date"], date])
+    bump_version(previous["username"])
+    return True, "Expense updated."
+
+
+# Archive: expenses dated before a cutoff live in monthly buckets (see backend/archive.py)
+def _find_buckets(collection, username, months=None, newest_first=False, fields=None):
+    query = {"username": username}
+    first, last = months or (None, None)
+    if first or last:
+        query["month"] = {operator: month for operator, month in (("$gte", first), ("$lte", last)) if month}
+    projection = {field: 1 for field in fields} if fields else None
+    return collection.find(query, projection).sort("month", -1 if newest_first else 1)
+
+
+def get_expense_buckets(username, months=None, newest_first=False):
+    return _find_buckets(expense_buckets_collection, username, months, newest_first)
+
+
+# Move the user's expenses dated before `before` into monthly buckets, one
+# transaction per month, merging into a month's bucket if it exists.
+# Spending doesn't change, so summaries and cached frames stay as they are.
+# Returns (expenses archived, buckets written).
+def archive_expenses(username, before):
+    before = normalize_date(before)
+    months = [row["_id"] for row in expenses_collection.aggregate([
+        {"$match": {"username": username, "date": {"$lt": before}}},
+        {"$group": {"_id": _EXPENSE_GROUP_KEYS["month"]}},
+        {"$sort": {"_id": 1}},
+    ])]
+    archived = 0
+    for month in months:
+        start = datetime.strptime(month, "%Y-%m")
+        end = min(before, (start + timedelta(days=32)).replace(day=1))
+        query = {"username": username, "date": {"$gte": start, "$lt": end}}
+        key = {"username": username, "month": month}
+
+        def move(session, query=query, key=key):
+            documents = list(expenses_collection.find(query, session=session))
+            existing = expense_buckets_collection.find_one(key, session=session)
+            previous = list(iter_bucket_expenses([existing])) if existing else []
+            bucket = pack_bucket(username, key["month"], previous + documents)
+            expense_buckets_collection.replace_one(key, bucket, upsert=True, session=session)
+            expenses_collection.delete_many({"_id": {"$in": [document["_id"] for document in documents]}},
+                                            session=session)
+            return len(documents)
+
+        archived += run_in_transaction(move)
+    return archived, len(months)
+
+
+# Move an archived expense back to the expenses collection, so it can be
+# edited or deleted; returns whether it was archived
+def _restore_archived_expense(expense_id):
+    def restore(session):
+        bucket = expense_buckets_collection.find_one({"ids": ObjectId(expense_id)}, session=session)
+        if not bucket:
+            return False
+        expense, rest = remove_from_bucket(bucket, expense_id)
+        expenses_collection.insert_one(expense, session=session)
+        if rest:
+            expense_buckets_collection.replace_one({"_id": bucket["_id"]}, rest, session=session)
+        else:
+            expense_buckets_collection.delete_one({"_id": bucket["_id"]}, session=session)
+        return True
+
+    return run_in_transaction(restore)
+
+
+# Add (sign=1) or remove (sign=-1) expenses from the materialized summaries
+def apply_summary_deltas(expenses, sign):
+    daily, monthly, spend = summary_deltas(expenses, sign)
+    if daily:
+        expense_summaries_collection.bulk_write([
+            UpdateOne({"username": username, "day": day, "category": category, "currency": currency},
+                      {"$inc": {"total": total, "count": count}}, upsert=True)
+            for (username, day, category, currency), (total, count) in daily.items()
+        ], ordered=False)
+        monthly_summaries_collection.bulk_write([
+            UpdateOne({"username": username, "month": month, "category": category},
+                      {"$inc": {"total": total, "count": count}}, upsert=True)
+            for (username, month, category), (total, count) in monthly.items()
+        ], ordered=False)
+        budget_spend_collection.bulk_write([
+            UpdateOne({"username": username, "period": period, "period_key": period_key, "category": category},
+                      {"$inc": {"spent": spent}}, upsert=True)
+            for (username, period, period_key, category), spent in spend.items()
+        ], ordered=False)
 
-    return True, "Expense updated." if result.modified_count else False, "Expense not found or no change made."
+
+# Summary totals grouped by day, month or category, as [(key, amount)] sorted by key
+def get_summary_totals(username, by):
+    collection, key = {
+        "day": (expense_summaries_analytics, "$day"),
+        "month": (monthly_summaries_analytics, "$month"),
+        "category": (monthly_summaries_analytics, "$category"),
+    }[by]
+    rows = collection.aggregate([
+        {"$match": {"username": username, "count": {"$gt": 0}}},
+        {"$group": {"_id": key, "amount": {"$sum": "$total"}}},
+        {"$sort": {"_id": 1}},
+    ])
+    if by == "day":
+        return [(row["_id"].date(), row["amount"]) for row in rows]
+    return [(row["_id"], row["amount"]) for row in rows]
+
+
+def get_daily_summary_rows(username):
+    return list(expense_summaries_analytics.find(
+        {"username": username, "count": {"$gt": 0}}, {"_id": 0, "day": 1, "category": 1, "currency": 1, "total": 1}
+    ))
+
+
+# Recompute the expected daily summary rows from raw expenses and the archive's bucket totals
+def compute_daily_rows(username=None):
+    match = {"username": username} if username else {}
+    rows = expenses_collection.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "username": "$username",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}},
+                "category": "$category",
+                "currency": {"$ifNull": ["$currency", "USD"]},
+            },
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+        }},
+    ])
+    daily = {
+        (row["_id"]["username"], row["_id"]["day"], row["_id"]["category"], row["_id"]["currency"]):
+            (row["total"], row["count"])
+        for row in rows
+    }
+    buckets = expense_buckets_collection.find(match, {field: 1 for field in TOTALS_FIELDS})
+    return add_bucket_daily_rows(daily, buckets)
+
+
+def get_stored_daily_rows(username=None):
+    match = {"username": username} if username else {}
+    return {
+        (row["username"], row["day"].strftime("%Y-%m-%d"), row["category"], row.get("currency")):
+            (row["total"], row["count"])
+        for row in expense_summaries_collection.find(match, {"_id": 0})
+    }
+
+
+def get_stored_budget_spend(username=None):
+    match = {"username": username} if username else {}
+    return {
+        (row["username"], row["period"], row["period_key"], row["category"]): row["spent"]
+        for row in budget_spend_collection.find(match, {"_id": 0, "alert_level": 0})
+    }
+
+
+# Replace one user's summaries and budget counters, inside the session's transaction
+def _replace_summaries(session, username, daily, monthly, spend):
+    match = {"username": username}
+    # Keep the alert levels already raised so rebuilding doesn't re-send alerts
+    alert_levels = {
+        (row["username"], row["period"], row["period_key"], row["category"]): row["alert_level"]
+        for row in budget_spend_collection.find({**match, "alert_level": {"$exists": True}}, session=session)
+    }
+    for collection in (expense_summaries_collection, monthly_summaries_collection, budget_spend_collection):
+        collection.delete_many(match, session=session)
+    if daily:
+        expense_summaries_collection.insert_many([
+            {"username": user, "day": day, "category": category, "currency": currency, "total": total, "count": count}
+            for (user, day, category, currency), (total, count) in daily.items()
+        ], session=session)
+    if monthly:
+        monthly_summaries_collection.insert_many([
+            {"username": user, "month": month, "category": category, "total": total, "count": count}
+            for (user, month, category), (total, count) in monthly.items()
+        ], session=session)
+    if spend:
+        counters = []
+        for key, spent in spend.items():
+            user, period, period_key, category = key
+            counter = {"username": user, "period": period, "period_key": period_key, "category": category,
+                       "spent": spent}
+            if key in alert_levels:
+                counter["alert_level"] = alert_levels[key]
+            counters.append(counter)
+        budget_spend_collection.insert_many(counters, session=session)
+
+
+# Rebuild summaries and budget counters from raw expenses, for one user or
+# everyone, in one transaction per user so readers never see a user's
+# summaries half rebuilt. Returns (daily rows, monthly rows, budget counters).
+def rebuild_summaries(username=None):
+    daily, monthly, spend = rebuilt_summaries(compute_daily_rows(username))
+    if username:
+        usernames = {username}
+    else:
+        # Everyone with expenses, and everyone with summaries left to clear
+        usernames = {key[0] for key in daily}
+        for collection in (expense_summaries_collection, monthly_summaries_collection, budget_spend_collection):
+            usernames.update(collection.distinct("username"))
+    per_user = {user: ({}, {}, {}) for user in usernames}
+    for index, totals in enumerate((daily, monthly, spend)):
+        for key, value in totals.items():
+            per_user[key[0]][index][key] = value
+    for user in sorted(usernames):
+        run_in_transaction(lambda session, user=user: _replace_summaries(session, user, *per_user[user]))
+    return len(daily), len(monthly), len(spend)
+
+
+# Budgets
+# Per user x category x period; category "All" budgets the user's total spend
+budgets_collection = LazyCollection("budgets")
+# Running spend per user x period x period key x category (and "All"), kept in
+# step with expenses by apply_summary_deltas, plus the highest alert level
+# already raised for that period
+budget_spend_collection = LazyCollection("budget_spend")
+
+
+def set_budget(username, category, amount, period="monthly"):
+    if period not in BUDGET_PERIODS:
+        return False, f"Unknown budget period {period!r}."
+    if float(amount) <= 0:
+        return False, "Budget must be greater than zero."
+    budgets_collection.update_one(
+        {"username": username, "category": category, "period": period},
+        {"$set": {"amount": float(amount), "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    evaluate_budget_thresholds(username, [datetime.today()])
+    return True, "Budget saved."
+
+
+def get_budgets(username):
+    return list(budgets_collection.find({"username": username}, {"_id": 0}))
+
+
+def delete_budget(username, category, period="monthly"):
+    result = budgets_collection.delete_one({"username": username, "category": category, "period": period})
+    if result.deleted_count == 0:
+        return False, "Budget not found."
+    return True, "Budget deleted."
+
+
+# Budget, spend so far and alert level for the period containing `on` (today by
+# default); two indexed point reads. None if no budget is set.
+def get_budget_status(username, category=ALL_CATEGORIES, period="monthly", on=None):
+    budget = budgets_collection.find_one({"username": username, "category": category, "period": period})
+    if not budget:
+        return None
+    period_key = (on or datetime.today()).strftime(BUDGET_PERIODS[period])
+    counter = budget_spend_collection.find_one(
+        {"username": username, "period": period, "period_key": period_key, "category": category}
+    ) or {}
+    spent = counter.get("spent", 0.0)
+    return {
+        "category": category,
+        "period": period,
+        "period_key": period_key,
+        "budget": budget["amount"],
+        "spent": spent,
+        "remaining": budget["amount"] - spent,
+        "level": budget_level(spent, budget["amount"]),
+    }
+
+
+# Compare the counters for the periods containing `days` against the user's
+# budgets. A level is raised at most once per period: the conditional update
+# only matches while the stored level is lower, so concurrent writers can't
+# both win. Crossings in the current period are queued as email alerts.
+# Returns [(category, period, period_key, level)] for new crossings.
+def evaluate_budget_thresholds(username, days):
+    budgets = list(budgets_collection.find({"username": username}))
+    if not budgets:
+        return []
+
+    crossings = []
+    for budget in budgets:
+        key_format = BUDGET_PERIODS[budget["period"]]
+        for period_key in {day.strftime(key_format) for day in days}:
+            counter_filter = {"username": username, "period": budget["period"], "period_key": period_key,
+                              "category": budget["category"]}
+            counter = budget_spend_collection.find_one(counter_filter) or {}
+            level = budget_level(counter.get("spent", 0.0), budget["amount"])
+            stored_level = counter.get("alert_level", 0)
+            if level > stored_level:
+                raised = budget_spend_collection.update_one(
+                    {**counter_filter, "$or": [{"alert_level": {"$lt": level}}, {"alert_level": {"$exists": False}}]},
+                    {"$set": {"alert_level": level}}
+                )
+                if raised.modified_count:
+                    crossings.append((budget["category"], budget["period"], period_key, level))
+            elif level < stored_level:
+                # Spend went back down (edit or delete), so a later rise alerts again
+                budget_spend_collection.update_one(counter_filter, {"$set": {"alert_level": level}})
+
+    today = datetime.today()
+    email = None
+    for category, period, period_key, level in crossings:
+        if period_key != today.strftime(BUDGET_PERIODS[period]):
+            continue  # Don't email about past periods, e.g. after importing old statements
+        email = email or get_user_email(username)
+        if not email:
+            break
+        alert_type, subject, message = budget_alert(category, period, level)
+        enqueue_notification(username, alert_type, period_key, email, subject, message)
+    return crossings
 
 
 # Income Tracking
 def add_income(username, date, source, amount, currency="USD"):
     try:
-        if isinstance(date, str):
-            date = datetime.strptime(date, "%Y-%m-%d")  # Ensure correct date format
-        elif isinstance(date, datetime.date):
-            date = datetime.combine(date, datetime.min.time())  # Convert date to datetime
+        date = normalize_date(date)
     except ValueError:
         return False, "Invalid date format. Use YYYY-MM-DD."
 
@@ -185,6 +698,7 @@ def add_income(username, date, source, amount, currency="USD"):
         "amount": float(amount),
         "currency": currency
     })
+    bump_version(username)
     return True, "Income added successfully."
 
 
@@ -196,8 +710,11 @@ def get_income(username):
 def delete_income(income_id):
     if not ObjectId.is_valid(income_id):
         return False, "Invalid income ID."
-    result = income_collection.delete_one({"_id": ObjectId(income_id)})
-    return True, "Income deleted." if result.deleted_count else False, "Income not found."
+    deleted = income_collection.find_one_and_delete({"_id": ObjectId(income_id)})
+    if not deleted:
+        return False, "Income not found."
+    bump_version(deleted["username"])
+    return True, "Income deleted."
 
 
 def update_income(income_id, date, source, amount, currency="USD"):
@@ -205,10 +722,7 @@ def update_income(income_id, date, source, amount, currency="USD"):
         return False, "Invalid income ID."
 
     try:
-        if isinstance(date, str):
-            date = datetime.strptime(date, "%Y-%m-%d")  # Ensure correct date format
-        elif isinstance(date, datetime.date):
-            date = datetime.combine(date, datetime.min.time())  # Convert date to datetime
+        date = normalize_date(date)
     except ValueError:
         return False, "Invalid date format. Use YYYY-MM-DD."
 
@@ -219,21 +733,34 @@ def update_income(income_id, date, source, amount, currency="USD"):
         "currency": currency
     }
 
-    result = income_collection.update_one(
-        {"_id": ObjectId(income_id)}, {"$set": update_data}
-    )
-
-    return True, "Income updated." if result.modified_count else False, "Income not found or no change made."
+    previous = income_collection.find_one_and_update({"_id": ObjectId(income_id)}, {"$set": update_data})
+    if not previous:
+        return False, "Income not found or no change made."
+    bump_version(previous["username"])
+    return True, "Income updated."
 
 
 # Add these collections
-recurring_expenses_collection = db["recurring_expenses"]
-split_expenses_collection = db["split_expenses"]
-debts_collection = db["debts"]
+recurring_expenses_collection = LazyCollection("recurring_expenses")
+split_expenses_collection = LazyCollection("split_expenses")
+debts_collection = LazyCollection("debts")
 
 
 # Recurring Expenses
-def add_recurring_expense(username, start_date, end_date, category, description, amount, frequency):
+# Only the rule is stored; backend/recurrence.py expands occurrences on read
+# until backend/batch.py stores the due ones as expenses and advances the
+# rule's materialized_through.
+# frequency is "Weekly", "Monthly" or "Every N days" (with interval_days).
+def add_recurring_expense(username, start_date, end_date, category, description, amount, frequency,
+                          interval_days=None, currency="USD"):
+    if frequency == "Every N days" and not interval_days:
+        return False, "Interval in days is required for this frequency."
+    try:
+        start_date = normalize_date(start_date)
+        end_date = normalize_date(end_date) if end_date else None
+    except ValueError:
+        return False, "Invalid date format. Use YYYY-MM-DD."
+
     recurring_expense = {
         "username": username,
         "start_date": start_date,
@@ -241,9 +768,13 @@ def add_recurring_expense(username, start_date, end_date, category, description,
         "category": category,
         "description": description,
         "amount": float(amount),
-        "frequency": frequency
+        "currency": currency,
+        "frequency": frequency,
+        "interval_days": int(interval_days) if interval_days else None,
+        "updated_at": datetime.utcnow()
     }
     recurring_expenses_collection.insert_one(recurring_expense)
+    bump_version(username)
     return True, "Recurring expense added successfully."
 
 
@@ -252,6 +783,42 @@ def get_recurring_expenses(username):
     return expenses if expenses else []
 
 
+# Recurring rules including their _id, for expansion
+def get_recurring_rules(username):
+    return list(recurring_expenses_collection.find({"username": username}))
+
+
+# Editing a rule changes every future occurrence with one document update
+def update_recurring_expense(rule_id, **fields):
+    if not ObjectId.is_valid(rule_id):
+        return False, "Invalid recurring expense ID."
+    try:
+        for field in ("start_date", "end_date"):
+            if fields.get(field):
+                fields[field] = normalize_date(fields[field])
+    except ValueError:
+        return False, "Invalid date format. Use YYYY-MM-DD."
+    if "amount" in fields:
+        fields["amount"] = float(fields["amount"])
+    fields["updated_at"] = datetime.utcnow()
+
+    previous = recurring_expenses_collection.find_one_and_update({"_id": ObjectId(rule_id)}, {"$set": fields})
+    if not previous:
+        return False, "Recurring expense not found."
+    bump_version(previous["username"])
+    return True, "Recurring expense updated."
+
+
+def delete_recurring_expense(rule_id):
+    if not ObjectId.is_valid(rule_id):
+        return False, "Invalid recurring expense ID."
+    deleted = recurring_expenses_collection.find_one_and_delete({"_id": ObjectId(rule_id)})
+    if not deleted:
+        return False, "Recurring expense not found."
+    bump_version(deleted["username"])
+    return True, "Recurring expense deleted."
+
+
 # Expense Splitting
 def add_split_expense(username, expense_id, person_name, amount):
     split_expense = {
@@ -261,9 +828,35 @@ def add_split_expense(username, expense_id, person_name, amount):
         "amount": float(amount)
     }
     split_expenses_collection.insert_one(split_expense)
+    bump_version(username)
     return True, "Expense split successfully."
 
 
+# Split one expense between several people in one write: all shares are
+# stored or none. Uses a transaction where the deployment has them; on a
+# standalone server the shares go in one insert_many and a failure removes
+# any that made it in.
+def add_split_expenses(username, expense_id, shares):
+    try:
+        documents = build_split_documents(username, expense_id, shares)
+    except ValueError as e:
+        return False, str(e)
+    for document in documents:
+        document["_id"] = ObjectId()
+
+    def write(session):
+        try:
+            split_expenses_collection.insert_many(documents, session=session)
+        except PyMongoError:
+            if session is None:
+                split_expenses_collection.delete_many({"_id": {"$in": [d["_id"] for d in documents]}})
+            raise
+
+    run_in_transaction(write)
+    bump_version(username)
+    return True, f"Expense split between {len(documents)} people."
+
+
 def get_split_expenses(username, expense_id):
     splits = list(split_expenses_collection.find({"username": username, "expense_id": expense_id}, {"_id": 0}))
     return splits if splits else []
@@ -271,6 +864,10 @@ def get_split_expenses(username, expense_id):
 
 # Debt & Loan Tracking
 def add_debt(username, date, person_name, description, amount, type):
+    try:
+        date = normalize_date(date)
+    except ValueError:
+        return False, "Invalid date format. Use YYYY-MM-DD."
     debt = {
         "username": username,
         "date": date,
@@ -280,9 +877,191 @@ def add_debt(username, date, person_name, description, amount, type):
         "type": type
     }
     debts_collection.insert_one(debt)
+    bump_version(username)
     return True, "Debt/Loan added successfully."
 
 
 def get_debts(username):
     debts = list(debts_collection.find({"username": username}, {"_id": 0}))
     return debts if debts else []
+
+
+# Net balance per counterparty over all splits and debts/loans, computed by
+# the server: {person: amount}, positive when they owe the user
+def get_counterparty_balances(username):
+    balances = {}
+    split_rows = split_expenses_collection.aggregate([
+        {"$match": {"username": username}},
+        {"$group": {"_id": "$person_name", "amount": {"$sum": "$amount"}}},
+    ])
+    debt_rows = debts_collection.aggregate([
+        {"$match": {"username": username, "type": {"$in": list(DEBT_SIGNS)}}},
+        {"$group": {"_id": {"person": "$person_name", "type": "$type"}, "amount": {"$sum": "$amount"}}},
+    ])
+    for row in split_rows:
+        balances[row["_id"]] = balances.get(row["_id"], 0.0) + row["amount"]
+    for row in debt_rows:
+        person = row["_id"]["person"]
+        balances[person] = balances.get(person, 0.0) + DEBT_SIGNS[row["_id"]["type"]] * row["amount"]
+    return balances
+
+
+# Collections a user's data can be exported from, by export name
+EXPORT_COLLECTIONS = {
+    "expenses": expenses_analytics,
+    "income": LazyCollection("income", analytics=True),
+    "debts": LazyCollection("debts", analytics=True),
+    "splits": LazyCollection("split_expenses", analytics=True),
+}
+
+
+# Cursor over a user's documents with only `fields`, fetched batch_size at a
+# time; archived expenses follow the hot ones
+def iter_user_documents(collection_name, username, fields, batch_size=5000):
+    projection = {field: 1 for field in fields}
+    projection["_id"] = 0
+    documents = EXPORT_COLLECTIONS[collection_name].find({"username": username}, projection).batch_size(batch_size)
+    if collection_name != "expenses":
+        return documents
+    archived = iter_bucket_expenses(_find_buckets(expense_buckets_analytics, username))
+    return chain(documents, (project_document(expense, projection) for expense in archived))
+
+
+# Notification outbox: the UI enqueues, backend/notifications.py sends
+notification_outbox_collection = LazyCollection("notification_outbox")
+
+
+# Queue an email once per (user, alert type, period); returns (queued, message)
+def enqueue_notification(username, alert_type, period, to_email, subject, message):
+    result = notification_outbox_collection.update_one(
+        {"dedup_key": f"{username}:{alert_type}:{period}"},
+        {"$setOnInsert": {
+            "username": username,
+            "alert_type": alert_type,
+            "period": period,
+            "to_email": to_email,
+            "subject": subject,
+            "message": message,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": datetime.utcnow(),
+            "created_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+    if result.upserted_id is None:
+        return False, "Notification already queued for this period."
+    return True, "Notification queued."
+
+
+# Atomically take up to `limit` due notifications; a lease stops other workers
+# from taking them until lease_seconds pass
+def claim_notifications(limit=50, lease_seconds=300):
+    claimed = []
+    now = datetime.utcnow()
+    for _ in range(limit):
+        notification = notification_outbox_collection.find_one_and_update(
+            {"status": {"$in": ["pending", "sending"]}, "next_attempt_at": {"$lte": now}},
+            {"$set": {"status": "sending", "next_attempt_at": now + timedelta(seconds=lease_seconds)}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if notification is None:
+            break
+        claimed.append(notification)
+    return claimed
+
+
+def mark_notification_sent(notification_id):
+    notification_outbox_collection.update_one(
+        {"_id": notification_id}, {"$set": {"status": "sent", "sent_at": datetime.utcnow()}}
+    )
+
+
+def mark_notification_failed(notification, error, base_delay_seconds=30):
+    update = notification_failure_update(notification, error, base_delay_seconds)
+    notification_outbox_collection.update_one({"_id": notification["_id"]}, {"$set": update})
+
+
+# Serialized per-user categorizer models (see backend/categorizer.py)
+categorizer_models_collection = LazyCollection("categorizer_models")
+
+
+def save_categorizer_model(username, model_bytes, classes, samples_seen):
+    categorizer_models_collection.update_one(
+        {"username": username},
+        {"$set": {
+            "model": Binary(model_bytes),
+            "classes": list(classes),
+            "samples_seen": samples_seen,
+            "updated_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+
+def load_categorizer_model(username):
+    return categorizer_models_collection.find_one({"username": username}, {"_id": 0})
+
+
+# Latency and Mongo traffic of every public function above, wrapped before
+# MongoRepository captures them (see backend/metrics.py)
+instrument_module(globals(), "database")
+
+
+# The functions above as a Repository (see backend/repository.py)
+class MongoRepository(Repository):
+    errors = (PyMongoError,)
+
+    create_user = staticmethod(create_user)
+    authenticate_user = staticmethod(authenticate_user)
+    get_user_email = staticmethod(get_user_email)
+    iter_usernames = staticmethod(iter_usernames)
+    get_data_version = staticmethod(get_data_version)
+    add_expense = staticmethod(add_expense)
+    insert_expenses = staticmethod(insert_expenses)
+    get_expenses = staticmethod(get_expenses)
+    get_expense_changes = staticmethod(get_expense_changes)
+    prune_expense_tombstones = staticmethod(prune_expense_tombstones)
+    find_expenses = staticmethod(find_expenses)
+    get_expenses_page = staticmethod(get_expenses_page)
+    get_expense_totals = staticmethod(get_expense_totals)
+    group_expenses = staticmethod(group_expenses)
+    delete_expense = staticmethod(delete_expense)
+    delete_user_expenses = staticmethod(delete_user_expenses)
+    update_expense = staticmethod(update_expense)
+    archive_expenses = staticmethod(archive_expenses)
+    get_expense_buckets = staticmethod(get_expense_buckets)
+    get_summary_totals = staticmethod(get_summary_totals)
+    get_daily_summary_rows = staticmethod(get_daily_summary_rows)
+    compute_daily_rows = staticmethod(compute_daily_rows)
+    get_stored_daily_rows = staticmethod(get_stored_daily_rows)
+    get_stored_budget_spend = staticmethod(get_stored_budget_spend)
+    rebuild_summaries = staticmethod(rebuild_summaries)
+    set_budget = staticmethod(set_budget)
+    get_budgets = staticmethod(get_budgets)
+    delete_budget = staticmethod(delete_budget)
+    get_budget_status = staticmethod(get_budget_status)
+    evaluate_budget_thresholds = staticmethod(evaluate_budget_thresholds)
+    add_income = staticmethod(add_income)
+    get_income = staticmethod(get_income)
+    delete_income = staticmethod(delete_income)
+    update_income = staticmethod(update_income)
+    add_recurring_expense = staticmethod(add_recurring_expense)
+    get_recurring_expenses = staticmethod(get_recurring_expenses)
+    get_recurring_rules = staticmethod(get_recurring_rules)
+    update_recurring_expense = staticmethod(update_recurring_expense)
+    delete_recurring_expense = staticmethod(delete_recurring_expense)
+    add_split_expense = staticmethod(add_split_expense)
+    add_split_expenses = staticmethod(add_split_expenses)
+    get_split_expenses = staticmethod(get_split_expenses)
+    add_debt = staticmethod(add_debt)
+    get_debts = staticmethod(get_debts)
+    get_counterparty_balances = staticmethod(get_counterparty_balances)
+    iter_user_documents = staticmethod(iter_user_documents)
+    enqueue_notification = staticmethod(enqueue_notification)
+    claim_notifications = staticmethod(claim_notifications)
+    mark_notification_sent = staticmethod(mark_notification_sent)
+    mark_notification_failed = staticmethod(mark_notification_failed)
+    save_categorizer_model = staticmethod(save_categorizer_model)
+    load_categorizer_model = staticmethod(load_categorizer_model)
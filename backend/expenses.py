@@ -1,30 +1,111 @@
+from datetime import datetime, timedelta
+
 import pandas as pd
-from backend.database import get_expenses
+from backend.repository import get_repository
+from backend.records import TOMBSTONE_RETENTION
+from backend.cache import get_or_refresh
+from backend.recurrence import expand_rules
+from backend.frames import EXPENSE_PROJECTION, build_bucket_frame, build_expenses_frame, restore_dtypes
+from backend.metrics import instrument_module
+from backend.rates import convert_frame
+
+# Overlap between delta syncs, covers clock skew between app processes
+SYNC_SLACK = timedelta(minutes=5)
+
+# Full snapshot of a user's expenses, hot and archived, with an "id" column
+# and a high-water mark. Delta syncs only see hot expenses, which is enough:
+# archiving doesn't change an expense, and editing or deleting an archived
+# one moves it back to the hot expenses first.
+def _load_expenses_snapshot(username):
+    repository = get_repository()
+    changed, _, high_water = repository.get_expense_changes(username, projection=EXPENSE_PROJECTION)
+    df = build_expenses_frame(changed)
+    # Read after the hot expenses, so one archived in between shows up in both (and is dropped here)
+    archived = build_bucket_frame(repository.get_expense_buckets(username))
+    if not archived.empty:
+        archived = archived[~archived["id"].isin(df["id"])]
+        df = archived if df.empty else restore_dtypes(pd.concat([archived, df], ignore_index=True))
+    return {"df": df.reset_index(drop=True), "high_water": high_water}
+
 
+# Merge expenses changed or deleted since the previous snapshot into it
+def _refresh_expenses_snapshot(username, previous):
+    if previous is None or previous["high_water"] < datetime.utcnow() - TOMBSTONE_RETENTION + SYNC_SLACK:
+        return _load_expenses_snapshot(username)
 
-# Get expenses as a DataFrame
+    changed, deleted, high_water = get_repository().get_expense_changes(
+        username, previous["high_water"] - SYNC_SLACK, projection=EXPENSE_PROJECTION
+    )
+    changed_df = build_expenses_frame(changed)
+    df = previous["df"]
+    stale_ids = set(changed_df["id"]) | set(deleted)
+    if stale_ids:
+        df = df[~df["id"].isin(stale_ids)]
+    if not changed_df.empty:
+        df = changed_df if df.empty else restore_dtypes(pd.concat([df, changed_df], ignore_index=True))
+    return {"df": df.reset_index(drop=True), "high_water": high_water}
+
+
+# Get expenses as a DataFrame, served from the per-user cache until the next
+# write (by any process) and then refreshed with only the expenses that changed
 def get_expenses_df(username):
-    expenses = get_expenses(username)
-    print("Raw expenses data:", expenses)  # Debug print
+    snapshot = get_or_refresh(
+        "expenses_df", username, lambda previous: _refresh_expenses_snapshot(username, previous),
+        stamp=lambda: get_repository().get_data_version(username)
+    )
+    # Shallow copy so callers adding columns don't change the cached frame
+    return snapshot["df"].copy(deep=False)
 
-    if not expenses:  # Handle empty expense list
-        return pd.DataFrame(columns=['date', 'category', 'description', 'amount', 'currency'])
 
-    df = pd.DataFrame(expenses)
-    print("DataFrame columns:", df.columns)  # Debug print
+# Check that the delta-synced frame matches a full fetch from the database
+def verify_expenses_df(username):
+    cached = get_expenses_df(username)
+    fresh = _load_expenses_snapshot(username)["df"]
+    if len(cached) != len(fresh):
+        return False
+    if cached.empty:
+        return True
+    columns = sorted(fresh.columns)
+    cached = cached.reindex(columns=columns).sort_values("id").reset_index(drop=True)
+    fresh = fresh[columns].sort_values("id").reset_index(drop=True)
+    try:
+        pd.testing.assert_frame_equal(cached, fresh, check_dtype=False)
+        return True
+    except AssertionError:
+        return False
 
-    if 'date' in df.columns:  # Safely convert date
-        df['date'] = pd.to_datetime(df['date'])
-    else:
-        print("Warning: 'date' column not found in DataFrame")
 
-    return df
+# Occurrences of the user's recurring rules between window_start (default:
+# earliest rule start) and window_end (default: today) that are not stored as
+# expenses yet. The rules are read uncached, like the summary rows they are
+# added to, because the batch runner advances materialized_through from
+# another process.
+def get_recurring_occurrences_df(username, window_start=None, window_end=None):
+    rules = get_repository().get_recurring_rules(username)
+    if not rules:
+        return expand_rules([], None, None)
+    if window_start is None:
+        window_start = min(rule["start_date"] for rule in rules)
+    if window_end is None:
+        window_end = datetime.today()
+    return expand_rules(rules, window_start, window_end)
+
+
+# Expenses plus recurring occurrences up to window_end, for the pandas rollups
+def with_recurring_occurrences(df, username, window_end=None):
+    occurrences = get_recurring_occurrences_df(username, window_end=window_end)
+    if occurrences.empty:
+        return df
+    if df.empty:
+        return occurrences
+    return restore_dtypes(pd.concat([df, occurrences], ignore_index=True))
 
 
 # Filter expenses by date range, category, and amount
 def filter_expenses(df, date_range=None, category=None, amount_range=None):
     if date_range:
-        df = df[(df["date"] >= date_range[0]) & (df["date"] <= date_range[1])]
+        start, end = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
+        df = df[(df["date"] >= start) & (df["date"] <= end)]
     if category and category != "All":
         df = df[df["category"] == category]
     if amount_range:
@@ -45,4 +126,153 @@ def calculate_monthly_spending(df):
 
 # Calculate category-wise spending
 def calculate_category_spending(df):
-    return df.groupby("category")["amount"].sum().reset_index()
+    return df.groupby("category", observed=True)["amount"].sum().reset_index()
+
+
+# Server-side versions of the functions above. Each one has the storage
+# backend filter and group the expenses so only the grouped rows come back,
+# and falls back to the pandas path if the query fails. The database adds
+# amounts as stored, whatever their currency; with base_currency set the
+# filtered rows are converted with the rates snapshot (backend/rates.py) and
+# grouped in pandas instead, leaving out currencies it has no rates for.
+# Recurring occurrences not stored as expenses yet are filtered and added in
+# pandas either way, as backend/summaries.py does.
+
+# Filter expenses inside the database and return them as a DataFrame
+def query_expenses_df(username, date_range=None, category=None, amount_range=None):
+    repository = get_repository()
+    try:
+        return build_expenses_frame(
+            repository.find_expenses(username, date_range, category, amount_range, projection=EXPENSE_PROJECTION)
+        )
+    except repository.errors:
+        return filter_expenses(get_expenses_df(username), date_range, category, amount_range)
+
+
+# One keyset-paginated page of expenses as a DataFrame, plus the next-page cursor
+def get_expenses_page_df(username, page_size=50, after=None, date_range=None, category=None, amount_range=None):
+    rows, next_after = get_repository().get_expenses_page(
+        username, page_size, after, date_range, category, amount_range, projection=EXPENSE_PROJECTION
+    )
+    return build_expenses_frame(rows), next_after
+
+
+def _filtered_df(username, filters):
+    df = with_recurring_occurrences(get_expenses_df(username), username)
+    if df.empty:
+        return None
+    return filter_expenses(df, **filters)
+
+
+def _filtered_occurrences(username, filters):
+    return filter_expenses(get_recurring_occurrences_df(username), **filters)
+
+
+# Grouped database rows plus the same rollup of the filtered occurrences
+def _with_occurrence_groups(grouped, username, filters, rollup, key):
+    occurrences = _filtered_occurrences(username, filters)
+    if occurrences.empty:
+        return grouped
+    occurrence_groups = rollup(occurrences.copy())
+    if grouped.empty:
+        return occurrence_groups
+    merged = pd.concat([grouped, occurrence_groups], ignore_index=True)
+    return merged.groupby(key)["amount"].sum().reset_index()
+
+
+# A rollup of the filtered expenses and occurrences converted to base_currency
+def _converted(username, filters, base_currency, rollup, columns):
+    df = query_expenses_df(username, **filters)
+    occurrences = _filtered_occurrences(username, filters)
+    if not occurrences.empty:
+        df = restore_dtypes(pd.concat([df, occurrences], ignore_index=True)) if not df.empty else occurrences
+    df = convert_frame(df, base_currency)
+    return rollup(df) if not df.empty else pd.DataFrame(columns=columns)
+
+
+# Calculate daily spending in the database
+def aggregate_daily_spending(username, date_range=None, category=None, amount_range=None, base_currency=None):
+    filters = {"date_range": date_range, "category": category, "amount_range": amount_range}
+    if base_currency:
+        return _converted(username, filters, base_currency, calculate_daily_spending, ["date", "amount"])
+    repository = get_repository()
+    try:
+        rows = repository.group_expenses(username, "day", **filters)
+    except repository.errors:
+        df = _filtered_df(username, filters)
+        return calculate_daily_spending(df) if df is not None else pd.DataFrame(columns=["date", "amount"])
+    grouped = pd.DataFrame({
+        "date": [day for day, _ in rows],
+        "amount": [float(amount) for _, amount in rows],
+    })
+    return _with_occurrence_groups(grouped, username, filters, calculate_daily_spending, "date")
+
+
+# Calculate monthly spending in the database
+def aggregate_monthly_spending(username, date_range=None, category=None, amount_range=None, base_currency=None):
+    filters = {"date_range": date_range, "category": category, "amount_range": amount_range}
+    if base_currency:
+        return _converted(username, filters, base_currency, calculate_monthly_spending, ["month", "amount"])
+    repository = get_repository()
+    try:
+        rows = repository.group_expenses(username, "month", **filters)
+    except repository.errors:
+        df = _filtered_df(username, filters)
+        return calculate_monthly_spending(df) if df is not None else pd.DataFrame(columns=["month", "amount"])
+    grouped = pd.DataFrame({
+        "month": pd.PeriodIndex([month for month, _ in rows], freq="M"),
+        "amount": [float(amount) for _, amount in rows],
+    })
+    return _with_occurrence_groups(grouped, username, filters, calculate_monthly_spending, "month")
+
+
+# Calculate category-wise spending in the database
+def aggregate_category_spending(username, date_range=None, category=None, amount_range=None, base_currency=None):
+    filters = {"date_range": date_range, "category": category, "amount_range": amount_range}
+    if base_currency:
+        return _converted(username, filters, base_currency, calculate_category_spending, ["category", "amount"])
+    repository = get_repository()
+    try:
+        rows = repository.group_expenses(username, "category", **filters)
+    except repository.errors:
+        df = _filtered_df(username, filters)
+        return calculate_category_spending(df) if df is not None else pd.DataFrame(columns=["category", "amount"])
+    grouped = pd.DataFrame({
+        "category": [name for name, _ in rows],
+        "amount": [float(amount) for _, amount in rows],
+    })
+    return _with_occurrence_groups(grouped, username, filters, calculate_category_spending, "category")
+
+
+# Compare the aggregation and pandas rollups for a user, returns {name: matches}
+def check_rollup_parity(username, date_range=None, category=None, amount_range=None):
+    filters = {"date_range": date_range, "category": category, "amount_range": amount_range}
+    df = _filtered_df(username, filters)
+    pairs = {
+        "daily": (aggregate_daily_spending, calculate_daily_spending),
+        "monthly": (aggregate_monthly_spending, calculate_monthly_spending),
+        "category": (aggregate_category_spending, calculate_category_spending),
+    }
+    results = {}
+    for name, (server_side, local) in pairs.items():
+        server_df = server_side(username, **filters)
+        if df is None or df.empty:
+            results[name] = server_df.empty
+            continue
+        local_df = local(df.copy())
+        # Categorical group keys compare equal to the plain strings from the database
+        local_df = local_df.astype({
+            column: object for column, dtype in local_df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)
+        })
+        try:
+            pd.testing.assert_frame_equal(
+                server_df.reset_index(drop=True), local_df.reset_index(drop=True), check_dtype=False
+            )
+            results[name] = True
+        except AssertionError:
+            results[name] = False
+    return results
+
+
+# Latency of every public function above (see backend/metrics.py)
+instrument_module(globals(), "expenses")
@@ -0,0 +1,151 @@
+"""
+Constant-memory exporters for expenses, income, debts and splits.
+
+Each exporter walks the storage cursor in batches and writes rows as they
+arrive: csv.writer for CSV, an openpyxl write-only workbook for XLSX and one
+row group per batch for Parquet (only if pyarrow is installed).
+
+Downloads from the app are written to a SpooledTemporaryFile, which stays in
+memory up to EXPORT_SPOOL_BYTES and moves to disk beyond that, and are capped
+at EXPORT_MAX_ROWS rows; the CLI has no cap.
+
+Usage:
+    python -m backend.exporter <username> <expenses|income|debts|splits> <output.csv|.xlsx|.parquet>
+"""
+import csv
+import io
+import os
+import sys
+import tempfile
+from itertools import islice
+
+from backend.repository import get_repository
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+BATCH_SIZE = 5000
+# Export name -> [(field, parquet type name)]
+EXPORT_FIELDS = {
+    "expenses": [("date", "timestamp"), ("category", "string"), ("description", "string"),
+                 ("amount", "float"), ("currency", "string")],
+    "income": [("date", "timestamp"), ("source", "string"), ("amount", "float"), ("currency", "string")],
+    "debts": [("date", "timestamp"), ("person_name", "string"), ("description", "string"),
+              ("amount", "float"), ("type", "string")],
+    "splits": [("expense_id", "string"), ("person_name", "string"), ("amount", "float")],
+}
+EXPORT_FORMATS = ("csv", "xlsx", "parquet")
+EXPORT_SPOOL_BYTES = int(os.getenv("EXPORT_SPOOL_BYTES", str(16 * 1024 * 1024)))
+EXPORT_MAX_ROWS = int(os.getenv("EXPORT_MAX_ROWS", "1000000"))
+
+
+def _fields(kind):
+    return [field for field, _ in EXPORT_FIELDS[kind]]
+
+
+# Formats this installation can write
+def available_formats():
+    return [name for name in EXPORT_FORMATS if name != "parquet" or pa is not None]
+
+
+def _batches(kind, username, batch_size, max_rows=None):
+    fields = _fields(kind)
+    cursor = islice(get_repository().iter_user_documents(kind, username, fields, batch_size), max_rows)
+    while True:
+        batch = list(islice(cursor, batch_size))
+        if not batch:
+            return
+        yield [[document.get(field) for field in fields] for document in batch]
+
+
+# Write a user's rows as CSV to a path or text stream, returns the row count
+def export_csv(kind, username, out, batch_size=BATCH_SIZE, max_rows=None):
+    handle = open(out, "w", newline="", encoding="utf-8") if isinstance(out, str) else out
+    try:
+        writer = csv.writer(handle)
+        writer.writerow(_fields(kind))
+        rows = 0
+        for batch in _batches(kind, username, batch_size, max_rows):
+            writer.writerows(batch)
+            rows += len(batch)
+        return rows
+    finally:
+        if isinstance(out, str):
+            handle.close()
+
+
+# Write a user's rows to an XLSX write-only workbook, returns the row count
+def export_xlsx(kind, username, out, batch_size=BATCH_SIZE, max_rows=None):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(kind)
+    sheet.append(_fields(kind))
+    rows = 0
+    for batch in _batches(kind, username, batch_size, max_rows):
+        for row in batch:
+            sheet.append(row)
+        rows += len(batch)
+    workbook.save(out)
+    return rows
+
+
+def _parquet_schema(kind):
+    types = {"timestamp": pa.timestamp("ms"), "string": pa.string(), "float": pa.float64()}
+    return pa.schema([(field, types[type_name]) for field, type_name in EXPORT_FIELDS[kind]])
+
+
+# Write a user's rows to Parquet, one row group per batch, returns the row count
+def export_parquet(kind, username, out, batch_size=BATCH_SIZE, max_rows=None):
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).")
+    schema = _parquet_schema(kind)
+    rows = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        for batch in _batches(kind, username, batch_size, max_rows):
+            columns = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=schema.field(index).type) for index, column in enumerate(columns)],
+                schema=schema,
+            ))
+            rows += len(batch)
+    return rows
+
+
+EXPORTERS = {"csv": export_csv, "xlsx": export_xlsx, "parquet": export_parquet}
+
+
+# Export to a spooled temporary file for download buttons, at most max_rows
+# rows. Returns (file positioned at the start, rows written); the caller closes it.
+def export_file(kind, username, export_format, max_rows=EXPORT_MAX_ROWS, spool_bytes=EXPORT_SPOOL_BYTES):
+    spooled = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    try:
+        if export_format == "csv":
+            text = io.TextIOWrapper(spooled, encoding="utf-8", newline="")
+            rows = export_csv(kind, username, text, max_rows=max_rows)
+            text.flush()
+            text.detach()
+        else:
+            rows = EXPORTERS[export_format](kind, username, spooled, max_rows=max_rows)
+        spooled.seek(0)
+        return spooled, rows
+    except BaseException:
+        spooled.close()
+        raise
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[2] not in EXPORT_FIELDS:
+        print(__doc__)
+        sys.exit(2)
+    path = sys.argv[3]
+    export_format = path.rsplit(".", 1)[-1].lower()
+    if export_format not in EXPORTERS:
+        print(f"Unsupported format {export_format!r}, use one of {', '.join(EXPORT_FORMATS)}.")
+        sys.exit(2)
+    count = EXPORTERS[export_format](sys.argv[2], sys.argv[1], path)
+    print(f"Exported {count} {sys.argv[2]} rows to {path}.")
@@ -0,0 +1,67 @@
+"""
+Registry of the app's heavy optional subsystems.
+
+Each feature is a module that pulls in a large dependency. The login page
+needs none of them, so app.py reaches them through lazy_feature() stand-ins
+and a feature is only imported when one of its functions is first called.
+load_times() reports how long each loaded feature took to import; the
+benchmarks/bench_startup.py check keeps them out of the startup path.
+"""
+import importlib
+import threading
+import time
+
+# Feature name -> module providing it (and what makes it heavy)
+FEATURES = {
+    "categorizer": "backend.categorizer",  # scikit-learn
+    "ocr": "backend.ocr",  # Pillow, pytesseract
+    "currency": "forex_python.converter",  # live exchange rates
+    "email": "smtplib",  # SMTP and TLS
+    "plotting": "backend.charts",  # matplotlib, seaborn
+    "export": "backend.exporter",  # pyarrow, for Parquet
+}
+
+_lock = threading.Lock()
+_loaded = {}  # feature name -> module
+_load_seconds = {}  # feature name -> import time
+
+
+# Import a feature's module on first use; raises ImportError if its
+# dependency is not installed
+def load_feature(name):
+    module = _loaded.get(name)
+    if module is not None:
+        return module
+    with _lock:
+        if name not in _loaded:
+            started = time.perf_counter()
+            _loaded[name] = importlib.import_module(FEATURES[name])
+            _load_seconds[name] = time.perf_counter() - started
+        return _loaded[name]
+
+
+def is_loaded(name):
+    return name in _loaded
+
+
+# {feature name: seconds its first import took}
+def load_times():
+    return dict(_load_seconds)
+
+
+# Stands in for a feature's module and imports it on first attribute access
+class LazyFeature:
+    def __init__(self, name):
+        if name not in FEATURES:
+            raise KeyError(f"Unknown feature {name!r}")
+        self._name = name
+
+    def __getattr__(self, attribute):
+        return getattr(load_feature(self._name), attribute)
+
+    def __repr__(self):
+        return f"LazyFeature({self._name!r}, loaded={is_loaded(self._name)})"
+
+
+def lazy_feature(name):
+    return LazyFeature(name)
@@ -0,0 +1,84 @@
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from backend.archive import bucket_columns
+
+# Fields fetched from MongoDB to build the expenses DataFrame
+EXPENSE_FIELDS = ("date", "category", "description", "amount", "currency", "recurring", "recurrence_period")
+EXPENSE_PROJECTION = {field: 1 for field in EXPENSE_FIELDS}
+CATEGORICAL_FIELDS = ("category", "currency")
+
+
+def _typed_batch(batch):
+    return {
+        "date": pd.DatetimeIndex([doc.get("date") for doc in batch]).as_unit("ns").values,
+        "category": pd.Categorical([doc.get("category") for doc in batch]),
+        "description": np.array([doc.get("description") for doc in batch], dtype=object),
+        "amount": np.array([doc.get("amount") for doc in batch], dtype=np.float64),
+        "currency": pd.Categorical([doc.get("currency") for doc in batch]),
+        "recurring": np.array([bool(doc.get("recurring")) for doc in batch], dtype=bool),
+        "recurrence_period": np.array([doc.get("recurrence_period") for doc in batch], dtype=np.float64),
+        "id": np.array([str(doc.get("_id", doc.get("id"))) for doc in batch], dtype=object),
+    }
+
+
+# Build a typed expenses DataFrame from an iterable of documents (usually a
+# pymongo cursor). Each batch is converted to typed arrays before the next is
+# read, so the Python dicts of only one batch are alive at a time.
+def build_expenses_frame(documents, batch_size=10000):
+    iterator = iter(documents)
+    chunks = []
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            break
+        chunks.append(_typed_batch(batch))
+        del batch
+    return _concat_chunks(chunks)
+
+
+# Build the same typed DataFrame from archive buckets (see backend/archive.py),
+# straight from their packed columns without making a dict per expense
+def build_bucket_frame(buckets):
+    chunks = []
+    for bucket in buckets:
+        columns = bucket_columns(bucket)
+        periods = columns["recurrence_period"].astype(np.float64)
+        periods[periods == 0] = np.nan
+        chunks.append({
+            "date": columns["date"].astype("datetime64[ns]"),
+            "category": pd.Categorical(columns["category"]),
+            "description": np.array(columns["description"], dtype=object),
+            "amount": columns["amount"].copy(),
+            "currency": pd.Categorical(columns["currency"]),
+            "recurring": columns["recurring"],
+            "recurrence_period": periods,
+            "id": np.array([str(expense_id) for expense_id in columns["_id"]], dtype=object),
+        })
+    return _concat_chunks(chunks)
+
+
+def _concat_chunks(chunks):
+    if not chunks:
+        chunks = [_typed_batch([])]
+    columns = {}
+    for field, first in chunks[0].items():
+        parts = [chunk[field] for chunk in chunks]
+        if isinstance(first, pd.Categorical):
+            columns[field] = union_categoricals(parts)
+        else:
+            columns[field] = np.concatenate(parts)
+    # Periods are whole days; keep missing ones as <NA> instead of NaN
+    columns["recurrence_period"] = pd.array(columns["recurrence_period"], dtype="Int64")
+    return pd.DataFrame(columns)
+
+
+# Re-apply categorical dtypes after concatenating frames with different categories
+def restore_dtypes(df):
+    for field in CATEGORICAL_FIELDS:
+        if field in df.columns and not isinstance(df[field].dtype, pd.CategoricalDtype):
+            df[field] = df[field].astype("category")
+    return df
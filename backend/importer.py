@@ -0,0 +1,207 @@
+"""
+Streaming bank statement importer for CSV and XLSX exports.
+
+Rows are parsed lazily, normalized with the same document builder as
+add_expense, tagged with a content hash and written with insert_expenses in
+bounded chunks. A unique import_hash index makes re-importing the same
+statement a no-op. The hash numbers identical rows of the same day; the
+counts are kept only for the RECENT_DATES dates seen last, so memory stays
+flat on date-ordered statements of any size and rows a few days out of
+order still count as repeats.
+
+Amounts in debit/withdrawal columns and positive amounts in a signed amount
+column are spending. Credits (a credit/deposit column, negative or bracketed
+amounts) are refunds or income and are skipped; pass spending_sign=-1
+(--negative-spending) for banks that export spending as negative amounts.
+Categories that come with the statement are fed to the user's categorizer
+once their rows are inserted.
+
+Usage:
+    python -m backend.importer <username> <statement.csv|statement.xlsx> [--auto-categorize] [--negative-spending]
+"""
+import csv
+import hashlib
+import io
+import re
+import sys
+import time
+from collections import OrderedDict
+
+from backend.records import build_expense_document
+from backend.repository import get_repository
+
+CHUNK_SIZE = 5000
+# Dates whose identical-row counts are kept while reading a statement
+RECENT_DATES = 64
+# Formats tried, in order, for text dates in statements
+STATEMENT_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%d %b %Y")
+# Normalized header -> expense field
+COLUMN_ALIASES = {
+    "date": "date", "transaction date": "date", "posted date": "date", "value date": "date",
+    "description": "description", "details": "description", "narration": "description", "memo": "description",
+    "payee": "description",
+    "amount": "amount", "debit": "amount", "withdrawal": "amount", "withdrawal amount": "amount",
+    "credit": "credit", "deposit": "credit", "deposit amount": "credit",
+    "category": "category",
+    "currency": "currency",
+}
+_NON_NUMERIC = re.compile(r"[^\d.\-]")
+
+
+# Yield rows of a CSV or XLSX statement as {header: value} dicts, lazily
+def iter_statement_rows(source, filename=None):
+    name = (filename or getattr(source, "name", "") or str(source)).lower()
+    if name.endswith(".xlsx"):
+        yield from _iter_xlsx_rows(source)
+    else:
+        yield from _iter_csv_rows(source)
+
+
+def _iter_csv_rows(source):
+    if isinstance(source, str):
+        with open(source, newline="", encoding="utf-8-sig") as handle:
+            yield from csv.DictReader(handle)
+    else:
+        if not isinstance(source, io.TextIOBase):
+            source = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+        yield from csv.DictReader(source)
+
+
+def _iter_xlsx_rows(source):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell) if cell is not None else "" for cell in next(rows, [])]
+        for row in rows:
+            yield dict(zip(header, row))
+    finally:
+        workbook.close()
+
+
+# Signed amount of a cell; "(12.50)" is negative as in accounting exports
+def _parse_amount(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value or "").strip()
+    sign = -1.0 if text.startswith("(") and text.endswith(")") else 1.0
+    cleaned = _NON_NUMERIC.sub("", text)
+    return sign * float(cleaned) if cleaned not in ("", "-", ".") else 0.0
+
+
+def _import_hash(username, expense, occurrence):
+    key = "|".join([
+        username, expense["date"].strftime("%Y-%m-%d"), f"{expense['amount']:.2f}",
+        " ".join(str(expense["description"]).lower().split()), str(occurrence),
+    ])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+# Turn raw statement rows into expense documents, skipping unusable rows.
+# Yields (document, None) or (None, reason).
+def iter_expense_documents(username, rows, default_currency="USD", spending_sign=1):
+    # Identical rows on the same day get distinct hashes, as long as the file
+    # doesn't go back to a date more than RECENT_DATES dates later
+    occurrences = OrderedDict()  # date -> {(amount, description): rows seen}, most recent last
+    for raw in rows:
+        row = {}
+        for header, value in raw.items():
+            field = COLUMN_ALIASES.get(str(header or "").strip().lower())
+            if field and field not in row:
+                row[field] = value
+        try:
+            amount = _parse_amount(row.get("amount")) * spending_sign
+            if amount < 0 or (not amount and _parse_amount(row.get("credit"))):
+                yield None, "credit or refund"
+                continue
+            if not amount:
+                yield None, "zero or missing amount"
+                continue
+            expense = build_expense_document(
+                username, row.get("date"), row.get("category") or None, (row.get("description") or "").strip(),
+                amount, row.get("currency") or default_currency, date_formats=STATEMENT_DATE_FORMATS,
+            )
+        except (TypeError, ValueError) as e:
+            yield None, str(e)
+            continue
+
+        day = occurrences.get(expense["date"])
+        if day is None:
+            day = occurrences[expense["date"]] = {}
+            if len(occurrences) > RECENT_DATES:
+                occurrences.popitem(last=False)
+        else:
+            occurrences.move_to_end(expense["date"])
+        key = (expense["amount"], expense["description"])
+        day[key] = day.get(key, 0) + 1
+        expense["import_hash"] = _import_hash(username, expense, day[key])
+        yield expense, None
+
+
+# Fill in missing categories; returns the expenses whose category came with the statement
+def _categorize(username, chunk, auto_categorize):
+    labelled = {id(expense) for expense in chunk if expense["category"]}
+    missing = [expense for expense in chunk if not expense["category"]]
+    if not missing:
+        return labelled
+    predictions = [None] * len(missing)
+    if auto_categorize:
+        from backend.categorizer import predict_categories
+        predictions = predict_categories(username, [expense["description"] for expense in missing])
+    for expense, category in zip(missing, predictions):
+        expense["category"] = category or "Other"
+    return labelled
+
+
+# Teach the user's categorizer the statement's own categories of the newly inserted rows
+def _learn(username, inserted, labelled):
+    learned = [expense for expense in inserted if id(expense) in labelled]
+    if learned:
+        from backend.categorizer import learn_expenses
+        learn_expenses(username, [expense["description"] for expense in learned],
+                       [expense["category"] for expense in learned])
+
+
+# Import a statement for a user, returns a report dict
+def import_statement(username, source, filename=None, auto_categorize=False, chunk_size=CHUNK_SIZE, spending_sign=1):
+    started = time.perf_counter()
+    report = {"rows": 0, "inserted": 0, "duplicates": 0, "skipped": 0, "errors": []}
+    chunk = []
+
+    def flush():
+        labelled = _categorize(username, chunk, auto_categorize)
+        inserted, duplicates = get_repository().insert_expenses(chunk, return_inserted=True)
+        report["inserted"] += len(inserted)
+        report["duplicates"] += duplicates
+        _learn(username, inserted, labelled)
+        chunk.clear()
+
+    rows = iter_statement_rows(source, filename)
+    for expense, error in iter_expense_documents(username, rows, spending_sign=spending_sign):
+        report["rows"] += 1
+        if error:
+            report["skipped"] += 1
+            if len(report["errors"]) < 20:
+                report["errors"].append(f"row {report['rows']}: {error}")
+            continue
+        chunk.append(expense)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    report["seconds"] = time.perf_counter() - started
+    report["rows_per_second"] = report["rows"] / report["seconds"] if report["seconds"] else 0.0
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(2)
+    result = import_statement(sys.argv[1], sys.argv[2], auto_categorize="--auto-categorize" in sys.argv[3:],
+                              spending_sign=-1 if "--negative-spending" in sys.argv[3:] else 1)
+    for error in result.pop("errors"):
+        print(error)
+    print(result)
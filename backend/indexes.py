@@ -0,0 +1,193 @@
+"""
+Declarative index registry and query-plan checks.
+
+mongo_client.py calls start_index_bootstrap(db) when it creates the client,
+which creates every index in INDEXES on a background thread so startup does
+not wait on it.
+find_collscans(db) explains the query shape of each helper in database.py
+and reports the ones whose winning plan is a full collection scan.
+
+Usage:
+    python -m backend.indexes create
+    python -m backend.indexes check
+"""
+import sys
+import threading
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+# Collection name -> indexes it must have
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+    ],
+    "expenses": [
+        IndexModel([("username", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)], name="username_date_id"),
+        IndexModel([("username", ASCENDING), ("updated_at", ASCENDING)], name="username_updated_at"),
+        # Content hash of imported statement rows (it covers the username), for dedup on re-import
+        IndexModel([("import_hash", ASCENDING)], unique=True, sparse=True, name="import_hash_unique"),
+    ],
+    "expense_buckets": [
+        IndexModel([("username", ASCENDING), ("month", ASCENDING)], unique=True, name="username_month"),
+        # Multikey indexes over every archived expense, to edit one and to dedup imports
+        IndexModel([("ids", ASCENDING)], name="ids"),
+        IndexModel([("import_hashes", ASCENDING)], name="import_hashes"),
+    ],
+    "expense_tombstones": [
+        IndexModel([("username", ASCENDING), ("deleted_at", ASCENDING)], name="username_deleted_at"),
+        # Pruning spans every user
+        IndexModel([("deleted_at", ASCENDING)], name="deleted_at"),
+    ],
+    "income": [
+        IndexModel([("username", ASCENDING), ("date", ASCENDING)], name="username_date"),
+    ],
+    "recurring_expenses": [
+        IndexModel([("username", ASCENDING), ("start_date", ASCENDING)], name="username_start_date"),
+    ],
+    "split_expenses": [
+        IndexModel([("username", ASCENDING), ("expense_id", ASCENDING)], name="username_expense_id"),
+    ],
+    "debts": [
+        IndexModel([("username", ASCENDING), ("date", ASCENDING)], name="username_date"),
+    ],
+    "notification_outbox": [
+        IndexModel([("dedup_key", ASCENDING)], unique=True, name="dedup_key_unique"),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt_at"),
+    ],
+    "categorizer_models": [
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+    ],
+    "user_versions": [
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+    ],
+    "expense_summaries": [
+        IndexModel([("username", ASCENDING), ("day", ASCENDING), ("category", ASCENDING), ("currency", ASCENDING)],
+                   unique=True, name="username_day_category_currency"),
+    ],
+    "monthly_summaries": [
+        IndexModel([("username", ASCENDING), ("month", ASCENDING), ("category", ASCENDING)],
+                   unique=True, name="username_month_category"),
+    ],
+    "budgets": [
+        IndexModel([("username", ASCENDING), ("category", ASCENDING), ("period", ASCENDING)],
+                   unique=True, name="username_category_period"),
+    ],
+    "budget_spend": [
+        IndexModel([("username", ASCENDING), ("period", ASCENDING), ("period_key", ASCENDING), ("category", ASCENDING)],
+                   unique=True, name="username_period_key_category"),
+    ],
+}
+
+# Indexes replaced by a newer definition above, dropped by ensure_indexes
+RETIRED_INDEXES = {
+    "expense_summaries": ["username_day_category"],
+}
+
+# (helper, collection, filter) for every query issued by database.py
+_SAMPLE_DAY = datetime(2000, 1, 1)
+QUERY_SHAPES = [
+    ("create_user/authenticate_user", "users", {"username": ""}),
+    ("get_expenses", "expenses", {"username": ""}),
+    ("find_expenses", "expenses", {"username": "", "date": {"$gte": _SAMPLE_DAY, "$lte": _SAMPLE_DAY}}),
+    ("get_expenses_page", "expenses", {"$and": [{"username": ""}, {"$or": [
+        {"date": {"$lt": _SAMPLE_DAY}}, {"date": _SAMPLE_DAY, "_id": {"$lt": ObjectId("0" * 24)}},
+    ]}]}),
+    ("get_expense_changes", "expenses", {"username": "", "updated_at": {"$gt": _SAMPLE_DAY}}),
+    ("get_expense_changes", "expense_tombstones", {"username": "", "deleted_at": {"$gt": _SAMPLE_DAY}}),
+    ("prune_expense_tombstones", "expense_tombstones", {"deleted_at": {"$lt": _SAMPLE_DAY}}),
+    ("get_expense_buckets", "expense_buckets", {"username": "", "month": {"$gte": "", "$lte": ""}}),
+    ("_restore_archived_expense", "expense_buckets", {"ids": ObjectId("0" * 24)}),
+    ("insert_expenses", "expense_buckets", {"import_hashes": {"$in": [""]}}),
+    ("get_income", "income", {"username": ""}),
+    ("get_recurring_expenses", "recurring_expenses", {"username": ""}),
+    ("get_split_expenses", "split_expenses", {"username": "", "expense_id": ""}),
+    ("get_debts", "debts", {"username": ""}),
+    ("claim_notifications", "notification_outbox",
+     {"status": {"$in": ["pending", "sending"]}, "next_attempt_at": {"$lte": _SAMPLE_DAY}}),
+    ("load_categorizer_model", "categorizer_models", {"username": ""}),
+    ("bump_version/get_data_version", "user_versions", {"username": ""}),
+    ("apply_summary_deltas", "expense_summaries",
+     {"username": "", "day": _SAMPLE_DAY, "category": "", "currency": ""}),
+    ("apply_summary_deltas", "monthly_summaries", {"username": "", "month": "", "category": ""}),
+    ("get_budget_status", "budgets", {"username": "", "category": "", "period": ""}),
+    ("get_budget_status", "budget_spend", {"username": "", "period": "", "period_key": "", "category": ""}),
+]
+
+
+# Create every registered index, returns {collection: [index names]}
+def ensure_indexes(db):
+    for collection_name, names in RETIRED_INDEXES.items():
+        try:
+            existing = db[collection_name].index_information()
+            for name in names:
+                if name in existing:
+                    db[collection_name].drop_index(name)
+        except PyMongoError as e:
+            print(f"❌ Could not drop retired indexes on {collection_name}: {e}")
+
+    created = {}
+    for collection_name, indexes in INDEXES.items():
+        try:
+            created[collection_name] = db[collection_name].create_indexes(indexes)
+        except PyMongoError as e:
+            print(f"❌ Could not create indexes on {collection_name}: {e}")
+    return created
+
+
+# Create the indexes on a daemon thread so app startup is not blocked
+def start_index_bootstrap(db):
+    thread = threading.Thread(target=ensure_indexes, args=(db,), name="index-bootstrap", daemon=True)
+    thread.start()
+    return thread
+
+
+def _plan_stages(plan):
+    yield plan.get("stage")
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+    for child in plan.get("shards", []):
+        yield from _plan_stages(child.get("winningPlan", {}))
+
+
+# Winning plan stages MongoDB would use for a query
+def explain_stages(db, collection_name, query):
+    explanation = db[collection_name].find(query).explain()
+    winning_plan = explanation["queryPlanner"]["winningPlan"]
+    # Slot-based engine plans nest the classic plan under queryPlan
+    winning_plan = winning_plan.get("queryPlan", winning_plan)
+    return [stage for stage in _plan_stages(winning_plan) if stage]
+
+
+# Helpers whose query falls back to COLLSCAN, as (helper, collection, stages)
+def find_collscans(db):
+    offenders = []
+    for helper, collection_name, query in QUERY_SHAPES:
+        stages = explain_stages(db, collection_name, query)
+        if "COLLSCAN" in stages:
+            offenders.append((helper, collection_name, stages))
+    return offenders
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("create", "check"):
+        print(__doc__)
+        sys.exit(2)
+
+    from backend.mongo_client import get_database
+
+    db = get_database()
+
+    if sys.argv[1] == "create":
+        for collection_name, names in ensure_indexes(db).items():
+            print(f"{collection_name}: {', '.join(names)}")
+    else:
+        collscans = find_collscans(db)
+        for helper, collection_name, stages in collscans:
+            print(f"COLLSCAN in {helper} ({collection_name}): {' -> '.join(stages)}")
+        print("All queries use an index." if not collscans else f"{len(collscans)} queries scan a collection.")
+        sys.exit(1 if collscans else 0)
@@ -0,0 +1,281 @@
+"""
+Hot-path timing and storage traffic counters.
+
+Every public function of database.py, sqlite_store.py, expenses.py and
+utils.py is wrapped by instrument_module / instrument_class at import. Each
+call adds its latency to a per-function histogram, and the storage work done
+while it runs is charged to it: MongoDB commands with the documents and reply
+bytes they returned (see CommandMetricsListener in mongo_client.py) or SQLite
+statements. Nested calls charge storage work to the innermost function, and
+every function's latency includes its callees.
+
+A call costs two perf_counter reads and a few dict and list updates, so the
+layer stays on by default. Settings:
+
+    METRICS_ENABLED        0 leaves every function unwrapped (default 1)
+    METRICS_MEASURE_BYTES  0 skips estimating the BSON bytes of Mongo replies
+                           (default 1)
+    METRICS_TEXTFILE       path that start_textfile_writer() rewrites with
+                           prometheus_text() every METRICS_TEXTFILE_INTERVAL
+                           seconds (default 15), for a Prometheus textfile
+                           collector
+
+snapshot() backs the performance panel in app.py; prometheus_text() renders
+the same counters in the Prometheus text exposition format.
+"""
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+MEASURE_BYTES = os.getenv("METRICS_MEASURE_BYTES", "1") != "0"
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")
+TEXTFILE_INTERVAL_SECONDS = float(os.getenv("METRICS_TEXTFILE_INTERVAL", "15"))
+METRIC_PREFIX = "expense_tracker"
+# Histogram upper bounds in seconds, Prometheus' defaults plus sub-millisecond buckets
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Storage work done outside any instrumented function
+UNATTRIBUTED = "(unattributed)"
+
+
+# Counters for one instrumented function
+class Series:
+    __slots__ = ("name", "calls", "errors", "seconds", "buckets", "round_trips", "documents", "bytes")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # Last one is +Inf
+        self.round_trips = 0
+        self.documents = 0
+        self.bytes = 0
+
+
+_lock = threading.Lock()
+_series = {}  # function name -> Series
+_current = ContextVar("metrics_series", default=None)  # Innermost running instrumented function
+
+
+def _get_series(name):
+    with _lock:
+        series = _series.get(name)
+        if series is None:
+            series = _series[name] = Series(name)
+        return series
+
+
+def _observe(series, seconds, failed):
+    bucket = bisect_left(BUCKETS, seconds)
+    with _lock:
+        series.calls += 1
+        series.errors += failed
+        series.seconds += seconds
+        series.buckets[bucket] += 1
+
+
+# Decorator recording the latency of every call under `name`
+def timed(name):
+    def decorate(fn):
+        if not METRICS_ENABLED or getattr(fn, "__metrics_series__", None):
+            return fn
+        series = _get_series(name)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = _current.set(series)
+            started = time.perf_counter()
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception:  # Not BaseException: Streamlit reruns and stops are not errors
+                failed = True
+                raise
+            finally:
+                seconds = time.perf_counter() - started
+                _current.reset(token)
+                bucket = bisect_left(BUCKETS, seconds)
+                with _lock:
+                    series.calls += 1
+                    series.errors += failed
+                    series.seconds += seconds
+                    series.buckets[bucket] += 1
+
+        wrapper.__metrics_series__ = series
+        return wrapper
+    return decorate
+
+
+# Time a block that is not a function: `with measure("app.rerun"): ...`
+@contextmanager
+def measure(name):
+    series = _get_series(name)
+    token = _current.set(series)
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        _observe(series, time.perf_counter() - started, failed)
+        _current.reset(token)
+
+
+def _public_functions(namespace, module_name):
+    return [
+        name for name, value in namespace.items()
+        if inspect.isfunction(value) and value.__module__ == module_name and not name.startswith("_")
+    ]
+
+
+# Wrap the public functions a module defines, in place: call at the end of
+# the module (before anything captures the functions, like staticmethod)
+def instrument_module(namespace, prefix):
+    for name in _public_functions(namespace, namespace["__name__"]):
+        namespace[name] = timed(f"{prefix}.{name}")(namespace[name])
+
+
+# Wrap the public methods a class defines, in place
+def instrument_class(cls, prefix):
+    for name in _public_functions(vars(cls), cls.__module__):
+        setattr(cls, name, timed(f"{prefix}.{name}")(vars(cls)[name]))
+    return cls
+
+
+# Charge one storage round trip to the running function
+def record_round_trip(documents=0, size=0):
+    series = _current.get() or _get_series(UNATTRIBUTED)
+    with _lock:
+        series.round_trips += 1
+        series.documents += documents
+        series.bytes += size
+
+
+# (name, calls, errors, seconds, buckets, round trips, documents, bytes) per function
+def _copy_series():
+    with _lock:
+        return [(s.name, s.calls, s.errors, s.seconds, list(s.buckets), s.round_trips, s.documents, s.bytes)
+                for s in _series.values()]
+
+
+# Latency upper bound below which `quantile` of the calls finished
+def _quantile_seconds(buckets, calls, quantile):
+    rank = quantile * calls
+    seen = 0
+    for bound, count in zip(BUCKETS, buckets):
+        seen += count
+        if seen >= rank:
+            return bound
+    return float("inf")
+
+
+# Counters as they are now, for snapshot(since=...)
+def checkpoint():
+    return {row[0]: row for row in _copy_series()}
+
+
+# One dict per function called (since the checkpoint `since`, if given),
+# slowest total first
+def snapshot(since=None):
+    rows = []
+    for name, calls, errors, seconds, buckets, round_trips, documents, size in _copy_series():
+        if since and name in since:
+            _, calls_0, errors_0, seconds_0, buckets_0, round_trips_0, documents_0, size_0 = since[name]
+            calls, errors, seconds = calls - calls_0, errors - errors_0, seconds - seconds_0
+            buckets = [count - count_0 for count, count_0 in zip(buckets, buckets_0)]
+            round_trips, documents, size = round_trips - round_trips_0, documents - documents_0, size - size_0
+        if not calls and not round_trips:
+            continue
+        rows.append({
+            "function": name,
+            "calls": calls,
+            "errors": errors,
+            "total_ms": seconds * 1000,
+            "mean_ms": seconds * 1000 / calls if calls else 0.0,
+            "p50_ms": _quantile_seconds(buckets, calls, 0.5) * 1000 if calls else 0.0,
+            "p95_ms": _quantile_seconds(buckets, calls, 0.95) * 1000 if calls else 0.0,
+            "round_trips": round_trips,
+            "documents": documents,
+            "bytes": size,
+        })
+    return sorted(rows, key=lambda row: -row["total_ms"])
+
+
+def _label(name):
+    return name.replace("\\", "\\\\").replace('"', '\\"')
+
+
+# All counters in the Prometheus text exposition format
+def prometheus_text():
+    series = _copy_series()
+    duration = f"{METRIC_PREFIX}_function_duration_seconds"
+    lines = [f"# HELP {duration} Latency of instrumented functions.", f"# TYPE {duration} histogram"]
+    for name, calls, _, seconds, buckets, _, _, _ in series:
+        function = _label(name)
+        cumulative = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), buckets):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{duration}_bucket{{function="{function}",le="{le}"}} {cumulative}')
+        lines.append(f'{duration}_sum{{function="{function}"}} {seconds!r}')
+        lines.append(f'{duration}_count{{function="{function}"}} {calls}')
+    for metric, index, help_text in (
+        ("function_errors_total", 2, "Calls that raised."),
+        ("storage_round_trips_total", 5, "MongoDB commands or SQLite statements run."),
+        ("storage_documents_total", 6, "Documents returned by MongoDB cursors."),
+        ("storage_bytes_total", 7, "Estimated BSON bytes of MongoDB replies."),
+    ):
+        lines += [f"# HELP {METRIC_PREFIX}_{metric} {help_text}", f"# TYPE {METRIC_PREFIX}_{metric} counter"]
+        lines += [f'{METRIC_PREFIX}_{metric}{{function="{_label(row[0])}"}} {row[index]}' for row in series]
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        for series in _series.values():
+            series.calls = series.errors = series.round_trips = series.documents = series.bytes = 0
+            series.seconds = 0.0
+            series.buckets = [0] * (len(BUCKETS) + 1)
+
+
+# Replace path atomically, so a collector never reads half a file
+def write_textfile(path=METRICS_TEXTFILE):
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(temporary, path)
+
+
+_writer = {"thread": None, "stop": threading.Event()}
+_writer_lock = threading.Lock()
+
+
+def _run_writer(path, interval):
+    stop = _writer["stop"]
+    while not stop.wait(interval):
+        try:
+            write_textfile(path)
+        except OSError as e:
+            print(f"Metrics textfile error: {e}")
+
+
+# Start the process-wide METRICS_TEXTFILE writer once; a no-op when unset
+def start_textfile_writer(path=METRICS_TEXTFILE, interval=TEXTFILE_INTERVAL_SECONDS):
+    if not path or not METRICS_ENABLED:
+        return None
+    with _writer_lock:
+        if _writer["thread"] is None or not _writer["thread"].is_alive():
+            _writer["stop"].clear()
+            _writer["thread"] = threading.Thread(
+                target=_run_writer, args=(path, interval), name="metrics-textfile", daemon=True
+            )
+            _writer["thread"].start()
+        return _writer["thread"]
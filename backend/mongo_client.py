@@ -0,0 +1,327 @@
+"""
+Process-wide MongoDB client.
+
+Nothing connects at import: the first get_client() call (normally the first
+query made through a collection in database.py) builds one MongoClient for
+the whole process and starts the background index bootstrap. Pool sizes,
+timeouts and the read preference of analytics queries come from the
+environment:
+
+    MONGO_MAX_POOL_SIZE                   connections per server (default 50)
+    MONGO_MIN_POOL_SIZE                   connections kept open (default 0)
+    MONGO_SERVER_SELECTION_TIMEOUT_MS     wait for a usable server (default 5000)
+    MONGO_CONNECT_TIMEOUT_MS              TCP connect timeout (default 5000)
+    MONGO_SOCKET_TIMEOUT_MS               per-operation socket timeout (default 30000)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS           wait for a free pooled connection (default 10000)
+    MONGO_ANALYTICS_READ_PREFERENCE       primary (default), primaryPreferred,
+                                          secondary, secondaryPreferred or nearest
+    MONGO_ANALYTICS_MAX_STALENESS_SECONDS max secondary lag for analytics reads
+
+Usage:
+    python -m backend.mongo_client status
+"""
+import os
+import sys
+import threading
+import time
+
+import bson
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from pymongo.monitoring import CommandListener, ConnectionPoolListener
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+from backend import metrics
+from backend.indexes import start_index_bootstrap
+
+load_dotenv()
+
+DATABASE_NAME = "expense_tracker"
+MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+# Secondaries can lag behind writes, so analytics stay on the primary unless configured
+ANALYTICS_READ_PREFERENCE = os.getenv("MONGO_ANALYTICS_READ_PREFERENCE", "primary")
+ANALYTICS_MAX_STALENESS_SECONDS = int(os.getenv("MONGO_ANALYTICS_MAX_STALENESS_SECONDS", "-1"))
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+_lock = threading.Lock()
+_client = None
+_databases = {}  # analytics flag -> Database
+_collections = {}  # (name, analytics) -> Collection
+_index_bootstrap = None
+_transactions = {}  # "supported" -> whether the deployment runs multi-document transactions
+
+
+# Connection pool counters, fed by pymongo's pool events
+class PoolStatsListener(ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()  # Checkout start time, events fire on the waiting thread
+        self.open_connections = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _waited(self):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        waited = self._waited()
+        with self._lock:
+            self.checkout_failures += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def connection_checked_out(self, event):
+        waited = self._waited()
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def snapshot(self):
+        with self._lock:
+            attempts = self.checkouts + self.checkout_failures
+            return {
+                "max_pool_size": MAX_POOL_SIZE,
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+                "avg_wait_ms": self.total_wait_seconds * 1000 / attempts if attempts else 0.0,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+            }
+
+
+pool_listener = PoolStatsListener()
+
+
+# Charges every command, with the documents and bytes of its reply, to the
+# instrumented function running it (see backend/metrics.py). Events fire on
+# the thread that sent the command. Re-encoding a whole batch would cost more
+# than decoding it did, so batch bytes are estimated from its first document.
+class CommandMetricsListener(CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        reply = event.reply
+        cursor = reply.get("cursor")
+        batch = (cursor.get("firstBatch") or cursor.get("nextBatch") or []) if cursor else []
+        size = 0
+        if metrics.MEASURE_BYTES:
+            size = len(bson.encode(batch[0])) * len(batch) if batch else len(bson.encode(reply))
+        metrics.record_round_trip(len(batch), size)
+
+    def failed(self, event):
+        metrics.record_round_trip()
+
+
+command_listener = CommandMetricsListener()
+
+
+# MONGO_URI from .env, or from Streamlit secrets when deployed
+def get_mongo_uri():
+    uri = os.getenv("MONGO_URI")
+    if not uri:
+        try:
+            import streamlit as st
+            uri = st.secrets["MONGO_URI"]
+        except Exception:
+            uri = None
+    if not uri:
+        raise ValueError("MongoDB URI is missing! Set MONGO_URI in .env or Streamlit Secrets.")
+    return uri
+
+
+def analytics_read_preference():
+    if ANALYTICS_READ_PREFERENCE not in READ_PREFERENCES:
+        raise ValueError(f"Unknown MONGO_ANALYTICS_READ_PREFERENCE {ANALYTICS_READ_PREFERENCE!r}, "
+                         f"expected one of {', '.join(READ_PREFERENCES)}")
+    if ANALYTICS_READ_PREFERENCE == "primary":
+        return Primary()
+    return READ_PREFERENCES[ANALYTICS_READ_PREFERENCE](max_staleness=ANALYTICS_MAX_STALENESS_SECONDS)
+
+
+# The shared client, created on first use
+def get_client():
+    global _client, _index_bootstrap
+    if _client is not None:
+        return _client
+    with _lock:
+        if _client is None:
+            client = MongoClient(
+                get_mongo_uri(),
+                maxPoolSize=MAX_POOL_SIZE,
+                minPoolSize=MIN_POOL_SIZE,
+                serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=SOCKET_TIMEOUT_MS,
+                waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+                event_listeners=[pool_listener, command_listener] if metrics.METRICS_ENABLED else [pool_listener],
+            )
+            # Create missing indexes in the background (see backend/indexes.py)
+            _index_bootstrap = start_index_bootstrap(client[DATABASE_NAME])
+            _client = client
+    return _client
+
+
+# The app database; analytics=True reads with the analytics read preference
+def get_database(analytics=False):
+    database = _databases.get(analytics)
+    if database is None:
+        client = get_client()
+        if analytics:
+            database = client.get_database(DATABASE_NAME, read_preference=analytics_read_preference())
+        else:
+            database = client[DATABASE_NAME]
+        _databases[analytics] = database
+    return database
+
+
+def get_collection(name, analytics=False):
+    collection = _collections.get((name, analytics))
+    if collection is None:
+        collection = _collections[(name, analytics)] = get_database(analytics)[name]
+    return collection
+
+
+# Stands in for a collection at import time and resolves it on first use,
+# so importing database.py never opens a connection
+class LazyCollection:
+    def __init__(self, name, analytics=False):
+        self._name = name
+        self._analytics = analytics
+
+    def __getattr__(self, attribute):
+        return getattr(get_collection(self._name, self._analytics), attribute)
+
+    def __repr__(self):
+        return f"LazyCollection({self._name!r}, analytics={self._analytics})"
+
+
+# Multi-document transactions need a replica set or a sharded cluster
+def supports_transactions():
+    supported = _transactions.get("supported")
+    if supported is None:
+        try:
+            hello = get_client().admin.command("hello")
+            supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+        except (PyMongoError, NotImplementedError):  # NotImplementedError: in-memory stand-ins like mongomock
+            supported = False
+        _transactions["supported"] = supported
+    return supported
+
+
+# callback(session) inside a transaction when the deployment supports them,
+# otherwise callback(None); returns what the callback returns
+def run_in_transaction(callback):
+    if not supports_transactions():
+        return callback(None)
+    with get_client().start_session() as session:
+        return session.with_transaction(callback)
+
+
+# Close the client and forget it; the next query reconnects
+def close_client():
+    global _client, _index_bootstrap
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _index_bootstrap = None
+        _transactions.clear()
+        _databases.clear()
+        _collections.clear()
+
+
+# Liveness: some server in the deployment answers a ping
+def check_health():
+    try:
+        started = time.perf_counter()
+        get_client().admin.command("ping", read_preference=Nearest())
+        return True, f"MongoDB reachable ({(time.perf_counter() - started) * 1000:.1f} ms)"
+    except (PyMongoError, ValueError) as e:
+        return False, f"MongoDB unreachable: {e}"
+
+
+# Readiness: the primary accepts commands and the index bootstrap has finished
+def check_readiness():
+    try:
+        get_client().admin.command("ping")
+    except (PyMongoError, ValueError) as e:
+        return False, f"No MongoDB primary available: {e}"
+    if _index_bootstrap is not None and _index_bootstrap.is_alive():
+        return False, "Indexes are still being created."
+    return True, "MongoDB ready."
+
+
+def pool_stats():
+    return pool_listener.snapshot()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] != "status":
+        print(__doc__)
+        sys.exit(2)
+
+    healthy, message = check_health()
+    print(message)
+    ready, message = check_readiness() if healthy else (False, "Skipped readiness check.")
+    print(message)
+    for name, value in pool_stats().items():
+        print(f"{name}: {value:.1f}" if isinstance(value, float) else f"{name}: {value}")
+    sys.exit(0 if ready else 1)
@@ -0,0 +1,145 @@
+"""
+Background sender for the notification outbox.
+
+The UI only calls enqueue_notification (database.py). A daemon worker claims
+due notifications in batches and sends them over one kept-alive SMTP
+connection, retrying failures with exponential backoff.
+
+SMTP settings come from the environment: EMAIL_HOST (smtp.gmail.com),
+EMAIL_PORT (587), EMAIL_USE_TLS (1), EMAIL_USER and EMAIL_PASS. For a local
+stand-in such as aiosmtpd use EMAIL_HOST=localhost EMAIL_PORT=8025
+EMAIL_USE_TLS=0 and leave the credentials unset.
+"""
+import os
+import threading
+import time
+
+from backend.features import lazy_feature
+from backend.repository import get_repository
+
+# smtplib (and ssl) load on the first send, not when the worker starts
+smtplib = lazy_feature("email")
+
+POLL_INTERVAL_SECONDS = 10
+# Close the SMTP connection after this long without sending
+IDLE_TIMEOUT_SECONDS = 60
+
+
+def smtp_settings():
+    return {
+        "host": os.getenv("EMAIL_HOST", "smtp.gmail.com"),
+        "port": int(os.getenv("EMAIL_PORT", "587")),
+        "use_tls": os.getenv("EMAIL_USE_TLS", "1") not in ("0", "false", "False"),
+        "user": os.getenv("EMAIL_USER"),
+        "password": os.getenv("EMAIL_PASS"),
+    }
+
+
+def build_message(sender, to_email, subject, message):
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    msg = MIMEMultipart()
+    msg["From"] = sender
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.attach(MIMEText(message, "plain"))
+    return msg
+
+
+# One SMTP connection reused across sends, reopened when the server drops it
+class SmtpConnection:
+    def __init__(self, settings=None):
+        self.settings = settings or smtp_settings()
+        self.server = None
+        self.last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.settings["host"], self.settings["port"], timeout=30)
+        if self.settings["use_tls"]:
+            server.starttls()
+        if self.settings["user"] and self.settings["password"]:
+            server.login(self.settings["user"], self.settings["password"])
+        self.server = server
+
+    def send(self, to_email, subject, message):
+        sender = self.settings["user"] or "expense-tracker@localhost"
+        payload = build_message(sender, to_email, subject, message).as_string()
+        for attempt in range(2):
+            if self.server is None:
+                self._connect()
+            try:
+                self.server.sendmail(sender, to_email, payload)
+                self.last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.server = None
+                if attempt:
+                    raise
+
+    def close_if_idle(self):
+        if self.server is not None and time.monotonic() - self.last_used > IDLE_TIMEOUT_SECONDS:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except smtplib.SMTPException:
+                pass
+            self.server = None
+
+
+# Send one batch of due notifications, returns (sent, failed). A claim holds a
+# notification for lease_seconds, after which another worker may retry it.
+def process_outbox(connection, batch_size=50, lease_seconds=300, base_delay_seconds=30):
+    repository = get_repository()
+    sent = failed = 0
+    for notification in repository.claim_notifications(batch_size, lease_seconds):
+        try:
+            connection.send(notification["to_email"], notification["subject"], notification["message"])
+            repository.mark_notification_sent(notification["_id"])
+            sent += 1
+        except (smtplib.SMTPException, OSError) as e:
+            connection.server = None  # Reconnect on the next send
+            repository.mark_notification_failed(notification, e, base_delay_seconds)
+            failed += 1
+    return sent, failed
+
+
+_worker = {"thread": None, "stop": threading.Event()}
+_worker_lock = threading.Lock()
+
+
+def _run_worker(interval):
+    connection = SmtpConnection()
+    stop = _worker["stop"]
+    while not stop.is_set():
+        try:
+            sent, failed = process_outbox(connection)
+        except Exception as e:
+            print(f"Notification worker error: {e}")
+            sent = failed = 0
+        if not sent and not failed:
+            connection.close_if_idle()
+            stop.wait(interval)
+    connection.close()
+
+
+# Start the process-wide worker thread once; later calls are no-ops
+def start_notification_worker(interval=POLL_INTERVAL_SECONDS):
+    with _worker_lock:
+        if _worker["thread"] is not None and _worker["thread"].is_alive():
+            return _worker["thread"]
+        _worker["stop"].clear()
+        _worker["thread"] = threading.Thread(
+            target=_run_worker, args=(interval,), name="notification-worker", daemon=True
+        )
+        _worker["thread"].start()
+        return _worker["thread"]
+
+
+def stop_notification_worker(timeout=5):
+    _worker["stop"].set()
+    if _worker["thread"] is not None:
+        _worker["thread"].join(timeout)
@@ -0,0 +1,166 @@
+"""
+Asynchronous receipt OCR.
+
+Uploads are keyed by the SHA-256 of their bytes. submit_receipt hands new
+images to a process pool that downscales and binarizes them before running
+tesseract, and get_receipt_result returns None until the text is ready. The
+text is parsed into a draft expense (amount, date, merchant) that
+save_receipt_draft stores with add_expense. Finished results and failures
+stay in LRU caches, so reruns with the same file attached don't OCR it again.
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+
+from PIL import Image, ImageOps
+
+from backend.repository import get_repository
+
+# Longest side after downscaling; receipts stay legible well below phone-camera size
+MAX_SIDE = 1600
+BINARIZE_THRESHOLD = 160
+MAX_CACHED_RESULTS = 256
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+
+RECEIPT_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%d/%m/%y", "%m/%d/%y", "%d-%m-%Y", "%d.%m.%Y",
+                        "%d %b %Y", "%b %d %Y")
+# A whole number of any length or one with "," or "." thousands separators, then
+# cents. The lookbehind stops a match from starting mid-number ("1234.56" is not
+# "234.56"). Spaces don't group digits: on item lines they follow a quantity
+# ("Widget 2 150.00").
+_AMOUNT = re.compile(r"(?<![\d,.])((?:\d{1,3}(?:[,.]\d{3})+|\d+)[.,]\d{2})\b")
+_DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2}|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{1,2} [A-Za-z]{3} \d{4}|[A-Za-z]{3} \d{1,2},? \d{4})\b")
+_TOTAL_LINE = re.compile(r"\b(grand total|total|amount due|balance due)\b", re.IGNORECASE)
+_NOT_TOTAL = re.compile(r"\b(sub ?total|tax|discount|change|tip)\b", re.IGNORECASE)
+
+_lock = threading.Lock()
+_results = OrderedDict()  # image hash -> {"text", "draft"}
+_failures = OrderedDict()  # image hash -> exception raised by OCR
+_pending = {}  # image hash -> Future
+_executor = {"pool": None}
+
+
+# Grayscale, downscale and binarize an image to speed up and steady tesseract
+def preprocess_image(image):
+    image = ImageOps.exif_transpose(image).convert("L")
+    image.thumbnail((MAX_SIDE, MAX_SIDE))
+    image = ImageOps.autocontrast(image)
+    return image.point(lambda value: 255 if value > BINARIZE_THRESHOLD else 0, mode="1")
+
+
+# Runs in a worker process
+def _ocr_bytes(image_bytes, preprocess=True):
+    import pytesseract
+
+    image = Image.open(io.BytesIO(image_bytes))
+    if preprocess:
+        image = preprocess_image(image)
+    return pytesseract.image_to_string(image)
+
+
+def _parse_amount(text):
+    cleaned = text.replace(",", ".")
+    # "1.234.56" -> "1234.56"
+    whole, _, cents = cleaned.rpartition(".")
+    return float(whole.replace(".", "") + "." + cents)
+
+
+# Pull total, date and merchant out of OCR text into a draft expense
+def parse_receipt(text):
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+
+    amount = None
+    for line in reversed(lines):  # The total is usually near the bottom
+        if _TOTAL_LINE.search(line) and not _NOT_TOTAL.search(line):
+            matches = _AMOUNT.findall(line)
+            if matches:
+                amount = _parse_amount(matches[-1])
+                break
+    if amount is None:
+        amounts = [_parse_amount(match) for line in lines for match in _AMOUNT.findall(line)]
+        amount = max(amounts) if amounts else None
+
+    expense_date = None
+    for match in _DATE.findall(text):
+        for date_format in RECEIPT_DATE_FORMATS:
+            try:
+                expense_date = datetime.strptime(match.replace(",", ""), date_format).date()
+                break
+            except ValueError:
+                continue
+        if expense_date:
+            break
+
+    merchant = next((line for line in lines if re.search(r"[A-Za-z]{3}", line)), None)
+    return {"amount": amount, "date": expense_date, "merchant": merchant, "description": merchant or "Receipt"}
+
+
+def image_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _pool():
+    if _executor["pool"] is None:
+        _executor["pool"] = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+    return _executor["pool"]
+
+
+def _remember(cache, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > MAX_CACHED_RESULTS:
+        cache.popitem(last=False)
+
+
+# Queue an image for OCR unless it is cached, in flight or failed before;
+# returns its hash
+def submit_receipt(image_bytes):
+    key = image_hash(image_bytes)
+    with _lock:
+        if key not in _results and key not in _pending and key not in _failures:
+            _pending[key] = _pool().submit(_ocr_bytes, image_bytes)
+    return key
+
+
+# {"text", "draft"} once OCR has finished, None while it is still running.
+# Raises the worker's exception if OCR failed, again on every later call.
+def get_receipt_result(key, wait=None):
+    with _lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key]
+        if key in _failures:
+            _failures.move_to_end(key)
+            raise _failures[key]
+        future = _pending.get(key)
+    if future is None:
+        raise KeyError(f"Unknown receipt {key}")
+    if wait is None and not future.done():
+        return None
+    try:
+        text = future.result(timeout=wait)
+    except FutureTimeoutError:
+        return None
+    except Exception as e:
+        with _lock:
+            _pending.pop(key, None)
+            _remember(_failures, key, e)
+        raise
+    result = {"text": text, "draft": parse_receipt(text)}
+    with _lock:
+        _pending.pop(key, None)
+        _remember(_results, key, result)
+    return result
+
+
+# Store a reviewed draft as an expense
+def save_receipt_draft(username, draft, category="Other"):
+    if not draft.get("amount"):
+        return False, "No amount found on the receipt."
+    return get_repository().add_expense(username, draft.get("date") or datetime.today().date(), category,
+                                        draft.get("description") or "Receipt", draft["amount"])
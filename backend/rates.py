@@ -0,0 +1,145 @@
+"""
+Offline exchange-rate store.
+
+Daily rates are loaded once from a CSV snapshot (date,currency,rate, where
+rate is units of the currency per 1 USD) and held in memory as sorted
+NumPy arrays per currency. Conversions use the latest rate on or before
+each row's date, so a whole DataFrame column converts with one vectorized
+lookup per currency and no network access.
+
+data/exchange_rates.csv ships with approximate reference rates for the
+start of 2023, 2024 and 2025; `fetch` replaces it with daily rates. Amounts
+in a currency the snapshot doesn't cover convert to NaN and convert_frame
+leaves those rows out, so callers can list them with missing_rates() and
+warn instead of failing.
+
+Usage:
+    python -m backend.rates fetch <start YYYY-MM-DD> <end YYYY-MM-DD> [currency ...]
+"""
+import csv
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+RATES_FILE = os.getenv("EXCHANGE_RATES_FILE", os.path.join(os.path.dirname(__file__), "..", "data", "exchange_rates.csv"))
+DEFAULT_CURRENCIES = ["EUR", "GBP", "INR", "JPY", "CAD", "AUD"]
+
+_lock = threading.Lock()
+_table = {"mtime": None, "rates": {}}  # currency -> (dates datetime64[D], rates float64)
+
+
+# Parse a snapshot file into {currency: (dates, rates)}
+def load_rates_file(path=RATES_FILE):
+    rows = {}
+    with open(path, newline="") as handle:
+        for row in csv.DictReader(handle):
+            rows.setdefault(row["currency"].upper(), []).append((row["date"], float(row["rate"])))
+    table = {}
+    for currency, values in rows.items():
+        values.sort()
+        table[currency] = (
+            np.array([day for day, _ in values], dtype="datetime64[D]"),
+            np.array([rate for _, rate in values], dtype=np.float64),
+        )
+    return table
+
+
+# In-memory rate arrays, reloaded only when the snapshot file changes
+def get_rates():
+    try:
+        mtime = os.path.getmtime(RATES_FILE)
+    except OSError:
+        return {}
+    with _lock:
+        if _table["mtime"] != mtime:
+            _table["rates"] = load_rates_file(RATES_FILE)
+            _table["mtime"] = mtime
+        return _table["rates"]
+
+
+# Currencies among `currencies` with no rates in the snapshot, sorted
+def missing_rates(currencies):
+    rates = get_rates()
+    return sorted({currency for currency in currencies if currency and currency != "USD" and currency not in rates})
+
+
+# Units of `currency` per USD on each of `days` (datetime64 array), NaN if the snapshot has no rates for it
+def _usd_rates(currency, days, rates):
+    if currency == "USD":
+        return np.ones(len(days))
+    if currency not in rates:
+        return np.full(len(days), np.nan)
+    rate_days, values = rates[currency]
+    positions = np.searchsorted(rate_days, days, side="right") - 1
+    # Dates before the snapshot starts use its first rate
+    return values[np.clip(positions, 0, len(values) - 1)]
+
+
+# Units of `currency` per USD on `day`, or None without rates for it
+def usd_rate(currency, day):
+    rate = _usd_rates(currency or "USD", np.array([day], dtype="datetime64[D]"), get_rates())[0]
+    return None if np.isnan(rate) else float(rate)
+
+
+# Convert amounts (arrays of equal length) into to_currency in one pass;
+# amounts in (or into) a currency without rates come back as NaN
+def convert_amounts(amounts, currencies, days, to_currency="USD"):
+    rates = get_rates()
+    amounts = np.asarray(amounts, dtype=np.float64)
+    # Rows stored without a currency were entered in USD
+    currencies = pd.Series(currencies, dtype=object).fillna("USD").replace("", "USD").to_numpy()
+    days = np.asarray(days, dtype="datetime64[D]")
+    to_rates = _usd_rates(to_currency, days, rates)
+    converted = np.empty(len(amounts))
+    for currency in pd.unique(currencies):
+        mask = currencies == currency
+        converted[mask] = amounts[mask] / _usd_rates(currency, days[mask], rates) * to_rates[mask]
+    return converted
+
+
+# Copy of an expense-like frame with amounts in base_currency, without the
+# rows that couldn't be converted (see missing_rates)
+def convert_frame(df, base_currency="USD", date_column="date"):
+    if df.empty or "currency" not in df.columns:
+        return df
+    converted = df.copy()
+    converted["amount"] = convert_amounts(
+        df["amount"].to_numpy(), df["currency"].astype(object).to_numpy(),
+        pd.to_datetime(df[date_column]).to_numpy(), base_currency,
+    )
+    converted["currency"] = base_currency
+    return converted[converted["amount"].notna()]
+
+
+# Download daily rates with forex_python and write a snapshot (needs network)
+def fetch_snapshot(start, end, currencies=DEFAULT_CURRENCIES, path=RATES_FILE):
+    from forex_python.converter import CurrencyRates
+
+    client = CurrencyRates()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["date", "currency", "rate"])
+        day = start
+        while day <= end:
+            rates = client.get_rates("USD", day)
+            for currency in currencies:
+                if currency in rates:
+                    writer.writerow([day.strftime("%Y-%m-%d"), currency, rates[currency]])
+            day += timedelta(days=1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[1] != "fetch":
+        print(__doc__)
+        sys.exit(2)
+    fetch_snapshot(
+        datetime.strptime(sys.argv[2], "%Y-%m-%d"),
+        datetime.strptime(sys.argv[3], "%Y-%m-%d"),
+        [currency.upper() for currency in sys.argv[4:]] or DEFAULT_CURRENCIES,
+    )
+    print(f"Wrote exchange rates to {RATES_FILE}.")
@@ -0,0 +1,190 @@
+import re
+from datetime import datetime, timedelta, date
+
+# Shared by every storage backend (see backend/repository.py): validation,
+# document building and the bookkeeping rules the write paths follow.
+
+# How long deleted expense ids are kept for delta syncs
+TOMBSTONE_RETENTION = timedelta(days=30)
+MAX_NOTIFICATION_ATTEMPTS = 5
+
+# Budgets: category "All" budgets the user's total spend
+ALL_CATEGORIES = "All"
+# Period name -> strftime format of its key
+BUDGET_PERIODS = {"weekly": "%G-W%V", "monthly": "%Y-%m"}
+# Alert levels, as percentages of the budget
+BUDGET_WARNING_LEVEL = 80
+BUDGET_EXCEEDED_LEVEL = 100
+
+# Debt type -> sign of what the counterparty owes the user: a debt is money
+# the user owes, a loan money they lent
+DEBT_SIGNS = {"Debt": -1, "Loan": 1}
+
+
+def is_strong_password(password):
+    """
+    Check if the password is strong:
+    - At least 8 characters
+    - Contains at least one uppercase letter
+    - Contains at least one lowercase letter
+    - Contains at least one digit
+    - Contains at least one special character
+    """
+    if len(password) < 8:
+        return False, "Password must be at least 8 characters long."
+    if not re.search(r"[A-Z]", password):
+        return False, "Password must contain at least one uppercase letter."
+    if not re.search(r"[a-z]", password):
+        return False, "Password must contain at least one lowercase letter."
+    if not re.search(r"\d", password):
+        return False, "Password must contain at least one digit."
+    if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
+        return False, "Password must contain at least one special character."
+    return True, ""
+
+
+# Normalize a str/date/datetime value to a datetime for queries
+def normalize_date(value, formats=("%Y-%m-%d",)):
+    if isinstance(value, str):
+        for date_format in formats:
+            try:
+                return datetime.strptime(value.strip(), date_format)
+            except ValueError:
+                continue
+        raise ValueError(f"time data {value!r} does not match any of {', '.join(formats)}")
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    raise ValueError(f"Invalid date type: {type(value)}")
+
+
+# Build the stored form of an expense; raises ValueError for a bad date.
+# Shared by add_expense and the bulk importer so both store dates the same way.
+def build_expense_document(username, date_value, category, description, amount, currency="USD",
+                           recurring=False, recurrence_period=None, date_formats=("%Y-%m-%d",)):
+    # Expenses are stored per day, at midnight
+    date_obj = datetime.combine(normalize_date(date_value, date_formats).date(), datetime.min.time())
+    return {
+        "username": username,
+        "date": date_obj,
+        "category": category,
+        "description": description,
+        "amount": float(amount),
+        "currency": currency,
+        "recurring": recurring,
+        "recurrence_period": recurrence_period if recurring and recurrence_period else None,
+        "updated_at": datetime.utcnow()
+    }
+
+
+# Split `total` evenly between people in whole cents; the first people take
+# the leftover cents, so the shares always add up to the total
+def split_shares(total, people):
+    cents, remainder = divmod(round(float(total) * 100), len(people))
+    return [(person, (cents + (index < remainder)) / 100) for index, person in enumerate(people)]
+
+
+# Split documents for one expense from [(person, amount)]; raises ValueError
+# on a blank or repeated name or a non-positive amount
+def build_split_documents(username, expense_id, shares):
+    if not shares:
+        raise ValueError("Add at least one person to split with.")
+    documents, seen = [], set()
+    for person, amount in shares:
+        person = (person or "").strip()
+        if not person:
+            raise ValueError("Every person needs a name.")
+        if person in seen:
+            raise ValueError(f"{person} is listed more than once.")
+        if float(amount) <= 0:
+            raise ValueError(f"{person}'s share must be more than zero.")
+        seen.add(person)
+        documents.append({"username": username, "expense_id": expense_id, "person_name": person,
+                          "amount": float(amount)})
+    return documents
+
+
+# Summary and budget counter increments for adding (sign=1) or removing
+# (sign=-1) expenses. Returns (daily, monthly, spend):
+#   daily   (username, day, category, currency) -> (total, count)
+#   monthly (username, "YYYY-MM", category) -> (total, count)
+#   spend   (username, period, period key, category) -> spent in USD
+# Daily and monthly totals add amounts as stored, in their own currencies.
+# Budgets are in USD, so spend converts with the rates snapshot (see
+# backend/rates.py); amounts in a currency it has no rates for don't count.
+# Pre-aggregated rows (as in rebuilds) carry their expense "count".
+def summary_deltas(expenses, sign):
+    daily, monthly, spend = {}, {}, {}
+    day_keys = {}  # day -> (month, budget period keys); strftime once per distinct day
+    usd_rates = {}  # (currency, day) -> units per USD, or None without rates
+    for expense in expenses:
+        day = datetime.combine(expense["date"].date(), datetime.min.time())
+        if day not in day_keys:
+            day_keys[day] = (day.strftime("%Y-%m"), [
+                (period, day.strftime(key_format)) for period, key_format in BUDGET_PERIODS.items()
+            ])
+        month, period_keys = day_keys[day]
+        currency = expense.get("currency") or "USD"
+        amount = sign * float(expense["amount"])
+        for totals, key in (
+            (daily, (expense["username"], day, expense["category"], currency)),
+            (monthly, (expense["username"], month, expense["category"])),
+        ):
+            total, count = totals.get(key, (0.0, 0))
+            totals[key] = (total + amount, count + sign * expense.get("count", 1))
+        spent = amount
+        if currency != "USD":
+            if (currency, day) not in usd_rates:
+                from backend.rates import usd_rate
+                usd_rates[(currency, day)] = usd_rate(currency, day)
+            rate = usd_rates[(currency, day)]
+            spent = amount / rate if rate else 0.0
+        for period, period_key in period_keys:
+            for category in (expense["category"], ALL_CATEGORIES):
+                key = (expense["username"], period, period_key, category)
+                spend[key] = spend.get(key, 0.0) + spent
+    return daily, monthly, spend
+
+
+# The (daily, monthly, spend) summaries that compute_daily_rows' rows
+# ({(username, "YYYY-MM-DD", category, currency): (total, count)}) add up to,
+# for rebuilds and drift checks
+def rebuilt_summaries(daily_rows):
+    rows = [
+        {"username": user, "date": datetime.strptime(day, "%Y-%m-%d"), "category": category, "currency": currency,
+         "amount": total, "count": count}
+        for (user, day, category, currency), (total, count) in daily_rows.items()
+    ]
+    return summary_deltas(rows, 1)
+
+
+def budget_level(spent, amount):
+    if spent > amount:
+        return BUDGET_EXCEEDED_LEVEL
+    if spent >= amount * BUDGET_WARNING_LEVEL / 100:
+        return BUDGET_WARNING_LEVEL
+    return 0
+
+
+# (alert type, subject, message) for a budget threshold crossing
+def budget_alert(category, period, level):
+    label = "your" if category == ALL_CATEGORIES else f"your {category}"
+    if level >= BUDGET_EXCEEDED_LEVEL:
+        subject, message = "Budget Exceeded", f"You have exceeded {label} {period} budget."
+    else:
+        subject, message = "Budget Warning", f"You have used {level}% of {label} {period} budget."
+    return f"budget_{category}_{period}_{level}", subject, message
+
+
+# Field updates after a failed send: retry with exponential backoff, or give
+# up after the last attempt
+def notification_failure_update(notification, error, base_delay_seconds=30):
+    attempts = notification.get("attempts", 0) + 1
+    update = {"attempts": attempts, "last_error": str(error)}
+    if attempts >= MAX_NOTIFICATION_ATTEMPTS:
+        update["status"] = "failed"
+    else:
+        update["status"] = "pending"
+        update["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=base_delay_seconds * 2 ** (attempts - 1))
+    return update
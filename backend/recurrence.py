@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+# Frequency name -> fixed interval in days ("Monthly" is calendar based)
+FIXED_INTERVALS = {"Daily": 1, "Weekly": 7, "Biweekly": 14}
+OCCURRENCE_COLUMNS = ["date", "category", "description", "amount", "currency", "recurring",
+                      "recurrence_period", "id"]
+
+
+def _to_day(value):
+    return np.datetime64(pd.Timestamp(value).date(), "D")
+
+
+# Occurrence dates of one rule that fall inside [window_start, window_end]
+def occurrence_dates(rule, window_start, window_end):
+    start = _to_day(rule["start_date"])
+    end = _to_day(window_end)
+    if rule.get("end_date") is not None:
+        end = min(end, _to_day(rule["end_date"]))
+    window_start = max(start, _to_day(window_start))
+    if end < window_start:
+        return np.array([], dtype="datetime64[D]")
+
+    if rule["frequency"] == "Monthly":
+        # Same day of month as start_date, clipped to the month's last day
+        start_month = start.astype("datetime64[M]")
+        first = int((window_start.astype("datetime64[M]") - start_month).astype(int))
+        last = int((end.astype("datetime64[M]") - start_month).astype(int))
+        months = start_month + np.arange(first, last + 1)
+        month_lengths = ((months + 1).astype("datetime64[D]") - months.astype("datetime64[D]")).astype(int)
+        day_offset = np.minimum(int((start - start_month.astype("datetime64[D]")).astype(int)), month_lengths - 1)
+        dates = months.astype("datetime64[D]") + day_offset
+    else:
+        interval = int(rule.get("interval_days") or FIXED_INTERVALS[rule["frequency"]])
+        first = -(-int((window_start - start).astype(int)) // interval)  # ceil division
+        last = int((end - start).astype(int)) // interval
+        dates = start + np.arange(first, last + 1) * interval
+
+    return dates[(dates >= window_start) & (dates <= end)]
+
+
+# First day whose occurrence of `rule` is not stored as an expense yet (the
+# batch runner stores due occurrences and sets materialized_through)
+def unmaterialized_start(rule, window_start):
+    materialized_through = rule.get("materialized_through")
+    if materialized_through is None:
+        return window_start
+    return max(pd.Timestamp(window_start), pd.Timestamp(materialized_through) + pd.Timedelta(days=1))
+
+
+# Expand recurring rules into expense-shaped rows for a date window, leaving
+# out occurrences already stored as expenses
+def expand_rules(rules, window_start, window_end):
+    frames = []
+    for rule in rules:
+        dates = occurrence_dates(rule, unmaterialized_start(rule, window_start), window_end)
+        if not len(dates):
+            continue
+        rule_id = str(rule.get("_id", ""))
+        frames.append(pd.DataFrame({
+            "date": dates.astype("datetime64[ns]"),
+            "category": rule["category"],
+            "description": rule["description"],
+            "amount": float(rule["amount"]),
+            "currency": rule.get("currency", "USD"),
+            "recurring": True,
+            "recurrence_period": rule.get("interval_days"),
+            "id": [f"{rule_id}:{day}" for day in dates.astype(str)],
+        }))
+    if not frames:
+        return pd.DataFrame(columns=OCCURRENCE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,246 @@
+"""
+Storage backends.
+
+Repository lists every storage operation the app uses. backend/database.py
+implements it on MongoDB and backend/sqlite_store.py on an embedded SQLite
+file; get_repository() returns the one selected by configuration:
+
+    STORAGE_BACKEND=mongo   (default) needs MONGO_URI
+    STORAGE_BACKEND=sqlite  uses SQLITE_PATH (default data/expense_tracker.db)
+
+Both return the same shapes: dicts keyed like the Mongo documents, datetimes
+for dates and (success, message) tuples from writes.
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(os.path.dirname(__file__), "..", "data", "expense_tracker.db"))
+# Keys accepted by group_expenses and get_summary_totals
+GROUP_KEYS = ("day", "month", "category")
+
+
+class Repository(ABC):
+    # Exception types the backend raises for storage failures
+    errors = ()
+
+    # Users
+    @abstractmethod
+    def create_user(self, username, password, email): ...
+
+    @abstractmethod
+    def authenticate_user(self, username, password): ...
+
+    @abstractmethod
+    def get_user_email(self, username): ...
+
+    # Usernames after `after` (all by default) in ascending order, paged
+    @abstractmethod
+    def iter_usernames(self, after=None, page_size=1000): ...
+
+    # Counter every write to the user's data raises, shared by all processes
+    # using the same storage (cached reads compare it, see backend/cache.py)
+    @abstractmethod
+    def get_data_version(self, username): ...
+
+    # Expenses
+    @abstractmethod
+    def add_expense(self, username, date_value, category, description, amount, currency="USD", recurring=False,
+                    recurrence_period=None): ...
+
+    # Insert built expense documents, skipping duplicate import hashes; returns (inserted, duplicates),
+    # with the inserted documents instead of their count if return_inserted
+    @abstractmethod
+    def insert_expenses(self, expenses, return_inserted=False): ...
+
+    @abstractmethod
+    def get_expenses(self, username): ...
+
+    # (iterable of changed expenses, deleted ids, high-water mark); hot expenses only, not archived ones
+    @abstractmethod
+    def get_expense_changes(self, username, since=None, projection=None, batch_size=5000): ...
+
+    @abstractmethod
+    def prune_expense_tombstones(self): ...
+
+    @abstractmethod
+    def find_expenses(self, username, date_range=None, category=None, amount_range=None, projection=None): ...
+
+    # (rows, next cursor) with keyset pagination on (date, id)
+    @abstractmethod
+    def get_expenses_page(self, username, page_size=50, after=None, date_range=None, category=None,
+                          amount_range=None, projection=None): ...
+
+    @abstractmethod
+    def get_expense_totals(self, username, date_range=None, category=None, amount_range=None): ...
+
+    # [(key, amount)] sorted by key; key is a date, "YYYY-MM" or a category per GROUP_KEYS.
+    # Amounts are added as stored, whatever their currency (converted rollups are in expenses.py)
+    @abstractmethod
+    def group_expenses(self, username, by, date_range=None, category=None, amount_range=None): ...
+
+    @abstractmethod
+    def delete_expense(self, expense_id): ...
+
+    # Delete all of a user's expenses, hot and archived, with their summaries and budget counters;
+    # returns how many were deleted
+    @abstractmethod
+    def delete_user_expenses(self, username): ...
+
+    @abstractmethod
+    def update_expense(self, expense_id, date, category, description, amount, currency="USD"): ...
+
+    # Archive (backend/archive.py)
+    # Move the user's expenses dated before `before` into monthly buckets; returns (archived, buckets written)
+    @abstractmethod
+    def archive_expenses(self, username, before): ...
+
+    # The user's buckets, optionally only months first..last ("YYYY-MM"), oldest first unless newest_first
+    @abstractmethod
+    def get_expense_buckets(self, username, months=None, newest_first=False): ...
+
+    # Materialized summaries
+    # [(key, amount)] from the summaries, like group_expenses without filters (amounts as stored)
+    @abstractmethod
+    def get_summary_totals(self, username, by): ...
+
+    # Non-empty daily summary rows: {"day", "category", "currency", "total"}
+    @abstractmethod
+    def get_daily_summary_rows(self, username): ...
+
+    # {(username, "YYYY-MM-DD", category, currency): (total, count)} recomputed from raw expenses
+    @abstractmethod
+    def compute_daily_rows(self, username=None): ...
+
+    # Same shape as compute_daily_rows, read from the stored summaries
+    @abstractmethod
+    def get_stored_daily_rows(self, username=None): ...
+
+    # Stored budget counters, {(username, period, period key, category): spent}
+    @abstractmethod
+    def get_stored_budget_spend(self, username=None): ...
+
+    # Rebuild summaries and budget counters from raw expenses; returns row counts
+    @abstractmethod
+    def rebuild_summaries(self, username=None): ...
+
+    # Budgets
+    @abstractmethod
+    def set_budget(self, username, category, amount, period="monthly"): ...
+
+    @abstractmethod
+    def get_budgets(self, username): ...
+
+    @abstractmethod
+    def delete_budget(self, username, category, period="monthly"): ...
+
+    # Budgets and their spend counters are in USD (see records.summary_deltas)
+    @abstractmethod
+    def get_budget_status(self, username, category="All", period="monthly", on=None): ...
+
+    @abstractmethod
+    def evaluate_budget_thresholds(self, username, days): ...
+
+    # Income
+    @abstractmethod
+    def add_income(self, username, date, source, amount, currency="USD"): ...
+
+    @abstractmethod
+    def get_income(self, username): ...
+
+    @abstractmethod
+    def delete_income(self, income_id): ...
+
+    @abstractmethod
+    def update_income(self, income_id, date, source, amount, currency="USD"): ...
+
+    # Recurring expenses
+    @abstractmethod
+    def add_recurring_expense(self, username, start_date, end_date, category, description, amount, frequency,
+                              interval_days=None, currency="USD"): ...
+
+    @abstractmethod
+    def get_recurring_expenses(self, username): ...
+
+    @abstractmethod
+    def get_recurring_rules(self, username): ...
+
+    @abstractmethod
+    def update_recurring_expense(self, rule_id, **fields): ...
+
+    @abstractmethod
+    def delete_recurring_expense(self, rule_id): ...
+
+    # Splits and debts
+    @abstractmethod
+    def add_split_expense(self, username, expense_id, person_name, amount): ...
+
+    # Store all [(person, amount)] shares of one expense atomically, or none
+    @abstractmethod
+    def add_split_expenses(self, username, expense_id, shares): ...
+
+    @abstractmethod
+    def get_split_expenses(self, username, expense_id): ...
+
+    @abstractmethod
+    def add_debt(self, username, date, person_name, description, amount, type): ...
+
+    @abstractmethod
+    def get_debts(self, username): ...
+
+    # {person: net amount} over splits and debts/loans, positive when they owe the user
+    @abstractmethod
+    def get_counterparty_balances(self, username): ...
+
+    # Exports
+    @abstractmethod
+    def iter_user_documents(self, collection_name, username, fields, batch_size=5000): ...
+
+    # Notification outbox
+    @abstractmethod
+    def enqueue_notification(self, username, alert_type, period, to_email, subject, message): ...
+
+    @abstractmethod
+    def claim_notifications(self, limit=50, lease_seconds=300): ...
+
+    @abstractmethod
+    def mark_notification_sent(self, notification_id): ...
+
+    @abstractmethod
+    def mark_notification_failed(self, notification, error, base_delay_seconds=30): ...
+
+    # Categorizer models
+    @abstractmethod
+    def save_categorizer_model(self, username, model_bytes, classes, samples_seen): ...
+
+    @abstractmethod
+    def load_categorizer_model(self, username): ...
+
+
+_repository = {"instance": None}
+_lock = threading.Lock()
+
+
+def create_repository(backend=STORAGE_BACKEND, sqlite_path=SQLITE_PATH):
+    if backend == "sqlite":
+        from backend.sqlite_store import SqliteRepository
+        return SqliteRepository(sqlite_path)
+    if backend == "mongo":
+        from backend.database import MongoRepository
+        return MongoRepository()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}, use 'mongo' or 'sqlite'.")
+
+
+# The process-wide repository for the configured backend
+def get_repository():
+    with _lock:
+        if _repository["instance"] is None:
+            _repository["instance"] = create_repository()
+        return _repository["instance"]
+
+
+# Replace the process-wide repository, e.g. with a wrapped one in benchmarks
+def set_repository(repository):
+    with _lock:
+        _repository["instance"] = repository
@@ -0,0 +1,79 @@
+"""
+Who owes whom, settled with as few transfers as possible.
+
+The storage backend sums every split and debt/loan per counterparty
+(Repository.get_counterparty_balances). Together with the user, those
+counterparties form one group whose balances add up to zero, and
+minimal_transfers() settles the group greedily: the largest debtor pays the
+largest creditor until one of them is square, so a group of n people settles
+in at most n - 1 transfers. A counterparty who owes the user can therefore
+be asked to pay someone the user owes directly. Amounts are handled in whole
+cents, so rounding never leaves a balance unsettled.
+
+Usage:
+    python -m backend.settlements <username>
+"""
+import heapq
+import sys
+
+import pandas as pd
+from backend.repository import get_repository
+
+
+# [(payer, payee, amount)] that settle `balances` ({party: amount}, positive
+# when the party is owed money); parties whose balances do not add up to
+# zero are settled as far as the other side allows
+def minimal_transfers(balances):
+    creditors, debtors = [], []
+    for party, amount in balances.items():
+        cents = round(amount * 100)
+        if cents > 0:
+            creditors.append((-cents, party))
+        elif cents < 0:
+            debtors.append((cents, party))
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        owed, creditor = heapq.heappop(creditors)
+        owing, debtor = heapq.heappop(debtors)
+        cents = min(-owed, -owing)
+        transfers.append((debtor, creditor, cents / 100))
+        if owed + cents:
+            heapq.heappush(creditors, (owed + cents, creditor))
+        if owing + cents:
+            heapq.heappush(debtors, (owing + cents, debtor))
+    return transfers
+
+
+# Net balance per counterparty, largest amounts owed to the user first
+def get_balances_df(username, balances=None):
+    if balances is None:
+        balances = get_repository().get_counterparty_balances(username)
+    df = pd.DataFrame(list(balances.items()), columns=["person", "balance"])
+    df["balance"] = df["balance"].round(2)
+    df = df[df["balance"] != 0]
+    return df.sort_values(["balance", "person"], ascending=[False, True], ignore_index=True)
+
+
+# Transfers that settle the user and all their counterparties
+def get_settlement(username, balances=None):
+    if balances is None:
+        balances = get_repository().get_counterparty_balances(username)
+    # Within the group a counterparty is owed the opposite of what they owe
+    # the user, and the user holds the rest
+    group = {person: -round(amount, 2) for person, amount in balances.items()}
+    group[username] = group.get(username, 0.0) - sum(group.values())
+    return minimal_transfers(group)
+
+
+def get_settlement_df(username, balances=None):
+    return pd.DataFrame(get_settlement(username, balances), columns=["from", "to", "amount"])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+    for payer, payee, amount in get_settlement(sys.argv[1]):
+        print(f"{payer} pays {payee} {amount:.2f}")
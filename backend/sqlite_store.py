@@ -0,0 +1,1229 @@
+"""
+Embedded SQLite storage backend.
+
+Implements Repository (backend/repository.py) on one SQLite file in WAL mode,
+so readers never wait for the writer. Each thread gets its own connection.
+Every write runs in a single transaction together with its summary and budget
+counter updates, and bulk inserts go through executemany. Ids are ObjectId
+strings, so ids, cursors and the UI look the same as with MongoDB.
+
+Select it with STORAGE_BACKEND=sqlite (and optionally SQLITE_PATH).
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, date
+from itertools import chain
+
+import bcrypt
+from bson.objectid import ObjectId
+
+from backend import metrics
+from backend.archive import (
+    PACKED_FIELDS, TOTALS_FIELDS, iter_bucket_expenses, pack_bucket, remove_from_bucket, project_document,
+    range_months, page_months, totals_fields, group_fields, page_bucket_expenses, merge_page, add_bucket_totals,
+    add_bucket_groups, add_bucket_daily_rows
+)
+from backend.cache import bump_version
+from backend.records import (
+    TOMBSTONE_RETENTION, ALL_CATEGORIES, BUDGET_PERIODS, DEBT_SIGNS, is_strong_password, normalize_date,
+    build_expense_document, build_split_documents, summary_deltas, rebuilt_summaries, budget_level, budget_alert,
+    notification_failure_update
+)
+from backend.repository import Repository
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password BLOB NOT NULL,
+    email TEXT
+);
+CREATE TABLE IF NOT EXISTS expenses (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    date TEXT NOT NULL,
+    category TEXT,
+    description TEXT,
+    amount REAL NOT NULL,
+    currency TEXT,
+    recurring INTEGER NOT NULL DEFAULT 0,
+    recurrence_period INTEGER,
+    import_hash TEXT UNIQUE,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS expenses_username_date_id ON expenses (username, date, id);
+CREATE INDEX IF NOT EXISTS expenses_username_updated_at ON expenses (username, updated_at);
+CREATE TABLE IF NOT EXISTS expense_tombstones (
+    username TEXT NOT NULL,
+    expense_id TEXT NOT NULL,
+    deleted_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS expense_tombstones_username_deleted_at ON expense_tombstones (username, deleted_at);
+CREATE INDEX IF NOT EXISTS expense_tombstones_deleted_at ON expense_tombstones (deleted_at);
+CREATE TABLE IF NOT EXISTS expense_buckets (
+    username TEXT NOT NULL,
+    month TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    first_date TEXT NOT NULL,
+    last_date TEXT NOT NULL,
+    totals TEXT NOT NULL,
+    ids BLOB NOT NULL,
+    dates BLOB NOT NULL,
+    amounts BLOB NOT NULL,
+    recurring BLOB NOT NULL,
+    recurrence_periods BLOB NOT NULL,
+    category_values TEXT NOT NULL,
+    category_codes BLOB NOT NULL,
+    currency_values TEXT NOT NULL,
+    currency_codes BLOB NOT NULL,
+    descriptions TEXT NOT NULL,
+    import_hashes TEXT NOT NULL,
+    archived_at TEXT,
+    PRIMARY KEY (username, month)
+);
+CREATE TABLE IF NOT EXISTS archived_expenses (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    month TEXT NOT NULL,
+    import_hash TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS archived_expenses_username_month ON archived_expenses (username, month);
+CREATE UNIQUE INDEX IF NOT EXISTS archived_expenses_import_hash ON archived_expenses (import_hash)
+    WHERE import_hash IS NOT NULL;
+CREATE TABLE IF NOT EXISTS expense_summaries (
+    username TEXT NOT NULL,
+    day TEXT NOT NULL,
+    category TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    total REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (username, day, category, currency)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS monthly_summaries (
+    username TEXT NOT NULL,
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (username, month, category)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS budgets (
+    username TEXT NOT NULL,
+    category TEXT NOT NULL,
+    period TEXT NOT NULL,
+    amount REAL NOT NULL,
+    updated_at TEXT,
+    PRIMARY KEY (username, category, period)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS budget_spend (
+    username TEXT NOT NULL,
+    period TEXT NOT NULL,
+    period_key TEXT NOT NULL,
+    category TEXT NOT NULL,
+    spent REAL NOT NULL,
+    alert_level INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, period, period_key, category)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS income (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    date TEXT NOT NULL,
+    source TEXT,
+    amount REAL NOT NULL,
+    currency TEXT
+);
+CREATE INDEX IF NOT EXISTS income_username_date ON income (username, date);
+CREATE TABLE IF NOT EXISTS recurring_expenses (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT,
+    category TEXT,
+    description TEXT,
+    amount REAL NOT NULL,
+    currency TEXT,
+    frequency TEXT,
+    interval_days INTEGER,
+    source_expense_id TEXT,
+    materialized_through TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS recurring_expenses_username_start_date ON recurring_expenses (username, start_date);
+CREATE TABLE IF NOT EXISTS split_expenses (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    expense_id TEXT,
+    person_name TEXT,
+    amount REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS split_expenses_username_expense_id ON split_expenses (username, expense_id);
+CREATE TABLE IF NOT EXISTS debts (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    date TEXT,
+    person_name TEXT,
+    description TEXT,
+    amount REAL NOT NULL,
+    type TEXT
+);
+CREATE INDEX IF NOT EXISTS debts_username_date ON debts (username, date);
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id TEXT PRIMARY KEY,
+    dedup_key TEXT NOT NULL UNIQUE,
+    username TEXT,
+    alert_type TEXT,
+    period TEXT,
+    to_email TEXT,
+    subject TEXT,
+    message TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT,
+    created_at TEXT,
+    sent_at TEXT,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS notification_outbox_status_next_attempt_at ON notification_outbox (status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS categorizer_models (
+    username TEXT PRIMARY KEY,
+    model BLOB NOT NULL,
+    classes TEXT NOT NULL,
+    samples_seen INTEGER NOT NULL,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS user_versions (
+    username TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+EXPENSE_COLUMNS = ("username", "date", "category", "description", "amount", "currency", "recurring",
+                   "recurrence_period", "import_hash", "updated_at")
+RECURRING_COLUMNS = ("username", "start_date", "end_date", "category", "description", "amount", "currency",
+                     "frequency", "interval_days", "source_expense_id", "materialized_through", "updated_at")
+# Export name -> (table, columns that can be exported)
+EXPORT_TABLES = {
+    "expenses": ("expenses", EXPENSE_COLUMNS),
+    "income": ("income", ("username", "date", "source", "amount", "currency")),
+    "debts": ("debts", ("username", "date", "person_name", "description", "amount", "type")),
+    "splits": ("split_expenses", ("username", "expense_id", "person_name", "amount")),
+}
+# Stored as fixed-width ISO text, so text order is time order
+DATETIME_COLUMNS = {"date", "updated_at", "deleted_at", "start_date", "end_date", "next_attempt_at", "created_at",
+                    "sent_at", "materialized_through"}
+BUCKET_COLUMNS = ("username", "month", "count", "total", "first_date", "last_date", "totals", *PACKED_FIELDS,
+                  "archived_at")
+BUCKET_DATETIME_COLUMNS = {"first_date", "last_date", "archived_at"}
+# expense_buckets columns stored as JSON text; ids are packed 12-byte ObjectIds
+BUCKET_JSON_COLUMNS = {"totals", "category_values", "currency_values", "descriptions", "import_hashes"}
+# Columns added after their table was first released; older files get them when opened
+ADDED_COLUMNS = (("recurring_expenses", "materialized_through", "TEXT"),)
+# SQLite's default limit on bound parameters is 999
+MAX_PARAMETERS = 500
+
+
+def _ts(value):
+    return value.isoformat(" ", "microseconds") if value is not None else None
+
+
+def _dt(text):
+    return datetime.fromisoformat(text) if text is not None else None
+
+
+def _day(text):
+    return datetime.strptime(text, "%Y-%m-%d")
+
+
+# Row -> document shaped like its Mongo counterpart ("id" becomes "_id")
+def _document(row):
+    document = {}
+    for key in row.keys():
+        value = row[key]
+        if key == "id":
+            document["_id"] = ObjectId(value)
+        elif key in DATETIME_COLUMNS:
+            document[key] = _dt(value)
+        elif key == "recurring":
+            document[key] = bool(value)
+        elif key == "import_hash":
+            if value is not None:  # Only imported rows have one
+                document[key] = value
+        else:
+            document[key] = value
+    return document
+
+
+# expense_buckets row -> bucket shaped like the Mongo document
+def _bucket(row):
+    bucket = {}
+    for key in row.keys():
+        value = row[key]
+        if key in BUCKET_JSON_COLUMNS:
+            value = json.loads(value)
+        elif key == "ids":
+            value = [ObjectId(value[offset:offset + 12]) for offset in range(0, len(value), 12)]
+        elif key in BUCKET_DATETIME_COLUMNS:
+            value = _dt(value)
+        bucket[key] = value
+    return bucket
+
+
+def _iter_documents(cursor, batch_size):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield _document(row)
+
+
+# SELECT column list for a Mongo-style projection ({field: 1, "_id": 0})
+def _columns(projection, default, include_id):
+    fields = [field for field, wanted in (projection or {}).items() if wanted and field != "_id"]
+    columns = [field for field in fields if field in default] or list(default)
+    if (projection or {}).get("_id", 1 if include_id else 0):
+        columns.insert(0, "id")
+    return ", ".join(columns)
+
+
+def _expense_filter(username, date_range=None, category=None, amount_range=None):
+    clauses, params = ["username = ?"], [username]
+    if date_range:
+        clauses.append("date BETWEEN ? AND ?")
+        params += [_ts(normalize_date(date_range[0])), _ts(normalize_date(date_range[1]))]
+    if category and category != ALL_CATEGORIES:
+        clauses.append("category = ?")
+        params.append(category)
+    if amount_range:
+        clauses.append("amount BETWEEN ? AND ?")
+        params += [float(amount_range[0]), float(amount_range[1])]
+    return " AND ".join(clauses), params
+
+
+# Summary and budget counter rows are keyed on the category, and primary key
+# columns of WITHOUT ROWID tables can't be NULL, so uncategorized expenses
+# count under "" there and read back as None
+def _key_category(category):
+    return "" if category is None else category
+
+
+def _row_category(category):
+    return category if category != "" else None
+
+
+def _valid_id(value):
+    return isinstance(value, (str, ObjectId)) and ObjectId.is_valid(value)
+
+
+class SqliteRepository(Repository):
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+        self._add_missing_columns()
+
+    # One connection per thread; WAL lets readers run alongside the writer
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            if metrics.METRICS_ENABLED:
+                # Each statement counts as a round trip of the running method
+                connection.set_trace_callback(lambda statement: metrics.record_round_trip())
+            self._local.connection = connection
+        return connection
+
+    def _add_missing_columns(self):
+        connection = self._connection()
+        for table, column, column_type in ADDED_COLUMNS:
+            if any(row["name"] == column for row in connection.execute(f"PRAGMA table_info({table})")):
+                continue
+            try:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            except sqlite3.OperationalError as e:
+                # "duplicate column name" means another process added it first
+                if "duplicate column" not in str(e):
+                    raise
+
+    # Write transaction; BEGIN IMMEDIATE takes the write lock up front, so
+    # read-then-write steps inside it can't interleave with other writers
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        return self._connection().execute(sql, params)
+
+    # Users
+    def create_user(self, username, password, email):
+        if self._query("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone():
+            return False, "Username already exists."
+        is_valid, message = is_strong_password(password)
+        if not is_valid:
+            return False, message
+        hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+        try:
+            with self._transaction() as connection:
+                connection.execute("INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+                                   (username, hashed_password, email))
+        except sqlite3.IntegrityError:
+            return False, "Username already exists."
+        return True, "Account created successfully!"
+
+    def authenticate_user(self, username, password):
+        user = self._query("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        if user and bcrypt.checkpw(password.encode("utf-8"), bytes(user["password"])):
+            return True, "Authentication successful."
+        return False, "Invalid username or password."
+
+    def get_user_email(self, username):
+        user = self._query("SELECT email FROM users WHERE username = ?", (username,)).fetchone()
+        return user["email"] if user else None
+
+    def iter_usernames(self, after=None, page_size=1000):
+        while True:
+            page = [row["username"] for row in self._query(
+                "SELECT username FROM users WHERE username > ? ORDER BY username LIMIT ?",
+                (after if after is not None else "", page_size)
+            )]
+            yield from page
+            if len(page) < page_size:
+                return
+            after = page[-1]
+
+    # Count a write to the user's data here, for other processes, and in this
+    # process's cache
+    def _bump_version(self, username):
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO user_versions (username, version) VALUES (?, 1)"
+                " ON CONFLICT (username) DO UPDATE SET version = version + 1", (username,)
+            )
+        bump_version(username)
+
+    def get_data_version(self, username):
+        row = self._query("SELECT version FROM user_versions WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else 0
+
+    # Expenses
+    def _insert_expense_rows(self, connection, expenses):
+        for expense in expenses:
+            expense.setdefault("_id", ObjectId())
+        connection.executemany(
+            f"INSERT INTO expenses (id, {', '.join(EXPENSE_COLUMNS)}) VALUES ({', '.join('?' * (len(EXPENSE_COLUMNS) + 1))})",
+            [
+                (str(expense["_id"]), expense["username"], _ts(expense["date"]), expense.get("category"),
+                 expense.get("description"), float(expense["amount"]), expense.get("currency"),
+                 int(bool(expense.get("recurring"))), expense.get("recurrence_period"), expense.get("import_hash"),
+                 _ts(expense.get("updated_at") or datetime.utcnow()))
+                for expense in expenses
+            ]
+        )
+
+    def add_expense(self, username, date_value, category, description, amount, currency="USD", recurring=False,
+                    recurrence_period=None):
+        try:
+            expense = build_expense_document(
+                username, date_value, category, description, amount, currency, recurring, recurrence_period
+            )
+            date_obj = expense["date"]
+            with self._transaction() as connection:
+                self._insert_expense_rows(connection, [expense])
+                self._apply_summary_deltas(connection, [expense], 1)
+                if recurring and recurrence_period and isinstance(recurrence_period, int):
+                    # Store the next 11 occurrences as one rule, expanded on read
+                    self._insert_recurring_rule(connection, {
+                        "username": username,
+                        "start_date": date_obj + timedelta(days=recurrence_period),
+                        "end_date": date_obj + timedelta(days=recurrence_period * 11),
+                        "category": category,
+                        "description": description,
+                        "amount": float(amount),
+                        "currency": currency,
+                        "frequency": "Every N days",
+                        "interval_days": recurrence_period,
+                        "source_expense_id": str(expense["_id"]),
+                        "updated_at": datetime.utcnow()
+                    })
+                self._evaluate_budget_thresholds(connection, username, [date_obj])
+            self._bump_version(username)
+            return True, "Expense added successfully."
+        except ValueError as e:
+            return False, f"Invalid date format: {str(e)}"
+        except Exception as e:
+            return False, f"Error adding expense: {str(e)}"
+
+    # Import hashes among `hashes` already stored, archived or not
+    def _existing_import_hashes(self, connection, hashes):
+        existing = set()
+        for start in range(0, len(hashes), MAX_PARAMETERS):
+            chunk = hashes[start:start + MAX_PARAMETERS]
+            for table in ("expenses", "archived_expenses"):
+                existing.update(row[0] for row in connection.execute(
+                    f"SELECT import_hash FROM {table}"
+                    f" WHERE import_hash IS NOT NULL AND import_hash IN ({', '.join('?' * len(chunk))})", chunk
+                ))
+        return existing
+
+    def insert_expenses(self, expenses, return_inserted=False):
+        if not expenses:
+            return ([] if return_inserted else 0), 0
+        with self._transaction() as connection:
+            seen = self._existing_import_hashes(
+                connection, [expense["import_hash"] for expense in expenses if expense.get("import_hash")]
+            )
+            inserted, duplicates = [], 0
+            for expense in expenses:
+                import_hash = expense.get("import_hash")
+                if import_hash is not None:
+                    if import_hash in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(import_hash)
+                inserted.append(expense)
+            self._insert_expense_rows(connection, inserted)
+            self._apply_summary_deltas(connection, inserted, 1)
+            usernames = {expense["username"] for expense in inserted}
+            for username in usernames:
+                self._evaluate_budget_thresholds(
+                    connection, username, list({expense["date"] for expense in inserted if expense["username"] == username})
+                )
+        for username in usernames:
+            self._bump_version(username)
+        return (inserted if return_inserted else len(inserted)), duplicates
+
+    def get_expenses(self, username):
+        cursor = self._query(f"SELECT {_columns(None, EXPENSE_COLUMNS, False)} FROM expenses WHERE username = ?",
+                             (username,))
+        return [_document(row) for row in cursor] + [
+            project_document(expense, {"_id": 0}) for expense in iter_bucket_expenses(self._buckets(username))
+        ]
+
+    # Hot expenses only; get_expenses_df reads the archived ones from their buckets
+    def get_expense_changes(self, username, since=None, projection=None, batch_size=5000):
+        high_water = datetime.utcnow()
+        sql = f"SELECT {_columns(projection, EXPENSE_COLUMNS, True)} FROM expenses WHERE username = ?"
+        params = [username]
+        if since is not None:
+            sql += " AND updated_at > ?"
+            params.append(_ts(since))
+        changed = _iter_documents(self._query(sql, params), batch_size)
+
+        deleted = []
+        if since is not None:
+            deleted = [row[0] for row in self._query(
+                "SELECT expense_id FROM expense_tombstones WHERE username = ? AND deleted_at > ?",
+                (username, _ts(since))
+            )]
+        return changed, deleted, high_water
+
+    def prune_expense_tombstones(self):
+        with self._transaction() as connection:
+            cursor = connection.execute("DELETE FROM expense_tombstones WHERE deleted_at < ?",
+                                        (_ts(datetime.utcnow() - TOMBSTONE_RETENTION),))
+        return cursor.rowcount
+
+    def find_expenses(self, username, date_range=None, category=None, amount_range=None, projection=None):
+        where, params = _expense_filter(username, date_range, category, amount_range)
+        projection = projection or {"_id": 0}
+        columns = _columns(projection, EXPENSE_COLUMNS, True)
+        archived = iter_bucket_expenses(
+            self._buckets(username, range_months(date_range)), date_range, category, amount_range
+        )
+        return chain(_iter_documents(self._query(f"SELECT {columns} FROM expenses WHERE {where}", params), 5000),
+                     (project_document(expense, projection) for expense in archived))
+
+    def get_expenses_page(self, username, page_size=50, after=None, date_range=None, category=None,
+                          amount_range=None, projection=None):
+        where, params = _expense_filter(username, date_range, category, amount_range)
+        if after:
+            after_date, after_id = after
+            where += " AND (date < ? OR (date = ? AND id < ?))"
+            params += [_ts(after_date), _ts(after_date), str(after_id)]
+        columns = _columns(projection, EXPENSE_COLUMNS, True)
+        rows = [_document(row) for row in self._query(
+            f"SELECT {columns} FROM expenses WHERE {where} ORDER BY date DESC, id DESC LIMIT ?", params + [page_size + 1]
+        )]
+        buckets = self._buckets(username, page_months(date_range, after, rows, page_size), newest_first=True)
+        archived = page_bucket_expenses(buckets, page_size + 1, after, date_range, category, amount_range)
+        rows, next_after = merge_page(rows, archived, page_size)
+        return [project_document(row, projection) for row in rows], next_after
+
+    def get_expense_totals(self, username, date_range=None, category=None, amount_range=None):
+        where, params = _expense_filter(username, date_range, category, amount_range)
+        row = self._query(
+            f"SELECT COUNT(*), TOTAL(amount), MIN(date), MAX(date) FROM expenses WHERE {where}", params
+        ).fetchone()
+        totals = {"count": row[0], "total": row[1], "first_date": _dt(row[2]), "last_date": _dt(row[3])}
+        buckets = self._buckets(username, range_months(date_range),
+                                fields=totals_fields(date_range, category, amount_range))
+        return add_bucket_totals(totals, buckets, date_range, category, amount_range)
+
+    def group_expenses(self, username, by, date_range=None, category=None, amount_range=None):
+        key = {"day": "substr(date, 1, 10)", "month": "substr(date, 1, 7)", "category": "category"}[by]
+        where, params = _expense_filter(username, date_range, category, amount_range)
+        rows = self._query(
+            f"SELECT {key} AS key, TOTAL(amount) FROM expenses WHERE {where} GROUP BY key ORDER BY key", params
+        ).fetchall()
+        if by == "day":
+            rows = [(date.fromisoformat(row[0]), row[1]) for row in rows]
+        else:
+            rows = [(row[0], row[1]) for row in rows]
+        buckets = self._buckets(username, range_months(date_range), fields=group_fields(amount_range))
+        return add_bucket_groups(rows, buckets, by, date_range, category, amount_range)
+
+    def delete_expense(self, expense_id):
+        if not _valid_id(expense_id):
+            return False, "Invalid expense ID."
+        with self._transaction() as connection:
+            row = connection.execute("SELECT * FROM expenses WHERE id = ?", (str(expense_id),)).fetchone()
+            if not row and self._restore_archived_expense(connection, expense_id):
+                row = connection.execute("SELECT * FROM expenses WHERE id = ?", (str(expense_id),)).fetchone()
+            if not row:
+                return False, "Expense not found."
+            deleted = _document(row)
+            connection.execute("DELETE FROM expenses WHERE id = ?", (str(expense_id),))
+            connection.execute("INSERT INTO expense_tombstones (username, expense_id, deleted_at) VALUES (?, ?, ?)",
+                               (deleted["username"], str(expense_id), _ts(datetime.utcnow())))
+            self._apply_summary_deltas(connection, [deleted], -1)
+            self._evaluate_budget_thresholds(connection, deleted["username"], [deleted["date"]])
+        self._bump_version(deleted["username"])
+        return True, "Expense deleted."
+
+    def delete_user_expenses(self, username):
+        with self._transaction() as connection:
+            deleted_at = _ts(datetime.utcnow())
+            deleted = connection.execute(
+                "INSERT INTO expense_tombstones (username, expense_id, deleted_at)"
+                " SELECT username, id, ? FROM expenses WHERE username = ?"
+                " UNION ALL SELECT username, id, ? FROM archived_expenses WHERE username = ?",
+                (deleted_at, username, deleted_at, username)
+            ).rowcount
+            for table in ("expenses", "expense_buckets", "archived_expenses", "expense_summaries",
+                          "monthly_summaries", "budget_spend"):
+                connection.execute(f"DELETE FROM {table} WHERE username = ?", (username,))
+        self._bump_version(username)
+        return deleted
+
+    def update_expense(self, expense_id, date, category, description, amount, currency="USD"):
+        if not _valid_id(expense_id):
+            return False, "Invalid expense ID."
+        try:
+            date = normalize_date(date)
+        except ValueError:
+            return False, "Invalid date format. Use YYYY-MM-DD."
+
+        update_data = {
+            "date": date,
+            "category": category,
+            "description": description,
+            "amount": float(amount),
+            "currency": currency,
+            "updated_at": datetime.utcnow()
+        }
+        with self._transaction() as connection:
+            row = connection.execute("SELECT * FROM expenses WHERE id = ?", (str(expense_id),)).fetchone()
+            if not row and self._restore_archived_expense(connection, expense_id):
+                row = connection.execute("SELECT * FROM expenses WHERE id = ?", (str(expense_id),)).fetchone()
+            if not row:
+                return False, "Expense not found or no change made."
+            previous = _document(row)
+            connection.execute(
+                "UPDATE expenses SET date = ?, category = ?, description = ?, amount = ?, currency = ?, updated_at = ?"
+                " WHERE id = ?",
+                (_ts(date), category, description, float(amount), currency, _ts(update_data["updated_at"]),
+                 str(expense_id))
+            )
+            self._apply_summary_deltas(connection, [previous], -1)
+            self._apply_summary_deltas(connection, [{**previous, **update_data}], 1)
+            self._evaluate_budget_thresholds(connection, previous["username"], [previous["date"], date])
+        self._bump_version(previous["username"])
+        return True, "Expense updated."
+
+    # Archive: expenses dated before a cutoff live in monthly buckets (see
+    # backend/archive.py), one column per packed field so reads select only
+    # what they need. archived_expenses says which bucket holds each expense,
+    # for edits and import dedup.
+
+    # Buckets decoded one at a time as they are iterated, with only `fields` (default all)
+    def _buckets(self, username, months=None, newest_first=False, fields=None):
+        sql = f"SELECT {', '.join(fields or BUCKET_COLUMNS)} FROM expense_buckets WHERE username = ?"
+        params = [username]
+        first, last = months or (None, None)
+        if first:
+            sql += " AND month >= ?"
+            params.append(first)
+        if last:
+            sql += " AND month <= ?"
+            params.append(last)
+        sql += f" ORDER BY month {'DESC' if newest_first else 'ASC'}"
+        return (_bucket(row) for row in self._query(sql, params))
+
+    def get_expense_buckets(self, username, months=None, newest_first=False):
+        return self._buckets(username, months, newest_first)
+
+    def _write_bucket(self, connection, bucket):
+        username, month = bucket["username"], bucket["month"]
+        values = []
+        for column in BUCKET_COLUMNS:
+            value = bucket[column]
+            if column in BUCKET_JSON_COLUMNS:
+                value = json.dumps(value)
+            elif column == "ids":
+                value = b"".join(expense_id.binary for expense_id in value)
+            elif column in BUCKET_DATETIME_COLUMNS:
+                value = _ts(value)
+            values.append(value)
+        connection.execute(
+            f"INSERT OR REPLACE INTO expense_buckets ({', '.join(BUCKET_COLUMNS)})"
+            f" VALUES ({', '.join('?' * len(BUCKET_COLUMNS))})", values
+        )
+        connection.execute("DELETE FROM archived_expenses WHERE username = ? AND month = ?", (username, month))
+        connection.executemany(
+            "INSERT INTO archived_expenses (id, username, month, import_hash) VALUES (?, ?, ?, ?)",
+            [(str(expense_id), username, month, import_hash)
+             for expense_id, import_hash in zip(bucket["ids"], bucket["import_hashes"])]
+        )
+
+    # Move the user's expenses dated before `before` into monthly buckets, one
+    # transaction per month. Spending doesn't change, so summaries and cached
+    # frames stay as they are. Returns (expenses archived, buckets written).
+    def archive_expenses(self, username, before):
+        before = normalize_date(before)
+        months = [row[0] for row in self._query(
+            "SELECT DISTINCT substr(date, 1, 7) FROM expenses WHERE username = ? AND date < ? ORDER BY 1",
+            (username, _ts(before))
+        )]
+        archived = 0
+        for month in months:
+            start = datetime.strptime(month, "%Y-%m")
+            end = min(before, (start + timedelta(days=32)).replace(day=1))
+            span = (username, _ts(start), _ts(end))
+            with self._transaction() as connection:
+                documents = [_document(row) for row in connection.execute(
+                    "SELECT * FROM expenses WHERE username = ? AND date >= ? AND date < ?", span
+                )]
+                existing = connection.execute("SELECT * FROM expense_buckets WHERE username = ? AND month = ?",
+                                              (username, month)).fetchone()
+                previous = list(iter_bucket_expenses([_bucket(existing)])) if existing else []
+                self._write_bucket(connection, pack_bucket(username, month, previous + documents))
+                connection.execute("DELETE FROM expenses WHERE username = ? AND date >= ? AND date < ?", span)
+            archived += len(documents)
+        return archived, len(months)
+
+    # Move an archived expense back to the expenses table, inside the caller's
+    # transaction; returns whether it was archived
+    def _restore_archived_expense(self, connection, expense_id):
+        located = connection.execute("SELECT username, month FROM archived_expenses WHERE id = ?",
+                                     (str(expense_id),)).fetchone()
+        if not located:
+            return False
+        key = (located["username"], located["month"])
+        bucket = _bucket(connection.execute(
+            "SELECT * FROM expense_buckets WHERE username = ? AND month = ?", key
+        ).fetchone())
+        expense, rest = remove_from_bucket(bucket, expense_id)
+        if rest:
+            self._write_bucket(connection, rest)
+        else:
+            connection.execute("DELETE FROM expense_buckets WHERE username = ? AND month = ?", key)
+            connection.execute("DELETE FROM archived_expenses WHERE id = ?", (str(expense_id),))
+        self._insert_expense_rows(connection, [expense])
+        return True
+
+    # Materialized summaries
+    def _apply_summary_deltas(self, connection, expenses, sign):
+        daily, monthly, spend = summary_deltas(expenses, sign)
+        if not daily:
+            return
+        connection.executemany(
+            "INSERT INTO expense_summaries (username, day, category, currency, total, count) VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (username, day, category, currency)"
+            " DO UPDATE SET total = total + excluded.total, count = count + excluded.count",
+            [(username, day.strftime("%Y-%m-%d"), _key_category(category), currency, total, count)
+             for (username, day, category, currency), (total, count) in daily.items()]
+        )
+        connection.executemany(
+            "INSERT INTO monthly_summaries (username, month, category, total, count) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (username, month, category)"
+            " DO UPDATE SET total = total + excluded.total, count = count + excluded.count",
+            [(username, month, _key_category(category), total, count)
+             for (username, month, category), (total, count) in monthly.items()]
+        )
+        connection.executemany(
+            "INSERT INTO budget_spend (username, period, period_key, category, spent) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (username, period, period_key, category) DO UPDATE SET spent = spent + excluded.spent",
+            [(username, period, period_key, _key_category(category), spent)
+             for (username, period, period_key, category), spent in spend.items()]
+        )
+
+    def get_summary_totals(self, username, by):
+        table, key = {
+            "day": ("expense_summaries", "day"),
+            "month": ("monthly_summaries", "month"),
+            "category": ("monthly_summaries", "category"),
+        }[by]
+        rows = self._query(
+            f"SELECT {key}, TOTAL(total) FROM {table} WHERE username = ? AND count > 0 GROUP BY {key} ORDER BY {key}",
+            (username,)
+        ).fetchall()
+        if by == "day":
+            return [(date.fromisoformat(row[0]), row[1]) for row in rows]
+        if by == "category":
+            return [(_row_category(row[0]), row[1]) for row in rows]
+        return [(row[0], row[1]) for row in rows]
+
+    def get_daily_summary_rows(self, username):
+        return [
+            {"day": _day(row["day"]), "category": _row_category(row["category"]), "currency": row["currency"],
+             "total": row["total"]}
+            for row in self._query(
+                "SELECT day, category, currency, total FROM expense_summaries WHERE username = ? AND count > 0",
+                (username,)
+            )
+        ]
+
+    def compute_daily_rows(self, username=None):
+        where, params = ("WHERE username = ?", (username,)) if username else ("", ())
+        rows = self._query(
+            "SELECT username, substr(date, 1, 10), category, COALESCE(currency, 'USD'), TOTAL(amount), COUNT(*)"
+            f" FROM expenses {where} GROUP BY 1, 2, 3, 4", params
+        )
+        daily = {(row[0], row[1], row[2], row[3]): (row[4], row[5]) for row in rows}
+        buckets = self._query(f"SELECT {', '.join(TOTALS_FIELDS)} FROM expense_buckets {where}", params)
+        return add_bucket_daily_rows(daily, (_bucket(row) for row in buckets))
+
+    def get_stored_daily_rows(self, username=None):
+        where, params = ("WHERE username = ?", (username,)) if username else ("", ())
+        rows = self._query(f"SELECT username, day, category, currency, total, count FROM expense_summaries {where}",
+                           params)
+        return {(row[0], row[1], _row_category(row[2]), row[3]): (row[4], row[5]) for row in rows}
+
+    def get_stored_budget_spend(self, username=None):
+        where, params = ("WHERE username = ?", (username,)) if username else ("", ())
+        rows = self._query(f"SELECT username, period, period_key, category, spent FROM budget_spend {where}", params)
+        return {(row[0], row[1], row[2], _row_category(row[3])): row[4] for row in rows}
+
+    def rebuild_summaries(self, username=None):
+        daily, monthly, spend = rebuilt_summaries(self.compute_daily_rows(username))
+        where, params = ("WHERE username = ?", (username,)) if username else ("", ())
+        with self._transaction() as connection:
+            # Keep the alert levels already raised so rebuilding doesn't re-send alerts
+            alert_levels = {
+                (row[0], row[1], row[2], _row_category(row[3])): row[4]
+                for row in connection.execute(
+                    f"SELECT username, period, period_key, category, alert_level FROM budget_spend {where}", params
+                )
+            }
+            for table in ("expense_summaries", "monthly_summaries", "budget_spend"):
+                connection.execute(f"DELETE FROM {table} {where}", params)
+            connection.executemany(
+                "INSERT INTO expense_summaries (username, day, category, currency, total, count) VALUES (?, ?, ?, ?, ?, ?)",
+                [(user, day.strftime("%Y-%m-%d"), _key_category(category), currency, total, count)
+                 for (user, day, category, currency), (total, count) in daily.items()]
+            )
+            connection.executemany(
+                "INSERT INTO monthly_summaries (username, month, category, total, count) VALUES (?, ?, ?, ?, ?)",
+                [(user, month, _key_category(category)) + value for (user, month, category), value in monthly.items()]
+            )
+            connection.executemany(
+                "INSERT INTO budget_spend (username, period, period_key, category, spent, alert_level)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [key[:3] + (_key_category(key[3]), spent, alert_levels.get(key, 0)) for key, spent in spend.items()]
+            )
+        return len(daily), len(monthly), len(spend)
+
+    # Budgets
+    def set_budget(self, username, category, amount, period="monthly"):
+        if period not in BUDGET_PERIODS:
+            return False, f"Unknown budget period {period!r}."
+        if float(amount) <= 0:
+            return False, "Budget must be greater than zero."
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO budgets (username, category, period, amount, updated_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (username, category, period)"
+                " DO UPDATE SET amount = excluded.amount, updated_at = excluded.updated_at",
+                (username, category, period, float(amount), _ts(datetime.utcnow()))
+            )
+            self._evaluate_budget_thresholds(connection, username, [datetime.today()])
+        return True, "Budget saved."
+
+    def get_budgets(self, username):
+        return [_document(row) for row in self._query(
+            "SELECT username, category, period, amount, updated_at FROM budgets WHERE username = ?", (username,)
+        )]
+
+    def delete_budget(self, username, category, period="monthly"):
+        with self._transaction() as connection:
+            cursor = connection.execute("DELETE FROM budgets WHERE username = ? AND category = ? AND period = ?",
+                                        (username, category, period))
+        if cursor.rowcount == 0:
+            return False, "Budget not found."
+        return True, "Budget deleted."
+
+    def get_budget_status(self, username, category=ALL_CATEGORIES, period="monthly", on=None):
+        budget = self._query("SELECT amount FROM budgets WHERE username = ? AND category = ? AND period = ?",
+                             (username, category, period)).fetchone()
+        if not budget:
+            return None
+        period_key = (on or datetime.today()).strftime(BUDGET_PERIODS[period])
+        counter = self._query(
+            "SELECT spent FROM budget_spend WHERE username = ? AND period = ? AND period_key = ? AND category = ?",
+            (username, period, period_key, category)
+        ).fetchone()
+        spent = counter["spent"] if counter else 0.0
+        return {
+            "category": category,
+            "period": period,
+            "period_key": period_key,
+            "budget": budget["amount"],
+            "spent": spent,
+            "remaining": budget["amount"] - spent,
+            "level": budget_level(spent, budget["amount"]),
+        }
+
+    # Runs inside the caller's write transaction, which makes the
+    # read-compare-raise of each alert level atomic
+    def _evaluate_budget_thresholds(self, connection, username, days):
+        budgets = connection.execute("SELECT category, period, amount FROM budgets WHERE username = ?",
+                                     (username,)).fetchall()
+        if not budgets:
+            return []
+
+        crossings = []
+        for budget in budgets:
+            key_format = BUDGET_PERIODS[budget["period"]]
+            for period_key in {day.strftime(key_format) for day in days}:
+                counter_key = (username, budget["period"], period_key, budget["category"])
+                counter = connection.execute(
+                    "SELECT spent, alert_level FROM budget_spend"
+                    " WHERE username = ? AND period = ? AND period_key = ? AND category = ?", counter_key
+                ).fetchone()
+                if not counter:
+                    continue
+                level = budget_level(counter["spent"], budget["amount"])
+                if level != counter["alert_level"]:
+                    # Lowered when spend goes back down, so a later rise alerts again
+                    connection.execute(
+                        "UPDATE budget_spend SET alert_level = ?"
+                        " WHERE username = ? AND period = ? AND period_key = ? AND category = ?",
+                        (level,) + counter_key
+                    )
+                if level > counter["alert_level"]:
+                    crossings.append((budget["category"], budget["period"], period_key, level))
+
+        today = datetime.today()
+        email = None
+        for category, period, period_key, level in crossings:
+            if period_key != today.strftime(BUDGET_PERIODS[period]):
+                continue  # Don't email about past periods, e.g. after importing old statements
+            if email is None:
+                row = connection.execute("SELECT email FROM users WHERE username = ?", (username,)).fetchone()
+                email = (row["email"] if row else None) or ""
+            if not email:
+                break
+            alert_type, subject, message = budget_alert(category, period, level)
+            self._enqueue_notification(connection, username, alert_type, period_key, email, subject, message)
+        return crossings
+
+    def evaluate_budget_thresholds(self, username, days):
+        with self._transaction() as connection:
+            return self._evaluate_budget_thresholds(connection, username, days)
+
+    # Income
+    def add_income(self, username, date, source, amount, currency="USD"):
+        try:
+            date = normalize_date(date)
+        except ValueError:
+            return False, "Invalid date format. Use YYYY-MM-DD."
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO income (id, username, date, source, amount, currency) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(ObjectId()), username, _ts(date), source, float(amount), currency)
+            )
+        self._bump_version(username)
+        return True, "Income added successfully."
+
+    def get_income(self, username):
+        return [_document(row) for row in self._query(
+            "SELECT username, date, source, amount, currency FROM income WHERE username = ?", (username,)
+        )]
+
+    def delete_income(self, income_id):
+        if not _valid_id(income_id):
+            return False, "Invalid income ID."
+        with self._transaction() as connection:
+            row = connection.execute("SELECT username FROM income WHERE id = ?", (str(income_id),)).fetchone()
+            if not row:
+                return False, "Income not found."
+            connection.execute("DELETE FROM income WHERE id = ?", (str(income_id),))
+        self._bump_version(row["username"])
+        return True, "Income deleted."
+
+    def update_income(self, income_id, date, source, amount, currency="USD"):
+        if not _valid_id(income_id):
+            return False, "Invalid income ID."
+        try:
+            date = normalize_date(date)
+        except ValueError:
+            return False, "Invalid date format. Use YYYY-MM-DD."
+        with self._transaction() as connection:
+            row = connection.execute("SELECT username FROM income WHERE id = ?", (str(income_id),)).fetchone()
+            if not row:
+                return False, "Income not found or no change made."
+            connection.execute("UPDATE income SET date = ?, source = ?, amount = ?, currency = ? WHERE id = ?",
+                               (_ts(date), source, float(amount), currency, str(income_id)))
+        self._bump_version(row["username"])
+        return True, "Income updated."
+
+    # Recurring expenses
+    def _insert_recurring_rule(self, connection, rule):
+        connection.execute(
+            f"INSERT INTO recurring_expenses (id, {', '.join(RECURRING_COLUMNS)})"
+            f" VALUES ({', '.join('?' * (len(RECURRING_COLUMNS) + 1))})",
+            [str(ObjectId())] + [
+                _ts(rule.get(column)) if column in DATETIME_COLUMNS else rule.get(column)
+                for column in RECURRING_COLUMNS
+            ]
+        )
+
+    def add_recurring_expense(self, username, start_date, end_date, category, description, amount, frequency,
+                              interval_days=None, currency="USD"):
+        if frequency == "Every N days" and not interval_days:
+            return False, "Interval in days is required for this frequency."
+        try:
+            start_date = normalize_date(start_date)
+            end_date = normalize_date(end_date) if end_date else None
+        except ValueError:
+            return False, "Invalid date format. Use YYYY-MM-DD."
+        with self._transaction() as connection:
+            self._insert_recurring_rule(connection, {
+                "username": username,
+                "start_date": start_date,
+                "end_date": end_date,
+                "category": category,
+                "description": description,
+                "amount": float(amount),
+                "currency": currency,
+                "frequency": frequency,
+                "interval_days": int(interval_days) if interval_days else None,
+                "updated_at": datetime.utcnow()
+            })
+        self._bump_version(username)
+        return True, "Recurring expense added successfully."
+
+    def get_recurring_expenses(self, username):
+        return [_document(row) for row in self._query(
+            f"SELECT {', '.join(RECURRING_COLUMNS)} FROM recurring_expenses WHERE username = ?", (username,)
+        )]
+
+    def get_recurring_rules(self, username):
+        return [_document(row) for row in self._query(
+            f"SELECT id, {', '.join(RECURRING_COLUMNS)} FROM recurring_expenses WHERE username = ?", (username,)
+        )]
+
+    def update_recurring_expense(self, rule_id, **fields):
+        if not _valid_id(rule_id):
+            return False, "Invalid recurring expense ID."
+        unknown = set(fields) - set(RECURRING_COLUMNS)
+        if unknown:
+            return False, f"Unknown recurring expense fields: {', '.join(sorted(unknown))}."
+        try:
+            for field in ("start_date", "end_date"):
+                if fields.get(field):
+                    fields[field] = normalize_date(fields[field])
+        except ValueError:
+            return False, "Invalid date format. Use YYYY-MM-DD."
+        if "amount" in fields:
+            fields["amount"] = float(fields["amount"])
+        fields["updated_at"] = datetime.utcnow()
+
+        with self._transaction() as connection:
+            row = connection.execute("SELECT username FROM recurring_expenses WHERE id = ?",
+                                     (str(rule_id),)).fetchone()
+            if not row:
+                return False, "Recurring expense not found."
+            connection.execute(
+                f"UPDATE recurring_expenses SET {', '.join(f'{field} = ?' for field in fields)} WHERE id = ?",
+                [_ts(value) if field in DATETIME_COLUMNS else value for field, value in fields.items()] + [str(rule_id)]
+            )
+        self._bump_version(row["username"])
+        return True, "Recurring expense updated."
+
+    def delete_recurring_expense(self, rule_id):
+        if not _valid_id(rule_id):
+            return False, "Invalid recurring expense ID."
+        with self._transaction() as connection:
+            row = connection.execute("SELECT username FROM recurring_expenses WHERE id = ?",
+                                     (str(rule_id),)).fetchone()
+            if not row:
+                return False, "Recurring expense not found."
+            connection.execute("DELETE FROM recurring_expenses WHERE id = ?", (str(rule_id),))
+        self._bump_version(row["username"])
+        return True, "Recurring expense deleted."
+
+    # Splits and debts
+    def add_split_expense(self, username, expense_id, person_name, amount):
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO split_expenses (id, username, expense_id, person_name, amount) VALUES (?, ?, ?, ?, ?)",
+                (str(ObjectId()), username, expense_id, person_name, float(amount))
+            )
+        self._bump_version(username)
+        return True, "Expense split successfully."
+
+    def add_split_expenses(self, username, expense_id, shares):
+        try:
+            documents = build_split_documents(username, expense_id, shares)
+        except ValueError as e:
+            return False, str(e)
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT INTO split_expenses (id, username, expense_id, person_name, amount) VALUES (?, ?, ?, ?, ?)",
+                [(str(ObjectId()), username, expense_id, d["person_name"], d["amount"]) for d in documents]
+            )
+        self._bump_version(username)
+        return True, f"Expense split between {len(documents)} people."
+
+    def get_split_expenses(self, username, expense_id):
+        return [_document(row) for row in self._query(
+            "SELECT username, expense_id, person_name, amount FROM split_expenses WHERE username = ? AND expense_id = ?",
+            (username, expense_id)
+        )]
+
+    def add_debt(self, username, date, person_name, description, amount, type):
+        try:
+            date = normalize_date(date)
+        except ValueError:
+            return False, "Invalid date format. Use YYYY-MM-DD."
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO debts (id, username, date, person_name, description, amount, type)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(ObjectId()), username, _ts(date), person_name, description, float(amount), type)
+            )
+        self._bump_version(username)
+        return True, "Debt/Loan added successfully."
+
+    def get_debts(self, username):
+        return [_document(row) for row in self._query(
+            "SELECT username, date, person_name, description, amount, type FROM debts WHERE username = ?", (username,)
+        )]
+
+    def get_counterparty_balances(self, username):
+        signs = [value for pair in DEBT_SIGNS.items() for value in pair]
+        rows = self._query(
+            "SELECT person_name, SUM(amount) FROM ("
+            " SELECT person_name, amount FROM split_expenses WHERE username = ?"
+            " UNION ALL SELECT person_name, amount * CASE type" + " WHEN ? THEN ?" * len(DEBT_SIGNS) + " END"
+            " FROM debts WHERE username = ? AND type IN (" + ", ".join("?" * len(DEBT_SIGNS)) + ")"
+            ") GROUP BY person_name",
+            (username, *signs, username, *DEBT_SIGNS)
+        )
+        return {person: amount for person, amount in rows}
+
+    # Exports
+    def iter_user_documents(self, collection_name, username, fields, batch_size=5000):
+        table, columns = EXPORT_TABLES[collection_name]
+        selected = [field for field in fields if field in columns]
+        if not selected:
+            raise ValueError(f"None of {fields} can be exported from {collection_name}.")
+        cursor = self._query(f"SELECT {', '.join(selected)} FROM {table} WHERE username = ?", (username,))
+        documents = _iter_documents(cursor, batch_size)
+        if collection_name != "expenses":
+            return documents
+        # Archived expenses follow the hot ones
+        projection = {**{field: 1 for field in selected}, "_id": 0}
+        archived = iter_bucket_expenses(self._buckets(username))
+        return chain(documents, (project_document(expense, projection) for expense in archived))
+
+    # Notification outbox
+    def _enqueue_notification(self, connection, username, alert_type, period, to_email, subject, message):
+        now = _ts(datetime.utcnow())
+        cursor = connection.execute(
+            "INSERT INTO notification_outbox (id, dedup_key, username, alert_type, period, to_email, subject, message,"
+            " status, attempts, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending', 0, ?, ?)"
+            " ON CONFLICT (dedup_key) DO NOTHING",
+            (str(ObjectId()), f"{username}:{alert_type}:{period}", username, alert_type, period, to_email, subject,
+             message, now, now)
+        )
+        return cursor.rowcount == 1
+
+    def enqueue_notification(self, username, alert_type, period, to_email, subject, message):
+        with self._transaction() as connection:
+            queued = self._enqueue_notification(connection, username, alert_type, period, to_email, subject, message)
+        if not queued:
+            return False, "Notification already queued for this period."
+        return True, "Notification queued."
+
+    def claim_notifications(self, limit=50, lease_seconds=300):
+        now = datetime.utcnow()
+        lease_until = _ts(now + timedelta(seconds=lease_seconds))
+        with self._transaction() as connection:
+            claimed = [_document(row) for row in connection.execute(
+                "SELECT * FROM notification_outbox WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?"
+                " ORDER BY next_attempt_at LIMIT ?", (_ts(now), limit)
+            )]
+            connection.executemany(
+                "UPDATE notification_outbox SET status = 'sending', next_attempt_at = ? WHERE id = ?",
+                [(lease_until, str(notification["_id"])) for notification in claimed]
+            )
+        for notification in claimed:
+            notification["status"] = "sending"
+            notification["next_attempt_at"] = _dt(lease_until)
+        return claimed
+
+    def mark_notification_sent(self, notification_id):
+        with self._transaction() as connection:
+            connection.execute("UPDATE notification_outbox SET status = 'sent', sent_at = ? WHERE id = ?",
+                               (_ts(datetime.utcnow()), str(notification_id)))
+
+    def mark_notification_failed(self, notification, error, base_delay_seconds=30):
+        update = notification_failure_update(notification, error, base_delay_seconds)
+        with self._transaction() as connection:
+            connection.execute(
+                f"UPDATE notification_outbox SET {', '.join(f'{field} = ?' for field in update)} WHERE id = ?",
+                [_ts(value) if field in DATETIME_COLUMNS else value for field, value in update.items()]
+                + [str(notification["_id"])]
+            )
+
+    # Categorizer models
+    def save_categorizer_model(self, username, model_bytes, classes, samples_seen):
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO categorizer_models (username, model, classes, samples_seen, updated_at)"
+                " VALUES (?, ?, ?, ?, ?) ON CONFLICT (username) DO UPDATE SET model = excluded.model,"
+                " classes = excluded.classes, samples_seen = excluded.samples_seen, updated_at = excluded.updated_at",
+                (username, model_bytes, json.dumps(list(classes)), samples_seen, _ts(datetime.utcnow()))
+            )
+
+    def load_categorizer_model(self, username):
+        row = self._query("SELECT * FROM categorizer_models WHERE username = ?", (username,)).fetchone()
+        if not row:
+            return None
+        model = _document(row)
+        model["model"] = bytes(model["model"])
+        model["classes"] = json.loads(model["classes"])
+        return model
+
+
+# Latency and statements of every public method (see backend/metrics.py)
+metrics.instrument_class(SqliteRepository, "sqlite_store")
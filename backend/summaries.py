@@ -0,0 +1,179 @@
+"""
+Materialized spending summaries.
+
+The storage backend (see backend/repository.py) keeps the expense_summaries
+(user x day x category x currency) and monthly_summaries (user x month x
+category) totals, and the budget_spend counters, up to date on every expense
+write. The functions here read them for the dashboard, add recurring
+occurrences (expanded on read until backend/batch.py stores them), and
+rebuild the summaries and counters from raw expenses when they drift. The
+counters convert to USD with the rates at write time, so changing the rates
+table (see backend/rates.py) shows up as drift too. Passing
+base_currency converts the per-currency daily rows with the offline rates
+table first.
+
+Usage:
+    python -m backend.summaries rebuild [username]
+    python -m backend.summaries check [username]
+"""
+import sys
+
+import pandas as pd
+from backend.repository import get_repository
+from backend.expenses import get_recurring_occurrences_df
+from backend.rates import convert_frame
+from backend.records import rebuilt_summaries
+
+# Sums that differ by less than this are not reported as drift
+DRIFT_TOLERANCE = 0.005
+
+
+# Add recurring occurrences (expanded up to today) to a summary frame
+def _with_occurrences(summary, username, key, occurrence_key):
+    occurrences = get_recurring_occurrences_df(username)
+    if occurrences.empty:
+        return summary
+    extra = occurrences.groupby(occurrence_key(occurrences))["amount"].sum().rename_axis(key).reset_index()
+    combined = pd.concat([summary, extra], ignore_index=True) if not summary.empty else extra
+    combined = combined.groupby(key, as_index=False)["amount"].sum()
+    combined["amount"] = combined["amount"].round(2)
+    return combined
+
+
+def _group(df, key, key_values):
+    grouped = df.groupby(key_values)["amount"].sum().rename_axis(key).reset_index()
+    grouped["amount"] = grouped["amount"].round(2)
+    return grouped
+
+
+# Daily summary rows plus recurring occurrences, in their own currencies
+def _daily_frame(username):
+    rows = get_repository().get_daily_summary_rows(username)
+    df = pd.DataFrame({
+        "date": pd.to_datetime([row["day"] for row in rows]),
+        "category": [row["category"] for row in rows],
+        "currency": [row.get("currency") for row in rows],
+        "amount": [row["total"] for row in rows],
+    })
+    occurrences = get_recurring_occurrences_df(username)
+    if not occurrences.empty:
+        occurrences = occurrences[["date", "category", "currency", "amount"]]
+        df = pd.concat([df, occurrences], ignore_index=True) if not df.empty else occurrences
+    return df
+
+
+# The daily frame converted to base_currency
+def _converted_daily_frame(username, base_currency):
+    return convert_frame(_daily_frame(username), base_currency)
+
+
+# Daily spending from the summary collection (one row per distinct day)
+def get_daily_summary(username, base_currency=None):
+    if base_currency:
+        df = _converted_daily_frame(username, base_currency)
+        return _group(df, "date", df["date"].dt.date)
+    rows = get_repository().get_summary_totals(username, "day")
+    summary = pd.DataFrame({
+        "date": [day for day, _ in rows],
+        "amount": [round(amount, 2) for _, amount in rows],
+    })
+    return _with_occurrences(summary, username, "date", lambda df: df["date"].dt.date)
+
+
+# Monthly spending from the summary collection
+def get_monthly_summary(username, base_currency=None):
+    if base_currency:
+        df = _converted_daily_frame(username, base_currency)
+        return _group(df, "month", df["date"].dt.to_period("M"))
+    rows = get_repository().get_summary_totals(username, "month")
+    summary = pd.DataFrame({
+        "month": pd.PeriodIndex([month for month, _ in rows], freq="M"),
+        "amount": [round(amount, 2) for _, amount in rows],
+    })
+    return _with_occurrences(summary, username, "month", lambda df: df["date"].dt.to_period("M"))
+
+
+# Category-wise spending from the summary collection
+def get_category_summary(username, base_currency=None):
+    if base_currency:
+        df = _converted_daily_frame(username, base_currency)
+        return _group(df, "category", df["category"])
+    rows = get_repository().get_summary_totals(username, "category")
+    summary = pd.DataFrame({
+        "category": [category for category, _ in rows],
+        "amount": [round(amount, 2) for _, amount in rows],
+    })
+    return _with_occurrences(summary, username, "category", lambda df: df["category"])
+
+
+# (daily, monthly, category) summaries in base_currency from one read of the
+# daily rows, for pages that show all three, plus the currencies spent in
+def get_converted_summaries(username, base_currency):
+    daily = _daily_frame(username)
+    currencies = sorted(daily["currency"].dropna().astype(str).unique()) if not daily.empty else []
+    df = convert_frame(daily, base_currency)
+    return (
+        _group(df, "date", df["date"].dt.date),
+        _group(df, "month", df["date"].dt.to_period("M")),
+        _group(df, "category", df["category"]),
+        currencies,
+    )
+
+
+# Rebuild summaries and budget counters from raw expenses, for one user or
+# everyone. Returns (daily rows, monthly rows, budget counters).
+def rebuild_summaries(username=None):
+    return get_repository().rebuild_summaries(username)
+
+
+# Compare stored daily summaries and budget counters against raw expenses.
+# Returns a list of mismatches: daily rows first, then budget counters, each
+# with the table it is from.
+def check_summary_drift(username=None):
+    repository = get_repository()
+    expected = repository.compute_daily_rows(username)
+    stored = repository.get_stored_daily_rows(username)
+
+    drift = []
+    for key in expected.keys() | stored.keys():
+        expected_total, expected_count = expected.get(key, (0.0, 0))
+        stored_total, stored_count = stored.get(key, (0.0, 0))
+        if expected_count != stored_count or abs(expected_total - stored_total) > DRIFT_TOLERANCE:
+            user, day, category, currency = key
+            drift.append({
+                "table": "expense_summaries", "username": user, "day": day, "category": category,
+                "currency": currency, "expected_total": expected_total, "stored_total": stored_total,
+                "expected_count": expected_count, "stored_count": stored_count,
+            })
+    drift.sort(key=lambda row: (row["username"], row["day"], str(row["category"]), str(row["currency"])))
+
+    expected_spend = rebuilt_summaries(expected)[2]
+    stored_spend = repository.get_stored_budget_spend(username)
+    spend_drift = []
+    for key in expected_spend.keys() | stored_spend.keys():
+        expected_spent, stored_spent = expected_spend.get(key, 0.0), stored_spend.get(key, 0.0)
+        if abs(expected_spent - stored_spent) > DRIFT_TOLERANCE:
+            user, period, period_key, category = key
+            spend_drift.append({
+                "table": "budget_spend", "username": user, "period": period, "period_key": period_key,
+                "category": category, "expected_spent": expected_spent, "stored_spent": stored_spent,
+            })
+    spend_drift.sort(key=lambda row: (row["username"], row["period"], row["period_key"], str(row["category"])))
+    return drift + spend_drift
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("rebuild", "check"):
+        print(__doc__)
+        sys.exit(2)
+
+    target = sys.argv[2] if len(sys.argv) > 2 else None
+    if sys.argv[1] == "rebuild":
+        days, months, counters = rebuild_summaries(target)
+        print(f"Rebuilt {days} daily and {months} monthly summary rows and {counters} budget counters.")
+    else:
+        mismatches = check_summary_drift(target)
+        for mismatch in mismatches:
+            print(mismatch)
+        print(f"{len(mismatches)} drifted summary rows and budget counters.")
+        sys.exit(1 if mismatches else 0)
@@ -1,13 +1,12 @@
 from dotenv import load_dotenv
+import math
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from forex_python.converter import CurrencyRates
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.naive_bayes import MultinomialNB
-from PIL import Image
-import pytesseract
+from datetime import datetime
+from backend.features import load_feature
+from backend.metrics import instrument_module
+from backend.rates import convert_amounts
+from backend.records import ALL_CATEGORIES, BUDGET_EXCEEDED_LEVEL, BUDGET_WARNING_LEVEL
+from backend.repository import get_repository
 
 # Load environment variables
 load_dotenv()
@@ -20,22 +19,34 @@ def validate_expense(date, category, description, amount):
         return False, "Amount must be greater than 0."
     return True, ""
 
-# Check budget
-def check_budget(total_spent, budget):
-    if total_spent > budget:
-        return "You have exceeded your budget!"
-    elif total_spent >= 0.8 * budget:
-        return "Warning: You are close to exceeding your budget!"
+# Check budget against the running spend counter for the current period.
+# Returns (status from get_budget_status or None, message).
+def check_budget(username, category=ALL_CATEGORIES, period="monthly"):
+    status = get_repository().get_budget_status(username, category, period)
+    if status is None:
+        return None, "No budget set."
+    if status["level"] >= BUDGET_EXCEEDED_LEVEL:
+        return status, "You have exceeded your budget!"
+    elif status["level"] >= BUDGET_WARNING_LEVEL:
+        return status, "Warning: You are close to exceeding your budget!"
     else:
-        return "You are within your budget."
+        return status, "You are within your budget."
 
-# Convert currency
-def convert_currency(amount, from_currency, to_currency):
-    c = CurrencyRates()
+# Convert currency with the offline rates snapshot (see backend/rates.py),
+# falling back to a live lookup for currencies the snapshot doesn't cover
+def convert_currency(amount, from_currency, to_currency, on_date=None):
+    day = (on_date or datetime.today()).strftime("%Y-%m-%d")
+    converted = float(convert_amounts([amount], [from_currency], [day], to_currency)[0])
+    if not math.isnan(converted):
+        return converted
+    c = load_feature("currency").CurrencyRates()
     return c.convert(from_currency, to_currency, amount)
 
 # Train expense categorizer
 def train_expense_categorizer(expenses_df):
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+
     vectorizer = CountVectorizer()
     X = vectorizer.fit_transform(expenses_df["description"])
     y = expenses_df["category"]
@@ -50,6 +61,8 @@ def predict_category(model, vectorizer, description):
 
 # Extract text from image (OCR)
 def extract_text_from_image(image):
+    import pytesseract
+
     return pytesseract.image_to_string(image)
 
 # Send email notification
@@ -66,6 +79,9 @@ def send_email_notification(subject, message, to_email):
         print("Email credentials not set in .env file.")
         return False
 
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+
     # Create the email
     msg = MIMEMultipart()
     msg["From"] = sender_email
@@ -75,7 +91,7 @@ def send_email_notification(subject, message, to_email):
 
     # Send the email
     try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
+        server = load_feature("email").SMTP(smtp_server, smtp_port)
         server.starttls()
         server.login(sender_email, sender_password)
         server.sendmail(sender_email, to_email, msg.as_string())
@@ -83,4 +99,8 @@ def send_email_notification(subject, message, to_email):
         return True
     except Exception as e:
         print(f"Error sending email: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+# Latency of every public function above (see backend/metrics.py)
+instrument_module(globals(), "utils")
@@ -0,0 +1,229 @@
+"""
+Query latency and storage size before and after archiving cold expenses.
+
+Generates synthetic users (benchmarks/datagen.py) with several years of
+expenses, times the expense reads of one of them, archives every user's
+expenses older than the hot window into monthly buckets (backend/archive.py)
+and times the same reads again. Prints the storage the expenses take before
+and after: on SQLite the pages of the expense tables and their indexes after
+VACUUM, and with MONGO_URI set the storage plus index size of the expenses
+and expense_buckets collections (whole collections, so use a scratch
+database).
+
+Checks that every read returns the same result before and after, that the
+summaries didn't drift and that the database and pandas rollups agree.
+
+Usage:
+    python -m benchmarks.bench_archive [users] [expenses per user] [days kept hot]   (default 10 20000 90)
+"""
+import math
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from bson.objectid import ObjectId
+
+from backend import expenses
+from backend.archive import archive_cutoff
+from backend.cache import clear_cache
+from backend.repository import create_repository, set_repository
+from backend.summaries import check_summary_drift
+from benchmarks.datagen import generate_user, user_names
+
+YEARS = 5
+# Expense tables in the SQLite storage numbers
+SQLITE_EXPENSE_TABLES = ("expenses", "expense_buckets", "archived_expenses")
+MONGO_EXPENSE_COLLECTIONS = ("expenses", "expense_buckets")
+
+
+def _median_ms(operation, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def _cold_frame(username):
+    clear_cache()
+    return expenses.get_expenses_df(username)
+
+
+# (name, operation, repeats) for the reads compared before and after archiving
+def read_operations(repository, username, deep_cursor):
+    today = datetime.today()
+    recent = (today - timedelta(days=90), today)
+    last_year = (today - timedelta(days=730), today - timedelta(days=365))
+    return [
+        ("get_expenses", lambda: repository.get_expenses(username), 3),
+        ("get_expenses_df (cold cache)", lambda: _cold_frame(username), 3),
+        ("get_expenses_page (first)", lambda: repository.get_expenses_page(username, 50), 20),
+        ("get_expenses_page (deep)", lambda: repository.get_expenses_page(username, 50, deep_cursor), 20),
+        ("find_expenses (last 90 days)", lambda: list(repository.find_expenses(username, recent)), 10),
+        ("find_expenses (a year ago)", lambda: list(repository.find_expenses(username, last_year, "Food")), 10),
+        ("get_expense_totals", lambda: repository.get_expense_totals(username), 10),
+        ("group_expenses (month)", lambda: repository.group_expenses(username, "month"), 10),
+        ("group_expenses (day, amounts)", lambda: repository.group_expenses(username, "day", None, None, (10, 50)), 10),
+        ("compute_daily_rows", lambda: repository.compute_daily_rows(username), 10),
+    ]
+
+
+def _canonical(value):
+    if isinstance(value, pd.DataFrame):
+        value = value.sort_values("id").reset_index(drop=True).astype(object)
+        return _canonical(value.where(value.notna(), None).to_dict("list"))
+    if isinstance(value, dict):
+        # An archived expense's updated_at is when it was archived
+        return sorted((str(key), _canonical(item)) for key, item in value.items() if key != "updated_at")
+    if isinstance(value, tuple):
+        return tuple(_canonical(item) for item in value)
+    if isinstance(value, list):
+        return sorted((_canonical(item) for item in value), key=lambda item: repr(_rounded(item)))
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (float, np.floating)):
+        return float(value)
+    return value
+
+
+def _rounded(value):
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_rounded(item) for item in value)
+    return value
+
+
+# Equal up to float summation order
+def _same(left, right):
+    if isinstance(left, float) and isinstance(right, float):
+        return math.isclose(left, right, rel_tol=1e-9, abs_tol=1e-6)
+    if isinstance(left, (list, tuple)) and isinstance(right, (list, tuple)):
+        return len(left) == len(right) and all(_same(a, b) for a, b in zip(left, right))
+    return left == right
+
+
+def run_reads(operations):
+    timings, results = {}, {}
+    for name, operation, repeat in operations:
+        timings[name] = _median_ms(operation, repeat)
+        results[name] = _canonical(operation())
+    return timings, results
+
+
+def sqlite_expense_bytes(path):
+    with tempfile.TemporaryDirectory() as directory:
+        copy = os.path.join(directory, "vacuumed.db")
+        with sqlite3.connect(path) as source, sqlite3.connect(copy) as target:
+            source.backup(target)
+        connection = sqlite3.connect(copy)
+        try:
+            connection.execute("VACUUM")
+            rows = connection.execute(
+                "SELECT m.tbl_name, SUM(s.pgsize) FROM dbstat s JOIN sqlite_master m ON m.name = s.name"
+                " GROUP BY m.tbl_name"
+            ).fetchall()
+        finally:
+            connection.close()
+    return sum(size for table, size in rows if table in SQLITE_EXPENSE_TABLES)
+
+
+def mongo_expense_bytes():
+    from backend.mongo_client import get_database
+
+    db = get_database()
+    total = 0
+    for name in MONGO_EXPENSE_COLLECTIONS:
+        if name in db.list_collection_names():
+            stats = db.command("collStats", name)
+            total += stats.get("storageSize", 0) + stats.get("totalIndexSize", 0)
+    return total
+
+
+def _cleanup_mongo(prefix):
+    from backend.mongo_client import get_database
+
+    db = get_database()
+    for name in db.list_collection_names():
+        db[name].delete_many({"username": {"$regex": f"^{prefix}"}})
+
+
+def bench_backend(name, repository, storage_bytes, usernames, expenses_per_user, days):
+    set_repository(repository)
+    rng = np.random.default_rng(23)
+    started = time.perf_counter()
+    for username in usernames:
+        generate_user(repository, username, rng, expenses=expenses_per_user, years=YEARS)
+    print(f"\n[{name}] generated {len(usernames)} users x {expenses_per_user} expenses over {YEARS} years "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    username = usernames[0]
+    # A cursor halfway through the user's history, kept for the second run
+    _, deep_cursor = repository.get_expenses_page(username, expenses_per_user // 2)
+    operations = read_operations(repository, username, deep_cursor)
+    size_before = storage_bytes()
+    before, results_before = run_reads(operations)
+
+    cutoff = archive_cutoff(days)
+    started = time.perf_counter()
+    archived = buckets = 0
+    for user in usernames:
+        user_archived, user_buckets = repository.archive_expenses(user, cutoff)
+        archived += user_archived
+        buckets += user_buckets
+    seconds = time.perf_counter() - started
+    print(f"[{name}] archived {archived} expenses dated before {cutoff:%Y-%m-%d} into {buckets} buckets "
+          f"in {seconds:.1f}s ({archived / seconds:,.0f} expenses/s)")
+
+    size_after = storage_bytes()
+    after, results_after = run_reads(operations)
+
+    failures = [operation for operation in results_before
+                if not _same(results_before[operation], results_after[operation])]
+    if check_summary_drift(username):
+        failures.append("summary drift")
+    if not all(expenses.check_rollup_parity(username).values()):
+        failures.append("rollup parity")
+    if not expenses.verify_expenses_df(username):
+        failures.append("verify_expenses_df")
+
+    print(f"\n{'operation (median ms)':<34}{'before':>10}{'after':>10}{'change':>9}")
+    for operation in before:
+        change = after[operation] / before[operation] if before[operation] else float("nan")
+        print(f"{operation:<34}{before[operation]:>10.2f}{after[operation]:>10.2f}{change:>8.2f}x")
+    print(f"{'expense storage (MB)':<34}{size_before / 1e6:>10.2f}{size_after / 1e6:>10.2f}"
+          f"{size_after / size_before if size_before else float('nan'):>8.2f}x")
+    for failure in failures:
+        print(f"[{name}] MISMATCH: {failure}")
+    return failures
+
+
+def main(users, expenses_per_user, days):
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "archive.db")
+        failures += bench_backend("sqlite", create_repository("sqlite", path), lambda: sqlite_expense_bytes(path),
+                                  user_names(users, "archive_user"), expenses_per_user, days)
+    if os.getenv("MONGO_URI"):
+        prefix = f"__bench_archive_{int(time.time())}_"
+        try:
+            failures += bench_backend("mongo", create_repository("mongo"), mongo_expense_bytes,
+                                      user_names(users, prefix), expenses_per_user, days)
+        finally:
+            _cleanup_mongo(prefix)
+    else:
+        print("\nMONGO_URI not set, SQLite only")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20_000,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 90)
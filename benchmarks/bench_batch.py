@@ -0,0 +1,96 @@
+"""
+Throughput of the headless batch runner (backend/batch.py).
+
+Generates synthetic users (benchmarks/datagen.py) into a SQLite file, then
+for each process count runs run_batch on a fresh copy of it twice: the
+first run stores every recurring occurrence since the rules started (a
+backlog), the second, with new checkpoints for the same day, finds nothing
+due, which is the steady daily cost. Prints users per second for both.
+
+Also checks that a run resumes from its checkpoints: with each shard's
+checkpoint rewound to half its users, a rerun processes only the rest.
+
+Usage:
+    python -m benchmarks.bench_batch [users] [process counts]   (default 200 1,2,4)
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from backend import batch
+from backend.sqlite_store import SqliteRepository
+from benchmarks.datagen import generate_user, user_names
+
+EXPENSES_PER_USER = 300
+YEARS = 2
+
+
+def _copy_database(source, target):
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+
+def _run(path, processes, directory):
+    report = batch.run_batch(processes, None, "sqlite", path, directory)
+    occurrences = sum(shard["occurrences"] for shard in report["shards"])
+    return report["users_per_second"], report["users"], occurrences
+
+
+# Rewind every finished shard to half its users and rerun; returns users processed
+def check_resume(path, processes, directory):
+    batch.run_batch(processes, None, "sqlite", path, directory)
+    expected = 0
+    for name in os.listdir(directory):
+        checkpoint = os.path.join(directory, name)
+        with open(checkpoint, encoding="utf-8") as f:
+            state = json.load(f)
+        shard = int(name.split("-shard-")[1].split("-")[0]) - 1
+        mine = [username for username in SqliteRepository(path).iter_usernames()
+                if batch.shard_of(username, processes) == shard]
+        keep = len(mine) // 2
+        state.update(last_username=mine[keep - 1] if keep else None, users=keep, done=False)
+        expected += len(mine) - keep
+        with open(checkpoint, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+    resumed = batch.run_batch(processes, None, "sqlite", path, directory)
+    assert resumed["users"] == expected, f"resumed {resumed['users']} users, expected {expected}"
+    assert all(shard["done"] for shard in resumed["shards"])
+    return resumed["users"]
+
+
+def main(users, process_counts):
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source.db")
+        store = SqliteRepository(source)
+        rng = np.random.default_rng(17)
+        started = time.perf_counter()
+        for username in user_names(users, "batch_user"):
+            generate_user(store, username, rng, expenses=EXPENSES_PER_USER, years=YEARS)
+        print(f"Generated {users} users ({EXPENSES_PER_USER} expenses, {YEARS} years of recurring rules each) "
+              f"in {time.perf_counter() - started:.1f}s; {os.cpu_count()} CPUs")
+
+        print(f"\n{'processes':>9}{'backlog users/s':>17}{'occurrences':>13}{'steady users/s':>16}")
+        for processes in process_counts:
+            path = os.path.join(directory, f"batch_{processes}.db")
+            _copy_database(source, path)
+            backlog_rate, processed, occurrences = _run(path, processes, os.path.join(directory, f"first_{processes}"))
+            assert processed == users, f"processed {processed} of {users} users"
+            steady_rate, _, again = _run(path, processes, os.path.join(directory, f"second_{processes}"))
+            assert again == 0, "second run stored occurrences again"
+            print(f"{processes:>9}{backlog_rate:>17.1f}{occurrences:>13}{steady_rate:>16.1f}")
+
+        processes = max(process_counts)
+        path = os.path.join(directory, "resume.db")
+        _copy_database(source, path)
+        resumed = check_resume(path, processes, os.path.join(directory, "resume"))
+        print(f"\nResume on {processes} processes: {resumed} of {users} users redone after rewinding checkpoints")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+         [int(count) for count in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 2, 4])
@@ -0,0 +1,124 @@
+"""
+Render time and memory of the visualizations section across reruns.
+
+Simulates Streamlit reruns of the three dashboard charts for a synthetic
+multi-year history and compares:
+
+  pyplot      the previous code: pyplot figures drawn from scratch, never
+              closed, saved like st.pyplot does (bbox_inches="tight")
+  uncached    backend.charts with the image cache cleared before every rerun
+  cached      backend.charts as the app uses it
+
+Memory is what tracemalloc still holds after the reruns, so figures that are
+never released show up as growth.
+
+Usage:
+    python -m benchmarks.bench_charts [years] [reruns]   (default 5, 20)
+"""
+import gc
+import io
+import statistics
+import sys
+import time
+import tracemalloc
+
+import matplotlib
+
+matplotlib.use("Agg")
+matplotlib.rcParams["figure.max_open_warning"] = 0  # The pyplot variant leaks on purpose
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import seaborn as sns  # noqa: E402
+
+from backend import charts  # noqa: E402
+
+
+# Frames shaped like get_daily_summary / get_monthly_summary / get_category_summary
+def synthetic_summaries(years, seed=3):
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2020-01-01", periods=365 * years, freq="D")
+    daily = pd.DataFrame({"date": days.date, "amount": rng.gamma(2.0, 30.0, len(days)).round(2)})
+    monthly = daily.groupby(pd.to_datetime(daily["date"]).dt.to_period("M"))["amount"].sum()
+    monthly = monthly.rename_axis("month").reset_index()
+    category = pd.DataFrame({
+        "category": ["Food", "Transport", "Entertainment", "Utilities", "Other"],
+        "amount": rng.uniform(100, 1000, 5).round(2),
+    })
+    return daily, monthly, category
+
+
+# The visualizations section as it was before backend/charts.py
+def pyplot_rerun(daily, monthly, category):
+    images = []
+    fig, ax = plt.subplots(figsize=(10, 5))
+    sns.lineplot(x="date", y="amount", data=daily, marker="o", markersize=8, linewidth=2, ax=ax)
+    plt.xticks(rotation=45)
+    images.append(fig)
+    fig, ax = plt.subplots(figsize=(10, 5))
+    sns.barplot(x="month", y="amount", data=monthly, ax=ax, edgecolor="black", linewidth=2)
+    plt.xticks(rotation=45)
+    images.append(fig)
+    fig, ax = plt.subplots(figsize=(10, 5))
+    ax.pie(category["amount"], labels=category["category"], autopct="%1.1f%%", colors=sns.color_palette("pastel"),
+           startangle=140)
+    images.append(fig)
+    for fig in images:
+        fig.savefig(io.BytesIO(), format="png", bbox_inches="tight")
+
+
+def charts_rerun(daily, monthly, category, cached=True):
+    if not cached:
+        charts.clear_chart_cache()
+    charts.render_chart("daily", daily)
+    charts.render_chart("monthly", monthly)
+    charts.render_chart("category", category)
+
+
+# (median ms per rerun, first rerun ms). Untraced, tracemalloc slows drawing down.
+def time_reruns(rerun, reruns):
+    timings = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        rerun()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), timings[0]
+
+
+# (KiB still allocated after the reruns, open pyplot figures)
+def retained_memory(rerun, reruns):
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for _ in range(reruns):
+        rerun()
+    gc.collect()
+    retained = (tracemalloc.get_traced_memory()[0] - baseline) / 1024
+    tracemalloc.stop()
+    return retained, len(plt.get_fignums())
+
+
+def main(years, reruns):
+    daily, monthly, category = synthetic_summaries(years)
+    print(f"{len(daily)} days, {len(monthly)} months, {reruns} reruns "
+          f"(daily series drawn with at most {charts.MAX_DAILY_POINTS} points)")
+
+    variants = {
+        "pyplot": lambda: pyplot_rerun(daily, monthly, category),
+        "uncached": lambda: charts_rerun(daily, monthly, category, cached=False),
+        "cached": lambda: charts_rerun(daily, monthly, category),
+    }
+    print(f"\n{'variant':<12}{'median ms':>12}{'first ms':>12}{'retained KiB':>15}{'open figures':>15}")
+    for name, rerun in variants.items():
+        charts.clear_chart_cache()
+        median_ms, first_ms = time_reruns(rerun, reruns)
+        plt.close("all")
+        charts.clear_chart_cache()
+        retained_kib, open_figures = retained_memory(rerun, reruns)
+        print(f"{name:<12}{median_ms:>12.1f}{first_ms:>12.1f}{retained_kib:>15.0f}{open_figures:>15}")
+        plt.close("all")
+    print(f"\nchart cache: {charts.chart_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5, int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,97 @@
+"""
+Dashboard load latency: sequential reads against load_dashboard().
+
+The stand-in server is a local SQLite store behind DelayedRepository, which
+sleeps for a fixed round-trip time before every repository call, the way a
+remote MongoDB adds network latency to each query. For each delay it times
+the reads the logged-in page made one after another before
+backend/dashboard.py, and load_dashboard(), each with a cold cache (first
+page view) and a warm one (rerun without writes).
+
+Usage:
+    python -m benchmarks.bench_dashboard [expenses] [runs]   (default 5000, 5)
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from backend.cache import clear_cache
+from backend.dashboard import load_dashboard
+from backend.expenses import get_expenses_df
+from backend.repository import set_repository
+from backend.sqlite_store import SqliteRepository
+from backend.summaries import get_category_summary, get_daily_summary, get_monthly_summary
+from backend.utils import check_budget
+from benchmarks.datagen import generate_user
+
+DELAYS_MS = (0, 1, 5, 20)
+USERNAME = "bench_dashboard"
+
+
+# A repository whose every call first waits delay_ms, like a round trip to a remote server
+class DelayedRepository:
+    def __init__(self, repository, delay_ms=0.0):
+        self._repository = repository
+        self.delay_ms = delay_ms
+
+    def __getattr__(self, name):
+        method = getattr(self._repository, name)
+
+        def call(*args, **kwargs):
+            time.sleep(self.delay_ms / 1000)
+            return method(*args, **kwargs)
+
+        return call
+
+
+# The page's reads in the order it made them before load_dashboard
+def sequential_reads(repository, username, base_currency="USD"):
+    get_expenses_df(username)
+    get_expenses_df(username)
+    get_daily_summary(username, base_currency)
+    get_monthly_summary(username, base_currency)
+    get_category_summary(username, base_currency)
+    for budget in repository.get_budgets(username):
+        check_budget(username, budget["category"], budget["period"])
+    repository.get_counterparty_balances(username)
+    repository.get_income(username)
+    repository.get_debts(username)
+    repository.get_recurring_expenses(username)
+
+
+def _median_ms(operation, runs, cold):
+    timings = []
+    for _ in range(runs):
+        if cold:
+            clear_cache()
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main(expenses, runs):
+    with tempfile.TemporaryDirectory() as directory:
+        store = SqliteRepository(os.path.join(directory, "bench.db"))
+        generate_user(store, USERNAME, np.random.default_rng(3), expenses=expenses)
+        repository = DelayedRepository(store)
+        set_repository(repository)
+        load_dashboard(USERNAME)  # Start the read pool and import everything once
+
+        print(f"{expenses} expenses, median of {runs} runs")
+        print(f"\n{'round trip':>10}{'cache':>7}{'sequential ms':>15}{'load_dashboard ms':>19}{'speedup':>9}")
+        for delay_ms in DELAYS_MS:
+            repository.delay_ms = delay_ms
+            for cold in (True, False):
+                sequential_ms = _median_ms(lambda: sequential_reads(repository, USERNAME), runs, cold)
+                concurrent_ms = _median_ms(lambda: load_dashboard(USERNAME), runs, cold)
+                print(f"{delay_ms:>8} ms{'cold' if cold else 'warm':>7}{sequential_ms:>15.1f}{concurrent_ms:>19.1f}"
+                      f"{sequential_ms / concurrent_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000, int(sys.argv[2]) if len(sys.argv) > 2 else 5)
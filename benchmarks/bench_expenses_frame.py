@@ -0,0 +1,72 @@
+"""
+Memory/latency benchmark: typed columnar expenses frame vs list-of-dicts.
+
+Usage:
+    python -m benchmarks.bench_expenses_frame [rows ...]   (default 10000 100000 1000000)
+"""
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pandas as pd
+from bson.objectid import ObjectId
+
+from backend.frames import build_expenses_frame
+
+CATEGORIES = ["Food", "Transport", "Entertainment", "Utilities", "Other"]
+CURRENCIES = ["USD", "EUR", "INR"]
+
+
+def make_documents(rows, seed=42):
+    rng = random.Random(seed)
+    start = datetime(2015, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "date": start + timedelta(days=rng.randrange(3650)),
+            "category": rng.choice(CATEGORIES),
+            "description": f"purchase {rng.randrange(500)}",
+            "amount": round(rng.uniform(1, 500), 2),
+            "currency": rng.choice(CURRENCIES),
+            "recurring": False,
+            "recurrence_period": None,
+        }
+        for _ in range(rows)
+    ]
+
+
+# The DataFrame construction used before build_expenses_frame
+def legacy_frame(documents):
+    df = pd.DataFrame(documents)
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+# Time a clean run, then a second run under tracemalloc for peak allocation
+def measure(builder, documents):
+    started = time.perf_counter()
+    df = builder(documents)
+    elapsed = time.perf_counter() - started
+    size = int(df.memory_usage(deep=True).sum())
+    del df
+
+    tracemalloc.start()
+    builder(documents)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def main(sizes):
+    print(f"{'rows':>9} {'builder':>8} {'seconds':>9} {'peak MiB':>9} {'frame MiB':>10}")
+    for rows in sizes:
+        documents = make_documents(rows)
+        for name, builder in (("legacy", legacy_frame), ("typed", build_expenses_frame)):
+            elapsed, peak, size = measure(builder, documents)
+            print(f"{rows:>9} {name:>8} {elapsed:>9.3f} {peak / 2**20:>9.1f} {size / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,70 @@
+"""
+Rows/sec and RSS benchmark for the streaming exporters.
+
+Seeds a throwaway user with synthetic expenses, exports them in every
+available format to temporary files and reports throughput plus RSS growth.
+Runs on the configured storage backend (STORAGE_BACKEND); with MongoDB,
+MONGO_URI must point at a scratch database.
+
+Usage:
+    python -m benchmarks.bench_export [rows]   (default 1000000)
+"""
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from backend.exporter import EXPORTERS, pa
+from backend.records import build_expense_document
+from backend.repository import get_repository
+
+BENCH_USER = "__bench_export__"
+
+
+def current_rss_mib():
+    with open("/proc/self/statm") as handle:
+        return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def seed(rows, batch_size=10000):
+    rng = random.Random(11)
+    start = datetime(2015, 1, 1)
+    repository = get_repository()
+    repository.delete_user_expenses(BENCH_USER)
+    for offset in range(0, rows, batch_size):
+        repository.insert_expenses([
+            build_expense_document(
+                BENCH_USER, start + timedelta(days=rng.randrange(3650)),
+                rng.choice(["Food", "Transport", "Entertainment", "Utilities", "Other"]),
+                f"merchant {rng.randrange(2000)}", round(rng.uniform(1, 500), 2),
+            )
+            for _ in range(min(batch_size, rows - offset))
+        ])
+
+
+def main(rows):
+    seed(rows)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for export_format, exporter in EXPORTERS.items():
+                if export_format == "parquet" and pa is None:
+                    print("parquet: skipped, pyarrow not installed")
+                    continue
+                path = os.path.join(directory, f"expenses.{export_format}")
+                rss_before = current_rss_mib()
+                started = time.perf_counter()
+                count = exporter("expenses", BENCH_USER, path)
+                elapsed = time.perf_counter() - started
+                print(f"{export_format:>8}: {count / elapsed:>9.0f} rows/s, "
+                      f"RSS {rss_before:.0f} -> {current_rss_mib():.0f} MiB, "
+                      f"file {os.path.getsize(path) / 2**20:.1f} MiB")
+    finally:
+        get_repository().delete_user_expenses(BENCH_USER)
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
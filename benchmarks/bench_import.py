@@ -0,0 +1,61 @@
+"""
+Throughput/memory benchmark for the statement importer.
+
+Writes a synthetic CSV statement to a temporary file and imports it for a
+throwaway user on the configured storage backend (STORAGE_BACKEND). With
+MongoDB, MONGO_URI must point at a scratch database.
+
+Usage:
+    python -m benchmarks.bench_import [rows]   (default 1000000)
+"""
+import csv
+import os
+import random
+import resource
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from backend.importer import import_statement
+from backend.repository import get_repository
+
+BENCH_USER = "__bench_import__"
+
+
+def write_statement(path, rows, seed=7):
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["Transaction Date", "Details", "Withdrawal", "Category"])
+        for _ in range(rows):
+            writer.writerow([
+                (start + timedelta(days=rng.randrange(3650))).strftime("%d/%m/%Y"),
+                f"merchant {rng.randrange(2000)}",
+                f"{rng.uniform(1, 500):.2f}",
+                rng.choice(["Food", "Transport", "Entertainment", "Utilities", "Other"]),
+            ])
+
+
+def main(rows):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "statement.csv")
+        write_statement(path, rows)
+        repository = get_repository()
+        repository.delete_user_expenses(BENCH_USER)
+        try:
+            first = import_statement(BENCH_USER, path)
+            again = import_statement(BENCH_USER, path)
+        finally:
+            repository.delete_user_expenses(BENCH_USER)
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    print(f"first import:  {first['inserted']} rows in {first['seconds']:.1f}s "
+          f"({first['rows_per_second']:.0f} rows/s)")
+    print(f"re-import:     {again['duplicates']} duplicates in {again['seconds']:.1f}s "
+          f"({again['rows_per_second']:.0f} rows/s)")
+    print(f"peak RSS:      {peak_rss:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
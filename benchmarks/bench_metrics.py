@@ -0,0 +1,110 @@
+"""
+Overhead of the metrics layer (backend/metrics.py).
+
+Measures the cost a timed() wrapper adds to one call and the cost of
+charging one storage round trip, then runs typical SQLite repository calls
+on a synthetic user with and without their wrappers. Also compares the
+reply-size estimate of the Mongo command listener (METRICS_MEASURE_BYTES)
+with an exact re-encode, relative to decoding the reply, which pymongo does
+anyway.
+
+Usage:
+    python -m benchmarks.bench_metrics [rows]   (default 20000)
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import bson
+
+from backend import metrics
+from backend.mongo_client import command_listener
+from backend.records import build_expense_document
+from backend.sqlite_store import SqliteRepository
+
+CALLS = 200_000
+REPLY_DOCUMENTS = 1000
+
+
+def _per_call_ns(fn, calls=CALLS):
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) * 1e9 / calls
+
+
+# Median ms of a and b, run alternately so drift hits both the same
+def _paired_ms(a, b, repeat):
+    timings = ([], [])
+    for _ in range(repeat):
+        for operation, samples in ((a, timings[0]), (b, timings[1])):
+            started = time.perf_counter()
+            operation()
+            samples.append(time.perf_counter() - started)
+    return [statistics.median(samples) * 1000 for samples in timings]
+
+
+def wrapper_overhead():
+    def noop():
+        return None
+
+    wrapped = metrics.timed("bench.noop")(noop)
+    bare_ns = min(_per_call_ns(noop) for _ in range(3))
+    wrapped_ns = min(_per_call_ns(wrapped) for _ in range(3))
+    with metrics.measure("bench.round_trips"):
+        round_trip_ns = min(_per_call_ns(metrics.record_round_trip) for _ in range(3))
+    print(f"timed() wrapper        {wrapped_ns - bare_ns:>8.0f} ns per call")
+    print(f"record_round_trip()    {round_trip_ns:>8.0f} ns per round trip")
+
+
+def repository_overhead(rows):
+    with tempfile.TemporaryDirectory() as directory:
+        repository = SqliteRepository(os.path.join(directory, "bench.db"))
+        start = datetime(2021, 1, 1)
+        repository.insert_expenses([
+            build_expense_document("bench", start + timedelta(days=index % 1000), "Food", f"item {index}", 5.0)
+            for index in range(rows)
+        ])
+        operations = {
+            "get_expenses_page": lambda method: method(repository, "bench", 50),
+            "get_expense_totals": lambda method: method(repository, "bench"),
+            "get_budget_status": lambda method: method(repository, "bench"),
+            "add_expense": lambda method: method(repository, "bench", "2024-01-01", "Food", "timed", 1.0),
+        }
+        print(f"\n{'SqliteRepository (median ms)':<30}{'bare':>10}{'wrapped':>10}{'added us':>10}")
+        for name, call in operations.items():
+            wrapped = getattr(SqliteRepository, name)
+            bare = getattr(wrapped, "__wrapped__", wrapped)
+            bare_ms, wrapped_ms = _paired_ms(lambda: call(bare), lambda: call(wrapped), 500)
+            print(f"{name:<30}{bare_ms:>10.3f}{wrapped_ms:>10.3f}{(wrapped_ms - bare_ms) * 1000:>10.1f}")
+
+
+def byte_counting_overhead():
+    start = datetime(2021, 1, 1)
+    reply = {"cursor": {"firstBatch": [
+        {"_id": bson.ObjectId(), **build_expense_document("bench", start, "Food", f"item {index}", 5.0)}
+        for index in range(REPLY_DOCUMENTS)
+    ], "id": 0, "ns": "expense_tracker.expenses"}, "ok": 1.0}
+    raw = bson.encode(reply)
+    event = SimpleNamespace(reply=reply)
+    decode_ms, encode_ms = _paired_ms(lambda: bson.decode(raw), lambda: bson.encode(reply), 50)
+    listener_ms = _paired_ms(lambda: command_listener.succeeded(event), lambda: None, 50)[0]
+    print(f"\n{REPLY_DOCUMENTS}-document reply ({len(raw) / 1024:.0f} KiB), decoded in {decode_ms:.2f} ms:")
+    print(f"  exact byte count (re-encode)    {encode_ms:>8.3f} ms ({encode_ms / decode_ms * 100:.0f}% of decoding)")
+    print(f"  CommandMetricsListener estimate {listener_ms:>8.3f} ms ({listener_ms / decode_ms * 100:.1f}% of decoding)")
+
+
+def main(rows):
+    if not metrics.METRICS_ENABLED:
+        sys.exit("METRICS_ENABLED=0, nothing to measure")
+    wrapper_overhead()
+    repository_overhead(rows)
+    byte_counting_overhead()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,71 @@
+"""
+Latency benchmark for receipt OCR.
+
+Runs every image in a directory through tesseract at full resolution, then
+through the preprocessed pipeline (downscale + binarize), then again through
+the result cache, and prints per-image latency percentiles for each. Needs
+the tesseract binary.
+
+Usage:
+    python -m benchmarks.bench_ocr <receipt image directory>
+"""
+import os
+import statistics
+import sys
+import time
+
+from backend.ocr import _ocr_bytes, get_receipt_result, parse_receipt, submit_receipt
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def load_corpus(directory):
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, name), "rb") as handle:
+                images.append((name, handle.read()))
+    return images
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:<14} median {statistics.median(timings) * 1000:9.1f} ms   "
+          f"p95 {p95 * 1000:9.1f} ms   total {sum(timings):7.2f} s")
+
+
+def main(directory):
+    images = load_corpus(directory)
+    if not images:
+        print(f"No {'/'.join(IMAGE_EXTENSIONS)} files in {directory}.")
+        return
+
+    raw, preprocessed, cached = [], [], []
+    parsed = 0
+    for _, image_bytes in images:
+        start = time.perf_counter()
+        _ocr_bytes(image_bytes, preprocess=False)
+        raw.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        key = submit_receipt(image_bytes)
+        result = get_receipt_result(key, wait=300)
+        preprocessed.append(time.perf_counter() - start)
+        parsed += parse_receipt(result["text"])["amount"] is not None
+
+        start = time.perf_counter()
+        get_receipt_result(submit_receipt(image_bytes))
+        cached.append(time.perf_counter() - start)
+
+    print(f"{len(images)} receipts, amount found on {parsed}")
+    report("full-res", raw)
+    report("preprocessed", preprocessed)
+    report("cache hit", cached)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(2)
+    main(sys.argv[1])
@@ -0,0 +1,189 @@
+"""
+Split writes, counterparty balances and settlement planning at scale.
+
+For a user with thousands of counterparties and tens of thousands of splits
+and debts/loans, on SQLite in a temporary file (and MongoDB too when
+MONGO_URI is set, which must point at a scratch database):
+
+  split writes  one add_split_expense call per person (the old UI loop)
+                against one add_split_expenses call per expense
+  balances      get_counterparty_balances (summed by the store) against
+                streaming every split and debt and summing them in Python
+  settlement    minimal_transfers with heaps against re-sorting the
+                balances after every transfer, for growing groups; every
+                plan is checked to settle all balances in at most n - 1
+                transfers
+
+Usage:
+    python -m benchmarks.bench_settlements [counterparties] [entries]   (default 5000, 50000)
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from backend.records import DEBT_SIGNS, split_shares
+from backend.repository import create_repository
+from backend.settlements import get_settlement, minimal_transfers
+
+SPLIT_WIDTH = 10  # People per split expense
+SPLIT_EXPENSES = 50  # Expenses split per write variant
+GROUP_SIZES = (100, 1000, 10_000, 100_000)
+SORTED_MAX_GROUP = 10_000  # The re-sorting variant is quadratic, skip it above this
+
+
+def _median_ms(operation, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+# The same greedy plan as minimal_transfers, re-sorting instead of using heaps
+def sorted_transfers(balances):
+    cents = {party: round(amount * 100) for party, amount in balances.items() if round(amount * 100)}
+    transfers = []
+    while True:
+        creditor = max(cents, key=cents.get, default=None)
+        debtor = min(cents, key=cents.get, default=None)
+        if creditor is None or cents[creditor] <= 0 or cents[debtor] >= 0:
+            return transfers
+        amount = min(cents[creditor], -cents[debtor])
+        transfers.append((debtor, creditor, amount / 100))
+        for party, change in ((creditor, -amount), (debtor, amount)):
+            cents[party] += change
+            if not cents[party]:
+                del cents[party]
+
+
+# Balances of a group that add up to zero
+def random_group(size, rng):
+    cents = rng.integers(-50_000, 50_000, size)
+    cents[-1] -= cents.sum()
+    return {f"person_{index:06d}": int(value) / 100 for index, value in enumerate(cents)}
+
+
+def check_plan(balances, transfers):
+    remaining = {party: round(amount * 100) for party, amount in balances.items()}
+    for payer, payee, amount in transfers:
+        remaining[payer] += round(amount * 100)
+        remaining[payee] -= round(amount * 100)
+    assert not any(remaining.values()), "plan leaves balances unsettled"
+    assert len(transfers) <= max(len(balances) - 1, 0), "plan uses more than n - 1 transfers"
+
+
+# A user with `counterparties` people across `entries` splits and debts/loans
+def fill_user(repository, username, counterparties, entries, rng):
+    people = [f"person_{index:05d}" for index in range(counterparties)]
+    split_count = entries * 2 // 3
+    start = datetime(2022, 1, 1)
+    for offset in range(0, split_count, SPLIT_WIDTH):
+        picks = rng.choice(counterparties, size=min(SPLIT_WIDTH, split_count - offset), replace=False)
+        total = float(rng.gamma(2.0, 20.0)) * len(picks)
+        repository.add_split_expenses(username, f"expense_{offset}", split_shares(total, [people[i] for i in picks]))
+    for index in range(entries - split_count):
+        day = start + timedelta(days=int(rng.integers(900)))
+        repository.add_debt(username, day, people[rng.integers(counterparties)], "bench",
+                            round(float(rng.gamma(2.0, 25.0)), 2), ("Debt", "Loan")[index % 2])
+
+
+# The balances without the server: every split and debt fetched and summed here
+def client_side_balances(repository, username):
+    balances = {}
+    for split in repository.iter_user_documents("splits", username, ["person_name", "amount"]):
+        balances[split["person_name"]] = balances.get(split["person_name"], 0.0) + split["amount"]
+    for debt in repository.iter_user_documents("debts", username, ["person_name", "amount", "type"]):
+        if debt["type"] in DEBT_SIGNS:
+            balances[debt["person_name"]] = (balances.get(debt["person_name"], 0.0)
+                                             + DEBT_SIGNS[debt["type"]] * debt["amount"])
+    return balances
+
+
+def time_store(repository, username, counterparties, entries):
+    rng = np.random.default_rng(5)
+    people = [f"writer_{index}" for index in range(SPLIT_WIDTH)]
+    shares = split_shares(SPLIT_WIDTH * 12.5, people)
+    timings = {}
+
+    def split_one_by_one():
+        for index in range(SPLIT_EXPENSES):
+            for person, amount in shares:
+                repository.add_split_expense(f"{username}_writes", f"loop_{index}", person, amount)
+
+    def split_batched():
+        for index in range(SPLIT_EXPENSES):
+            repository.add_split_expenses(f"{username}_writes", f"batch_{index}", shares)
+
+    timings[f"split {SPLIT_WIDTH} ways, per-person writes"] = _median_ms(split_one_by_one, 1) / SPLIT_EXPENSES
+    timings[f"split {SPLIT_WIDTH} ways, add_split_expenses"] = _median_ms(split_batched, 1) / SPLIT_EXPENSES
+
+    started = time.perf_counter()
+    fill_user(repository, username, counterparties, entries, rng)
+    print(f"  filled {entries} entries in {time.perf_counter() - started:.1f} s")
+
+    server = repository.get_counterparty_balances(username)
+    client = client_side_balances(repository, username)
+    assert server.keys() == client.keys() and all(abs(server[p] - client[p]) < 0.01 for p in server)
+    timings["balances, get_counterparty_balances"] = _median_ms(
+        lambda: repository.get_counterparty_balances(username), 5)
+    timings["balances, summed client-side"] = _median_ms(lambda: client_side_balances(repository, username), 5)
+    timings["settlement plan from the store"] = _median_ms(
+        lambda: get_settlement(username, repository.get_counterparty_balances(username)), 5)
+    group = {person: -round(amount, 2) for person, amount in server.items()}
+    check_plan({**group, username: -sum(group.values())}, get_settlement(username, server))
+    return timings
+
+
+def time_planning():
+    rng = np.random.default_rng(7)
+    print(f"\n{'group size':>10}{'heap ms':>12}{'sorted ms':>12}{'transfers':>12}")
+    for size in GROUP_SIZES:
+        balances = random_group(size, rng)
+        transfers = minimal_transfers(balances)
+        check_plan(balances, transfers)
+        heap_ms = _median_ms(lambda: minimal_transfers(balances), 3)
+        if size <= SORTED_MAX_GROUP:
+            check_plan(balances, sorted_transfers(balances))
+            sorted_ms = f"{_median_ms(lambda: sorted_transfers(balances), 1):>12.1f}"
+        else:
+            sorted_ms = f"{'-':>12}"
+        print(f"{size:>10}{heap_ms:>12.1f}{sorted_ms}{len(transfers):>12}")
+
+
+def main(counterparties, entries):
+    run_id = f"{int(time.time())}"
+    username = f"__bench_settlements_{run_id}__"
+    with tempfile.TemporaryDirectory() as directory:
+        backends = {"sqlite": create_repository("sqlite", os.path.join(directory, "bench.db"))}
+        if os.getenv("MONGO_URI"):
+            backends["mongo"] = create_repository("mongo")
+        else:
+            print("MONGO_URI not set, timing SQLite only")
+
+        results = {}
+        try:
+            for name, repository in backends.items():
+                print(f"{name}: {counterparties} counterparties, {entries} splits and debts/loans")
+                results[name] = time_store(repository, username, counterparties, entries)
+        finally:
+            if "mongo" in backends:
+                from backend.mongo_client import get_database
+
+                for collection in ("split_expenses", "debts"):
+                    get_database()[collection].delete_many({"username": {"$regex": f"^{username}"}})
+
+    names = list(results)
+    print(f"\n{'operation (median ms)':<44}" + "".join(f"{name:>12}" for name in names))
+    for operation in results[names[0]]:
+        print(f"{operation:<44}" + "".join(f"{results[name][operation]:>12.2f}" for name in names))
+    time_planning()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000, int(sys.argv[2]) if len(sys.argv) > 2 else 50_000)
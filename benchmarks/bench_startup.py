@@ -0,0 +1,128 @@
+"""
+Cold-start import time of app.py, with regression thresholds.
+
+Imports every module app.py imports at the top level in a fresh interpreter
+under `python -X importtime`, several times, and reports the median total
+plus the packages that cost the most. Then times the first load of each
+feature in backend/features.py on top of that. Exits non-zero if a heavy
+dependency is imported at startup or the median total exceeds the budget.
+
+Usage:
+    python -m benchmarks.bench_startup [budget ms] [runs]   (default 2000, 5)
+"""
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from backend.features import FEATURES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Top-level packages that must only load behind the feature registry. Not
+# pyarrow: pandas imports it itself when it is installed.
+HEAVY_PACKAGES = {"sklearn", "scipy", "PIL", "pytesseract", "forex_python", "matplotlib", "seaborn", "smtplib",
+                  "ssl"}
+TOP_PACKAGES = 10
+
+# Imports the modules one by one so a missing dependency is reported, not fatal
+_IMPORT_SCRIPT = """
+import importlib, json, sys
+missing = []
+for name in sys.argv[1:]:
+    try:
+        importlib.import_module(name)
+    except ImportError as e:
+        missing.append(f"{name}: {e}")
+print(json.dumps(missing))
+"""
+
+_FEATURE_SCRIPT = """
+import importlib, json, sys
+for name in sys.argv[2:]:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+from backend.features import load_feature, load_times
+try:
+    load_feature(sys.argv[1])
+    print(json.dumps(load_times()[sys.argv[1]]))
+except ImportError as e:
+    print(json.dumps(str(e)))
+"""
+
+
+# Modules app.py imports at module level
+def startup_modules(path=os.path.join(ROOT, "app.py")):
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+# (total ms, {top-level package: self ms}, missing imports) for one cold import
+def measure_startup(modules):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _IMPORT_SCRIPT, *modules],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    total_us = 0
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1000
+        if not name[1:].startswith(" "):  # Not nested under another import
+            total_us += int(cumulative_us)
+    return total_us / 1000, packages, json.loads(result.stdout)
+
+
+def measure_feature(name, modules):
+    result = subprocess.run(
+        [sys.executable, "-c", _FEATURE_SCRIPT, name, *modules],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def main(budget_ms, runs):
+    modules = startup_modules()
+    measurements = [measure_startup(modules) for _ in range(runs)]
+    totals = [total for total, _, _ in measurements]
+    _, packages, missing = measurements[-1]
+    for error in missing:
+        print(f"not installed, skipped: {error}")
+
+    total = statistics.median(totals)
+    print(f"app.py imports: {total:.0f} ms median over {runs} runs (budget {budget_ms:.0f} ms)")
+    print(f"\n{'package (self ms)':<28}{'ms':>10}")
+    for package, ms in sorted(packages.items(), key=lambda item: -item[1])[:TOP_PACKAGES]:
+        print(f"{package:<28}{ms:>10.1f}")
+
+    print(f"\n{'feature (first load)':<28}{'ms':>10}")
+    for name in FEATURES:
+        seconds = measure_feature(name, modules)
+        print(f"{name:<28}" + (f"{seconds * 1000:>10.1f}" if isinstance(seconds, float) else f"  {seconds}"))
+
+    failures = []
+    eager = sorted(HEAVY_PACKAGES & set(packages))
+    if eager:
+        failures.append(f"heavy packages imported at startup: {', '.join(eager)}")
+    if total > budget_ms:
+        failures.append(f"startup imports took {total:.0f} ms, over the {budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"\nFAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2000.0, int(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -0,0 +1,94 @@
+"""
+Latency comparison for the storage backends.
+
+Times the hot operations on every available Repository implementation
+(SQLite in a temporary file always; MongoDB too when MONGO_URI is set) and
+prints them side by side. The behaviour both must share is tested in
+tests/test_repository.py.
+
+Usage:
+    python -m benchmarks.bench_storage [rows]   (default 20000)
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from backend.records import ALL_CATEGORIES, build_expense_document
+from backend.repository import create_repository
+
+CATEGORIES = ["Food", "Transport", "Entertainment", "Utilities", "Other"]
+
+
+def _median_ms(operation, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def time_operations(repository, username, rows):
+    rng = random.Random(5)
+    start = datetime(2020, 1, 1)
+    documents = [
+        build_expense_document(username, start + timedelta(days=rng.randrange(1500)), rng.choice(CATEGORIES),
+                               f"merchant {rng.randrange(500)}", round(rng.uniform(1, 200), 2))
+        for _ in range(rows)
+    ]
+    repository.set_budget(username, ALL_CATEGORIES, 500.0, "monthly")
+    timings = {}
+    started = time.perf_counter()
+    for offset in range(0, rows, 5000):
+        repository.insert_expenses(documents[offset:offset + 5000])
+    timings[f"insert_expenses ({rows} rows)"] = (time.perf_counter() - started) * 1000
+    timings["add_expense"] = _median_ms(
+        lambda: repository.add_expense(username, "2024-01-01", "Food", "timed", 1.0), 50
+    )
+    timings["get_expenses_page"] = _median_ms(lambda: repository.get_expenses_page(username, 50), 50)
+    timings["get_expense_totals"] = _median_ms(lambda: repository.get_expense_totals(username), 20)
+    timings["group_expenses(month)"] = _median_ms(lambda: repository.group_expenses(username, "month"), 20)
+    timings["get_summary_totals(day)"] = _median_ms(lambda: repository.get_summary_totals(username, "day"), 20)
+    timings["get_budget_status"] = _median_ms(lambda: repository.get_budget_status(username), 50)
+    timings["full fetch"] = _median_ms(lambda: list(repository.get_expense_changes(username)[0]), 3)
+    return timings
+
+
+def _cleanup_mongo(run_id):
+    from backend.mongo_client import get_database
+
+    db = get_database()
+    prefix = {"$regex": f"^__bench_storage_{run_id}_"}
+    for name in db.list_collection_names():
+        db[name].delete_many({"username": prefix})
+
+
+def main(rows):
+    run_id = f"{int(time.time())}"
+    with tempfile.TemporaryDirectory() as directory:
+        backends = {"sqlite": create_repository("sqlite", os.path.join(directory, "bench.db"))}
+        if os.getenv("MONGO_URI"):
+            backends["mongo"] = create_repository("mongo")
+        else:
+            print("MONGO_URI not set, timing SQLite only")
+
+        results = {}
+        try:
+            for name, repository in backends.items():
+                results[name] = time_operations(repository, f"__bench_storage_{run_id}_timing__", rows)
+        finally:
+            if "mongo" in backends:
+                _cleanup_mongo(run_id)
+
+    names = list(results)
+    print(f"\n{'operation (median ms)':<34}" + "".join(f"{name:>12}" for name in names))
+    for operation in results[names[0]]:
+        print(f"{operation:<34}" + "".join(f"{results[name][operation]:>12.2f}" for name in names))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,395 @@
+"""
+Benchmark suite for the storage, expense and utility functions.
+
+Generates synthetic users (benchmarks/datagen.py) into a scratch store, times
+every public function of backend/database.py (through the Repository
+interface), backend/expenses.py and backend/utils.py, plus the summary,
+settlement, dashboard, batch and categorizer entry points, and writes the
+results as JSON. Functions with no case are listed as uncovered, so new functions
+don't silently go untimed.
+
+Backends:
+    mongomock  in-memory MongoDB stand-in (needs the mongomock package)
+    mongo      MONGO_URI, which must point at a scratch database
+    sqlite     a temporary SQLite file
+
+Compare two runs by passing the older results as --baseline: any case whose
+median is more than --threshold times the baseline (and slower by at least
+--min-delta-ms) is reported and the exit status is 1.
+
+Usage:
+    python -m benchmarks.bench_suite [--backend mongomock] [--users 5] [--expenses 2000]
+        [--repeat 5] [--output results.json] [--baseline old.json] [--threshold 1.25]
+"""
+import argparse
+import inspect
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+from benchmarks.datagen import PASSWORD, generate_dataset, write_rates_file
+
+# Need external services, never timed
+SKIPPED = {
+    "utils.extract_text_from_image": "needs the tesseract binary",
+    "utils.send_email_notification": "sends over SMTP",
+}
+# Only exist on the MongoDB backend
+MONGO_ONLY = {"build_expense_query", "aggregate_expenses", "apply_summary_deltas"}
+
+
+# Point the backend modules at the chosen store; must run before they are imported
+def configure_backend(backend, directory):
+    if backend == "sqlite":
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = os.path.join(directory, "bench_suite.db")
+        return
+    os.environ["STORAGE_BACKEND"] = "mongo"
+    if backend == "mongomock":
+        import mongomock
+        import pymongo
+
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+    elif not os.getenv("MONGO_URI"):
+        sys.exit("MONGO_URI must point at a scratch database for --backend mongo")
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# {"median_ms", "p95_ms", "min_ms", "runs"} for `repeat` calls of fn(*setup())
+def time_case(fn, setup, repeat):
+    timings = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        started = time.perf_counter()
+        fn(*args)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        "min_ms": round(timings[0], 4),
+        "runs": len(timings),
+    }
+
+
+# [(case name, fn, setup)]; setup() returns the arguments of one call
+def build_cases(repository, username, scratch, backend):
+    from backend import batch, categorizer, dashboard, expenses, settlements, summaries, utils
+    from backend.cache import clear_cache
+
+    today = datetime.today()
+    date_range = (today - timedelta(days=180), today)
+    df = expenses.get_expenses_df(username)
+    model, vectorizer = utils.train_expense_categorizer(df)
+    names = itertools.count()
+
+    def new_expense_id():
+        repository.add_expense(scratch, today, "Food", "scratch", 9.99)
+        rows, _ = repository.get_expenses_page(scratch, 1)
+        return rows[0]["_id"]
+
+    # get_income leaves out ids, so these time the lookup of a well-formed id that matches nothing
+    def new_income_id():
+        return str(ObjectId())
+
+    def new_rule_id():
+        repository.add_recurring_expense(scratch, today, None, "Other", "scratch", 5.0, "Monthly")
+        return repository.get_recurring_rules(scratch)[-1]["_id"]
+
+    def queued_notification():
+        repository.enqueue_notification(scratch, f"bench_{next(names)}", "scratch", "a@example.com", "s", "m")
+        return ()
+
+    def claimed_notification():
+        queued_notification()
+        return repository.claim_notifications(1)[0]
+
+    def saved_budget():
+        repository.set_budget(scratch, "Food", 100.0, "monthly")
+        return ()
+
+    # A stand-in model blob, under its own user so the categorizer cases never load it
+    def saved_model():
+        repository.save_categorizer_model(f"{scratch}_model", b"\0" * 100_000, ["Food", "Other"], 10)
+        return ()
+
+    # A month of expenses for a user of its own, archived by the case
+    def archivable():
+        repository.insert_expenses([
+            {"username": f"{scratch}_archive", "date": datetime(2020, 1, 1 + index % 28), "category": "Food",
+             "description": f"old {index}", "amount": 2.0, "currency": "USD", "recurring": False,
+             "recurrence_period": None, "updated_at": today}
+            for index in range(200)
+        ])
+        return ()
+
+    def cold_cache():
+        clear_cache()
+        return ()
+
+    cases = [
+        # database.py, through the Repository interface
+        ("database.create_user", repository.create_user,
+         lambda: (f"{scratch}_new_{next(names)}", PASSWORD, "new@example.com")),
+        ("database.authenticate_user", lambda: repository.authenticate_user(username, PASSWORD), None),
+        ("database.get_user_email", lambda: repository.get_user_email(username), None),
+        ("database.iter_usernames", lambda: list(repository.iter_usernames()), None),
+        ("database.add_expense", lambda: repository.add_expense(scratch, today, "Food", "timed", 4.5), None),
+        ("database.insert_expenses", lambda documents: repository.insert_expenses(documents), lambda: ([
+            {"username": scratch, "date": today, "category": "Food", "description": f"bulk {index}",
+             "amount": 1.0, "currency": "USD", "recurring": False, "recurrence_period": None, "updated_at": today}
+            for index in range(100)
+        ],)),
+        ("database.get_expenses", lambda: repository.get_expenses(username), None),
+        ("database.get_expense_changes", lambda: list(repository.get_expense_changes(username)[0]), None),
+        ("database.prune_expense_tombstones", repository.prune_expense_tombstones, None),
+        ("database.find_expenses", lambda: list(repository.find_expenses(username, date_range, "Food")), None),
+        ("database.get_expenses_page", lambda: repository.get_expenses_page(username, 50), None),
+        ("database.get_expense_totals", lambda: repository.get_expense_totals(username), None),
+        ("database.group_expenses", lambda: repository.group_expenses(username, "month"), None),
+        ("database.delete_expense", repository.delete_expense, lambda: (new_expense_id(),)),
+        ("database.update_expense", lambda expense_id: repository.update_expense(
+            expense_id, today, "Other", "updated", 7.0), lambda: (new_expense_id(),)),
+        ("database.archive_expenses", lambda: repository.archive_expenses(f"{scratch}_archive", datetime(2020, 2, 1)),
+         archivable),
+        ("database.get_expense_buckets", lambda: list(repository.get_expense_buckets(f"{scratch}_archive")),
+         None),
+        ("database.get_summary_totals", lambda: repository.get_summary_totals(username, "day"), None),
+        ("database.get_daily_summary_rows", lambda: repository.get_daily_summary_rows(username), None),
+        ("database.compute_daily_rows", lambda: repository.compute_daily_rows(username), None),
+        ("database.get_stored_daily_rows", lambda: repository.get_stored_daily_rows(username), None),
+        ("database.rebuild_summaries", lambda: repository.rebuild_summaries(username), None),
+        ("database.set_budget", lambda: repository.set_budget(scratch, "Food", 100.0, "monthly"), None),
+        ("database.get_budgets", lambda: repository.get_budgets(username), None),
+        ("database.delete_budget", lambda: repository.delete_budget(scratch, "Food", "monthly"), saved_budget),
+        ("database.get_budget_status", lambda: repository.get_budget_status(username), None),
+        ("database.evaluate_budget_thresholds", lambda: repository.evaluate_budget_thresholds(username, [today]),
+         None),
+        ("database.add_income", lambda: repository.add_income(scratch, today, "Timed", 10.0), None),
+        ("database.get_income", lambda: repository.get_income(username), None),
+        ("database.delete_income", repository.delete_income, lambda: (new_income_id(),)),
+        ("database.update_income", lambda income_id: repository.update_income(income_id, today, "Updated", 11.0),
+         lambda: (new_income_id(),)),
+        ("database.add_recurring_expense", lambda: repository.add_recurring_expense(
+            scratch, today, None, "Other", "timed", 5.0, "Weekly"), None),
+        ("database.get_recurring_expenses", lambda: repository.get_recurring_expenses(username), None),
+        ("database.get_recurring_rules", lambda: repository.get_recurring_rules(username), None),
+        ("database.update_recurring_expense", lambda rule_id: repository.update_recurring_expense(
+            rule_id, amount=6.0), lambda: (new_rule_id(),)),
+        ("database.delete_recurring_expense", repository.delete_recurring_expense, lambda: (new_rule_id(),)),
+        ("database.add_split_expense", lambda: repository.add_split_expense(scratch, "0" * 24, "Alex", 3.0), None),
+        ("database.add_split_expenses", lambda: repository.add_split_expenses(
+            scratch, "0" * 24, [("Alex", 3.0), ("Sam", 3.0), ("Jordan", 2.99)]), None),
+        ("database.get_split_expenses", lambda expense_id: repository.get_split_expenses(username, expense_id),
+         lambda: (str(repository.get_expenses_page(username, 1)[0][0]["_id"]),)),
+        ("database.add_debt", lambda: repository.add_debt(scratch, today, "Alex", "timed", 5.0, "Debt"), None),
+        ("database.get_debts", lambda: repository.get_debts(username), None),
+        ("database.get_counterparty_balances", lambda: repository.get_counterparty_balances(username), None),
+        ("database.iter_user_documents", lambda: list(repository.iter_user_documents(
+            "expenses", username, ["date", "category", "amount"])), None),
+        ("database.enqueue_notification", lambda: repository.enqueue_notification(
+            scratch, f"bench_{next(names)}", "scratch", "a@example.com", "s", "m"), None),
+        ("database.claim_notifications", lambda: repository.claim_notifications(1), queued_notification),
+        ("database.mark_notification_sent", lambda notification: repository.mark_notification_sent(
+            notification["_id"]), lambda: (claimed_notification(),)),
+        ("database.mark_notification_failed", lambda notification: repository.mark_notification_failed(
+            notification, "timed failure"), lambda: (claimed_notification(),)),
+        ("database.save_categorizer_model", lambda: saved_model(), None),
+        ("database.load_categorizer_model", lambda: repository.load_categorizer_model(f"{scratch}_model"),
+         saved_model),
+
+        # expenses.py
+        ("expenses.get_expenses_df[cold]", lambda: expenses.get_expenses_df(username), cold_cache),
+        ("expenses.get_expenses_df[warm]", lambda: expenses.get_expenses_df(username), None),
+        ("expenses.verify_expenses_df", lambda: expenses.verify_expenses_df(username), None),
+        ("expenses.get_recurring_occurrences_df", lambda: expenses.get_recurring_occurrences_df(username), None),
+        ("expenses.with_recurring_occurrences", lambda: expenses.with_recurring_occurrences(df, username), None),
+        ("expenses.filter_expenses", lambda: expenses.filter_expenses(df, date_range, "Food", (5, 100)), None),
+        ("expenses.calculate_daily_spending", expenses.calculate_daily_spending, lambda: (df.copy(),)),
+        ("expenses.calculate_monthly_spending", expenses.calculate_monthly_spending, lambda: (df.copy(),)),
+        ("expenses.calculate_category_spending", expenses.calculate_category_spending, lambda: (df.copy(),)),
+        ("expenses.query_expenses_df", lambda: expenses.query_expenses_df(username, date_range, "Food"), None),
+        ("expenses.get_expenses_page_df", lambda: expenses.get_expenses_page_df(username, 50), None),
+        ("expenses.aggregate_daily_spending", lambda: expenses.aggregate_daily_spending(username), None),
+        ("expenses.aggregate_monthly_spending", lambda: expenses.aggregate_monthly_spending(username), None),
+        ("expenses.aggregate_category_spending", lambda: expenses.aggregate_category_spending(username), None),
+        ("expenses.check_rollup_parity", lambda: expenses.check_rollup_parity(username), None),
+
+        # utils.py
+        ("utils.validate_expense", lambda: utils.validate_expense(today, "Food", "coffee", 3.5), None),
+        ("utils.check_budget", lambda: utils.check_budget(username), None),
+        ("utils.convert_currency", lambda: utils.convert_currency(100.0, "EUR", "USD"), None),
+        ("utils.train_expense_categorizer", lambda: utils.train_expense_categorizer(df), None),
+        ("utils.predict_category", lambda: utils.predict_category(model, vectorizer, "Cafe Aroma"), None),
+
+        # Rollups and the incremental categorizer
+        ("summaries.get_daily_summary", lambda: summaries.get_daily_summary(username), None),
+        ("summaries.get_monthly_summary[EUR]", lambda: summaries.get_monthly_summary(username, "EUR"), None),
+        ("summaries.get_category_summary", lambda: summaries.get_category_summary(username), None),
+        ("summaries.check_summary_drift", lambda: summaries.check_summary_drift(username), None),
+        ("settlements.get_settlement", lambda: settlements.get_settlement(username), None),
+        ("dashboard.load_dashboard[cold]", lambda: dashboard.load_dashboard(username, "EUR"), cold_cache),
+        ("dashboard.load_dashboard[warm]", lambda: dashboard.load_dashboard(username, "EUR"), None),
+        ("batch.process_user", lambda: batch.process_user(scratch, today), None),
+        ("categorizer.learn_expenses", lambda: categorizer.learn_expenses(
+            scratch, list(df["description"].astype(str)[:500]), list(df["category"].astype(str)[:500])), None),
+        ("categorizer.predict_categories", lambda: categorizer.predict_categories(
+            username, list(df["description"].astype(str)[:500])), None),
+    ]
+
+    if backend != "sqlite":
+        from backend import database
+
+        cases += [
+            ("database.build_expense_query", lambda: database.build_expense_query(
+                username, date_range, "Food", (5, 100)), None),
+            ("database.aggregate_expenses", lambda: database.aggregate_expenses([
+                {"$match": {"username": username}}, {"$group": {"_id": "$category", "n": {"$sum": 1}}},
+            ]), None),
+            ("database.apply_summary_deltas", lambda documents: (
+                database.apply_summary_deltas(documents, 1), database.apply_summary_deltas(documents, -1)
+            ), lambda: (repository.get_expenses_page(username, 100)[0],)),
+        ]
+    return cases
+
+
+# Public functions of the timed modules that no case covers
+def uncovered(cases, backend):
+    from backend import expenses, utils
+    from backend.repository import Repository
+
+    public = {f"database.{name}" for name in Repository.__abstractmethods__}
+    if backend != "sqlite":
+        public |= {f"database.{name}" for name in MONGO_ONLY}
+    for prefix, module in (("expenses", expenses), ("utils", utils)):
+        public |= {
+            f"{prefix}.{name}" for name, fn in inspect.getmembers(module, inspect.isfunction)
+            if fn.__module__ == module.__name__ and not name.startswith("_")
+        }
+    covered = {name.split("[")[0] for name, _, _ in cases} | set(SKIPPED)
+    return sorted(public - covered)
+
+
+# Cases at least `threshold` times (and min_delta_ms) slower than the baseline
+def compare(results, baseline, threshold, min_delta_ms):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        now, before = result["median_ms"], previous["median_ms"]
+        if now > before * threshold and now - before >= min_delta_ms:
+            regressions.append((name, before, now))
+    return regressions
+
+
+def run(args, directory):
+    configure_backend(args.backend, directory)
+    today = datetime.today()
+    os.environ["EXCHANGE_RATES_FILE"] = os.path.join(directory, "rates.csv")
+    write_rates_file(os.environ["EXCHANGE_RATES_FILE"], today - timedelta(days=365 * args.years + 31), today)
+
+    from backend.repository import get_repository
+
+    repository = get_repository()
+    prefix = f"__bench_suite_{int(time.time())}"
+    started = time.perf_counter()
+    dataset = generate_dataset(repository, args.users, args.expenses, args.years, seed=args.seed, prefix=prefix,
+                               currencies=("USD", "EUR", "INR"))
+    generate_seconds = time.perf_counter() - started
+    print(f"Generated {dataset['counts']} for {args.users} users in {generate_seconds:.1f}s")
+
+    username = dataset["users"][0]
+    scratch = f"{prefix}_scratch"
+    repository.create_user(scratch, PASSWORD, "scratch@example.com")
+    try:
+        cases = build_cases(repository, username, scratch, args.backend)
+        results = {}
+        for name, fn, setup in cases:
+            results[name] = time_case(fn, setup, args.repeat)
+            print(f"{name:<48}{results[name]['median_ms']:>12.3f} ms")
+        missing = uncovered(cases, args.backend)
+    finally:
+        if args.backend == "mongo":
+            from backend.mongo_client import get_database
+
+            db = get_database()
+            for collection_name in db.list_collection_names():
+                db[collection_name].delete_many({"username": {"$regex": f"^{prefix}"}})
+
+    return {
+        "meta": {
+            "commit": _commit(),
+            "backend": args.backend,
+            "users": args.users,
+            "expenses_per_user": args.expenses,
+            "years": args.years,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "generate_seconds": round(generate_seconds, 3),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        },
+        "dataset": dataset["counts"],
+        "results": results,
+        "skipped": SKIPPED,
+        "uncovered": missing,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", choices=("mongomock", "mongo", "sqlite"), default="mongomock")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--expenses", type=int, default=2000, help="expenses per user")
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--min-delta-ms", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = run(args, directory)
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+        print(f"Wrote {args.output}")
+    if report["uncovered"]:
+        print(f"Not timed: {', '.join(report['uncovered'])}")
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        if baseline["meta"]["backend"] != args.backend:
+            print(f"Baseline ran on {baseline['meta']['backend']}, this run on {args.backend}")
+        regressions = compare(report["results"], baseline["results"], args.threshold, args.min_delta_ms)
+        for name, before, now in regressions:
+            print(f"REGRESSION {name}: {before:.3f} -> {now:.3f} ms ({now / before:.2f}x)")
+        print(f"{len(regressions)} regressions over {args.threshold:.2f}x against {args.baseline}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Synthetic multi-user data for the benchmarks.
+
+generate_dataset() creates users through the Repository interface, so it
+fills any storage backend. Each user gets a few years of expenses whose
+dates follow weekly and yearly seasonality (weekends and December spend
+more) and whose amounts are log-normal per category, plus recurring rules,
+monthly salary income, splits, debts/loans and budgets. Everything is drawn
+from a seeded generator, so the same arguments give the same data.
+"""
+import csv
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from backend.records import ALL_CATEGORIES, build_expense_document
+
+# Strong enough for is_strong_password
+PASSWORD = "Bench#Pass1"
+# Category -> (share of purchases, median amount, merchants)
+CATEGORY_PROFILES = {
+    "Food": (0.45, 18.0, ["Corner Grocer", "Fresh Market", "Cafe Aroma", "Pizza Place", "Noodle Bar"]),
+    "Transport": (0.20, 12.0, ["Metro Card", "City Cabs", "Fuel Stop", "Parking"]),
+    "Entertainment": (0.12, 35.0, ["Cinema", "Concert Hall", "Game Store", "Bookshop"]),
+    "Utilities": (0.08, 90.0, ["Power Co", "Water Board", "Phone Bill", "Internet"]),
+    "Other": (0.15, 40.0, ["Pharmacy", "Hardware Store", "Gift Shop", "Dry Cleaner"]),
+}
+# Relative spend by month (January first) and weekday (Monday first)
+MONTH_WEIGHTS = np.array([0.9, 0.85, 0.95, 1.0, 1.0, 1.1, 1.15, 1.1, 1.0, 1.0, 1.15, 1.45])
+WEEKDAY_WEIGHTS = np.array([0.9, 0.9, 0.95, 1.0, 1.2, 1.4, 1.1])
+AMOUNT_SIGMA = 0.6
+COUNTERPARTIES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn"]
+RECURRING_RULES = [
+    ("Utilities", "Rent", 1200.0, "Monthly"),
+    ("Entertainment", "Streaming", 12.99, "Monthly"),
+    ("Food", "Grocery box", 45.0, "Weekly"),
+]
+INSERT_BATCH_SIZE = 5000
+
+
+def user_names(count, prefix="bench_user"):
+    return [f"{prefix}_{index:05d}" for index in range(count)]
+
+
+# Expense documents for one user between start and end, ready for insert_expenses
+def expense_documents(username, count, rng, start, end, currencies=("USD",)):
+    days = np.arange(np.datetime64(start.date()), np.datetime64(end.date()), dtype="datetime64[D]")
+    months = days.astype("datetime64[M]").astype(int) % 12
+    weekdays = (days.astype(int) + 3) % 7  # 1970-01-01 was a Thursday
+    weights = MONTH_WEIGHTS[months] * WEEKDAY_WEIGHTS[weekdays]
+    chosen_days = rng.choice(days, size=count, p=weights / weights.sum())
+
+    names = list(CATEGORY_PROFILES)
+    shares = np.array([CATEGORY_PROFILES[name][0] for name in names])
+    chosen = rng.choice(len(names), size=count, p=shares / shares.sum())
+    medians = np.array([CATEGORY_PROFILES[name][1] for name in names])[chosen]
+    amounts = np.round(rng.lognormal(np.log(medians), AMOUNT_SIGMA), 2).clip(0.5)
+    # Most purchases in the first currency, the rest spread over the others
+    currency_weights = np.full(len(currencies), 0.1 / max(len(currencies) - 1, 1))
+    currency_weights[0] = 1.0 - currency_weights[1:].sum()
+    currency_picks = rng.choice(len(currencies), size=count, p=currency_weights)
+
+    documents = []
+    for day, category_index, amount, currency_index in zip(chosen_days, chosen, amounts, currency_picks):
+        category = names[category_index]
+        merchants = CATEGORY_PROFILES[category][2]
+        documents.append(build_expense_document(
+            username, day.astype(datetime), category, merchants[int(rng.integers(len(merchants)))],
+            float(amount), currencies[currency_index],
+        ))
+    return documents
+
+
+# Create one user with all their records; returns {record kind: count}
+def generate_user(repository, username, rng, expenses=2000, years=3, splits=50, debts=30, end=None,
+                  currencies=("USD",)):
+    end = end or datetime.today()
+    start = end - timedelta(days=365 * years)
+    repository.create_user(username, PASSWORD, f"{username}@example.com")
+
+    documents = expense_documents(username, expenses, rng, start, end, currencies)
+    for offset in range(0, len(documents), INSERT_BATCH_SIZE):
+        repository.insert_expenses(documents[offset:offset + INSERT_BATCH_SIZE])
+
+    for category, description, amount, frequency in RECURRING_RULES:
+        repository.add_recurring_expense(username, start, None, category, description, amount, frequency)
+
+    salary = round(float(rng.uniform(3000, 7000)), 2)
+    month = datetime(start.year, start.month, 1)
+    incomes = 0
+    while month <= end:
+        repository.add_income(username, month, "Salary", salary)
+        incomes += 1
+        month = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+    split_count = 0
+    rows, _ = repository.get_expenses_page(username, splits)
+    for row in rows:
+        people = rng.choice(COUNTERPARTIES, size=int(rng.integers(1, 4)), replace=False)
+        share = round(row["amount"] / (len(people) + 1), 2)
+        repository.add_split_expenses(username, str(row["_id"]), [(str(person), share) for person in people])
+        split_count += len(people)
+
+    for _ in range(debts):
+        day = start + timedelta(days=int(rng.integers((end - start).days)))
+        repository.add_debt(username, day, str(rng.choice(COUNTERPARTIES)), "Shared costs",
+                            round(float(rng.lognormal(np.log(40), 0.8)), 2), str(rng.choice(["Debt", "Loan"])))
+
+    monthly_spend = sum(document["amount"] for document in documents) / (12 * years)
+    repository.set_budget(username, ALL_CATEGORIES, round(monthly_spend * 1.1, 2), "monthly")
+    repository.set_budget(username, "Food", round(monthly_spend * 0.45 / 4, 2), "weekly")
+    return {"expenses": len(documents), "recurring": len(RECURRING_RULES), "income": incomes,
+            "splits": split_count, "debts": debts, "budgets": 2}
+
+
+# Create `users` users; returns {"users": [names], "counts": {record kind: total}}
+def generate_dataset(repository, users=5, expenses_per_user=2000, years=3, splits=50, debts=30, seed=7,
+                     prefix="bench_user", currencies=("USD",)):
+    names = user_names(users, prefix)
+    totals = {}
+    for index, username in enumerate(names):
+        rng = np.random.default_rng(seed + index)
+        counts = generate_user(repository, username, rng, expenses_per_user, years, splits, debts,
+                               currencies=currencies)
+        for kind, count in counts.items():
+            totals[kind] = totals.get(kind, 0) + count
+    return {"users": names, "counts": totals}
+
+
+# Daily rates snapshot in the backend/rates.py format, as a random walk per currency
+def write_rates_file(path, start, end, currencies=("EUR", "GBP", "INR", "JPY", "CAD", "AUD"), seed=11):
+    base_rates = {"EUR": 0.92, "GBP": 0.79, "INR": 83.0, "JPY": 150.0, "CAD": 1.36, "AUD": 1.52}
+    rng = np.random.default_rng(seed)
+    days = np.arange(np.datetime64(start.date()), np.datetime64(end.date()) + 1, dtype="datetime64[D]")
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["date", "currency", "rate"])
+        for currency in currencies:
+            walk = base_rates.get(currency, 1.0) * np.exp(np.cumsum(rng.normal(0, 0.003, len(days))))
+            writer.writerows((str(day), currency, f"{rate:.6f}") for day, rate in zip(days, walk))
@@ -0,0 +1,64 @@
+import mongomock
+import pytest
+
+import backend.repository
+from backend import database, mongo_client
+from backend.cache import clear_cache
+from backend.repository import create_repository, set_repository
+from backend.sqlite_store import SqliteRepository
+
+BACKENDS = ["sqlite", "mongo"]
+
+
+# A fresh in-memory MongoDB (mongomock) behind backend/mongo_client.py
+@pytest.fixture
+def mongo_database(monkeypatch):
+    monkeypatch.setenv("MONGO_URI", "mongodb://localhost:27017")
+    monkeypatch.setattr(mongo_client, "MongoClient", lambda uri, **options: mongomock.MongoClient(uri))
+    mongo_client.close_client()
+    database = mongo_client.get_database()
+    yield database
+    database.client.drop_database(mongo_client.DATABASE_NAME)
+    mongo_client.close_client()
+
+
+# Each storage backend in turn, installed as the process-wide repository
+@pytest.fixture(params=BACKENDS)
+def repository(request, tmp_path):
+    if request.param == "mongo":
+        request.getfixturevalue("mongo_database")
+        repository = create_repository("mongo")
+    else:
+        repository = create_repository("sqlite", str(tmp_path / "expenses.db"))
+    previous = backend.repository._repository["instance"]
+    set_repository(repository)
+    clear_cache()
+    yield repository
+    clear_cache()
+    set_repository(previous)
+
+
+# Writes straight to storage that skip the summaries and budget counters, so
+# tests can make them drift from the expenses
+class RawWrites:
+    def __init__(self, repository):
+        self.repository = repository
+
+    def insert_expense(self, expense):
+        if isinstance(self.repository, SqliteRepository):
+            with self.repository._transaction() as connection:
+                self.repository._insert_expense_rows(connection, [expense])
+        else:
+            database.expenses_collection.insert_one(expense)
+
+    def delete_expenses(self, username):
+        if isinstance(self.repository, SqliteRepository):
+            with self.repository._transaction() as connection:
+                connection.execute("DELETE FROM expenses WHERE username = ?", (username,))
+        else:
+            database.expenses_collection.delete_many({"username": username})
+
+
+@pytest.fixture
+def raw_writes(repository):
+    return RawWrites(repository)
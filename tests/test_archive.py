@@ -0,0 +1,133 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from backend import expenses
+from backend.archive import archive_cutoff
+from backend.cache import clear_cache
+from backend.records import build_expense_document
+
+USERNAME = "archive_user"
+CUTOFF = datetime(2024, 3, 1)
+FILTERS = [
+    {},
+    {"date_range": ("2024-02-15", "2024-03-10")},
+    {"date_range": (datetime(2024, 2, 29, 12), "2024-03-01")},
+    {"category": "Food"},
+    {"amount_range": (5, 20)},
+    {"date_range": ("2024-01-01", "2024-02-29"), "category": "Transport", "amount_range": (0, 10)},
+]
+
+
+# Expenses either side of the cutoff, with several on each of the days around it
+@pytest.fixture
+def history(repository):
+    documents = []
+    for index, day in enumerate(["2024-01-05", "2024-01-31", "2024-02-29", "2024-03-01", "2024-03-12"]):
+        for tie in range(4):
+            category = ["Food", "Transport", "Other"][(index + tie) % 3]
+            currency = "EUR" if tie == 3 else "USD"
+            documents.append(build_expense_document(USERNAME, day, category, f"{day} #{tie}", 2.5 * (index + tie + 1),
+                                                    currency))
+    repository.insert_expenses(documents)
+    return repository
+
+
+def _frame(df):
+    df = df.assign(id=df["id"].astype(str)).sort_values("id", ignore_index=True)
+    return df[sorted(df.columns)]
+
+
+def _pages(repository, page_size, **filters):
+    seen, after = [], None
+    while True:
+        rows, after = repository.get_expenses_page(USERNAME, page_size=page_size, after=after, **filters)
+        seen += [str(row["_id"]) for row in rows]
+        if after is None:
+            return seen
+
+
+def _rows(repository):
+    rows, _ = repository.get_expenses_page(USERNAME, page_size=1000)
+    return rows
+
+
+def _reads(repository, filters):
+    return {
+        "totals": repository.get_expense_totals(USERNAME, **filters),
+        "by_day": repository.group_expenses(USERNAME, "day", **filters),
+        "by_month": repository.group_expenses(USERNAME, "month", **filters),
+        "by_category": repository.group_expenses(USERNAME, "category", **filters),
+        "found": sorted(str(row["_id"]) for row in repository.find_expenses(USERNAME, projection={"amount": 1},
+                                                                            **filters)),
+        "pages": _pages(repository, 3, **filters),
+    }
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_reads_merge_the_archive(history, filters):
+    before = _reads(history, filters)
+    assert history.archive_expenses(USERNAME, CUTOFF) == (12, 2)
+    assert _reads(history, filters) == before
+
+
+def test_expense_frames_merge_the_archive(history):
+    before = _frame(expenses.get_expenses_df(USERNAME))
+    daily = history.compute_daily_rows(USERNAME)
+    history.archive_expenses(USERNAME, CUTOFF)
+    # Both the cached frame and a fresh load
+    pd.testing.assert_frame_equal(_frame(expenses.get_expenses_df(USERNAME)), before)
+    clear_cache()
+    pd.testing.assert_frame_equal(_frame(expenses.get_expenses_df(USERNAME)), before)
+    assert history.compute_daily_rows(USERNAME) == daily
+    assert expenses.verify_expenses_df(USERNAME)
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 3, 4, 5, 8, 100])
+def test_pages_cross_from_hot_to_archived_expenses(history, page_size):
+    before = _pages(history, page_size)
+    history.archive_expenses(USERNAME, CUTOFF)
+    seen = _pages(history, page_size)
+    assert seen == before
+    assert len(set(seen)) == 20
+
+
+def test_editing_moves_an_expense_back_out(history):
+    expenses.get_expenses_df(USERNAME)
+    history.archive_expenses(USERNAME, CUTOFF)
+    expense_id = next(str(row["_id"]) for row in _rows(history) if row["description"] == "2024-01-31 #3")
+    assert history.update_expense(expense_id, "2024-01-30", "Food", "edited", 99, "EUR")[0]
+
+    buckets = {bucket["month"]: bucket["count"] for bucket in history.get_expense_buckets(USERNAME)}
+    assert buckets == {"2024-01": 7, "2024-02": 4}
+    matches = [row for row in _rows(history) if str(row["_id"]) == expense_id]
+    assert len(matches) == 1 and matches[0]["description"] == "edited" and matches[0]["amount"] == 99.0
+    df = expenses.get_expenses_df(USERNAME)
+    assert df.loc[df["id"].astype(str) == expense_id, "description"].tolist() == ["edited"]
+    assert len(df) == 20 and expenses.verify_expenses_df(USERNAME)
+    stored = {key: row for key, row in history.get_stored_daily_rows(USERNAME).items() if row[1]}
+    assert history.compute_daily_rows(USERNAME) == stored
+
+    # Archiving the month again merges the edited expense back into its bucket
+    assert history.archive_expenses(USERNAME, CUTOFF) == (1, 1)
+    buckets = {bucket["month"]: bucket["count"] for bucket in history.get_expense_buckets(USERNAME)}
+    assert buckets == {"2024-01": 8, "2024-02": 4}
+    assert [row["description"] for row in _rows(history) if str(row["_id"]) == expense_id] == ["edited"]
+
+
+def test_old_expenses_added_later_join_their_bucket(history):
+    history.archive_expenses(USERNAME, CUTOFF)
+    totals = history.get_expense_totals(USERNAME)
+    history.add_expense(USERNAME, "2024-02-10", "Food", "late receipt", 10)
+    assert history.get_expense_totals(USERNAME)["total"] == totals["total"] + 10
+    assert history.archive_expenses(USERNAME, CUTOFF) == (1, 1)
+    buckets = {bucket["month"]: bucket["count"] for bucket in history.get_expense_buckets(USERNAME)}
+    assert buckets == {"2024-01": 8, "2024-02": 5}
+    assert history.get_expense_totals(USERNAME)["total"] == totals["total"] + 10
+
+
+def test_archive_cutoff_is_a_whole_month():
+    assert archive_cutoff(30, datetime(2024, 3, 15)) == datetime(2024, 2, 1)
+    assert archive_cutoff(0, datetime(2024, 3, 1, 18)) == datetime(2024, 3, 1)
+    assert archive_cutoff(366, datetime(2024, 3, 15)) == datetime(2023, 3, 1)
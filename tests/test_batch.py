@@ -0,0 +1,127 @@
+from datetime import datetime
+
+import bcrypt
+import pytest
+
+from backend import batch
+from backend.batch import archive_history, checkpoint_path, materialize_recurring, refresh_rollups, run_shard, shard_of
+from backend.records import build_expense_document
+from backend.repository import get_repository
+from backend.sqlite_store import SqliteRepository
+
+AS_OF = datetime(2024, 3, 15)
+USERNAMES = [f"batch_user_{index}" for index in range(5)]
+
+
+@pytest.fixture
+def users(repository, monkeypatch):
+    # Cheap password hashes, so creating users doesn't dominate the tests
+    gensalt = bcrypt.gensalt
+    monkeypatch.setattr(bcrypt, "gensalt", lambda rounds=4, prefix=b"2b": gensalt(4, prefix))
+    for username in USERNAMES:
+        repository.create_user(username, "Test#Pass1", f"{username}@example.com")
+        repository.add_recurring_expense(username, "2024-01-01", None, "Utilities", "rent", 10, "Monthly")
+    return repository
+
+
+# run_shard's storage arguments for the repository under test
+@pytest.fixture
+def shard_options(repository, tmp_path):
+    if isinstance(repository, SqliteRepository):
+        return {"backend": "sqlite", "sqlite_path": repository.path, "directory": str(tmp_path / "checkpoints")}
+    return {"backend": "mongo", "directory": str(tmp_path / "checkpoints")}
+
+
+def _expense_count(username):
+    return len(get_repository().get_expenses(username))
+
+
+def test_materializing_is_idempotent(users):
+    assert materialize_recurring(USERNAMES[0], AS_OF) == 3
+    assert users.get_recurring_rules(USERNAMES[0])[0]["materialized_through"] == AS_OF
+    assert materialize_recurring(USERNAMES[0], AS_OF) == 0
+    # A crash before materialized_through moved on: the rerun stores nothing twice
+    rule = users.get_recurring_rules(USERNAMES[0])[0]
+    users.update_recurring_expense(rule["_id"], materialized_through=datetime(2024, 1, 15))
+    assert materialize_recurring(USERNAMES[0], AS_OF) == 0
+    assert _expense_count(USERNAMES[0]) == 3
+    assert materialize_recurring(USERNAMES[0], datetime(2024, 4, 1)) == 1
+
+
+def test_rollups_are_only_rebuilt_on_drift(users, raw_writes):
+    users.add_expense(USERNAMES[0], "2024-01-03", "Food", "lunch", 12)
+    assert not refresh_rollups(USERNAMES[0])
+    raw_writes.insert_expense(build_expense_document(USERNAMES[0], "2024-01-04", "Food", "dinner", 20))
+    assert refresh_rollups(USERNAMES[0])
+    assert not refresh_rollups(USERNAMES[0])
+
+
+def test_every_user_is_in_exactly_one_shard(users, shard_options):
+    results = [run_shard(shard, 3, AS_OF, **shard_options) for shard in range(3)]
+    assert sum(result["users"] for result in results) == len(USERNAMES)
+    for shard, result in enumerate(results):
+        assert result["users"] == sum(shard_of(username, 3) == shard for username in USERNAMES)
+        assert result["done"] and result["failed"] == []
+    assert sum(result["occurrences"] for result in results) == 3 * len(USERNAMES)
+    assert all(_expense_count(username) == 3 for username in USERNAMES)
+
+
+def test_an_interrupted_shard_resumes_after_its_checkpoint(users, shard_options, monkeypatch):
+    monkeypatch.setattr(batch, "CHECKPOINT_EVERY", 2)
+    process_user = batch.process_user
+    calls = []
+
+    def interrupted(username, as_of):
+        calls.append(username)
+        if len(calls) == 4:
+            raise KeyboardInterrupt
+        return process_user(username, as_of)
+
+    monkeypatch.setattr(batch, "process_user", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        run_shard(0, 1, AS_OF, **shard_options)
+    path = checkpoint_path(AS_OF, 0, 1, shard_options["directory"])
+    state = batch._read_checkpoint(path)
+    assert state["last_username"] == USERNAMES[1] and state["users"] == 2 and not state["done"]
+
+    # The third user was done after the checkpoint and is redone harmlessly
+    calls.clear()
+    result = run_shard(0, 1, AS_OF, **shard_options)
+    assert calls == USERNAMES[2:]
+    assert result["run_users"] == 3 and result["users"] == len(USERNAMES) and result["done"]
+    assert result["occurrences"] == 3 * len(USERNAMES) - 3
+    assert all(_expense_count(username) == 3 for username in USERNAMES)
+
+    # A finished shard is not run again
+    calls.clear()
+    result = run_shard(0, 1, AS_OF, **shard_options)
+    assert calls == [] and result["run_users"] == 0 and result["users"] == len(USERNAMES)
+
+
+def test_a_failing_user_does_not_stop_the_shard(users, shard_options, monkeypatch):
+    process_user = batch.process_user
+
+    def failing(username, as_of):
+        if username == USERNAMES[1]:
+            raise ValueError("bad data")
+        return process_user(username, as_of)
+
+    monkeypatch.setattr(batch, "process_user", failing)
+    result = run_shard(0, 1, AS_OF, **shard_options)
+    assert result["failed"] == [{"username": USERNAMES[1], "error": "ValueError: bad data"}]
+    assert batch._read_checkpoint(checkpoint_path(AS_OF, 0, 1, shard_options["directory"]))["failed"] == \
+        result["failed"]
+    assert result["users"] == len(USERNAMES) and result["done"]
+    assert _expense_count(USERNAMES[1]) == 0 and _expense_count(USERNAMES[2]) == 3
+
+
+def test_archived_occurrences_are_not_stored_again(users):
+    username = USERNAMES[0]
+    materialize_recurring(username, AS_OF)
+    assert archive_history(username, AS_OF, 0) == 0
+    assert archive_history(username, AS_OF, 30) == 1
+    assert archive_history(username, AS_OF, 30) == 0
+    rule = users.get_recurring_rules(username)[0]
+    users.update_recurring_expense(rule["_id"], materialized_through=None)
+    assert materialize_recurring(username, AS_OF) == 0
+    assert _expense_count(username) == 3
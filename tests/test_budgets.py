@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.records import ALL_CATEGORIES
+from backend.utils import check_budget
+
+USERNAME = "budget_user"
+
+
+@pytest.fixture
+def budgeted(repository):
+    repository.create_user(USERNAME, "Test#Pass1", "budget@example.com")
+    repository.set_budget(USERNAME, ALL_CATEGORIES, 100)
+    return repository
+
+
+def _alerts(repository):
+    return sorted(notification["alert_type"] for notification in repository.claim_notifications(100))
+
+
+def _spend(repository, amount, category="Food", day=None):
+    assert repository.add_expense(USERNAME, day or datetime.today(), category, "spend", amount)[0]
+
+
+def test_each_level_alerts_once(budgeted):
+    _spend(budgeted, 50)
+    assert _alerts(budgeted) == []
+    _spend(budgeted, 30)
+    _spend(budgeted, 5)
+    assert _alerts(budgeted) == ["budget_All_monthly_80"]
+    _spend(budgeted, 20)
+    _spend(budgeted, 20)
+    assert _alerts(budgeted) == ["budget_All_monthly_100"]
+    assert check_budget(USERNAME)[1] == "You have exceeded your budget!"
+    assert budgeted.evaluate_budget_thresholds(USERNAME, [datetime.today()]) == []
+    assert _alerts(budgeted) == []
+
+
+def test_going_back_under_and_over_again_does_not_email_twice(budgeted):
+    _spend(budgeted, 120)
+    # Straight past 100%: only the exceeded alert
+    assert _alerts(budgeted) == ["budget_All_monthly_100"]
+    rows, _ = budgeted.get_expenses_page(USERNAME)
+    budgeted.delete_expense(str(rows[0]["_id"]))
+    assert budgeted.get_budget_status(USERNAME)["level"] == 0
+    _spend(budgeted, 120)
+    # The level is raised again, but the outbox keeps one email per alert and period
+    assert budgeted.get_budget_status(USERNAME)["level"] == 100
+    assert _alerts(budgeted) == []
+
+
+def test_category_and_weekly_budgets(budgeted):
+    budgeted.set_budget(USERNAME, "Food", 40)
+    budgeted.set_budget(USERNAME, "Food", 40, "weekly")
+    _spend(budgeted, 45, "Transport")
+    _spend(budgeted, 35)
+    assert _alerts(budgeted) == ["budget_All_monthly_80", "budget_Food_monthly_80", "budget_Food_weekly_80"]
+    assert check_budget(USERNAME, "Food", "weekly")[1] == "Warning: You are close to exceeding your budget!"
+    assert check_budget(USERNAME, "Transport")[0] is None
+
+
+def test_setting_a_budget_below_the_spend_alerts(repository):
+    repository.create_user(USERNAME, "Test#Pass1", "budget@example.com")
+    _spend(repository, 90)
+    repository.set_budget(USERNAME, ALL_CATEGORIES, 100)
+    assert _alerts(repository) == ["budget_All_monthly_80"]
+
+
+def test_past_periods_raise_levels_without_email(budgeted):
+    last_year = datetime.today() - timedelta(days=400)
+    _spend(budgeted, 150, day=last_year)
+    assert budgeted.get_budget_status(USERNAME, on=last_year)["level"] == 100
+    assert _alerts(budgeted) == []
+
+
+def test_no_email_without_an_address(repository):
+    repository.set_budget(USERNAME, ALL_CATEGORIES, 100)
+    _spend(repository, 150)
+    assert repository.get_budget_status(USERNAME)["level"] == 100
+    assert _alerts(repository) == []
+
+
+def test_rebuilding_keeps_raised_levels(budgeted):
+    _spend(budgeted, 90)
+    assert _alerts(budgeted) == ["budget_All_monthly_80"]
+    budgeted.rebuild_summaries(USERNAME)
+    assert budgeted.evaluate_budget_thresholds(USERNAME, [datetime.today()]) == []
+    _spend(budgeted, 20)
+    assert _alerts(budgeted) == ["budget_All_monthly_100"]
+
+
+def test_concurrent_writers_alert_once(budgeted):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: _spend(budgeted, 6), range(40)))
+    assert budgeted.get_budget_status(USERNAME)["spent"] == 240
+    assert _alerts(budgeted) == ["budget_All_monthly_100", "budget_All_monthly_80"]
@@ -0,0 +1,87 @@
+import pandas as pd
+import pytest
+
+from backend import cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    cache.clear_cache()
+    yield
+    cache.clear_cache()
+
+
+def _frame(rows):
+    return pd.DataFrame({"description": [f"expense {index}" for index in range(rows)], "amount": 1.0})
+
+
+def test_write_invalidates():
+    loads = []
+    load = lambda: loads.append(1) or len(loads)
+    assert cache.get_or_load("test", "ann", load) == 1
+    assert cache.get_or_load("test", "ann", load) == 1
+    cache.bump_version("ann")
+    assert cache.get_or_load("test", "ann", load) == 2
+
+
+def test_write_during_load_is_not_cached():
+    def load():
+        cache.bump_version("ann")
+        return "stale"
+
+    assert cache.get_or_load("test", "ann", load) == "stale"
+    assert cache.get_or_load("test", "ann", lambda: "fresh") == "fresh"
+    assert cache.get_or_load("test", "ann", lambda: "other") == "fresh"
+
+
+def test_stamp_changes_invalidate():
+    stamps, loads = [1], []
+    load = lambda: loads.append(1) or len(loads)
+    stamp = lambda: stamps[-1]
+    assert cache.get_or_load("test", "ann", load) == 1
+    assert cache.get_or_refresh("test", "ann", lambda previous: load(), stamp) == 2
+    assert cache.get_or_refresh("test", "ann", lambda previous: load(), stamp) == 2
+    stamps.append(2)
+    assert cache.get_or_refresh("test", "ann", lambda previous: previous * 10, stamp) == 20
+
+
+def test_stamp_moving_during_load_is_not_trusted():
+    stamps = [1]
+
+    def refresh(previous):
+        stamps.append(2)
+        return "loaded at 1"
+
+    assert cache.get_or_refresh("test", "ann", refresh, lambda: stamps[-1]) == "loaded at 1"
+    assert cache.get_or_refresh("test", "ann", lambda previous: "fresh", lambda: stamps[-1]) == "fresh"
+    assert cache.get_or_refresh("test", "ann", lambda previous: "other", lambda: stamps[-1]) == "fresh"
+
+
+def test_evicts_least_recently_used_by_bytes(monkeypatch):
+    size = cache.value_size(_frame(1000))
+    monkeypatch.setattr(cache, "MAX_CACHED_BYTES", int(size * 2.5))
+    for username in ("ann", "bob"):
+        cache.get_or_load("frame", username, lambda: _frame(1000))
+    cache.get_or_load("frame", "ann", lambda: None)  # ann is now the most recently used
+    cache.get_or_load("frame", "cat", lambda: _frame(1000))
+
+    stats = cache.cache_stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1 and stats["bytes"] <= stats["max_bytes"]
+    assert cache.get_or_load("frame", "bob", lambda: "reloaded") == "reloaded"
+
+
+def test_value_over_budget_is_not_cached(monkeypatch):
+    monkeypatch.setattr(cache, "MAX_CACHED_BYTES", 1000)
+    assert len(cache.get_or_load("frame", "ann", lambda: _frame(1000))) == 1000
+    assert cache.cache_stats()["entries"] == 0 and cache.cache_stats()["tracked_users"] == 0
+
+
+def test_versions_are_evicted_with_entries(monkeypatch):
+    monkeypatch.setattr(cache, "MAX_CACHED_ENTRIES", 2)
+    for index in range(100):
+        username = f"user{index}"
+        cache.get_or_load("test", username, lambda: index)
+        cache.bump_version(username)
+    for index in range(100):
+        cache.bump_version(f"writer{index}")
+    assert cache.cache_stats()["tracked_users"] <= 2
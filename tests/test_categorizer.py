@@ -0,0 +1,151 @@
+import io
+import pickle
+import threading
+
+import numpy as np
+import pytest
+
+from backend import categorizer
+
+TRAINING = [("coffee and bagel", "Food"), ("lunch sandwich", "Food"), ("bus ticket", "Transport"),
+            ("train pass", "Transport"), ("cinema tickets", "Entertainment")]
+
+
+@pytest.fixture(autouse=True)
+def no_cached_models():
+    categorizer._models.clear()
+    categorizer._evicted.clear()
+    yield
+    categorizer._models.clear()
+    categorizer._evicted.clear()
+
+
+# Counts calls to the repository's save_categorizer_model
+@pytest.fixture
+def saves(repository, monkeypatch):
+    calls = []
+    save = repository.save_categorizer_model
+    monkeypatch.setattr(repository, "save_categorizer_model",
+                        lambda username, *args: calls.append(username) or save(username, *args))
+    return calls
+
+
+# Pickled object that records being unpickled
+class Payload:
+    loaded = []
+
+    def __reduce__(self):
+        return Payload.loaded.append, ("unpickled",)
+
+
+def _npz(**arrays):
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def trained(repository):
+    for description, category in TRAINING:
+        repository.add_expense("ann", "2024-01-01", category, description, 5)
+    categorizer.learn_expenses("ann", ["monthly metro pass"], ["Transport"])
+    return repository
+
+
+def test_learns_and_reloads_stored_model(trained):
+    assert categorizer.predict_categories("ann", ["bagel", "metro"]) == ["Food", "Transport"]
+    categorizer._models.clear()
+    assert categorizer.predict_categories("ann", ["bagel", "metro"]) == ["Food", "Transport"]
+    stored = trained.load_categorizer_model("ann")
+    assert categorizer._load_model(stored) is not None
+
+
+def test_rebuilt_model_matches_the_trained_one(trained):
+    categorizer.predict_categories("ann", ["bagel"])
+    model = categorizer._models["ann"]["model"]
+    rebuilt = categorizer._load_model(trained.load_categorizer_model("ann"))
+    features = categorizer._featurize(["bagel", "metro", "cinema", "unknown words"])
+    np.testing.assert_allclose(rebuilt.predict_proba(features), model.predict_proba(features))
+    # And it keeps learning like the original
+    for each in (model, rebuilt):
+        each.partial_fit(categorizer._featurize(["bagel deluxe"]), ["Entertainment"])
+    np.testing.assert_allclose(rebuilt.predict_proba(features), model.predict_proba(features))
+
+
+@pytest.mark.parametrize("blob", [
+    b"\0" * 100, pickle.dumps({"format": 0}), pickle.dumps("not a model"), pickle.dumps(Payload()),
+    _npz(format=np.array(1)),
+    _npz(format=np.array(2), classes=np.array(["Food", "Other"]), class_count=np.zeros(2), feature_count=np.zeros(3)),
+    _npz(format=np.array(2), classes=np.array([Payload()], dtype=object), class_count=np.zeros(1),
+         feature_count=np.zeros((1, categorizer.N_FEATURES))),
+])
+def test_unusable_stored_model_is_refit(trained, blob):
+    trained.save_categorizer_model("ann", blob, ["Food", "Other"], 10)
+    categorizer._models.clear()
+    assert categorizer.predict_categories("ann", ["bagel"]) == ["Food"]
+    assert categorizer._load_model(trained.load_categorizer_model("ann")) is not None
+    assert Payload.loaded == []
+
+
+def test_stored_model_with_other_classes_is_refit(trained):
+    stored = trained.load_categorizer_model("ann")
+    trained.save_categorizer_model("ann", bytes(stored["model"]), ["Food"], stored["samples_seen"])
+    assert categorizer._load_model(trained.load_categorizer_model("ann")) is None
+
+
+def test_refit_does_not_block_other_users(trained, monkeypatch):
+    categorizer.predict_categories("ann", ["bagel"])
+    started, release = threading.Event(), threading.Event()
+    train = categorizer._train_from_history
+
+    def slow_train(username, extra_categories=()):
+        if username == "bob":
+            started.set()
+            release.wait(10)
+        return train(username, extra_categories)
+
+    monkeypatch.setattr(categorizer, "_train_from_history", slow_train)
+    refit = threading.Thread(target=categorizer.predict_categories, args=("bob", ["anything"]))
+    refit.start()
+    try:
+        assert started.wait(10)
+        assert categorizer.predict_categories("ann", ["bagel"]) == ["Food"]
+        categorizer.learn_expenses("ann", ["pizza"], ["Food"])
+    finally:
+        release.set()
+        refit.join(10)
+    assert not categorizer._user_locks
+
+
+def test_updates_are_saved_on_a_timer(trained, saves, monkeypatch):
+    categorizer.predict_categories("ann", ["bagel"])
+    monkeypatch.setattr(categorizer, "SAVE_INTERVAL_SECONDS", 3600)
+    for _ in range(5):
+        categorizer.learn_expense("ann", "pizza slice", "Food")
+    assert saves == []
+    seen = categorizer._models["ann"]["samples_seen"]
+    assert trained.load_categorizer_model("ann")["samples_seen"] == seen - 5
+
+    categorizer.flush_models()
+    assert saves == ["ann"]
+    assert trained.load_categorizer_model("ann")["samples_seen"] == seen
+    categorizer.flush_models()
+    assert saves == ["ann"]
+
+    monkeypatch.setattr(categorizer, "SAVE_INTERVAL_SECONDS", 0)
+    categorizer.learn_expense("ann", "pizza slice", "Food")
+    assert saves == ["ann", "ann"]
+
+
+def test_unsaved_models_are_saved_when_evicted(trained, saves, monkeypatch):
+    monkeypatch.setattr(categorizer, "SAVE_INTERVAL_SECONDS", 3600)
+    monkeypatch.setattr(categorizer, "MAX_CACHED_MODELS", 1)
+    categorizer.predict_categories("ann", ["bagel"])
+    categorizer.learn_expense("ann", "pizza slice", "Food")
+    seen = categorizer._models["ann"]["samples_seen"]
+    assert saves == []
+    # Bob's new model pushes Ann's out of the cache
+    categorizer.predict_categories("bob", ["anything"])
+    assert saves == ["bob", "ann"]
+    assert trained.load_categorizer_model("ann")["samples_seen"] == seen
+    assert not categorizer._evicted
@@ -0,0 +1,167 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend import database, expenses, sqlite_store
+from backend.cache import clear_cache
+
+USERNAME = "sync_user"
+
+
+def _id(repository, description):
+    rows, _ = repository.get_expenses_page(USERNAME, page_size=1000)
+    return next(str(row["_id"]) for row in rows if row["description"] == description)
+
+
+@pytest.fixture
+def full_loads(monkeypatch):
+    loads = []
+    load = expenses._load_expenses_snapshot
+    monkeypatch.setattr(expenses, "_load_expenses_snapshot", lambda username: loads.append(username) or load(username))
+    return loads
+
+
+def test_delta_sync_follows_adds_edits_and_deletes(repository, full_loads):
+    repository.add_expense(USERNAME, "2024-01-05", "Food", "lunch", 12.5)
+    repository.add_expense(USERNAME, "2024-01-06", "Transport", "bus", 2.0)
+    assert sorted(expenses.get_expenses_df(USERNAME)["description"]) == ["bus", "lunch"]
+    assert full_loads == [USERNAME]
+
+    repository.add_expense(USERNAME, "2024-01-07", "Food", "dinner", 30)
+    repository.update_expense(_id(repository, "lunch"), "2024-01-05", "Food", "brunch", 15)
+    repository.delete_expense(_id(repository, "bus"))
+    df = expenses.get_expenses_df(USERNAME)
+    assert sorted(zip(df["description"], df["amount"])) == [("brunch", 15.0), ("dinner", 30.0)]
+    # Merged from the changes and tombstones, not reloaded
+    assert full_loads == [USERNAME]
+    assert expenses.verify_expenses_df(USERNAME)
+
+
+def test_callers_get_a_copy_of_the_cached_frame(repository):
+    repository.add_expense(USERNAME, "2024-01-05", "Food", "lunch", 12.5)
+    first = expenses.get_expenses_df(USERNAME)
+    first["extra"] = 1
+    assert "extra" not in expenses.get_expenses_df(USERNAME)
+
+
+def test_deleting_everything(repository):
+    repository.add_expense(USERNAME, "2024-01-05", "Food", "lunch", 12.5)
+    expenses.get_expenses_df(USERNAME)
+    repository.delete_expense(_id(repository, "lunch"))
+    assert expenses.get_expenses_df(USERNAME).empty
+    assert expenses.verify_expenses_df(USERNAME)
+
+
+def test_deleting_an_archived_expense(repository):
+    repository.add_expense(USERNAME, "2023-06-05", "Food", "old", 4)
+    repository.add_expense(USERNAME, "2024-01-05", "Food", "new", 5)
+    repository.archive_expenses(USERNAME, datetime(2024, 1, 1))
+    assert sorted(expenses.get_expenses_df(USERNAME)["description"]) == ["new", "old"]
+    repository.delete_expense(_id(repository, "old"))
+    assert list(expenses.get_expenses_df(USERNAME)["description"]) == ["new"]
+    assert expenses.verify_expenses_df(USERNAME)
+
+
+def test_a_snapshot_older_than_the_tombstones_is_reloaded(repository, full_loads, monkeypatch):
+    repository.add_expense(USERNAME, "2024-01-05", "Food", "lunch", 12.5)
+    expenses.get_expenses_df(USERNAME)
+    # Tombstones are pruned after TOMBSTONE_RETENTION, so a delta from before then could miss deletes
+    monkeypatch.setattr(expenses, "TOMBSTONE_RETENTION", timedelta(0))
+    repository.add_expense(USERNAME, "2024-01-06", "Food", "dinner", 20)
+    assert len(expenses.get_expenses_df(USERNAME)) == 2
+    assert full_loads == [USERNAME, USERNAME]
+
+
+def test_tombstones(repository, monkeypatch):
+    repository.add_expense(USERNAME, "2024-01-05", "Food", "lunch", 12.5)
+    lunch = _id(repository, "lunch")
+    # Less slack than the app's SYNC_SLACK, enough for MongoDB's millisecond dates
+    since = repository.get_expense_changes(USERNAME)[2] - timedelta(seconds=1)
+    repository.delete_expense(lunch)
+    assert repository.get_expense_changes(USERNAME, since=since)[1] == [lunch]
+    assert repository.get_expense_changes("other_user", since=since)[1] == []
+
+    assert repository.prune_expense_tombstones() == 0
+    for module in (database, sqlite_store):
+        monkeypatch.setattr(module, "TOMBSTONE_RETENTION", timedelta(seconds=-1))
+    assert repository.prune_expense_tombstones() == 1
+    assert repository.get_expense_changes(USERNAME, since=since)[1] == []
+
+
+def test_verify_spots_a_stale_frame(repository, monkeypatch):
+    repository.add_expense(USERNAME, "2024-01-05", "Food", "lunch", 12.5)
+    expenses.get_expenses_df(USERNAME)
+    # A write the cache doesn't hear about
+    monkeypatch.setattr(database, "bump_version", lambda username: 0)
+    monkeypatch.setattr(sqlite_store.SqliteRepository, "_bump_version", lambda self, username: 0)
+    repository.add_expense(USERNAME, "2024-01-06", "Food", "dinner", 20)
+    assert not expenses.verify_expenses_df(USERNAME)
+    clear_cache()
+    assert expenses.verify_expenses_df(USERNAME)
+
+
+def test_writes_by_other_processes_refresh_the_frame(repository, full_loads, monkeypatch):
+    repository.add_expense(USERNAME, "2024-01-05", "Food", "lunch", 12.5)
+    assert len(expenses.get_expenses_df(USERNAME)) == 1
+    # Writes from another process (the batch runner, say) only reach storage
+    monkeypatch.setattr(database, "bump_cached_version", lambda username: 0)
+    monkeypatch.setattr(sqlite_store, "bump_version", lambda username: 0)
+    version = repository.get_data_version(USERNAME)
+    repository.add_expense(USERNAME, "2024-01-06", "Food", "dinner", 20)
+    assert repository.get_data_version(USERNAME) == version + 1
+    assert sorted(expenses.get_expenses_df(USERNAME)["description"]) == ["dinner", "lunch"]
+    repository.delete_expense(_id(repository, "lunch"))
+    assert expenses.get_expenses_df(USERNAME)["description"].tolist() == ["dinner"]
+    # Delta synced, not reloaded
+    assert full_loads == [USERNAME]
+    assert repository.get_data_version("nobody") == 0
+
+
+def _all_pages(page, page_size, **filters):
+    seen, after, pages = [], None, 0
+    while True:
+        rows, after = page(USERNAME, page_size=page_size, after=after, **filters)
+        seen += rows
+        pages += 1
+        if after is None:
+            return seen, pages
+
+
+@pytest.mark.parametrize("page_size", [1, 3, 4, 7, 50])
+def test_pages_walk_ties_on_the_same_day_once(repository, page_size):
+    for index in range(12):
+        # Most expenses share one of two days, so pages break inside runs of equal dates
+        repository.add_expense(USERNAME, "2024-02-01" if index % 3 else "2024-01-15", "Food", f"row {index}", index)
+    seen, pages = _all_pages(repository.get_expenses_page, page_size)
+    assert len(seen) == 12 and len({str(row["_id"]) for row in seen}) == 12
+    keys = [(row["date"], str(row["_id"])) for row in seen]
+    assert keys == sorted(keys, reverse=True)
+    assert pages == max(1, -(-12 // page_size))
+
+
+def test_filtered_pages(repository):
+    for index in range(10):
+        repository.add_expense(USERNAME, "2024-03-01", "Food" if index % 2 else "Transport", f"row {index}", index)
+    seen, _ = _all_pages(repository.get_expenses_page, 2, category="Food", amount_range=(2, 8))
+    assert sorted(row["amount"] for row in seen) == [3.0, 5.0, 7.0]
+    assert repository.get_expenses_page(USERNAME, 5, category="Healthcare") == ([], None)
+
+
+def test_pages_do_not_shift_when_newer_expenses_arrive(repository):
+    for index in range(6):
+        repository.add_expense(USERNAME, "2024-03-01", "Food", f"row {index}", index)
+    first, after = repository.get_expenses_page(USERNAME, page_size=3)
+    repository.add_expense(USERNAME, "2024-04-01", "Food", "newer", 99)
+    rest, after = repository.get_expenses_page(USERNAME, page_size=3, after=after)
+    assert after is None
+    assert {row["description"] for row in first + rest} == {f"row {index}" for index in range(6)}
+
+
+def test_page_frames(repository):
+    for index in range(5):
+        repository.add_expense(USERNAME, "2024-03-01", "Food", f"row {index}", index)
+    df, after = expenses.get_expenses_page_df(USERNAME, page_size=1)
+    assert len(df) == 1 and after is not None
+    df, after = expenses.get_expenses_page_df(USERNAME, page_size=10, after=after)
+    assert len(df) == 4 and after is None
+    assert expenses.get_expenses_page_df("nobody", page_size=1)[0].empty
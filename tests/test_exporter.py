@@ -0,0 +1,44 @@
+import csv
+import io
+
+import pytest
+from openpyxl import load_workbook
+
+from backend import exporter
+
+
+@pytest.fixture
+def filled(repository):
+    for day in range(1, 8):
+        repository.add_expense("ann", f"2024-01-{day:02d}", "Food", f"lunch {day}", day)
+    return repository
+
+
+@pytest.mark.parametrize("max_rows, expected", [(None, 7), (5, 5)])
+def test_csv_export_file(filled, max_rows, expected):
+    export, rows = exporter.export_file("expenses", "ann", "csv", max_rows=max_rows, spool_bytes=64)
+    with export:
+        assert export._rolled  # over spool_bytes, so written to disk
+        lines = list(csv.reader(io.StringIO(export.read().decode("utf-8"))))
+    assert rows == expected and len(lines) == expected + 1
+    assert lines[0] == exporter._fields("expenses")
+
+
+def test_xlsx_export_file(filled):
+    export, rows = exporter.export_file("expenses", "ann", "xlsx", max_rows=3)
+    with export:
+        sheet = load_workbook(io.BytesIO(export.read()), read_only=True).active
+        assert rows == 3 and len(list(sheet.iter_rows())) == 4
+
+
+def test_parquet_export_file(filled):
+    pq = pytest.importorskip("pyarrow.parquet")
+    export, rows = exporter.export_file("expenses", "ann", "parquet")
+    with export:
+        assert rows == 7 and pq.read_table(io.BytesIO(export.read())).num_rows == 7
+
+
+def test_available_formats(monkeypatch):
+    assert exporter.available_formats()[:2] == ["csv", "xlsx"]
+    monkeypatch.setattr(exporter, "pa", None)
+    assert exporter.available_formats() == ["csv", "xlsx"]
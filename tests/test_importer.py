@@ -0,0 +1,85 @@
+import io
+
+import pytest
+
+from backend import categorizer, importer
+from backend.importer import import_statement, iter_expense_documents
+
+
+def _csv(*lines):
+    return io.BytesIO("\n".join(lines).encode("utf-8"))
+
+
+@pytest.fixture
+def learned(monkeypatch):
+    calls = []
+    monkeypatch.setattr(categorizer, "learn_expenses",
+                        lambda username, descriptions, categories: calls.append(list(zip(descriptions, categories))))
+    return calls
+
+
+def test_identical_rows_in_an_unsorted_file_are_kept(repository):
+    statement = ["Date,Description,Amount", "2024-01-05,coffee,3.50", "2024-01-06,bus,2.00",
+                 "2024-01-05,coffee,3.50"]
+    report = import_statement("ann", _csv(*statement), "statement.csv")
+    assert (report["inserted"], report["duplicates"]) == (3, 0)
+    report = import_statement("ann", _csv(*statement), "statement.csv")
+    assert (report["inserted"], report["duplicates"]) == (0, 3)
+
+
+def test_hashes_do_not_depend_on_row_order():
+    rows = [{"Date": "2024-01-05", "Description": "coffee", "Amount": "3.50"},
+            {"Date": "2024-01-06", "Description": "bus", "Amount": "2.00"},
+            {"Date": "2024-01-05", "Description": "coffee", "Amount": "3.50"}]
+    hashes = [document["import_hash"] for document, _ in iter_expense_documents("ann", rows)]
+    reordered = [document["import_hash"] for document, _ in iter_expense_documents("ann", [rows[0], rows[2], rows[1]])]
+    assert len(set(hashes)) == 3 and set(hashes) == set(reordered)
+
+
+@pytest.mark.parametrize("statement, spending_sign, amounts", [
+    (["Date,Description,Amount", "2024-01-05,shop,20", "2024-01-06,refund,-20", "2024-01-07,fee,(1.50)"],
+     1, [20.0]),
+    (["Date,Description,Amount", "2024-01-05,shop,-20", "2024-01-06,salary,1000"], -1, [20.0]),
+    (["Date,Description,Debit,Credit", "2024-01-05,shop,20,", "2024-01-06,refund,,20"], 1, [20.0]),
+])
+def test_credits_are_skipped(repository, statement, spending_sign, amounts):
+    report = import_statement("ann", _csv(*statement), "statement.csv", spending_sign=spending_sign)
+    assert report["inserted"] == len(amounts)
+    assert sum("credit or refund" in error for error in report["errors"]) == report["skipped"] == \
+        len(statement) - 1 - len(amounts)
+    assert [expense["amount"] for expense in repository.get_expenses("ann")] == amounts
+
+
+def test_statement_categories_are_learned_once(repository, learned):
+    statement = ["Date,Description,Amount,Category", "2024-01-05,whole foods,30,Groceries",
+                 "2024-01-06,unknown shop,10,"]
+    import_statement("ann", _csv(*statement), "statement.csv")
+    assert learned == [[("whole foods", "Groceries")]]
+    import_statement("ann", _csv(*statement), "statement.csv")
+    assert len(learned) == 1
+
+
+def test_learned_categories_are_predicted(repository):
+    categorizer._models.clear()
+    statement = ["Date,Description,Amount,Category"] + [
+        f"2024-01-{day:02d},whole foods market,30,Groceries" for day in range(1, 6)
+    ] + [f"2024-02-{day:02d},city metro,2,Transport" for day in range(1, 6)]
+    import_statement("ann", _csv(*statement), "statement.csv")
+    assert categorizer.predict_categories("ann", ["whole foods"]) == ["Groceries"]
+    categorizer._models.clear()
+
+
+def test_repeat_counts_are_kept_for_recent_dates_only(monkeypatch):
+    monkeypatch.setattr(importer, "RECENT_DATES", 2)
+    rows = [{"Date": f"2024-01-{day:02d}", "Description": "coffee", "Amount": "3.50"} for day in (5, 6, 5, 7, 8, 5)]
+    hashes = [document["import_hash"] for document, _ in iter_expense_documents("ann", rows)]
+    # 5th kept its count across the 6th; by the last row it has been forgotten
+    assert len(set(hashes[:5])) == 5 and hashes[5] == hashes[0]
+
+
+def test_reimporting_a_deleted_statement(repository):
+    statement = ["Date,Description,Amount", "2024-01-05,coffee,3.50", "2024-01-05,coffee,3.50"]
+    import_statement("ann", _csv(*statement), "statement.csv")
+    assert repository.delete_user_expenses("ann") == 2
+    assert repository.get_expenses("ann") == [] and repository.get_summary_totals("ann", "day") == []
+    assert import_statement("ann", _csv(*statement), "statement.csv")["inserted"] == 2
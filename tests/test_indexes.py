@@ -0,0 +1,50 @@
+import os
+
+import pytest
+from pymongo import MongoClient
+
+from backend.indexes import INDEXES, QUERY_SHAPES, ensure_indexes, find_collscans
+
+# A real server to explain the queries against; mongomock has no query planner
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI")
+
+
+# Fields a query constrains on every path; a field only some $or branches use doesn't count
+def _constrained_fields(query):
+    fields = set()
+    for key, value in query.items():
+        if key == "$and":
+            for clause in value:
+                fields |= _constrained_fields(clause)
+        elif key == "$or":
+            fields |= set.intersection(*(_constrained_fields(clause) for clause in value))
+        elif not key.startswith("$"):
+            fields.add(key)
+    return fields
+
+
+@pytest.mark.parametrize("helper, collection_name, query", QUERY_SHAPES,
+                         ids=[f"{helper}:{name}" for helper, name, _ in QUERY_SHAPES])
+def test_query_shape_has_an_index_prefix(helper, collection_name, query):
+    leading_keys = {next(iter(index.document["key"])) for index in INDEXES.get(collection_name, [])}
+    assert leading_keys & _constrained_fields(query), f"{helper} on {collection_name} has no usable index"
+
+
+def test_ensure_indexes_creates_the_registry(mongo_database):
+    ensure_indexes(mongo_database)
+    for collection_name, indexes in INDEXES.items():
+        existing = mongo_database[collection_name].index_information()
+        assert {index.document["name"] for index in indexes} <= existing.keys()
+
+
+@pytest.mark.mongo
+@pytest.mark.skipif(not MONGO_TEST_URI, reason="MONGO_TEST_URI not set")
+def test_no_query_shape_collscans():
+    client = MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=5000)
+    db = client["expense_tracker_index_test"]
+    try:
+        ensure_indexes(db)
+        assert find_collscans(db) == []
+    finally:
+        client.drop_database(db.name)
+        client.close()
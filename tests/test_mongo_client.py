@@ -0,0 +1,109 @@
+import mongomock
+import pytest
+
+from backend import mongo_client
+from backend.mongo_client import LazyCollection, run_in_transaction, supports_transactions
+
+
+class FakeSession:
+    def __init__(self):
+        self.transactions = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def with_transaction(self, callback):
+        self.transactions += 1
+        return callback(self)
+
+
+class FakeAdmin:
+    def __init__(self, hello):
+        self.hello = hello
+        self.calls = 0
+
+    def command(self, name, **options):
+        self.calls += 1
+        return self.hello
+
+
+class FakeClient:
+    def __init__(self, hello):
+        self.admin = FakeAdmin(hello)
+        self.session = FakeSession()
+
+    def start_session(self):
+        return self.session
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    def install(hello):
+        client = FakeClient(hello)
+        monkeypatch.setattr(mongo_client, "_client", client)
+        monkeypatch.setattr(mongo_client, "_transactions", {})
+        return client
+    return install
+
+
+def test_without_transactions_the_callback_gets_no_session(mongo_database):
+    assert not supports_transactions()
+    sessions = []
+
+    def write(session):
+        sessions.append(session)
+        mongo_database["things"].insert_one({"name": "kept"}, session=session)
+        return "done"
+
+    assert run_in_transaction(write) == "done"
+    assert sessions == [None]
+    assert mongo_database["things"].count_documents({}) == 1
+
+
+def test_errors_in_the_callback_propagate(mongo_database):
+    def fail(session):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        run_in_transaction(fail)
+
+
+@pytest.mark.parametrize("hello, supported", [
+    ({"setName": "rs0"}, True), ({"msg": "isdbgrid"}, True), ({"isWritablePrimary": True}, False),
+])
+def test_transactions_on_replica_sets_and_sharded_clusters(fake_client, hello, supported):
+    client = fake_client(hello)
+    sessions = []
+    assert run_in_transaction(lambda session: sessions.append(session) or 7) == 7
+    assert sessions == [client.session if supported else None]
+    assert client.session.transactions == int(supported)
+    # The deployment is only asked once
+    run_in_transaction(lambda session: None)
+    assert client.admin.calls == 1
+
+
+def test_collections_connect_on_first_use(monkeypatch):
+    created = []
+    monkeypatch.setenv("MONGO_URI", "mongodb://localhost:27017")
+    monkeypatch.setattr(mongo_client, "MongoClient",
+                        lambda uri, **options: created.append(options) or mongomock.MongoClient(uri))
+    mongo_client.close_client()
+    try:
+        collection = LazyCollection("expenses")
+        assert created == []
+        assert collection.count_documents({}) == 0
+        assert len(created) == 1 and created[0]["maxPoolSize"] == mongo_client.MAX_POOL_SIZE
+        LazyCollection("income").count_documents({})
+        assert len(created) == 1
+    finally:
+        mongo_client.close_client()
+
+
+def test_a_missing_uri_fails_on_the_first_query(monkeypatch):
+    monkeypatch.delenv("MONGO_URI", raising=False)
+    mongo_client.close_client()
+    with pytest.raises(ValueError, match="MONGO_URI"):
+        LazyCollection("expenses").count_documents({})
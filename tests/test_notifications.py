@@ -0,0 +1,116 @@
+import socket
+import time
+from datetime import datetime
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from backend import notifications
+from backend.records import MAX_NOTIFICATION_ATTEMPTS, notification_failure_update
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, envelope.content.decode("utf-8", "replace")))
+        return "250 OK"
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _settings(port):
+    return {"host": "127.0.0.1", "port": port, "use_tls": False, "user": None, "password": None}
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+def _enqueue(repository, alert_type, to_email="ann@example.com"):
+    assert repository.enqueue_notification("ann", alert_type, "2024-01", to_email, f"Subject {alert_type}", "Body")[0]
+
+
+def test_delivers_due_notifications(repository, smtp_server):
+    controller, handler = smtp_server
+    for alert_type in ("budget_80", "budget_100"):
+        _enqueue(repository, alert_type)
+    connection = notifications.SmtpConnection(_settings(controller.port))
+    try:
+        assert notifications.process_outbox(connection) == (2, 0)
+        assert notifications.process_outbox(connection) == (0, 0)
+    finally:
+        connection.close()
+    assert [rcpt_tos for rcpt_tos, _ in handler.messages] == [["ann@example.com"], ["ann@example.com"]]
+    assert {content.split("Subject: ")[1].splitlines()[0] for _, content in handler.messages} == {
+        "Subject budget_80", "Subject budget_100"
+    }
+
+
+def test_expired_lease_is_claimed_again(repository):
+    _enqueue(repository, "budget_80")
+    _enqueue(repository, "budget_100")
+    # A worker claims both and dies before sending them; one lease has already run out
+    assert len(repository.claim_notifications(1, lease_seconds=300)) == 1
+    assert len(repository.claim_notifications(1, lease_seconds=0)) == 1
+    time.sleep(0.01)
+    reclaimed = repository.claim_notifications(10)
+    assert len(reclaimed) == 1 and reclaimed[0]["status"] == "sending"
+    assert repository.claim_notifications(10) == []
+
+
+def test_refused_connection_backs_off_then_delivers(repository, smtp_server):
+    controller, handler = smtp_server
+    _enqueue(repository, "budget_80")
+    refused = notifications.SmtpConnection(_settings(_free_port()))
+    assert notifications.process_outbox(refused) == (0, 1)
+    # Backing off: not due again yet
+    assert notifications.process_outbox(refused) == (0, 0)
+    assert repository.claim_notifications(10) == []
+
+    _enqueue(repository, "budget_100")
+    assert notifications.process_outbox(refused, base_delay_seconds=0) == (0, 1)
+    time.sleep(0.01)
+    connection = notifications.SmtpConnection(_settings(controller.port))
+    try:
+        assert notifications.process_outbox(connection) == (1, 0)
+    finally:
+        connection.close()
+    assert len(handler.messages) == 1 and "Subject: Subject budget_100" in handler.messages[0][1]
+
+
+def test_failures_back_off_exponentially():
+    notification = {"attempts": 0}
+    delays = []
+    for _ in range(MAX_NOTIFICATION_ATTEMPTS - 1):
+        before = datetime.utcnow()
+        update = notification_failure_update(notification, OSError("refused"), base_delay_seconds=30)
+        assert update["status"] == "pending"
+        delays.append(round((update["next_attempt_at"] - before).total_seconds()))
+        notification = {"attempts": update["attempts"]}
+    assert delays == [30 * 2 ** attempt for attempt in range(MAX_NOTIFICATION_ATTEMPTS - 1)]
+    assert notification_failure_update(notification, OSError("refused"))["status"] == "failed"
+
+
+def test_worker_sends_in_the_background(repository, smtp_server, monkeypatch):
+    controller, handler = smtp_server
+    monkeypatch.setattr(notifications, "smtp_settings", lambda: _settings(controller.port))
+    _enqueue(repository, "budget_80")
+    notifications.start_notification_worker(interval=0.05)
+    try:
+        deadline = time.monotonic() + 10
+        while not handler.messages and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        notifications.stop_notification_worker()
+    assert len(handler.messages) == 1
@@ -0,0 +1,103 @@
+from datetime import date
+
+import pytest
+
+from concurrent.futures import Future
+
+from backend import ocr
+from backend.ocr import get_receipt_result, parse_receipt, submit_receipt
+
+
+@pytest.mark.parametrize("line, amount", [
+    ("TOTAL 1234.56", 1234.56),
+    ("TOTAL 12345.00", 12345.0),
+    ("TOTAL 1,234.56", 1234.56),
+    ("TOTAL 1.234,56", 1234.56),
+    ("Total: $999.99", 999.99),
+    ("TOTAL 7,50", 7.5),
+    ("AMOUNT DUE 0.99", 0.99),
+])
+def test_total_amount(line, amount):
+    assert parse_receipt(f"CORNER SHOP\n{line}\n")["amount"] == amount
+
+
+def test_total_line_wins_over_subtotal_and_tax():
+    text = "CORNER SHOP\n2024-03-05\nWidget 1500.00\nSUBTOTAL 1500.00\nTAX 120.00\nTOTAL 1620.00\nCHANGE 0.00\n"
+    draft = parse_receipt(text)
+    assert draft == {"amount": 1620.0, "date": date(2024, 3, 5), "merchant": "CORNER SHOP",
+                     "description": "CORNER SHOP"}
+
+
+def test_largest_amount_without_a_total_line():
+    assert parse_receipt("CORNER SHOP\nCoffee 3.50\nLaptop 1299.00\n")["amount"] == 1299.0
+
+
+def test_no_amount():
+    draft = parse_receipt("just some text\n")
+    assert draft["amount"] is None and draft["date"] is None
+
+
+@pytest.mark.parametrize("text, amount", [
+    # A quantity before the price is not a thousands group
+    ("SHOP\nWidget 2 150.00\nPen 1.50\n", 150.0),
+    ("SHOP\nTOTAL 1 100.00\n", 100.0),
+    ("SHOP\nTOTAL 1 234,56\n", 234.56),
+])
+def test_spaces_do_not_group_digits(text, amount):
+    assert parse_receipt(text)["amount"] == amount
+
+
+# Executor whose jobs finish at once, with `outcome` as result or exception
+class ImmediatePool:
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.submitted = 0
+
+    def submit(self, function, *args):
+        self.submitted += 1
+        future = Future()
+        if isinstance(self.outcome, Exception):
+            future.set_exception(self.outcome)
+        else:
+            future.set_result(self.outcome)
+        return future
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    def install(outcome):
+        pool = ImmediatePool(outcome)
+        monkeypatch.setattr(ocr, "_pool", lambda: pool)
+        monkeypatch.setattr(ocr, "_results", type(ocr._results)())
+        monkeypatch.setattr(ocr, "_failures", type(ocr._failures)())
+        monkeypatch.setattr(ocr, "_pending", {})
+        return pool
+    return install
+
+
+def test_results_are_cached(pool):
+    jobs = pool("CORNER SHOP\nTOTAL 12.50\n")
+    key = submit_receipt(b"receipt")
+    assert get_receipt_result(key)["draft"]["amount"] == 12.5
+    assert submit_receipt(b"receipt") == key
+    assert get_receipt_result(key)["text"].startswith("CORNER SHOP")
+    assert jobs.submitted == 1
+
+
+def test_failures_are_cached(pool):
+    jobs = pool(RuntimeError("tesseract is not installed"))
+    key = submit_receipt(b"receipt")
+    for _ in range(3):
+        with pytest.raises(RuntimeError, match="tesseract"):
+            get_receipt_result(submit_receipt(b"receipt"))
+    assert jobs.submitted == 1
+    with pytest.raises(KeyError):
+        get_receipt_result("unknown")
+    assert key == ocr.image_hash(b"receipt")
+
+
+def test_a_running_job_is_not_waited_for(monkeypatch):
+    future = Future()
+    monkeypatch.setattr(ocr, "_pending", {"key": future})
+    assert get_receipt_result("key") is None
+    assert get_receipt_result("key", wait=0) is None
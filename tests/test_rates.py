@@ -0,0 +1,103 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend import expenses, rates
+from backend.dashboard import load_dashboard
+from backend.utils import convert_currency
+
+
+@pytest.fixture
+def rates_file(tmp_path, monkeypatch):
+    path = tmp_path / "rates.csv"
+    path.write_text("date,currency,rate\n2024-01-01,EUR,0.5\n2024-02-01,EUR,0.25\n2024-01-01,GBP,2\n")
+    monkeypatch.setattr(rates, "RATES_FILE", str(path))
+    monkeypatch.setitem(rates._table, "mtime", None)
+    return path
+
+
+def test_shipped_snapshot_covers_the_default_currencies():
+    path = os.path.join(os.path.dirname(rates.__file__), "..", "data", "exchange_rates.csv")
+    assert set(rates.DEFAULT_CURRENCIES) <= set(rates.load_rates_file(path))
+
+
+def test_convert_amounts(rates_file):
+    converted = rates.convert_amounts([10, 10, 10, 10], ["EUR", "EUR", None, "GBP"],
+                                      ["2024-01-15", "2024-03-01", "2024-01-15", "2023-06-01"], "USD")
+    assert list(converted) == [20.0, 40.0, 10.0, 5.0]
+    assert rates.convert_amounts([10], ["GBP"], ["2024-01-15"], "EUR")[0] == 2.5
+
+
+def test_missing_rates_convert_to_nan_and_are_dropped(rates_file):
+    converted = rates.convert_amounts([10, 10], ["EUR", "XYZ"], ["2024-01-15", "2024-01-15"], "USD")
+    assert converted[0] == 20.0 and math.isnan(converted[1])
+    assert rates.missing_rates(["USD", "EUR", "XYZ", None, "ABC"]) == ["ABC", "XYZ"]
+    df = pd.DataFrame({"date": pd.to_datetime(["2024-01-15"] * 3), "currency": ["EUR", "XYZ", "USD"],
+                       "amount": [10.0, 10.0, 1.0]})
+    assert list(rates.convert_frame(df, "USD")["amount"]) == [20.0, 1.0]
+
+
+def test_no_snapshot_does_not_raise(tmp_path, monkeypatch):
+    monkeypatch.setattr(rates, "RATES_FILE", str(tmp_path / "missing.csv"))
+    assert rates.get_rates() == {}
+    assert np.isnan(rates.convert_amounts([10], ["EUR"], ["2024-01-15"], "USD")[0])
+    assert rates.usd_rate("EUR", "2024-01-15") is None and rates.usd_rate("USD", "2024-01-15") == 1.0
+
+
+def test_convert_currency_uses_the_snapshot(rates_file):
+    assert convert_currency(10, "EUR", "USD", pd.Timestamp("2024-01-15")) == 20.0
+
+
+@pytest.fixture
+def mixed(repository, rates_file):
+    repository.add_expense("ann", "2024-01-15", "Food", "lunch", 10, "EUR")
+    repository.add_expense("ann", "2024-01-16", "Food", "dinner", 5, "USD")
+    repository.add_expense("ann", "2024-01-17", "Travel", "taxi", 7, "XYZ")
+    return repository
+
+
+def test_group_expenses_adds_amounts_as_stored(mixed):
+    assert mixed.group_expenses("ann", "month") == [("2024-01", 22.0)]
+    assert list(expenses.aggregate_monthly_spending("ann")["amount"]) == [22.0]
+
+
+def test_aggregations_convert_to_base_currency(mixed):
+    monthly = expenses.aggregate_monthly_spending("ann", base_currency="USD")
+    assert list(monthly["amount"]) == [25.0]  # 10 EUR = 20 USD; XYZ has no rates
+    category = expenses.aggregate_category_spending("ann", base_currency="EUR")
+    assert list(zip(category["category"].astype(str), category["amount"])) == [("Food", 12.5)]
+    daily = expenses.aggregate_daily_spending("ann", category="Food", base_currency="USD")
+    assert list(daily["amount"]) == [20.0, 5.0]
+    assert expenses.aggregate_daily_spending("ann", category="Nothing", base_currency="USD").empty
+
+
+def test_budget_counters_are_in_usd(mixed):
+    mixed.set_budget("ann", "All", 100)
+    status = mixed.get_budget_status("ann", on=pd.Timestamp("2024-01-20").to_pydatetime())
+    assert status["spent"] == 25.0
+    lunch = next(row for row in mixed.get_expenses_page("ann", 10)[0] if row["description"] == "lunch")
+    assert mixed.delete_expense(str(lunch["_id"]))[0]
+    assert mixed.get_budget_status("ann", on=pd.Timestamp("2024-01-20").to_pydatetime())["spent"] == 5.0
+    mixed.rebuild_summaries("ann")
+    assert mixed.get_budget_status("ann", on=pd.Timestamp("2024-01-20").to_pydatetime())["spent"] == 5.0
+
+
+def test_dashboard_warns_instead_of_failing(mixed):
+    dashboard = load_dashboard("ann", "EUR")
+    assert dashboard["missing_rates"] == ["XYZ"] and dashboard["base_currency"] == "EUR"
+    assert list(dashboard["monthly"]["amount"]) == [12.5]
+    dashboard = load_dashboard("ann", "ABC")
+    assert dashboard["missing_rates"] == ["ABC", "XYZ"] and dashboard["base_currency"] == "USD"
+    assert list(dashboard["monthly"]["amount"]) == [25.0]
+
+
+def test_dashboard_checks_for_expenses_without_loading_them(mixed, monkeypatch):
+    monkeypatch.setattr(expenses, "_load_expenses_snapshot", lambda username: pytest.fail("loaded every expense"))
+    assert load_dashboard("ann")["has_expenses"]
+    assert not load_dashboard("bob")["has_expenses"]
+    day = pd.Timestamp("2024-01-15").date()
+    page, _ = expenses.get_expenses_page_df("ann", 50, date_range=(day, day))
+    assert len(page) and (page["date"].dt.date == day).all()
@@ -0,0 +1,75 @@
+from datetime import date, datetime
+
+import pytest
+
+from backend import expenses
+from backend.recurrence import expand_rules, occurrence_dates, unmaterialized_start
+
+
+def _rule(frequency="Monthly", start="2024-01-31", end=None, **fields):
+    return {"_id": "rule", "start_date": datetime.fromisoformat(start),
+            "end_date": datetime.fromisoformat(end) if end else None, "frequency": frequency,
+            "category": "Utilities", "description": "rent", "amount": 500.0, "currency": "USD", **fields}
+
+
+def _days(dates):
+    return [str(day) for day in dates]
+
+
+def test_monthly_clips_to_the_last_day_of_short_months():
+    dates = occurrence_dates(_rule(start="2024-01-31"), "2024-01-01", "2024-05-31")
+    assert _days(dates) == ["2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30", "2024-05-31"]
+    assert _days(occurrence_dates(_rule(start="2023-01-29"), "2023-01-01", "2023-03-31")) == [
+        "2023-01-29", "2023-02-28", "2023-03-29"
+    ]
+
+
+def test_window_and_end_date():
+    rule = _rule(start="2024-01-15", end="2024-04-15")
+    assert _days(occurrence_dates(rule, "2024-02-16", "2024-12-31")) == ["2024-03-15", "2024-04-15"]
+    assert _days(occurrence_dates(rule, "2024-01-01", "2024-02-14")) == ["2024-01-15"]
+    assert _days(occurrence_dates(rule, "2024-04-16", "2024-12-31")) == []
+    # Nothing before the rule starts
+    assert _days(occurrence_dates(rule, "2023-01-01", "2024-01-14")) == []
+
+
+@pytest.mark.parametrize("frequency, fields, expected", [
+    ("Weekly", {}, ["2024-01-03", "2024-01-10", "2024-01-17", "2024-01-24", "2024-01-31"]),
+    ("Biweekly", {}, ["2024-01-03", "2024-01-17", "2024-01-31"]),
+    ("Every N days", {"interval_days": 10}, ["2024-01-03", "2024-01-13", "2024-01-23"]),
+])
+def test_fixed_intervals(frequency, fields, expected):
+    rule = _rule(frequency, start="2024-01-03", **fields)
+    assert _days(occurrence_dates(rule, "2024-01-01", "2024-01-31")) == expected
+    # A window starting between occurrences picks up at the next one
+    assert _days(occurrence_dates(rule, "2024-01-04", "2024-01-31")) == expected[1:]
+
+
+def test_materialized_through_skips_stored_occurrences():
+    rule = _rule(start="2024-01-31", materialized_through=datetime(2024, 3, 31))
+    assert unmaterialized_start(rule, datetime(2024, 1, 1)) == datetime(2024, 4, 1)
+    assert unmaterialized_start(_rule(), datetime(2024, 1, 1)) == datetime(2024, 1, 1)
+    df = expand_rules([rule], datetime(2024, 1, 1), datetime(2024, 6, 30))
+    assert [day.date() for day in df["date"]] == [date(2024, 4, 30), date(2024, 5, 31), date(2024, 6, 30)]
+    assert list(df["id"]) == ["rule:2024-04-30", "rule:2024-05-31", "rule:2024-06-30"]
+    assert df["recurring"].all() and (df["amount"] == 500.0).all()
+
+
+def test_expand_without_rules():
+    df = expand_rules([], None, None)
+    assert df.empty and "date" in df.columns
+
+
+def test_stored_rules_are_expanded_up_to_the_window_end(repository):
+    repository.add_recurring_expense("ann", "2024-01-31", "2024-12-31", "Utilities", "rent", 500, "Monthly")
+    repository.add_recurring_expense("ann", "2024-03-01", None, "Other", "gym", 30, "Every N days", interval_days=14)
+    df = expenses.get_recurring_occurrences_df("ann", window_end=datetime(2024, 3, 31))
+    assert sorted((str(day.date()), description) for day, description in zip(df["date"], df["description"])) == [
+        ("2024-01-31", "rent"), ("2024-02-29", "rent"), ("2024-03-01", "gym"), ("2024-03-15", "gym"),
+        ("2024-03-29", "gym"), ("2024-03-31", "rent"),
+    ]
+    rule = next(rule for rule in repository.get_recurring_rules("ann") if rule["description"] == "rent")
+    repository.update_recurring_expense(str(rule["_id"]), materialized_through=datetime(2024, 2, 29))
+    df = expenses.get_recurring_occurrences_df("ann", window_end=datetime(2024, 3, 31))
+    assert sorted(df.loc[df["description"] == "rent", "date"].dt.strftime("%Y-%m-%d")) == ["2024-03-31"]
+    assert expenses.get_recurring_occurrences_df("nobody").empty
@@ -0,0 +1,259 @@
+import time
+from datetime import date, datetime, timedelta
+
+from backend.records import ALL_CATEGORIES, build_expense_document, split_shares
+
+# Conformance tests: every storage backend must pass them (see the repository fixture)
+USERNAME = "conformance_user"
+# Strong enough for is_strong_password
+PASSWORD = "Test#Pass1"
+
+
+def _expense_id(repository, description, username=USERNAME):
+    rows, _ = repository.get_expenses_page(username, page_size=1000)
+    return next(str(row["_id"]) for row in rows if row["description"] == description)
+
+
+def test_users(repository):
+    assert repository.create_user(USERNAME, PASSWORD, "user@example.com")[0]
+    assert not repository.create_user(USERNAME, PASSWORD, "other@example.com")[0]
+    assert not repository.create_user("weak_user", "weak", "weak@example.com")[0]
+    assert repository.authenticate_user(USERNAME, PASSWORD)[0]
+    assert not repository.authenticate_user(USERNAME, "Wrong#Pass1")[0]
+    assert not repository.authenticate_user("nobody", PASSWORD)[0]
+    assert repository.get_user_email(USERNAME) == "user@example.com"
+    assert repository.get_user_email("nobody") is None
+    repository.create_user("another_user", PASSWORD, "another@example.com")
+    assert list(repository.iter_usernames(page_size=1)) == ["another_user", USERNAME]
+    assert list(repository.iter_usernames(after="another_user")) == [USERNAME]
+
+
+def test_expense_crud(repository):
+    assert repository.add_expense(USERNAME, "2024-01-05", "Food", "lunch", 12.5)[0]
+    assert repository.add_expense(USERNAME, "2024-01-06", "Transport", "bus", 2.0, "EUR")[0]
+    assert not repository.add_expense(USERNAME, "05/01/2024", "Food", "bad date", 1)[0]
+    expenses = sorted(repository.get_expenses(USERNAME), key=lambda expense: expense["date"])
+    assert [expense["description"] for expense in expenses] == ["lunch", "bus"]
+    assert "_id" not in expenses[0] and expenses[0]["date"] == datetime(2024, 1, 5)
+    assert expenses[1]["currency"] == "EUR"
+
+    lunch_id = _expense_id(repository, "lunch")
+    assert repository.update_expense(lunch_id, "2024-02-01", "Food", "dinner", 20)[0]
+    assert not repository.update_expense("0" * 24, "2024-02-01", "Food", "x", 1)[0]
+    assert not repository.update_expense("not-an-id", "2024-02-01", "Food", "x", 1)[0]
+    assert repository.get_expense_totals(USERNAME) == {
+        "count": 2, "total": 22.0, "first_date": datetime(2024, 1, 6), "last_date": datetime(2024, 2, 1)
+    }
+    assert repository.delete_expense(lunch_id)[0]
+    assert not repository.delete_expense(lunch_id)[0]
+    assert repository.get_expense_totals(USERNAME)["count"] == 1
+
+
+def test_expense_without_category(repository):
+    assert repository.add_expense(USERNAME, "2024-01-05", None, "uncategorized", 4.0)[0]
+    assert repository.add_expense(USERNAME, "2024-01-05", "Food", "lunch", 6.0)[0]
+    assert repository.get_summary_totals(USERNAME, "category") == [(None, 4.0), ("Food", 6.0)]
+    assert repository.compute_daily_rows(USERNAME) == repository.get_stored_daily_rows(USERNAME)
+    assert repository.rebuild_summaries(USERNAME) == (2, 2, 6)
+    assert repository.compute_daily_rows(USERNAME) == repository.get_stored_daily_rows(USERNAME)
+    assert repository.delete_expense(_expense_id(repository, "uncategorized"))[0]
+    assert repository.get_summary_totals(USERNAME, "category") == [("Food", 6.0)]
+
+
+def test_queries(repository):
+    start = datetime(2024, 3, 1)
+    for day in range(10):
+        for category in ("Food", "Transport"):
+            repository.add_expense(USERNAME, start + timedelta(days=day), category, f"{category} {day}", day + 1)
+
+    food = list(repository.find_expenses(USERNAME, category="Food"))
+    assert len(food) == 10 and all("_id" not in row for row in food)
+    in_range = list(repository.find_expenses(USERNAME, date_range=("2024-03-02", "2024-03-03"),
+                                             amount_range=(0, 100)))
+    assert len(in_range) == 4
+    assert list(repository.find_expenses(USERNAME, category="Healthcare")) == []
+
+    by_day = repository.group_expenses(USERNAME, "day")
+    assert by_day[0] == (start.date(), 2.0) and len(by_day) == 10
+    assert repository.group_expenses(USERNAME, "month") == [("2024-03", 110.0)]
+    assert repository.group_expenses(USERNAME, "category", category="Food") == [("Food", 55.0)]
+    assert repository.group_expenses(USERNAME, "day", date_range=("2023-01-01", "2023-12-31")) == []
+
+
+def test_expense_changes(repository):
+    repository.add_expense(USERNAME, "2024-01-01", "Food", "first", 1)
+    changed, deleted, high_water = repository.get_expense_changes(USERNAME)
+    first = list(changed)
+    assert len(first) == 1 and deleted == []
+    time.sleep(0.01)
+    repository.add_expense(USERNAME, "2024-01-02", "Food", "second", 2)
+    assert repository.delete_expense(str(first[0]["_id"]))[0]
+    changed, deleted, _ = repository.get_expense_changes(USERNAME, since=high_water)
+    assert [row["description"] for row in changed] == ["second"]
+    assert deleted == [str(first[0]["_id"])]
+
+
+def test_bulk_insert(repository):
+    documents = []
+    for index in range(5):
+        document = build_expense_document(USERNAME, f"2024-04-0{index + 1}", "Food", f"row {index}", 10)
+        document["import_hash"] = f"{USERNAME}:{index}"
+        documents.append(document)
+    assert repository.insert_expenses(documents) == (5, 0)
+    again = [{key: value for key, value in document.items() if key != "_id"} for document in documents[:3]]
+    assert repository.insert_expenses(again) == (0, 3)
+    assert repository.insert_expenses([]) == (0, 0)
+    assert repository.get_expense_totals(USERNAME)["count"] == 5
+
+
+def test_delete_user_expenses(repository):
+    repository.add_expense(USERNAME, "2024-01-05", "Food", "old", 3)
+    repository.add_expense(USERNAME, "2024-03-05", "Food", "recent", 4)
+    repository.add_expense("other_user", "2024-03-05", "Food", "kept", 5)
+    repository.archive_expenses(USERNAME, datetime(2024, 2, 1))
+    _, _, high_water = repository.get_expense_changes(USERNAME)
+    assert repository.delete_user_expenses(USERNAME) == 2
+    assert repository.get_expenses(USERNAME) == [] and list(repository.get_expense_buckets(USERNAME)) == []
+    assert repository.get_stored_daily_rows(USERNAME) == {}
+    assert len(repository.get_expense_changes(USERNAME, since=high_water - timedelta(seconds=1))[1]) == 2
+    assert [expense["description"] for expense in repository.get_expenses("other_user")] == ["kept"]
+
+
+def test_summaries(repository):
+    repository.add_expense(USERNAME, "2024-05-01", "Food", "a", 10)
+    repository.add_expense(USERNAME, "2024-05-01", "Food", "b", 5, "EUR")
+    repository.add_expense(USERNAME, "2024-06-01", "Transport", "c", 7)
+    assert repository.get_summary_totals(USERNAME, "month") == [("2024-05", 15.0), ("2024-06", 7.0)]
+    assert repository.get_summary_totals(USERNAME, "category") == [("Food", 15.0), ("Transport", 7.0)]
+    assert len(repository.get_daily_summary_rows(USERNAME)) == 3
+    assert repository.compute_daily_rows(USERNAME) == repository.get_stored_daily_rows(USERNAME)
+    assert repository.rebuild_summaries(USERNAME) == (3, 2, 8)
+    assert repository.compute_daily_rows(USERNAME) == repository.get_stored_daily_rows(USERNAME)
+
+
+def test_budgets(repository):
+    repository.create_user(USERNAME, PASSWORD, "user@example.com")
+    today = datetime.today()
+    assert repository.set_budget(USERNAME, ALL_CATEGORIES, 100)[0]
+    assert not repository.set_budget(USERNAME, ALL_CATEGORIES, 100, "yearly")[0]
+    assert not repository.set_budget(USERNAME, ALL_CATEGORIES, 0)[0]
+    assert repository.get_budget_status(USERNAME, "Food") is None
+    repository.add_expense(USERNAME, today, "Food", "a", 85)
+    status = repository.get_budget_status(USERNAME)
+    assert status["spent"] == 85 and status["level"] == 80 and status["remaining"] == 15
+    repository.add_expense(USERNAME, today, "Food", "b", 20)
+    assert repository.get_budget_status(USERNAME)["level"] == 100
+    # Already raised, so a re-check finds nothing new
+    assert repository.evaluate_budget_thresholds(USERNAME, [today]) == []
+    claimed = repository.claim_notifications(100)
+    assert sorted(notification["alert_type"] for notification in claimed) == [
+        "budget_All_monthly_100", "budget_All_monthly_80"
+    ]
+    assert [budget["category"] for budget in repository.get_budgets(USERNAME)] == [ALL_CATEGORIES]
+    assert repository.delete_budget(USERNAME, ALL_CATEGORIES)[0]
+    assert not repository.delete_budget(USERNAME, ALL_CATEGORIES)[0]
+
+
+def test_outbox(repository):
+    assert repository.enqueue_notification(USERNAME, "test", "2024-01", "a@example.com", "s", "m")[0]
+    assert not repository.enqueue_notification(USERNAME, "test", "2024-01", "a@example.com", "s", "m")[0]
+    claimed = repository.claim_notifications(100)
+    assert len(claimed) == 1 and claimed[0]["status"] == "sending"
+    assert repository.claim_notifications(100) == []
+    repository.mark_notification_failed(claimed[0], RuntimeError("down"), base_delay_seconds=0)
+    retried = repository.claim_notifications(100)
+    assert len(retried) == 1 and retried[0]["attempts"] == 1 and retried[0]["last_error"] == "down"
+    repository.mark_notification_sent(retried[0]["_id"])
+    assert repository.claim_notifications(100) == []
+
+
+def test_income(repository):
+    assert repository.add_income(USERNAME, date(2024, 5, 1), "Salary", 2500.0) == (True, "Income added successfully.")
+    [income] = repository.get_income(USERNAME)
+    assert (income["date"], income["source"], income["amount"], income["currency"]) == (
+        datetime(2024, 5, 1), "Salary", 2500.0, "USD")
+    assert repository.add_income(USERNAME, "05/01/2024", "Salary", 2500.0) == (
+        False, "Invalid date format. Use YYYY-MM-DD.")
+    rows = list(repository.iter_user_documents("income", USERNAME, ["date", "source", "amount"]))
+    assert rows == [{"date": datetime(2024, 5, 1), "source": "Salary", "amount": 2500.0}]
+
+
+def test_recurring_rules(repository):
+    assert repository.add_recurring_expense(USERNAME, "2024-01-01", None, "Utilities", "rent", 500, "Monthly")[0]
+    assert not repository.add_recurring_expense(USERNAME, "2024-01-01", None, "Other", "x", 1, "Every N days")[0]
+    rule = repository.get_recurring_rules(USERNAME)[0]
+    assert repository.update_recurring_expense(str(rule["_id"]), amount=550)[0]
+    assert repository.get_recurring_expenses(USERNAME)[0]["amount"] == 550.0
+    assert repository.update_recurring_expense(str(rule["_id"]), materialized_through=datetime(2024, 3, 1))[0]
+    assert repository.get_recurring_rules(USERNAME)[0]["materialized_through"] == datetime(2024, 3, 1)
+    assert not repository.update_recurring_expense("not-an-id", amount=1)[0]
+    assert repository.delete_recurring_expense(str(rule["_id"]))[0]
+    assert repository.get_recurring_rules(USERNAME) == []
+
+
+def test_debts_and_single_splits(repository):
+    assert repository.add_debt(USERNAME, "2024-01-02", "Sam", "loan", 50, "Loan")[0]
+    assert repository.get_debts(USERNAME)[0]["person_name"] == "Sam"
+    assert repository.add_split_expense(USERNAME, "expense-1", "Sam", 5)[0]
+    assert repository.get_split_expenses(USERNAME, "expense-1")[0]["amount"] == 5.0
+
+
+def test_categorizer_models(repository):
+    assert repository.load_categorizer_model(USERNAME) is None
+    repository.save_categorizer_model(USERNAME, b"model", ["Food", "Other"], 3)
+    stored = repository.load_categorizer_model(USERNAME)
+    assert bytes(stored["model"]) == b"model" and stored["classes"] == ["Food", "Other"]
+    assert stored["samples_seen"] == 3
+
+
+def test_splits_and_balances(repository):
+    assert not repository.add_split_expenses(USERNAME, "expense-1", [("Sam", 5), ("Sam", 5)])[0]
+    assert not repository.add_split_expenses(USERNAME, "expense-1", [("Sam", 5), ("Alex", 0)])[0]
+    assert repository.get_split_expenses(USERNAME, "expense-1") == []
+    assert repository.add_split_expenses(USERNAME, "expense-1", split_shares(10, ["Sam", "Alex", "Jo"]))[0]
+    shares = repository.get_split_expenses(USERNAME, "expense-1")
+    assert sorted(share["amount"] for share in shares) == [3.33, 3.33, 3.34]
+
+    repository.add_debt(USERNAME, "2024-01-01", "Sam", "tickets", 20, "Debt")
+    repository.add_debt(USERNAME, "2024-01-02", "Jo", "cash", 1, "Loan")
+    repository.add_debt(USERNAME, "2024-01-03", "Kim", "untyped", 7, "Other")
+    balances = {person: round(amount, 2) for person, amount in repository.get_counterparty_balances(USERNAME).items()}
+    assert balances == {"Sam": -16.66, "Alex": 3.33, "Jo": 4.33}
+
+
+def test_archive(repository):
+    repository.add_expense(USERNAME, "2024-01-05", "Food", "old lunch", 12.5)
+    repository.add_expense(USERNAME, "2024-02-10", "Transport", "old bus", 2.0, "EUR")
+    repository.add_expense(USERNAME, "2024-03-01", "Food", "recent", 7)
+    document = build_expense_document(USERNAME, "2024-01-20", "Other", "imported", 3)
+    document["import_hash"] = f"{USERNAME}:archived"
+    assert repository.insert_expenses([document]) == (1, 0)
+    before = repository.get_expense_totals(USERNAME)
+    by_month = repository.group_expenses(USERNAME, "month")
+    daily = repository.compute_daily_rows(USERNAME)
+
+    assert repository.archive_expenses(USERNAME, datetime(2024, 3, 1)) == (3, 2)
+    assert repository.archive_expenses(USERNAME, datetime(2024, 3, 1)) == (0, 0)
+    assert [bucket["month"] for bucket in repository.get_expense_buckets(USERNAME)] == ["2024-01", "2024-02"]
+    assert [bucket["month"] for bucket in repository.get_expense_buckets(USERNAME, ("2024-02", "2024-12"))] == [
+        "2024-02"
+    ]
+    assert repository.get_expense_totals(USERNAME) == before
+    assert repository.group_expenses(USERNAME, "month") == by_month
+    assert repository.compute_daily_rows(USERNAME) == daily
+    assert len(repository.get_expenses(USERNAME)) == 4
+    assert [row["description"] for row in repository.find_expenses(USERNAME, category="Transport")] == ["old bus"]
+    rows, _ = repository.get_expenses_page(USERNAME, page_size=10)
+    assert [row["description"] for row in rows] == ["recent", "old bus", "imported", "old lunch"]
+    again = {key: value for key, value in document.items() if key != "_id"}
+    assert repository.insert_expenses([again]) == (0, 1)
+
+    # Editing or deleting an archived expense moves it back out of its bucket
+    lunch_id = _expense_id(repository, "old lunch")
+    assert repository.update_expense(lunch_id, "2024-01-06", "Food", "older lunch", 13)[0]
+    assert [bucket["count"] for bucket in repository.get_expense_buckets(USERNAME)] == [1, 1]
+    assert repository.delete_expense(_expense_id(repository, "old bus"))[0]
+    assert [bucket["month"] for bucket in repository.get_expense_buckets(USERNAME)] == ["2024-01"]
+    assert repository.get_expense_totals(USERNAME)["total"] == 23.0
+    stored = {key: row for key, row in repository.get_stored_daily_rows(USERNAME).items() if row[1]}
+    assert repository.compute_daily_rows(USERNAME) == stored
@@ -0,0 +1,112 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from backend import expenses
+
+USERNAME = "rollup_user"
+EXPENSES = [
+    ("2024-01-03", "Food", "groceries", 42.5),
+    ("2024-01-03", "Transport", "bus", 2.75),
+    ("2024-01-17", "Food", "lunch", 12.0),
+    ("2024-02-01", "Utilities", "power", 80.0),
+    ("2024-02-14", "Entertainment", "cinema", 18.25),
+    ("2024-03-30", "Food", "dinner", 35.0),
+]
+FILTERS = [
+    {},
+    {"date_range": ("2024-01-01", "2024-01-31")},
+    {"category": "Food"},
+    {"category": "All"},
+    {"amount_range": (10, 50)},
+    {"date_range": ("2024-01-10", "2024-02-28"), "category": "Food", "amount_range": (0, 100)},
+    # Nothing matches these
+    {"category": "Healthcare"},
+    {"date_range": ("2023-01-01", "2023-12-31")},
+    {"amount_range": (1000, 2000)},
+]
+ROLLUPS = [
+    (expenses.aggregate_daily_spending, expenses.calculate_daily_spending),
+    (expenses.aggregate_monthly_spending, expenses.calculate_monthly_spending),
+    (expenses.aggregate_category_spending, expenses.calculate_category_spending),
+]
+
+
+# Unstored occurrences on 2024-01-10, 2024-02-10 and 2024-03-10
+RULE = ("2024-01-10", "2024-03-31", "Utilities", "internet", 40, "Monthly")
+
+
+@pytest.fixture(params=["expenses", "recurring"])
+def filled(request, repository):
+    for day, category, description, amount in EXPENSES:
+        assert repository.add_expense(USERNAME, day, category, description, amount)[0]
+    if request.param == "recurring":
+        assert repository.add_recurring_expense(USERNAME, *RULE)[0]
+    return repository
+
+
+@pytest.fixture
+def recurring(repository):
+    for day, category, description, amount in EXPENSES:
+        assert repository.add_expense(USERNAME, day, category, description, amount)[0]
+    assert repository.add_recurring_expense(USERNAME, *RULE)[0]
+    return repository
+
+
+def _plain(df):
+    df = df.astype({column: object for column, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)})
+    return df.reset_index(drop=True)
+
+
+@pytest.mark.parametrize("filters", FILTERS, ids=lambda filters: ",".join(filters) or "none")
+@pytest.mark.parametrize("server_side, local", ROLLUPS, ids=["daily", "monthly", "category"])
+def test_aggregations_match_pandas(filled, filters, server_side, local):
+    server_df = server_side(USERNAME, **filters)
+    df = expenses.with_recurring_occurrences(expenses.get_expenses_df(USERNAME), USERNAME)
+    local_df = local(expenses.filter_expenses(df, **filters).copy())
+    if local_df.empty:
+        assert server_df.empty
+    else:
+        pd.testing.assert_frame_equal(_plain(server_df), _plain(local_df), check_dtype=False)
+
+
+@pytest.mark.parametrize("filters", FILTERS, ids=lambda filters: ",".join(filters) or "none")
+def test_check_rollup_parity(filled, filters):
+    assert expenses.check_rollup_parity(USERNAME, **filters) == {"daily": True, "monthly": True, "category": True}
+
+
+def test_aggregated_values(repository):
+    for day, category, description, amount in EXPENSES:
+        assert repository.add_expense(USERNAME, day, category, description, amount)[0]
+    daily = expenses.aggregate_daily_spending(USERNAME, category="Food")
+    assert list(zip(daily["date"], daily["amount"])) == [
+        (date(2024, 1, 3), 42.5), (date(2024, 1, 17), 12.0), (date(2024, 3, 30), 35.0)
+    ]
+    monthly = expenses.aggregate_monthly_spending(USERNAME)
+    assert [str(month) for month in monthly["month"]] == ["2024-01", "2024-02", "2024-03"]
+    assert list(monthly["amount"]) == [57.25, 98.25, 35.0]
+    category = expenses.aggregate_category_spending(USERNAME, date_range=("2024-02-01", "2024-12-31"))
+    assert list(zip(category["category"], category["amount"])) == [
+        ("Entertainment", 18.25), ("Food", 35.0), ("Utilities", 80.0)
+    ]
+
+
+def test_aggregations_include_recurring_occurrences(recurring):
+    daily = expenses.aggregate_daily_spending(USERNAME, date_range=("2024-01-01", "2024-01-31"))
+    assert list(zip(daily["date"], daily["amount"])) == [
+        (date(2024, 1, 3), 45.25), (date(2024, 1, 10), 40.0), (date(2024, 1, 17), 12.0)
+    ]
+    monthly = expenses.aggregate_monthly_spending(USERNAME)
+    assert list(monthly["amount"]) == [97.25, 138.25, 75.0]
+    category = expenses.aggregate_category_spending(USERNAME, category="Utilities")
+    assert list(zip(category["category"], category["amount"])) == [("Utilities", 200.0)]
+    assert expenses.aggregate_category_spending(USERNAME, amount_range=(41, 1000))["amount"].sum() == 122.5
+    monthly = expenses.aggregate_monthly_spending(USERNAME, base_currency="USD")
+    assert list(monthly["amount"]) == [97.25, 138.25, 75.0]
+
+
+def test_empty_user(repository):
+    for server_side, _ in ROLLUPS:
+        assert server_side("nobody").empty
+    assert all(expenses.check_rollup_parity("nobody").values())
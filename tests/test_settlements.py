@@ -0,0 +1,124 @@
+import sqlite3
+
+import pytest
+from pymongo.errors import PyMongoError
+
+from backend import database
+from backend.records import split_shares
+from backend.settlements import get_balances_df, get_settlement, get_settlement_df, minimal_transfers
+from backend.sqlite_store import SqliteRepository
+
+USERNAME = "split_user"
+
+
+# Split collection that stores the shares before `person` and then fails,
+# as a server error part way through insert_many would
+class FailingSplits:
+    def __init__(self, collection, person):
+        self.collection = collection
+        self.person = person
+
+    def insert_many(self, documents, session=None):
+        for document in documents:
+            if document["person_name"] == self.person:
+                raise PyMongoError("insert failed")
+            self.collection.insert_one(document, session=session)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+# Makes storing a share for `person` fail on the current backend
+@pytest.fixture
+def fail_share_for(repository, monkeypatch):
+    def install(person):
+        if isinstance(repository, SqliteRepository):
+            repository._connection().execute(
+                "CREATE TEMP TRIGGER fail_share BEFORE INSERT ON split_expenses"
+                f" WHEN NEW.person_name = '{person}' BEGIN SELECT RAISE(ABORT, 'insert failed'); END"
+            )
+        else:
+            monkeypatch.setattr(database, "split_expenses_collection",
+                                FailingSplits(database.split_expenses_collection, person))
+    return install
+
+
+def test_a_failed_split_stores_no_shares(repository, fail_share_for):
+    fail_share_for("Jo")
+    with pytest.raises((PyMongoError, sqlite3.Error)):
+        repository.add_split_expenses(USERNAME, "expense-1", split_shares(30, ["Sam", "Alex", "Jo"]))
+    assert repository.get_split_expenses(USERNAME, "expense-1") == []
+    assert repository.get_counterparty_balances(USERNAME) == {}
+
+    assert repository.add_split_expenses(USERNAME, "expense-1", split_shares(30, ["Sam", "Alex"]))[0]
+    assert sorted(split["person_name"] for split in repository.get_split_expenses(USERNAME, "expense-1")) == [
+        "Alex", "Sam"
+    ]
+
+
+def test_invalid_shares_store_nothing(repository):
+    for shares in ([], [("Sam", 5), (" ", 5)], [("Sam", 5), ("Sam ", 5)], [("Sam", 5), ("Alex", -1)]):
+        assert not repository.add_split_expenses(USERNAME, "expense-1", shares)[0]
+    assert repository.get_split_expenses(USERNAME, "expense-1") == []
+
+
+@pytest.mark.parametrize("total, people", [(10, 3), (0.05, 3), (100, 7), (99.99, 4)])
+def test_split_shares_add_up_to_the_total(total, people):
+    shares = split_shares(total, [f"person {index}" for index in range(people)])
+    assert round(sum(amount for _, amount in shares), 2) == total
+    amounts = [amount for _, amount in shares]
+    assert max(amounts) - min(amounts) <= 0.01 + 1e-9
+
+
+def test_minimal_transfers():
+    assert minimal_transfers({}) == []
+    assert minimal_transfers({"a": 0, "b": 0.001}) == []
+    assert minimal_transfers({"a": 10, "b": -10}) == [("b", "a", 10.0)]
+    assert minimal_transfers({"a": 30, "b": -10, "c": -20}) == [("c", "a", 20.0), ("b", "a", 10.0)]
+    # Amounts are settled in whole cents, so thirds leave nothing behind
+    transfers = minimal_transfers({"a": 0.1 + 0.2, "b": -0.1, "c": -0.2})
+    assert sorted(transfers) == [("b", "a", 0.1), ("c", "a", 0.2)]
+
+
+@pytest.mark.parametrize("balances", [
+    {"a": 5, "b": 5, "c": -3, "d": -7},
+    {"a": 12.34, "b": -0.01, "c": -12.33},
+    {f"p{index}": (index - 4.5) * 3.17 for index in range(10)},
+])
+def test_minimal_transfers_settle_everyone(balances):
+    transfers = minimal_transfers(balances)
+    assert len(transfers) <= len(balances) - 1
+    left = {party: round(amount * 100) for party, amount in balances.items()}
+    for payer, payee, amount in transfers:
+        assert amount > 0
+        left[payer] += round(amount * 100)
+        left[payee] -= round(amount * 100)
+    assert set(left.values()) == {0}
+
+
+def test_unbalanced_groups_settle_as_far_as_possible():
+    assert minimal_transfers({"a": 10, "b": -4}) == [("b", "a", 4.0)]
+
+
+def test_settlement_from_stored_splits_and_debts(repository):
+    repository.add_split_expenses(USERNAME, "dinner", split_shares(30, ["Sam", "Alex"]))
+    repository.add_debt(USERNAME, "2024-01-01", "Sam", "tickets", 40, "Debt")
+    repository.add_debt(USERNAME, "2024-01-02", "Jo", "cash", 5, "Loan")
+
+    balances = get_balances_df(USERNAME)
+    assert balances.to_dict("records") == [
+        {"person": "Alex", "balance": 15.0}, {"person": "Jo", "balance": 5.0}, {"person": "Sam", "balance": -25.0},
+    ]
+    # Alex and Jo owe the user, who owes Sam more than that: they pay Sam
+    # directly and the user only covers the rest
+    transfers = get_settlement(USERNAME)
+    assert sorted(transfers) == [("Alex", "Sam", 15.0), ("Jo", "Sam", 5.0), (USERNAME, "Sam", 5.0)]
+    assert get_settlement_df(USERNAME).columns.tolist() == ["from", "to", "amount"]
+
+
+def test_settled_counterparties_are_left_out(repository):
+    repository.add_debt(USERNAME, "2024-01-01", "Sam", "tickets", 20, "Debt")
+    repository.add_debt(USERNAME, "2024-01-02", "Sam", "paid back", 20, "Loan")
+    assert get_balances_df(USERNAME).empty
+    assert get_settlement(USERNAME) == []
+    assert get_settlement(USERNAME, {"Kim": 12.5}) == [("Kim", USERNAME, 12.5)]
@@ -0,0 +1,130 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from backend import database, expenses, rates, summaries
+from backend.records import build_expense_document
+
+USERNAME = "summary_user"
+
+
+@pytest.fixture
+def filled(repository):
+    repository.add_expense(USERNAME, "2024-01-03", "Food", "groceries", 42.5)
+    repository.add_expense(USERNAME, "2024-01-03", "Food", "coffee", 3.0, "EUR")
+    repository.add_expense(USERNAME, "2024-02-14", "Transport", "train", 18.25)
+    repository.add_expense("other_user", "2024-01-03", "Food", "lunch", 9.0)
+    return repository
+
+
+def test_writes_keep_summaries_in_step(filled):
+    expense_id = next(str(row["_id"]) for row in filled.get_expenses_page(USERNAME)[0]
+                      if row["description"] == "groceries")
+    filled.update_expense(expense_id, "2024-01-04", "Food", "groceries", 40)
+    filled.insert_expenses([build_expense_document(USERNAME, "2024-03-01", "Other", "imported", 5)])
+    filled.delete_expense(next(str(row["_id"]) for row in filled.get_expenses_page(USERNAME)[0]
+                               if row["description"] == "train"))
+    assert summaries.check_summary_drift() == []
+    assert filled.get_summary_totals(USERNAME, "month") == [("2024-01", 43.0), ("2024-03", 5.0)]
+
+
+def test_drift_is_detected_and_rebuilt(filled, raw_writes):
+    raw_writes.insert_expense(build_expense_document(USERNAME, "2024-01-03", "Food", "unsummarized", 7.5))
+    raw_writes.insert_expense(build_expense_document(USERNAME, "2024-05-01", "Travel", "unsummarized", 100))
+
+    drift = summaries.check_summary_drift(USERNAME)
+    daily = [row for row in drift if row["table"] == "expense_summaries"]
+    assert [(row["day"], row["category"], row["currency"]) for row in daily] == [
+        ("2024-01-03", "Food", "USD"), ("2024-05-01", "Travel", "USD")
+    ]
+    assert (daily[0]["expected_total"], daily[0]["stored_total"]) == (50.0, 42.5)
+    assert (daily[0]["expected_count"], daily[0]["stored_count"]) == (2, 1)
+    # The budget counters missed the same expenses
+    counters = {(row["period"], row["period_key"], row["category"]): (row["expected_spent"], row["stored_spent"])
+                for row in drift if row["table"] == "budget_spend"}
+    assert len(counters) == 8
+    assert counters[("monthly", "2024-05", "Travel")] == (100.0, 0.0)
+    assert counters[("monthly", "2024-01", "All")][0] - counters[("monthly", "2024-01", "All")][1] == 7.5
+    assert summaries.check_summary_drift("other_user") == []
+
+    assert summaries.rebuild_summaries(USERNAME) == (4, 3, 12)
+    assert summaries.check_summary_drift() == []
+    assert filled.get_summary_totals(USERNAME, "category") == [
+        ("Food", 53.0), ("Transport", 18.25), ("Travel", 100.0)
+    ]
+    # Other users' rows are left alone
+    assert filled.get_summary_totals("other_user", "day") == [(date(2024, 1, 3), 9.0)]
+
+
+def test_rebuild_everyone(filled, raw_writes):
+    raw_writes.insert_expense(build_expense_document("other_user", "2024-01-03", "Food", "unsummarized", 1))
+    assert [row["table"] for row in summaries.check_summary_drift()] == ["expense_summaries"] + ["budget_spend"] * 4
+    summaries.rebuild_summaries()
+    assert summaries.check_summary_drift() == []
+    assert filled.get_summary_totals("other_user", "day") == [(date(2024, 1, 3), 10.0)]
+
+
+def test_users_without_expenses_are_cleared(filled, raw_writes):
+    raw_writes.delete_expenses("other_user")
+    assert {row["username"] for row in summaries.check_summary_drift()} == {"other_user"}
+    summaries.rebuild_summaries()
+    assert summaries.check_summary_drift() == []
+    assert filled.get_summary_totals("other_user", "day") == []
+    assert filled.get_stored_budget_spend("other_user") == {}
+
+
+def test_a_rates_change_drifts_only_the_budget_counters(filled, tmp_path, monkeypatch):
+    path = tmp_path / "rates.csv"
+    path.write_text("date,currency,rate\n2024-01-01,EUR,0.5\n")
+    monkeypatch.setattr(rates, "RATES_FILE", str(path))
+    monkeypatch.setitem(rates._table, "mtime", None)
+    monkeypatch.setitem(rates._table, "rates", {})
+    filled.set_budget(USERNAME, "All", 100)
+    summaries.rebuild_summaries()
+    assert summaries.check_summary_drift() == []
+
+    path.write_text("date,currency,rate\n2024-01-01,EUR,0.25\n")
+    monkeypatch.setitem(rates._table, "mtime", None)
+    drift = summaries.check_summary_drift()
+    assert {row["table"] for row in drift} == {"budget_spend"}
+    monthly = next(row for row in drift if (row["period"], row["category"]) == ("monthly", "All")
+                   and row["username"] == USERNAME)
+    assert (monthly["expected_spent"], monthly["stored_spent"]) == (54.5, 48.5)
+    summaries.rebuild_summaries()
+    assert summaries.check_summary_drift() == []
+    assert filled.get_budget_status(USERNAME, on=pd.Timestamp("2024-01-20").to_pydatetime())["spent"] == 54.5
+
+
+def test_mongo_rebuilds_each_user_in_its_own_transaction(filled, monkeypatch):
+    if not isinstance(filled, database.MongoRepository):
+        pytest.skip("MongoDB only")
+    transactions = []
+    replace_summaries = database._replace_summaries
+
+    def run_in_transaction(callback):
+        transactions.append([])
+        return callback(None)
+
+    def replace(session, username, *totals):
+        transactions[-1].append(username)
+        return replace_summaries(session, username, *totals)
+
+    monkeypatch.setattr(database, "run_in_transaction", run_in_transaction)
+    monkeypatch.setattr(database, "_replace_summaries", replace)
+    summaries.rebuild_summaries()
+    assert transactions == [["other_user"], [USERNAME]]
+    assert summaries.check_summary_drift() == []
+
+
+def test_summaries_match_the_pandas_rollups(filled):
+    filled.add_recurring_expense(USERNAME, "2024-01-31", "2024-03-31", "Utilities", "rent", 500, "Monthly")
+    df = expenses.with_recurring_occurrences(expenses.get_expenses_df(USERNAME), USERNAME)
+    for summary, rollup in ((summaries.get_daily_summary, expenses.calculate_daily_spending),
+                            (summaries.get_monthly_summary, expenses.calculate_monthly_spending),
+                            (summaries.get_category_summary, expenses.calculate_category_spending)):
+        expected = rollup(df.copy())
+        expected = expected.astype({column: object for column, dtype in expected.dtypes.items()
+                                    if isinstance(dtype, pd.CategoricalDtype)})
+        pd.testing.assert_frame_equal(summary(USERNAME).reset_index(drop=True), expected.reset_index(drop=True),
+                                      check_dtype=False)